@@ -1,15 +1,33 @@
+"""
+In-memory stand-in for schedge-backend, for frontend development and load tests.
+
+Every user has their own tasks and slots, indexed by task ID. Users up to
+`--users` are filled with synthetic tasks the first time they are accessed;
+the data is derived from `--seed` and the user ID, so it is the same on every
+run. Other users start with a copy of the sample tasks below.
+
+Latency, jitter and failures can be injected for all routes or per route,
+e.g. `python mock.py --users 5000 --tasks 40 --latency 20 --jitter 10
+--route route_user_task_create=200:50:0.05`.
+"""
+import argparse
+import copy
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
 import flask
 import flask_cors
-import flask_sock
 from flask_sock import Sock
-import uuid
 
 app = flask.Flask(__name__)
 flask_cors.CORS(app)
 sock = Sock(app)
 
-# In-memory data
-USER_TASKS = [
+# Sample data of users without synthetic data
+SAMPLE_TASKS = [
     {
         "id": 1,
         "type": "fixed",
@@ -81,78 +99,226 @@ USER_TASKS = [
     }
 ]
 
-SLOTS = [
+SAMPLE_SLOTS = [
     {
         "start": "2025-04-28T16:00:00+0300",
         "end": "2025-04-28T18:00:00+0300",
-        "task": USER_TASKS[0],
+        "task": 1,
     },
     {
         "start": "2025-04-28T18:00:00+0300",
         "end": "2025-04-28T19:30:00+0300",
-        "task": USER_TASKS[1],
+        "task": 2,
     },
 ]
 
-# Keep track of the next available task ID
-next_task_id = len(USER_TASKS) + 1
+COLORS = ["#3498DB", "#FFD700", "#2ECC71", "#E74C3C", "#9B59B6"]
+NAMES = ["Reading", "Workout", "Groceries", "Course homework", "Call parents", "Walk", "Write report"]
+
+
+class User:
+    """
+    Tasks and slots of one user.
+
+    Args:
+        tasks (list[dict]): Initial tasks, with unique IDs
+        slots (list[dict]): Initial slots; `task` is the ID of the slot's task
+    """
+
+    def __init__(self, tasks, slots):
+        self.tasks = {task["id"]: task for task in tasks}
+        self.slots = slots
+        self.next_task_id = max(self.tasks, default=0) + 1
+        self.lock = threading.Lock()
+
+    def state(self, user_id):
+        # Slots refer to tasks by ID so that updates show up in them
+        return {
+            "userId": user_id,
+            "tasks": list(self.tasks.values()),
+            "slots": self.resolved_slots(),
+        }
+
+    def resolved_slots(self):
+        return [
+            {**slot, "task": self.tasks[slot["task"]]}
+            for slot in self.slots
+            if slot["task"] in self.tasks
+        ]
+
+
+def synthetic_user(user_id, count, seed, now=None):
+    """
+    Generate a user's tasks deterministically from `seed` and `user_id`.
 
+    Args:
+        user_id (int): User ID
+        count (int): Number of tasks
+        seed (int): Seed shared by all users
+        now (datetime | None): Start of the generated schedule, today at midnight UTC by default
+
+    Returns:
+        User: The user, with a slot for every fixed task
+    """
+    rng = random.Random(seed * 1_000_003 + user_id)
+    now = now or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    tasks, slots = [], []
+    for task_id in range(1, count + 1):
+        offset = timedelta(minutes=5 * rng.randrange(0, 14 * 24 * 12))
+        task = {
+            "id": task_id,
+            "name": rng.choice(NAMES),
+            "description": None,
+            "color": rng.choice(COLORS),
+            "leisure": rng.random() < 0.3,
+            "dependencies": [],
+            "nonce": 1,
+        }
+        kind = rng.random()
+        if kind < 0.4:
+            start = now + offset
+            end = start + timedelta(minutes=30 * rng.randint(1, 6))
+            task.update(type="fixed", start=start.isoformat(), end=end.isoformat())
+            slots.append({"start": task["start"], "end": task["end"], "task": task_id})
+        elif kind < 0.85:
+            kickoff = now + offset
+            task.update(
+                type="continuous",
+                duration=f"PT{15 * rng.randint(1, 8)}M",
+                kickoff=kickoff.isoformat(),
+                deadline=(kickoff + timedelta(days=rng.randint(1, 7))).isoformat(),
+            )
+        else:
+            kickoff = now + offset
+            task.update(
+                type="project",
+                duration=f"PT{rng.randint(2, 20)}H",
+                kickoff=kickoff.isoformat(),
+                deadline=(kickoff + timedelta(days=rng.randint(3, 14))).isoformat(),
+                timings={"work": "PT25M", "smallBreak": "PT5M", "bigBreak": "PT20M", "numberOfSmallBreaks": 3},
+            )
+        tasks.append(task)
+    return User(tasks, slots)
+
+
+class Settings:
+    """Command-line options, see `parse_args`."""
+
+    users = 0
+    tasks = 50
+    seed = 0
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    error_status = 503
+    # Endpoint name -> (latency, jitter, error rate)
+    routes = {}
+
+
+SETTINGS = Settings()
+# User ID -> User
+USERS = {}
+USERS_LOCK = threading.Lock()
+# User ID -> {connection ID: socket}
 CONNECTIONS = {}
+CONNECTIONS_LOCK = threading.Lock()
+
+
+def get_user(user_id):
+    user = USERS.get(user_id)
+    if user is not None:
+        return user
+    with USERS_LOCK:
+        user = USERS.get(user_id)
+        if user is None:
+            if user_id <= SETTINGS.users:
+                user = synthetic_user(user_id, SETTINGS.tasks, SETTINGS.seed)
+            else:
+                user = User(copy.deepcopy(SAMPLE_TASKS), copy.deepcopy(SAMPLE_SLOTS))
+            USERS[user_id] = user
+    return user
+
 
 def emit_state(user_id):
-    for uid, ws in list(CONNECTIONS.items()):
+    """Send the user's state to that user's sockets only."""
+    with CONNECTIONS_LOCK:
+        sockets = list(CONNECTIONS.get(user_id, {}).items())
+    if not sockets:
+        return
+    user = get_user(user_id)
+    with user.lock:
+        message = flask.json.dumps(user.state(user_id))
+    for uid, ws in sockets:
         try:
-            ws.send(flask.json.dumps({
-                "userId": user_id,
-                "tasks": USER_TASKS,
-                "slots": SLOTS,
-            }))
+            ws.send(message)
         except Exception as e:
             print(f"Error sending state to {ws}: {e}")
-            CONNECTIONS.pop(uid, None)
+            with CONNECTIONS_LOCK:
+                CONNECTIONS.get(user_id, {}).pop(uid, None)
+
+
+@app.before_request
+def inject_faults():
+    if flask.request.endpoint == "echo":
+        return None
+    latency, jitter, error_rate = SETTINGS.routes.get(
+        flask.request.endpoint, (SETTINGS.latency, SETTINGS.jitter, SETTINGS.error_rate)
+    )
+    delay = latency + random.uniform(-jitter, jitter)
+    if delay > 0:
+        time.sleep(delay)
+    if error_rate and random.random() < error_rate:
+        return {
+            "status": "error",
+            "message": "Injected failure"
+        }, SETTINGS.error_status
+    return None
 
 
 @app.route("/user/<int:user_id>/state", methods=['GET'])
 def route_user_state(user_id):
+    user = get_user(user_id)
+    with user.lock:
+        state = user.state(user_id)
     return {
         "status": "ok",
-        "result": {
-            "userId": user_id,
-            "tasks": USER_TASKS,
-            "slots": SLOTS,
-        },
+        "result": state,
     }
 
 
 @app.route("/user/<int:user_id>/task", methods=['GET'])
 def route_user_tasks(user_id):
+    user = get_user(user_id)
+    with user.lock:
+        tasks = list(user.tasks.values())
     return {
         "status": "ok",
-        "result": USER_TASKS,
+        "result": tasks,
     }
 
 
 @app.route("/user/<int:user_id>/task/<int:task_id>", methods=['GET'])
 def route_user_task(user_id, task_id):
-    for task in USER_TASKS:
-        if task["id"] == task_id:
-            return {
-                "status": "ok",
-                "result": task,
-            }
+    task = get_user(user_id).tasks.get(task_id)
+    if task is None:
+        return {
+            "status": "error",
+            "message": "Task not found"
+        }, 404
     return {
-        "status": "error",
-        "message": "Task not found"
-    }, 404
+        "status": "ok",
+        "result": task,
+    }
 
 
 @app.route("/user/<int:user_id>/task", methods=['POST'])
 def route_user_task_create(user_id):
-    global next_task_id
     task = flask.request.json
-    task["id"] = next_task_id
-    USER_TASKS.append(task)
-    next_task_id += 1
+    user = get_user(user_id)
+    with user.lock:
+        task["id"] = user.next_task_id
+        user.next_task_id += 1
+        user.tasks[task["id"]] = task
     emit_state(user_id)
     return {
         "status": "ok",
@@ -163,37 +329,37 @@ def route_user_task_create(user_id):
 @app.route("/user/<int:user_id>/task/<int:task_id>", methods=['PUT'])
 def route_user_task_update(user_id, task_id):
     task = flask.request.json
-    for i, t in enumerate(USER_TASKS):
-        if t["id"] == task_id:
-            USER_TASKS[i] = task  # Update the task in place
-            emit_state(user_id)
+    user = get_user(user_id)
+    with user.lock:
+        if task_id not in user.tasks:
             return {
-                "status": "ok",
-                "result": task,
-            }
+                "status": "error",
+                "message": "Task not found"
+            }, 404
+        task["id"] = task_id
+        user.tasks[task_id] = task
+    emit_state(user_id)
     return {
-        "status": "error",
-        "message": "Task not found"
-    }, 404
+        "status": "ok",
+        "result": task,
+    }
 
 
 @app.route("/user/<int:user_id>/task/<int:task_id>", methods=['DELETE'])
 def route_user_task_delete(user_id, task_id):
-    global USER_TASKS
-    original_length = len(USER_TASKS)
-    USER_TASKS = [task for task in USER_TASKS if task["id"] != task_id]
-
-    if len(USER_TASKS) < original_length:
-        emit_state(user_id)
-        return {
-            "status": "ok",
-            "message": "Task deleted"
-        }, 200
-    else:
-        return {
-            "status": "error",
-            "message": "Task not found"
-        }, 404
+    user = get_user(user_id)
+    with user.lock:
+        if user.tasks.pop(task_id, None) is None:
+            return {
+                "status": "error",
+                "message": "Task not found"
+            }, 404
+        user.slots = [slot for slot in user.slots if slot["task"] != task_id]
+    emit_state(user_id)
+    return {
+        "status": "ok",
+        "message": "Task deleted"
+    }, 200
 
 
 @app.route("/user/<int:user_id>/queue", methods=['POST'])
@@ -207,9 +373,12 @@ def route_user_queue(user_id):
 
 @app.route("/user/<int:user_id>/slot", methods=['GET'])
 def route_user_slots(user_id):
+    user = get_user(user_id)
+    with user.lock:
+        slots = user.resolved_slots()
     return {
         "status": "ok",
-        "result": SLOTS,
+        "result": slots,
     }
 
 
@@ -217,17 +386,77 @@ def route_user_slots(user_id):
 def echo(ws, user_id):
     uid = uuid.uuid4()
     try:
-        CONNECTIONS[uid] = ws
+        with CONNECTIONS_LOCK:
+            CONNECTIONS.setdefault(user_id, {})[uid] = ws
         while True:
             data = ws.receive()
             if data == "ping":
                 emit_state(user_id)
             else:
                 print(f"Received unknown message: {data}")
-    except flask_sock.ConnectionClosed as e:
-        CONNECTIONS.pop(uid, None)
-        raise e
+    finally:
+        with CONNECTIONS_LOCK:
+            sockets = CONNECTIONS.get(user_id, {})
+            sockets.pop(uid, None)
+            if not sockets:
+                CONNECTIONS.pop(user_id, None)
+
+
+def parse_route(value):
+    """
+    Parse `ENDPOINT=LATENCY_MS[:JITTER_MS[:ERROR_RATE]]`.
+
+    Returns:
+        tuple[str, tuple[float, float, float]]: Endpoint name and its (latency, jitter, error rate),
+            with times in seconds
+    """
+    endpoint, sep, spec = value.partition("=")
+    parts = spec.split(":")
+    if not sep or not endpoint or not 1 <= len(parts) <= 3:
+        raise argparse.ArgumentTypeError(f"Expected ENDPOINT=LATENCY_MS[:JITTER_MS[:ERROR_RATE]], got {value}")
+    try:
+        latency = float(parts[0]) / 1000
+        jitter = float(parts[1]) / 1000 if len(parts) > 1 else 0.0
+        error_rate = float(parts[2]) if len(parts) > 2 else 0.0
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid numbers in {value}")
+    return endpoint, (latency, jitter, error_rate)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mock schedge backend")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=0, help="Users with synthetic tasks (IDs 1..N)")
+    parser.add_argument("--tasks", type=int, default=50, help="Tasks per synthetic user")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data")
+    parser.add_argument("--preload", action="store_true",
+                        help="Generate synthetic users at startup rather than on first access")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay added to every request, in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random variation of the delay, in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="Status of injected failures")
+    parser.add_argument("--route", type=parse_route, action="append", default=[],
+                        metavar="ENDPOINT=LATENCY_MS[:JITTER_MS[:ERROR_RATE]]",
+                        help="Override the latency, jitter and error rate of one endpoint, e.g. "
+                             "route_user_task_create=200:50:0.1")
+    parser.add_argument("--debug", action="store_true")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    args = parse_args()
+    SETTINGS.users = args.users
+    SETTINGS.tasks = args.tasks
+    SETTINGS.seed = args.seed
+    SETTINGS.latency = args.latency / 1000
+    SETTINGS.jitter = args.jitter / 1000
+    SETTINGS.error_rate = args.error_rate
+    SETTINGS.error_status = args.error_status
+    SETTINGS.routes = dict(args.route)
+    unknown = set(SETTINGS.routes) - set(app.view_functions)
+    if unknown:
+        raise SystemExit(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+    if args.preload:
+        for user_id in range(1, args.users + 1):
+            get_user(user_id)
+    app.run(debug=args.debug, port=args.port, threaded=True)
@@ -0,0 +1,342 @@
+"""
+Compaction of past slots and finished tasks into archive collections.
+
+The hot `tasks` and `slots` collections are read in full on every state
+read, so they should only hold what is still relevant. Every `interval`
+seconds one replica, holding a lease in the `leases` collection, goes over
+the users and moves the slots and tasks that ended more than `retention`
+seconds ago to `archived_slots` and `archived_tasks`:
+
+- a slot ends at its `end`;
+- a fixed task at its `end`, other tasks at their `deadline`;
+- a recurring task at the end of its last occurrence; series without
+  `count` or `until` never end.
+
+Archived documents are the hot ones with `endsAt` and `archivedAt` (BSON
+dates) added; a TTL index on `endsAt` optionally expires them. A move writes
+the archive copy first and then deletes the hot document, so an interrupted
+pass is simply repeated; a task is only deleted if it was not modified in
+between (its `nonce` is unchanged).
+"""
+import asyncio
+import contextlib
+import logging
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import bson
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from recurrence import Series, parse_time
+
+logger = logging.getLogger(__name__)
+
+ARCHIVES = {"tasks": "archived_tasks", "slots": "archived_slots"}
+LEASE_ID = "compaction"
+TTL_INDEX = "endsAt_ttl"
+# Occurrences walked to find the end of a series with a large `count`
+MAX_SERIES_WALK = 100_000
+
+
+def series_end(task):
+    """
+    Returns:
+        datetime | None: End of the last occurrence of a recurring task, None if the series is endless
+    """
+    rule = task["recurrence"]
+    if not rule.get("count") and not rule.get("until"):
+        return None
+    series = Series(task)
+    last = None
+    for index, moment in enumerate(series.between(series.anchor, datetime.max.replace(tzinfo=timezone.utc))):
+        if index >= MAX_SERIES_WALK:
+            return None
+        last = moment
+    ends = [last + series.length] if last is not None else []
+    # Overrides may move an occurrence later than the rule would
+    for override in (rule.get("overrides") or {}).values():
+        for field in ("end", "deadline"):
+            if override.get(field):
+                ends.append(parse_time(override[field]))
+    return max(ends, default=None)
+
+
+def ends_at(document, kind):
+    """
+    When a slot or task ended.
+
+    Args:
+        document (dict): A slot or task as stored
+        kind (str): "slots" or "tasks"
+
+    Returns:
+        datetime | None: The end (aware), None if it has none or never ends
+    """
+    try:
+        if kind == "tasks" and document.get("recurrence"):
+            return series_end(document)
+        field = "end" if kind == "slots" or document.get("type") == "fixed" else "deadline"
+        return parse_time(document[field])
+    except (KeyError, TypeError, AttributeError, ValueError, OverflowError):
+        return None
+
+
+def expired(documents, kind, cutoff):
+    """
+    Returns:
+        list[tuple[dict, datetime]]: The documents that ended before `cutoff`, with their end
+    """
+    result = []
+    for document in documents:
+        end = ends_at(document, kind)
+        if end is not None and end < cutoff:
+            result.append((document, end))
+    return result
+
+
+def encode_cursor(document):
+    """
+    Returns:
+        str: Cursor of the page after an archived document, e.g. "1746093600000.665f1c..."
+    """
+    ends = document["endsAt"]
+    if ends.tzinfo is None:
+        ends = ends.replace(tzinfo=timezone.utc)
+    return f"{int(ends.timestamp() * 1000)}.{document['_id']}"
+
+
+def decode_cursor(cursor):
+    """
+    Returns:
+        tuple[datetime, ObjectId]: The position a cursor points after
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    millis, _, object_id = cursor.partition(".")
+    try:
+        return datetime.fromtimestamp(int(millis) / 1000, timezone.utc), bson.ObjectId(object_id)
+    except (InvalidId, TypeError, ValueError, OverflowError, OSError):
+        raise ValueError(f"Invalid cursor: {cursor}") from None
+
+
+def history_query(user_id, cursor=None):
+    """
+    Query of one page of a user's archive, newest first.
+
+    Args:
+        user_id (int): The user
+        cursor (str | None): `encode_cursor` of the last document of the previous page
+    """
+    query = {"userId": user_id}
+    if cursor is not None:
+        ends, object_id = decode_cursor(cursor)
+        query["$or"] = [{"endsAt": {"$lt": ends}}, {"endsAt": ends, "_id": {"$lt": object_id}}]
+    return query
+
+
+async def read_history(db, user_id, kind, cursor=None, limit=50):
+    """
+    Read one page of a user's archived slots or tasks, newest first.
+
+    Returns:
+        tuple[list[dict], str | None]: The documents and the cursor of the next page, if any
+    """
+    documents = await db[ARCHIVES[kind]].find(history_query(user_id, cursor)).sort(
+        [("endsAt", DESCENDING), ("_id", DESCENDING)]
+    ).limit(limit + 1).to_list(None)
+    next_cursor = encode_cursor(documents[limit - 1]) if len(documents) > limit else None
+    return documents[:limit], next_cursor
+
+
+async def ensure_archive_indexes(db, ttl):
+    """
+    Create the archive indexes, and the TTL index if `ttl` (seconds) is positive.
+
+    Changing `ttl` updates the existing TTL index; setting it to 0 drops it.
+    """
+    for collection in ARCHIVES.values():
+        await db[collection].create_index([("userId", ASCENDING), ("endsAt", DESCENDING), ("_id", DESCENDING)])
+        if ttl > 0:
+            try:
+                await db[collection].create_index([("endsAt", ASCENDING)], name=TTL_INDEX, expireAfterSeconds=int(ttl))
+            except OperationFailure as e:
+                # IndexOptionsConflict: created with another TTL
+                if e.code != 85:
+                    raise
+                await db.command("collMod", collection, index={"name": TTL_INDEX, "expireAfterSeconds": int(ttl)})
+        else:
+            try:
+                await db[collection].drop_index(TTL_INDEX)
+            except OperationFailure as e:
+                # NamespaceNotFound, IndexNotFound
+                if e.code not in (26, 27):
+                    raise
+
+
+class Compactor:
+    """
+    Moves the past slots and finished tasks of every user to the archive.
+
+    Args:
+        db (AsyncDatabase): The database
+        changed (Callable[[int], Awaitable]): Called after a user's documents were moved
+        interval (float): Seconds between passes
+        retention (float): Seconds after their end that documents stay in the hot collections
+        lease (float): Seconds a pass holds the lease before it must renew it
+        worker_id (str | None): Holder of the lease, random by default
+        editing (Callable[[int], AsyncContextManager] | None): Held around the move of a
+            user's documents, to serialize it with the other writes of this process
+        committed (Callable[[int], Awaitable] | None): Called within `editing` once a user's
+            documents were moved, e.g. to bump their state version
+    """
+
+    def __init__(self, db, changed, interval=3600.0, retention=30 * 86400.0, lease=600.0, worker_id=None,
+                 editing=None, committed=None):
+        self.db = db
+        self.changed = changed
+        self.editing = editing or (lambda user_id: contextlib.nullcontext())
+        self.committed = committed
+        self.interval = interval
+        self.retention = retention
+        self.lease = lease
+        self.worker_id = worker_id or uuid.uuid4().hex
+        self.passes = 0
+        self.users = 0
+        self.moved = {kind: 0 for kind in ARCHIVES}
+        self.failed = 0
+        self._task = None
+
+    @classmethod
+    def from_config(cls, db, changed, config, editing=None, committed=None):
+        return cls(
+            db,
+            changed,
+            interval=config.archive_interval,
+            retention=config.archive_retention,
+            lease=config.archive_lease,
+            editing=editing,
+            committed=committed,
+        )
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        # Replicas started together should not race for the lease
+        await asyncio.sleep(random.uniform(0, min(self.interval, 60)))
+        while True:
+            try:
+                await self.run_pass()
+            except Exception as e:
+                logger.error(f"Error compacting tasks and slots: {e!r}")
+            await asyncio.sleep(self.interval)
+
+    async def acquire(self, now=None):
+        """
+        Take or renew the lease on compaction.
+
+        Returns:
+            bool: Whether this worker holds the lease
+        """
+        now = now or datetime.now(timezone.utc)
+        try:
+            doc = await self.db.leases.find_one_and_update(
+                {"_id": LEASE_ID, "$or": [{"until": {"$lte": now}}, {"owner": self.worker_id}]},
+                {"$set": {"until": now + timedelta(seconds=self.lease), "owner": self.worker_id}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Held by another replica
+            return False
+        return doc is not None
+
+    async def release(self):
+        await self.db.leases.delete_one({"_id": LEASE_ID, "owner": self.worker_id})
+
+    async def run_pass(self, now=None):
+        """Compact every user, if no other replica is doing it."""
+        if not await self.acquire():
+            return
+        self.passes += 1
+        renewed = asyncio.get_running_loop().time()
+        try:
+            async for doc in self.db.state_versions.find({}, {"_id": 1}):
+                try:
+                    await self.compact_user(doc["_id"], now)
+                except Exception as e:
+                    self.failed += 1
+                    logger.warning(f"Compaction of user {doc['_id']} failed: {e!r}")
+                if asyncio.get_running_loop().time() - renewed > self.lease / 3:
+                    if not await self.acquire():
+                        logger.warning("Compaction lease lost, stopping the pass")
+                        return
+                    renewed = asyncio.get_running_loop().time()
+        finally:
+            await self.release()
+
+    async def compact_user(self, user_id, now=None):
+        """
+        Move a user's expired slots and tasks to the archive.
+
+        Returns:
+            dict[str, int]: Documents moved per kind
+        """
+        now = now or datetime.now(timezone.utc)
+        cutoff = now - timedelta(seconds=self.retention)
+        moved = {}
+        async with self.editing(user_id):
+            try:
+                for kind in ARCHIVES:
+                    documents = await self.db[kind].find({"userId": user_id}).to_list(None)
+                    moved[kind] = await self._move(kind, expired(documents, kind, cutoff), now)
+                    self.moved[kind] += moved[kind]
+            finally:
+                # Also after a failure, for the documents already moved
+                if any(moved.values()) and self.committed is not None:
+                    await self.committed(user_id)
+        self.users += 1
+        if any(moved.values()):
+            await self.changed(user_id)
+        return moved
+
+    async def _move(self, kind, documents, now):
+        if not documents:
+            return 0
+        archive = self.db[ARCHIVES[kind]]
+        await archive.bulk_write(
+            [
+                ReplaceOne({"_id": document["_id"]}, {**document, "endsAt": end, "archivedAt": now}, upsert=True)
+                for document, end in documents
+            ],
+            ordered=False,
+        )
+        ids = [document["_id"] for document, _ in documents]
+        if kind == "slots":
+            await self.db.slots.delete_many({"_id": {"$in": ids}})
+            return len(ids)
+
+        # Tasks modified since they were read stay hot, and their copies are withdrawn
+        result = await self.db.tasks.delete_many(
+            {"$or": [{"_id": document["_id"], "nonce": document.get("nonce")} for document, _ in documents]}
+        )
+        if result.deleted_count < len(ids):
+            kept = await self.db.tasks.find({"_id": {"$in": ids}}, {"_id": 1}).to_list(None)
+            await archive.delete_many({"_id": {"$in": [doc["_id"] for doc in kept]}})
+        return result.deleted_count
+
+    def stats(self):
+        return {"passes": self.passes, "users": self.users, "moved": dict(self.moved), "failed": self.failed}
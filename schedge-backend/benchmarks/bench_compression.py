@@ -0,0 +1,61 @@
+"""
+Bandwidth / CPU tradeoff of response compression at typical state sizes.
+
+For every state size and available content coding, reports the encoded size,
+the compression ratio and the time to compress, next to the time to send the
+uncompressed body at a few link speeds, so the break-even point is visible.
+
+Run from schedge-backend:
+    python -m benchmarks.bench_compression [--sizes 1,50,500] [--repeat 20]
+"""
+import argparse
+import json
+import time
+
+from compression import available_encodings, compress
+from benchmarks.fixtures import make_state
+
+# Link speeds in megabits per second
+LINKS = {"3G": 1.5, "4G": 20, "wifi": 100}
+
+
+def measure(data, encoding, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        compressed = compress(data, encoding)
+        best = min(best, time.perf_counter() - started)
+    return len(compressed), best
+
+
+def transfer_ms(size, mbps):
+    return size * 8 / (mbps * 1_000_000) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,50,500", help="Comma-separated task counts")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    encodings = available_encodings()
+    print(f"Available encodings: {', '.join(encodings)}")
+    header = f"{'tasks':>6} {'coding':>8} {'bytes':>10} {'ratio':>7} {'cpu ms':>8}"
+    header += "".join(f" {name + ' saved ms':>15}" for name in LINKS)
+    print(header)
+
+    for count in (int(size) for size in args.sizes.split(",")):
+        data = json.dumps(make_state(count)).encode()
+        print(f"{count:>6} {'identity':>8} {len(data):>10} {1.0:>7.2f} {0.0:>8.3f}"
+              + "".join(f" {0.0:>15.2f}" for _ in LINKS))
+        for encoding in encodings:
+            size, seconds = measure(data, encoding, args.repeat)
+            cpu_ms = seconds * 1000
+            # Time saved on the wire minus time spent compressing
+            saved = [transfer_ms(len(data) - size, mbps) - cpu_ms for mbps in LINKS.values()]
+            print(f"{count:>6} {encoding:>8} {size:>10} {len(data) / size:>7.2f} {cpu_ms:>8.3f}"
+                  + "".join(f" {value:>15.2f}" for value in saved))
+
+
+if __name__ == "__main__":
+    main()
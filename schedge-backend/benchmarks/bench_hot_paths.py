@@ -0,0 +1,233 @@
+"""
+Microbenchmarks of the pure functions on the request path, with a regression gate.
+
+Each function runs on generated tasks (see fixtures.py) of every size in
+`--sizes`: durations and times as clients send them for the normalizers,
+normalized tasks for schema validation, documents as read from Mongo for
+`fix_object_id` and full states for the `json.dumps` done by `emit_state`.
+A sample times `inner` calls, chosen so that it lasts at least `--sample-ms`,
+and the best of `--repeat` samples is reported per call, which is the least
+noisy estimate.
+
+`--save` writes the results as a baseline; `--compare` reports the change
+against a baseline and exits with status 1 if any function got slower by
+more than `--threshold` (a fraction, 0.25 = 25%). A regression is measured
+again up to `--retries` times before it counts. Baselines are only
+comparable on the same machine and Python version, which are recorded.
+
+Run from schedge-backend:
+    python -m benchmarks.bench_hot_paths [--sizes 1,50,500] [--functions fix_object_id,validate_schema]
+        [--save baseline.json | --compare baseline.json [--threshold 0.25]]
+"""
+import argparse
+import copy
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+from main import fix_object_id, normalize_datetime, normalize_duration, normalize_task_dates, validate_schema
+from benchmarks.fixtures import make_raw_tasks, make_state, make_stored_tasks
+
+
+def durations(tasks):
+    values = []
+    for task in tasks:
+        if "duration" in task:
+            values.append(task["duration"])
+        values.extend(value for value in task.get("timings", {}).values() if isinstance(value, str))
+    return values
+
+
+def datetimes(tasks):
+    return [task[field] for task in tasks for field in ("start", "end", "kickoff", "deadline") if field in task]
+
+
+def run_each(function, *args):
+    def run(values):
+        for value in values:
+            function(value, *args)
+    return run
+
+
+# Name -> (input for a task count, function timed on the input, whether the function mutates the input)
+CASES = {
+    "normalize_duration": (lambda count: durations(make_raw_tasks(count)), run_each(normalize_duration), False),
+    "normalize_datetime": (lambda count: datetimes(make_raw_tasks(count)), run_each(normalize_datetime), False),
+    "normalize_task_dates": (make_raw_tasks, run_each(normalize_task_dates), True),
+    "validate_schema": (
+        lambda count: [normalize_task_dates(task) for task in make_raw_tasks(count)],
+        run_each(validate_schema, "RawTask"),
+        False,
+    ),
+    "fix_object_id": (make_stored_tasks, fix_object_id, False),
+    "emit_state.json_dumps": (make_state, json.dumps, False),
+}
+
+
+def time_calls(run, data, mutates, inner):
+    inputs = [copy.deepcopy(data) for _ in range(inner)] if mutates else [data] * inner
+    # As in timeit, collections would land on whichever sample happens to trigger them
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        for value in inputs:
+            run(value)
+        return time.perf_counter() - started
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def measure(setup, run, mutates, count, repeat, sample_seconds):
+    """
+    Time one function on one input size.
+
+    Returns:
+        dict: Best and median seconds per call, and the calls per sample
+    """
+    data = setup(count)
+    # Calibrate like timeit's autorange, which also warms up caches and lazy imports
+    inner = 1
+    while time_calls(run, data, mutates, inner) < sample_seconds:
+        inner *= 2
+
+    samples = [time_calls(run, data, mutates, inner) / inner for _ in range(repeat)]
+    return {"best": min(samples), "median": statistics.median(samples), "inner": inner}
+
+
+def run_suite(names, sizes, repeat=20, sample_seconds=0.02):
+    """
+    Returns:
+        dict: "function[size]" -> `measure` result
+    """
+    results = {}
+    for name in names:
+        setup, run, mutates = CASES[name]
+        for count in sizes:
+            results[f"{name}[{count}]"] = measure(setup, run, mutates, count, repeat, sample_seconds)
+    return results
+
+
+def remeasure(results, keys, repeat, sample_seconds):
+    """Measure benchmarks again, keeping the best time of all runs."""
+    for key in keys:
+        name, count = key[:-1].split("[")
+        setup, run, mutates = CASES[name]
+        result = measure(setup, run, mutates, int(count), repeat, sample_seconds)
+        if result["best"] < results[key]["best"]:
+            results[key] = result
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "node": platform.node(),
+    }
+
+
+def compare(baseline, results, threshold):
+    """
+    Compare results with a baseline by best time per call.
+
+    Args:
+        baseline (dict): Baseline results, as returned by `run_suite`
+        results (dict): Current results
+        threshold (float): Relative slowdown beyond which a function regressed
+
+    Returns:
+        list[tuple[str, float | None, float | None, str]]: (benchmark, baseline seconds,
+            current seconds, verdict) with verdict one of "ok", "regressed",
+            "improved", "new" and "missing"
+    """
+    rows = []
+    for key in list(results) + [key for key in baseline if key not in results]:
+        before = baseline[key]["best"] if key in baseline else None
+        after = results[key]["best"] if key in results else None
+        if before is None:
+            verdict = "new"
+        elif after is None:
+            verdict = "missing"
+        elif after > before * (1 + threshold):
+            verdict = "regressed"
+        elif after < before / (1 + threshold):
+            verdict = "improved"
+        else:
+            verdict = "ok"
+        rows.append((key, before, after, verdict))
+    return rows
+
+
+def format_us(seconds):
+    return f"{seconds * 1e6:>12.2f}" if seconds is not None else f"{'-':>12}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,50,500", help="Comma-separated task counts")
+    parser.add_argument("--functions", default=",".join(CASES), help="Comma-separated benchmarks to run")
+    parser.add_argument("--repeat", type=int, default=20, help="Samples per benchmark")
+    parser.add_argument("--sample-ms", type=float, default=20.0, help="Shortest duration of one sample")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--save", metavar="FILE", help="Write the results as a baseline")
+    group.add_argument("--compare", metavar="FILE", help="Compare with a baseline and fail on regressions")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Slowdown, as a fraction, that fails --compare")
+    parser.add_argument("--retries", type=int, default=2,
+                        help="Times a regressed benchmark is measured again before it fails --compare")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.functions.split(",") if name.strip()]
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}; known: {', '.join(CASES)}")
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    results = run_suite(names, sizes, args.repeat, args.sample_ms / 1000)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline.get("environment") != environment():
+            print(f"Warning: the baseline was recorded on {baseline.get('environment')}, "
+                  f"numbers may not be comparable", file=sys.stderr)
+        rows = compare(baseline["results"], results, args.threshold)
+        for _ in range(args.retries):
+            # A slowdown that does not reproduce was noise from other processes
+            regressed = [key for key, _, _, verdict in rows if verdict == "regressed"]
+            if not regressed:
+                break
+            remeasure(results, regressed, args.repeat, args.sample_ms / 1000)
+            rows = compare(baseline["results"], results, args.threshold)
+        print(f"{'benchmark':<32} {'baseline us':>12} {'current us':>12} {'change':>8}  verdict")
+        for key, before, after, verdict in rows:
+            change = f"{(after / before - 1) * 100:>+7.1f}%" if before and after else f"{'-':>8}"
+            print(f"{key:<32} {format_us(before)} {format_us(after)} {change}  {verdict}")
+        regressed = [row for row in rows if row[3] == "regressed"]
+        if regressed:
+            print(f"\n{len(regressed)} benchmarks regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+        return
+
+    print(f"{'benchmark':<32} {'best us':>12} {'median us':>12} {'calls':>7}")
+    for key, result in results.items():
+        print(f"{key:<32} {format_us(result['best'])} {format_us(result['median'])} {result['inner']:>7}")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump({
+                "created": datetime.now(timezone.utc).isoformat(),
+                "environment": environment(),
+                "results": results,
+            }, file, indent=2)
+        print(f"\nBaseline written to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Event-loop lag while encoding states inline vs in the offload process pool.
+
+A probe coroutine sleeps for a fixed interval and records how late it wakes up;
+meanwhile `--concurrency` coroutines encode states the way `GET /state` does.
+Lag percentiles show how long other requests would wait behind the encoding.
+
+Run from schedge-backend:
+    python -m benchmarks.bench_offload [--sizes 50,500] [--workers 2] [--requests 40]
+"""
+import argparse
+import asyncio
+import time
+
+import bson
+
+from main import render_state
+from offload import Offloader
+from solver_client import percentile
+from benchmarks.fixtures import make_state
+
+PROBE_INTERVAL = 0.001
+
+
+async def probe(lags, stop):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def measure(offloader, state, requests, concurrency):
+    tasks = b"".join(bson.encode(task) for task in state["tasks"])
+    slots = b"".join(bson.encode(slot) for slot in state["slots"])
+    size = len(tasks) + len(slots)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await offloader.run(size, render_state, state["userId"], tasks, slots, True)
+
+    lags, stop = [], asyncio.Event()
+    prober = asyncio.create_task(probe(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    return size, elapsed, lags
+
+
+async def run(args):
+    modes = {"inline": Offloader(workers=0), "pool": Offloader(workers=args.workers, threshold=0)}
+    for offloader in modes.values():
+        await offloader.start()
+    try:
+        print(f"{'tasks':>6} {'mode':>7} {'bytes':>10} {'req/s':>8} {'lag p50 ms':>11} {'lag p99 ms':>11} {'lag max ms':>11}")
+        for count in (int(size) for size in args.sizes.split(",")):
+            state = make_state(count)
+            for name, offloader in modes.items():
+                size, elapsed, lags = await measure(offloader, state, args.requests, args.concurrency)
+                lags = sorted(lags) or [0.0]
+                print(f"{count:>6} {name:>7} {size:>10} {args.requests / elapsed:>8.1f}"
+                      f" {percentile(lags, 0.5) * 1000:>11.2f} {percentile(lags, 0.99) * 1000:>11.2f}"
+                      f" {lags[-1] * 1000:>11.2f}")
+    finally:
+        for offloader in modes.values():
+            await offloader.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="50,500", help="Comma-separated task counts")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
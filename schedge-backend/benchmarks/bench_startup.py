@@ -0,0 +1,79 @@
+"""
+Startup-time benchmark.
+
+Measures, in fresh interpreters:
+- the cost of `import main`,
+- the cost of `create_app()`,
+- optionally (with --mongo-uri) the full on_startup phase up to readiness.
+
+Run from schedge-backend:
+    python -m benchmarks.bench_startup [--runs 10] [--mongo-uri mongodb://localhost:27017]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = r"""
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+app = main.create_app(main.Config(mongo_uri=sys.argv[1] or None))
+t2 = time.perf_counter()
+result = {"import": t1 - t0, "create_app": t2 - t1}
+if sys.argv[1]:
+    from aiohttp.test_utils import TestServer
+    async def start():
+        server = TestServer(app)
+        t3 = time.perf_counter()
+        await server.start_server()
+        result["startup"] = time.perf_counter() - t3
+        result["ready"] = app[main.READY_KEY]
+        await server.close()
+    asyncio.run(start())
+print(json.dumps(result))
+"""
+
+
+def run_probe(mongo_uri):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, mongo_uri or ""],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "min_ms": samples[0] * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--mongo-uri", default=None, help="Also measure on_startup against this Mongo instance")
+    args = parser.parse_args()
+
+    results = [run_probe(args.mongo_uri) for _ in range(args.runs)]
+    for phase in ("import", "create_app", "startup"):
+        samples = [r[phase] for r in results if phase in r]
+        if not samples:
+            continue
+        stats = summarize(samples)
+        print(f"{phase:>10}: min {stats['min_ms']:8.2f} ms  "
+              f"median {stats['median_ms']:8.2f} ms  max {stats['max_ms']:8.2f} ms")
+    if args.mongo_uri:
+        ready = sum(1 for r in results if r.get("ready"))
+        print(f"{'ready':>10}: {ready}/{len(results)} runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+WebSocket state frames: JSON text vs the binary schedge.msgpack encoding.
+
+For every state size, reports the time to encode a state the way
+`emit_state` does (from fix_object_id'd documents) and to decode it on the
+client, and the frame size before and after permessage-deflate, which /ws
+negotiates by default.
+
+Run from schedge-backend:
+    python -m benchmarks.bench_ws_encoding [--sizes 1,50,500] [--repeat 20]
+"""
+import argparse
+import json
+import time
+import zlib
+
+import msgpack
+
+import ws_codec
+from benchmarks.fixtures import make_state
+
+
+def best_of(repeat, function, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def deflated_size(data):
+    # permessage-deflate: raw deflate with a sync flush, as aiohttp sends it
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return len(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH))
+
+
+def encode_json(state):
+    return json.dumps(state).encode()
+
+
+def encode_msgpack(state):
+    ws_codec.epoch_minutes.cache_clear()
+    return ws_codec.encode_state(state["userId"], state["tasks"], state["slots"])
+
+
+FORMATS = {
+    "json": (encode_json, json.loads),
+    "msgpack": (encode_msgpack, msgpack.unpackb),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,50,500", help="Comma-separated task counts")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'tasks':>6} {'format':>8} {'bytes':>10} {'deflated':>10} {'encode ms':>10} {'decode ms':>10}")
+    for count in (int(size) for size in args.sizes.split(",")):
+        state = make_state(count)
+        for name, (encode, decode) in FORMATS.items():
+            frame, encode_seconds = best_of(args.repeat, encode, state)
+            _, decode_seconds = best_of(args.repeat, decode, frame)
+            print(f"{count:>6} {name:>8} {len(frame):>10} {deflated_size(frame):>10}"
+                  f" {encode_seconds * 1000:>10.3f} {decode_seconds * 1000:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Realistic generated inputs for the benchmarks.
+
+Tasks and slots have the shape they have after `fix_object_id`, i.e. what
+`emit_state` and `GET /state` send to clients.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+import bson
+
+COLORS = ["#3498DB", "#FFD700", "#2ECC71", "#E74C3C", "#9B59B6"]
+NAMES = ["Reading", "Walk with a friend", "Work on the project", "Gym", "Team sync", "Groceries"]
+DESCRIPTIONS = [None, "Rationality: from AI to Zombies", "Weekly planning", "Chapter 3 and exercises"]
+
+START = datetime(2025, 4, 28, tzinfo=timezone.utc)
+
+
+def make_task(rng, index, user_id=1):
+    kind = rng.choice(["fixed", "continuous", "project"])
+    day = START + timedelta(days=rng.randrange(28), hours=rng.randrange(8, 20))
+    task = {
+        "id": str(bson.ObjectId()),
+        "type": kind,
+        "name": f"{rng.choice(NAMES)} {index}",
+        "description": rng.choice(DESCRIPTIONS),
+        "color": rng.choice(COLORS),
+        "leisure": rng.random() < 0.3,
+        "dependencies": [],
+        "nonce": rng.randrange(1, 10),
+        "userId": user_id,
+    }
+    if kind == "fixed":
+        task["start"] = day.isoformat()
+        task["end"] = (day + timedelta(minutes=rng.choice([30, 60, 90, 120]))).isoformat()
+    else:
+        task["kickoff"] = day.isoformat()
+        task["deadline"] = (day + timedelta(days=rng.randrange(1, 7))).isoformat()
+        task["duration"] = f"PT{rng.choice([30, 60, 90, 180])}M"
+        if kind == "project":
+            task["timings"] = {
+                "work": "PT25M",
+                "smallBreak": "PT5M",
+                "bigBreak": "PT15M",
+                "numberOfSmallBreaks": 3,
+            }
+    return task
+
+
+def make_tasks(count, seed=0, user_id=1):
+    """
+    Args:
+        count (int): Number of tasks
+        seed (int): Seed for reproducible output
+
+    Returns:
+        list[dict]: A mix of fixed, continuous and project tasks
+    """
+    rng = random.Random(seed)
+    return [make_task(rng, index, user_id) for index in range(count)]
+
+
+def make_slots(tasks, seed=0, user_id=1):
+    """
+    Build a plausible schedule: one slot per fixed or continuous task
+    and a few per project, each embedding its task like solver output does.
+    """
+    rng = random.Random(seed)
+    slots = []
+    for task in tasks:
+        pieces = 4 if task["type"] == "project" else 1
+        for _ in range(pieces):
+            start = START + timedelta(days=rng.randrange(28), minutes=5 * rng.randrange(12 * 24))
+            slots.append({
+                "id": str(bson.ObjectId()),
+                "start": start.isoformat(),
+                "end": (start + timedelta(minutes=25)).isoformat(),
+                "task": {k: v for k, v in task.items() if k != "userId"},
+                "userId": user_id,
+            })
+    return slots
+
+
+def make_state(count, seed=0, user_id=1):
+    """
+    Returns:
+        dict: A state message as sent by emit_state, with `count` tasks
+    """
+    tasks = make_tasks(count, seed, user_id)
+    return {
+        "userId": user_id,
+        "tasks": tasks,
+        "slots": make_slots(tasks, seed, user_id),
+    }
+
+
+
+def make_raw_task(rng, index):
+    """
+    A task as a client sends it: times with seconds and a `Z` suffix, and
+    durations in hours and days, so that normalization has work to do.
+    """
+    task = make_task(rng, index)
+    del task["userId"]
+    for field in ("start", "end", "kickoff", "deadline"):
+        if field in task:
+            moment = datetime.fromisoformat(task[field]) + timedelta(seconds=rng.randrange(60))
+            task[field] = moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+    if "duration" in task:
+        task["duration"] = rng.choice(["PT45M", "PT1H30M", "PT2H", "P1DT4H", "PT90M"])
+    if "timings" in task:
+        task["timings"]["work"] = rng.choice(["PT25M", "PT1H"])
+    return task
+
+
+def make_raw_tasks(count, seed=0):
+    """
+    Returns:
+        list[dict]: `count` tasks as sent to POST /task
+    """
+    rng = random.Random(seed)
+    return [make_raw_task(rng, index) for index in range(count)]
+
+
+def make_stored_tasks(count, seed=0, user_id=1):
+    """
+    Returns:
+        list[dict]: `count` tasks as read from the database, with an ObjectId `_id`
+    """
+    return [
+        {"_id": bson.ObjectId(task.pop("id")), **task}
+        for task in make_tasks(count, seed, user_id)
+    ]
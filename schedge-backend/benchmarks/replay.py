@@ -0,0 +1,259 @@
+"""
+Replay captured traffic against one or two backends.
+
+Entries recorded with CAPTURE_FILE (see capture.py) are re-issued at their
+original offsets divided by `--speed`, each request on its own task, so
+requests that overlapped in the capture overlap again. WebSocket connections
+are opened, fed their inbound messages and closed at their recorded times.
+
+The report lists latency percentiles per route and target. With one target,
+responses are compared with the captured ones by status and body digest;
+with two, the responses of both targets are compared with each other.
+Requests whose bodies were not captured (e.g. iCalendar uploads) are skipped.
+
+Run from schedge-backend:
+    python -m benchmarks.replay capture.jsonl --target http://localhost:5000 [--target http://other:5000]
+        [--speed 10] [--limit 1000] [--diffs 10] [--output results.jsonl]
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+
+import aiohttp
+
+from capture import body_digest, normalize
+from solver_client import percentile
+
+
+def load(path, limit=None):
+    """
+    Returns:
+        list[dict]: Captured entries ordered by time
+    """
+    entries = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                entries.append(json.loads(line))
+    entries.sort(key=lambda entry: entry["t"])
+    return entries[:limit] if limit else entries
+
+
+def json_diff(a, b, path="$"):
+    """
+    Returns:
+        list[str]: Paths at which two JSON values differ
+    """
+    if isinstance(a, dict) and isinstance(b, dict):
+        diffs = []
+        for key in sorted(set(a) | set(b), key=str):
+            if key not in a or key not in b:
+                diffs.append(f"{path}.{key}")
+            else:
+                diffs.extend(json_diff(a[key], b[key], f"{path}.{key}"))
+        return diffs
+    if isinstance(a, list) and isinstance(b, list):
+        if len(a) != len(b):
+            return [f"{path} (length {len(a)} != {len(b)})"]
+        diffs = []
+        for index, (x, y) in enumerate(zip(a, b)):
+            diffs.extend(json_diff(x, y, f"{path}[{index}]"))
+        return diffs
+    return [] if a == b else [path]
+
+
+def describe_difference(first, second):
+    """
+    Summarize how two replayed responses differ.
+
+    Returns:
+        str | None: None if they match
+    """
+    if first["status"] != second["status"]:
+        return f"status {first['status']} != {second['status']}"
+    if first["digest"] == second["digest"]:
+        return None
+    try:
+        paths = json_diff(normalize(json.loads(first["body"])), normalize(json.loads(second["body"])))
+    except ValueError:
+        return "body differs"
+    shown = ", ".join(paths[:5]) + (f" and {len(paths) - 5} more" if len(paths) > 5 else "")
+    return f"body differs at {shown}"
+
+
+class Replayer:
+    """
+    Re-issues captured entries against `targets`.
+
+    Args:
+        session (ClientSession): Session used for all targets
+        targets (list[str]): Base URLs, e.g. http://localhost:5000
+        speed (float): Time compression factor, 1 replays in real time
+    """
+
+    def __init__(self, session, targets, speed=1.0):
+        self.session = session
+        self.targets = targets
+        self.speed = speed
+        # (target, route) -> latencies in seconds
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.results = []
+        self.skipped = 0
+        self.sockets = {}
+        self.last_event = {}
+        self.received = defaultdict(int)
+        self.late = 0.0
+
+    async def run(self, entries):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        pending = []
+        for entry in entries:
+            delay = started + entry["t"] / self.speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.late = max(self.late, -delay)
+            handler = getattr(self, f"on_{entry['type']}", None)
+            if handler is None:
+                continue
+            if "conn" in entry:
+                # Events of one WebSocket connection must not overtake each other
+                task = asyncio.create_task(self.after(self.last_event.get(entry["conn"]), handler(entry)))
+                self.last_event[entry["conn"]] = task
+            else:
+                task = asyncio.create_task(handler(entry))
+            pending.append(task)
+        await asyncio.gather(*pending)
+        for connections in list(self.sockets.values()):
+            for ws, reader in connections:
+                await ws.close()
+                await reader
+
+    @staticmethod
+    async def after(previous, coroutine):
+        if previous is not None:
+            await previous
+        await coroutine
+
+    async def request(self, target, entry):
+        headers = dict(entry.get("headers") or {})
+        data = entry["body"].encode() if entry.get("body") is not None else None
+        started = time.perf_counter()
+        try:
+            async with self.session.request(entry["method"], target + entry["path"], data=data,
+                                            headers=headers, allow_redirects=False) as resp:
+                body = await resp.read()
+                status = resp.status
+        except aiohttp.ClientError as e:
+            body, status = str(e).encode(), 0
+        elapsed = time.perf_counter() - started
+        route = f"{entry['method']} {entry.get('route') or entry['path']}"
+        self.latencies[(target, route)].append(elapsed)
+        if status == 0 or status >= 500:
+            self.errors[(target, route)] += 1
+        return {"status": status, "digest": body_digest(body), "body": body,
+                "captured_digest": body_digest(body, entry.get("redacted", False)), "latency": elapsed}
+
+    async def on_http(self, entry):
+        if entry.get("body") is None and entry.get("body_size"):
+            self.skipped += 1
+            return
+        responses = await asyncio.gather(*(self.request(target, entry) for target in self.targets))
+        if len(responses) == 2:
+            difference = describe_difference(*responses)
+        elif responses[0]["status"] != entry["status"]:
+            difference = f"status {entry['status']} (captured) != {responses[0]['status']}"
+        elif "response_digest" in entry and responses[0]["captured_digest"] != entry["response_digest"]:
+            difference = "body differs from the captured response"
+        else:
+            difference = None
+        self.results.append({
+            "t": entry["t"],
+            "method": entry["method"],
+            "path": entry["path"],
+            "captured_status": entry["status"],
+            "responses": [{key: response[key] for key in ("status", "digest", "latency")} for response in responses],
+            "difference": difference,
+        })
+
+    async def on_ws_open(self, entry):
+        connections = []
+        for target in self.targets:
+            url = target.replace("http", "ws", 1) + entry["path"]
+            try:
+                ws = await self.session.ws_connect(url)
+            except aiohttp.ClientError:
+                self.errors[(target, "WS " + entry["path"])] += 1
+                continue
+            connections.append((ws, asyncio.create_task(self.drain(target, ws))))
+        self.sockets[entry["conn"]] = connections
+
+    async def drain(self, target, ws):
+        async for _ in ws:
+            self.received[target] += 1
+
+    async def on_ws_message(self, entry):
+        for ws, _ in self.sockets.get(entry["conn"], []):
+            if not ws.closed and "data" in entry:
+                await ws.send_str(entry["data"])
+
+    async def on_ws_close(self, entry):
+        for ws, reader in self.sockets.pop(entry["conn"], []):
+            await ws.close()
+            await reader
+
+    def report(self, diffs=10):
+        print(f"{'target':<28} {'route':<52} {'count':>6} {'err':>5}"
+              f" {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for (target, route), samples in sorted(self.latencies.items()):
+            print(f"{target:<28} {route:<52} {len(samples):>6} {self.errors[(target, route)]:>5}"
+                  f" {percentile(samples, 0.5) * 1000:>8.1f} {percentile(samples, 0.9) * 1000:>8.1f}"
+                  f" {percentile(samples, 0.99) * 1000:>8.1f} {max(samples) * 1000:>8.1f}")
+
+        differing = [result for result in self.results if result["difference"]]
+        print(f"\n{len(self.results)} requests replayed, {self.skipped} skipped, {len(differing)} responses differ")
+        for target in self.targets:
+            if self.received[target]:
+                print(f"{target}: {self.received[target]} WebSocket messages received")
+        if self.late > 0.1:
+            print(f"Replay fell behind the schedule by up to {self.late * 1000:.0f} ms; lower --speed")
+        for result in differing[:diffs]:
+            print(f"  {result['method']} {result['path']}: {result['difference']}")
+
+
+async def run(args):
+    entries = load(args.capture, args.limit)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        replayer = Replayer(session, [target.rstrip("/") for target in args.target], args.speed)
+        await replayer.run(entries)
+    replayer.report(args.diffs)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            for result in replayer.results:
+                file.write(json.dumps(result) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", help="JSONL file written by the backend with CAPTURE_FILE")
+    parser.add_argument("--target", action="append", required=True,
+                        help="Base URL of a backend; give twice to compare two builds")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed-up, e.g. 10 for 10x")
+    parser.add_argument("--limit", type=int, default=None, help="Replay only the first N entries")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--diffs", type=int, default=10, help="Differing responses to print")
+    parser.add_argument("--output", help="Write per-request results to this JSONL file")
+    args = parser.parse_args()
+    if len(args.target) > 2:
+        parser.error("at most two targets can be compared")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
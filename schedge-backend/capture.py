@@ -0,0 +1,260 @@
+"""
+Recording of API traffic for replay (see benchmarks/replay.py).
+
+`capture_middleware` writes one JSON line per API request, and the WebSocket
+handler adds one per connection, inbound message and disconnect. Entries carry
+the time since recording started, so the replay can reproduce both the pacing
+and the concurrency of the original traffic.
+
+Captures are sanitized: admin endpoints are skipped, only a few harmless
+headers are kept, bodies are recorded only when they are JSON and small, and
+free-text task fields are masked unless `redact` is off.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from aiohttp import hdrs, web
+
+logger = logging.getLogger(__name__)
+
+# Request headers worth replaying. If-Match carries client-side nonces; ETags for If-None-Match
+# depend on the server's state, and credentials are never recorded.
+RECORDED_HEADERS = ("Content-Type", "Accept", "Accept-Encoding", "If-Match")
+# Task fields holding user-written text
+REDACTED_FIELDS = ("name", "description")
+# Response fields that differ between runs on the same workload
+VOLATILE_FIELDS = ("_id", "version")
+
+
+def redact(value):
+    """
+    Mask user-written text in a JSON value, keeping string lengths.
+
+    Returns:
+        The value with the strings of REDACTED_FIELDS replaced by "x"s
+    """
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    if isinstance(value, dict):
+        return {
+            key: "x" * len(item) if key in REDACTED_FIELDS and isinstance(item, str) else redact(item)
+            for key, item in value.items()
+        }
+    return value
+
+
+def normalize(value):
+    """Drop VOLATILE_FIELDS from a JSON value so that responses of two runs can be compared."""
+    if isinstance(value, list):
+        return [normalize(item) for item in value]
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items() if key not in VOLATILE_FIELDS}
+    return value
+
+
+def body_digest(body, redacted=False):
+    """
+    Fingerprint of a response body, insensitive to VOLATILE_FIELDS and key order for JSON.
+
+    Args:
+        body (bytes): The body
+        redacted (bool): Mask free-text fields first, for bodies echoing a redacted request
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    try:
+        value = normalize(json.loads(body))
+        body = json.dumps(redact(value) if redacted else value, sort_keys=True).encode()
+    except ValueError:
+        pass
+    return hashlib.sha256(body).hexdigest()
+
+
+class TrafficRecorder:
+    """
+    Buffers traffic entries and appends them to a JSONL file.
+
+    Entries are written from a thread every `interval` seconds. When the
+    buffer is full new entries are dropped and counted, so recording never
+    slows requests down.
+
+    Args:
+        path (str): File to append to
+        max_body (int): Largest request body recorded, in bytes
+        redact (bool): Mask free-text task fields in recorded bodies
+        interval (float): Seconds between writes
+        max_queue (int): Most entries buffered between writes
+    """
+
+    def __init__(self, path, max_body=64 * 1024, redact=True, interval=1.0, max_queue=10000):
+        self.path = path
+        self.max_body = max_body
+        self.redact = redact
+        self.interval = interval
+        self.queue = deque()
+        self.max_queue = max_queue
+        self.recorded = 0
+        self.dropped = 0
+        self.started = time.monotonic()
+        self._task = None
+
+    @classmethod
+    def from_config(cls, config):
+        if not config.capture_file:
+            return None
+        return cls(config.capture_file, max_body=config.capture_max_body, redact=config.capture_redact)
+
+    def elapsed(self):
+        return round(time.monotonic() - self.started, 6)
+
+    def record(self, entry):
+        if len(self.queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self.queue.append(entry)
+
+    def ws_open(self, connection_id, user_id, path):
+        self.record({"type": "ws_open", "t": self.elapsed(), "conn": str(connection_id),
+                     "user_id": user_id, "path": path})
+
+    def ws_message(self, connection_id, data):
+        entry = {"type": "ws_message", "t": self.elapsed(), "conn": str(connection_id), "size": len(data)}
+        if len(data) <= self.max_body:
+            entry["data"] = data
+        self.record(entry)
+
+    def ws_close(self, connection_id):
+        self.record({"type": "ws_close", "t": self.elapsed(), "conn": str(connection_id)})
+
+    def encode_body(self, request, body):
+        """
+        Returns:
+            str | None: The request body as recorded, or None if it is not recorded
+        """
+        if not body or request.content_type != "application/json":
+            return None
+        text = body.decode("utf-8", errors="replace")
+        if not self.redact:
+            return text
+        try:
+            return json.dumps(redact(json.loads(text)))
+        except ValueError:
+            return None
+
+    async def start(self):
+        self.started = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error writing captured traffic: {e!r}")
+
+    async def flush(self):
+        if not self.queue:
+            return
+        entries = [self.queue.popleft() for _ in range(len(self.queue))]
+        lines = "".join(json.dumps(entry) + "\n" for entry in entries)
+        await asyncio.get_running_loop().run_in_executor(None, self._append, lines)
+        self.recorded += len(entries)
+
+    def _append(self, lines):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(lines)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error writing captured traffic: {e!r}")
+
+    def stats(self):
+        return {"queued": len(self.queue), "recorded": self.recorded, "dropped": self.dropped}
+
+
+def user_id_of(request):
+    try:
+        return int(request.match_info.get("user_id"))
+    except (TypeError, ValueError):
+        return None
+
+
+def capture_middleware(recorder):
+    """
+    Build a middleware that records API requests with `recorder`.
+
+    It should be the innermost middleware, so that it sees uncompressed
+    responses. WebSocket connections are recorded by their handler.
+
+    Args:
+        recorder (TrafficRecorder): Where requests are recorded
+
+    Returns:
+        Callable: The aiohttp middleware
+    """
+
+    @web.middleware
+    async def middleware(request, handler):
+        if (not request.path.startswith("/api/v0/user/")
+                or request.headers.get(hdrs.UPGRADE, "").lower() == "websocket"):
+            return await handler(request)
+
+        t = recorder.elapsed()
+        body = None
+        # Only bodies of known, small size are read here; others (e.g. iCalendar uploads) are streamed
+        length = request.content_length
+        if request.body_exists and length is not None and length <= recorder.max_body:
+            body = await request.read()
+
+        resource = request.match_info.route.resource
+        entry = {
+            "type": "http",
+            "t": t,
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "user_id": user_id_of(request),
+            "method": request.method,
+            "path": request.path_qs,
+            "route": resource.canonical if resource is not None else None,
+            "headers": {name: request.headers[name] for name in RECORDED_HEADERS if name in request.headers},
+            "body": recorder.encode_body(request, body),
+            "body_size": length,
+            "redacted": recorder.redact,
+        }
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await handler(request)
+            return response
+        except web.HTTPException as e:
+            response = e
+            raise
+        finally:
+            entry["duration"] = round(time.perf_counter() - started, 6)
+            entry["status"] = response.status if response is not None else 500
+            response_body = getattr(response, "body", None)
+            if isinstance(response_body, bytes):
+                entry["response_size"] = len(response_body)
+                entry["response_digest"] = body_digest(response_body, recorder.redact)
+            recorder.record(entry)
+
+    return middleware
@@ -0,0 +1,199 @@
+import asyncio
+import gzip
+import logging
+
+from aiohttp import hdrs, web
+
+logger = logging.getLogger(__name__)
+
+try:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+
+def available_encodings():
+    """
+    Returns:
+        list[str]: Content codings this process can produce, best first
+    """
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def parse_encoding_list(value):
+    """
+    Parse a comma-separated list of preferred encodings from the configuration,
+    dropping the ones that are not installed.
+
+    Args:
+        value (str): e.g. "zstd,br,gzip"
+
+    Returns:
+        list[str]: Usable encodings in order of preference
+    """
+    available = available_encodings()
+    return [coding for coding in (item.strip().lower() for item in value.split(",")) if coding in available]
+
+
+def parse_accept_encoding(header):
+    """
+    Parse an Accept-Encoding header.
+
+    Args:
+        header (str): The header value, e.g. "gzip, br;q=0.9"
+
+    Returns:
+        dict[str, float]: Quality value for every listed coding
+    """
+    accepted = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def choose_encoding(header, supported):
+    """
+    Pick the content coding for a response.
+
+    The client's quality values decide; the server's order of preference
+    breaks ties.
+
+    Args:
+        header (str | None): The request's Accept-Encoding header
+        supported (list[str]): Codings the server may use, best first
+
+    Returns:
+        str | None: The chosen coding, or None to send the body as is
+    """
+    if not header:
+        return None
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+
+    best, best_quality = None, 0.0
+    for coding in supported:
+        quality = accepted.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(data, encoding):
+    """
+    Compress a body with the given content coding.
+
+    Args:
+        data (bytes): The body
+        encoding (str): "gzip", "br" or "zstd"
+
+    Returns:
+        bytes: The compressed body
+    """
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def add_encoding_suffix(etag, encoding):
+    """
+    Derive the strong ETag of an encoded representation, e.g. "a-1" -> "a-1-gzip".
+    """
+    if etag.startswith('"') and etag.endswith('"'):
+        return f'{etag[:-1]}-{encoding}"'
+    return etag
+
+
+def strip_encoding_suffix(etag):
+    """
+    Inverse of `add_encoding_suffix` for every coding this module can produce.
+    """
+    for encoding in ("gzip", "br", "zstd"):
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+def compression_middleware(encodings, min_size=1024, executor_size=64 * 1024):
+    """
+    Build a middleware that compresses response bodies negotiated from Accept-Encoding.
+
+    Bodies smaller than `min_size` are sent as is, since the framing overhead
+    outweighs the savings. Bodies of at least `executor_size` bytes are
+    compressed in the default executor so the event loop is not blocked.
+    WebSocket and streamed responses are left alone.
+
+    Args:
+        encodings (list[str]): Codings the server may use, best first
+        min_size (int): Smallest body that is compressed, in bytes
+        executor_size (int): Smallest body that is compressed off the event loop
+
+    Returns:
+        Callable: The aiohttp middleware
+    """
+
+    @web.middleware
+    async def middleware(request, handler):
+        response = await handler(request)
+
+        if not isinstance(response, web.Response) or not encodings:
+            return response
+        body = response.body
+        if not isinstance(body, (bytes, bytearray)) or hdrs.CONTENT_ENCODING in response.headers:
+            return response
+
+        response.headers.add(hdrs.VARY, hdrs.ACCEPT_ENCODING)
+        if len(body) < min_size:
+            return response
+
+        encoding = choose_encoding(request.headers.get(hdrs.ACCEPT_ENCODING), encodings)
+        if encoding is None:
+            return response
+
+        if len(body) >= executor_size:
+            loop = asyncio.get_running_loop()
+            compressed = await loop.run_in_executor(None, compress, bytes(body), encoding)
+        else:
+            compressed = compress(bytes(body), encoding)
+
+        response.body = compressed
+        response.headers[hdrs.CONTENT_ENCODING] = encoding
+        if hdrs.ETAG in response.headers:
+            response.headers[hdrs.ETAG] = add_encoding_suffix(response.headers[hdrs.ETAG], encoding)
+        return response
+
+    return middleware
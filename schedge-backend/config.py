@@ -0,0 +1,194 @@
+import os
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Config:
+    """
+    Runtime configuration of the backend.
+
+    Every field can be set through an environment variable of the same name
+    in upper case (see `Config.from_env`).
+    """
+    mongo_uri: str | None = None
+    db_name: str = "schedge"
+    # Comma-separated list of solver URLs, e.g. http://solver-0:6000/schedule,http://solver-1:6000/schedule
+    solver_server_url: str | None = None
+    backend_host_address: str = "localhost"
+    backend_port: int = 5000
+
+    # Number of Mongo connections opened before the readiness probe passes
+    mongo_min_pool_size: int = 4
+    mongo_max_pool_size: int = 100
+    # Reads of users' state (GET /state, /task, /slot and WebSocket updates) go to the replica set
+    # members picked by MONGO_READ_PREFERENCE (primary, primaryPreferred, secondary,
+    # secondaryPreferred or nearest) that lag at most MONGO_MAX_STALENESS seconds behind the
+    # primary (0 for no limit, otherwise at least 90), with read concern MONGO_READ_CONCERN.
+    # Writes use MONGO_WRITE_CONCERN ("majority" or a number of members). The times of the last
+    # writes of up to CAUSAL_CACHE_USERS users are remembered so that their reads see them.
+    mongo_read_preference: str = "primary"
+    mongo_max_staleness: float = 0.0
+    mongo_read_concern: str = "majority"
+    mongo_write_concern: str = "majority"
+    causal_cache_users: int = 10000
+    # Upper bound for the warm-up phase, in seconds
+    warmup_timeout: float = 10.0
+
+    # Response compression: codings in order of preference (unavailable ones are skipped),
+    # the smallest body worth compressing, and the size from which it runs off the event loop
+    compression_encodings: str = "zstd,br,gzip"
+    compression_min_size: int = 1024
+    compression_executor_size: int = 64 * 1024
+    # permessage-deflate on /ws
+    ws_compress: bool = True
+
+    # Event-loop monitoring: seconds between lag samples, the stall after which the
+    # blocked stack is logged, and the request duration after which a request is logged
+    loop_lag_interval: float = 0.05
+    loop_block_threshold: float = 0.1
+    slow_request_threshold: float = 1.0
+    # Bearer token for /api/v0/admin/* (the admin endpoints are disabled if unset)
+    admin_token: str | None = None
+    profile_max_seconds: float = 60.0
+
+    # Memory accounting: every MEMORY_CHECK_INTERVAL seconds (0 disables the checks) closed
+    # WebSocket connections still registered are dropped and a warning is logged whenever the
+    # process's resident memory, or one user's approximate bytes held, WebSocket connections or
+    # pending background tasks, exceed a limit (0 disables a limit). MEMORY_TRACE_FRAMES frames
+    # are kept per allocation once tracemalloc is started from /api/v0/admin/memory/snapshot.
+    memory_check_interval: float = 60.0
+    memory_alert_rss_mb: int = 0
+    memory_alert_user_bytes: int = 16 * 1024 * 1024
+    memory_alert_user_connections: int = 20
+    memory_alert_user_tasks: int = 10
+    memory_trace_frames: int = 1
+
+    # Tracing: OTLP/JSON spans are appended to TRACE_EXPORT_FILE and/or posted to
+    # TRACE_EXPORT_URL (e.g. http://collector:4318/v1/traces); tracing is off if neither is set.
+    # TRACE_SAMPLE_RATIO of new traces are recorded; traces continued from a traceparent
+    # header keep the caller's decision.
+    trace_export_file: str | None = None
+    trace_export_url: str | None = None
+    trace_sample_ratio: float = 0.01
+    trace_export_interval: float = 5.0
+    trace_max_queue: int = 2048
+    trace_service_name: str = "schedge-backend"
+
+    # Traffic capture for benchmarks/replay.py: API requests and WebSocket messages are appended
+    # to CAPTURE_FILE as JSON lines (off if unset), with request bodies up to CAPTURE_MAX_BODY
+    # bytes and, if CAPTURE_REDACT, task names and descriptions masked
+    capture_file: str | None = None
+    capture_max_body: int = 64 * 1024
+    capture_redact: bool = True
+
+    # Worker processes for CPU-heavy work such as encoding large states (0 keeps
+    # everything on the event loop), and the input size in bytes from which a work item is sent to them
+    offload_workers: int = 2
+    offload_threshold: int = 256 * 1024
+
+    # Users whose task dependency graphs are kept in memory
+    dependency_cache_users: int = 10000
+    # Users whose busy times (fixed tasks and slots) are kept in memory for /freebusy
+    busy_cache_users: int = 10000
+
+    solver_timeout: float = 120.0
+    # Expand every solver host into one endpoint per resolved address
+    # (use with a headless Kubernetes service)
+    solver_resolve_dns: bool = False
+    solver_dns_refresh: float = 30.0
+    # Consecutive failures before a replica's circuit opens, and how long it stays open
+    solver_failure_threshold: int = 5
+    solver_reset_timeout: float = 30.0
+    # Duplicate requests slower than the given latency quantile to a second replica
+    solver_hedge: bool = False
+    solver_hedge_quantile: float = 0.95
+    solver_hedge_min_delay: float = 0.5
+    # Jobs arriving within this many seconds are sent to the solver as one batch
+    # (0 disables batching); larger task sets are always sent on their own
+    solver_batch_window: float = 0.01
+    solver_batch_max_size: int = 32
+    solver_batch_max_tasks: int = 50
+    # Scheduling jobs solving at once across the backend, interactive and background alike
+    solver_max_concurrency: int = 16
+
+    # What this process runs: "api" serves HTTP and WebSocket requests and only queues
+    # scheduling jobs; "worker" (python worker.py) runs the queued jobs, the background
+    # re-solving and the compaction; "all" does both, for local runs and tests. The loop
+    # and memory monitors run in every role.
+    role: str = "api"
+
+    # Asynchronous scheduling jobs are queued in JOB_STORE ("mongo", or "memory" to keep them in
+    # this process for local runs and tests, with ROLE=all) and run by SCHEDULING_WORKERS workers
+    # per worker process.
+    # A claimed job is leased for JOB_LEASE seconds and renewed while it runs, so the jobs of a
+    # crashed worker are claimed again once their lease expires. Failed jobs are retried up to
+    # JOB_MAX_ATTEMPTS runs, JOB_RETRY_DELAY seconds apart and doubling; finished jobs are kept
+    # for JOB_RETENTION seconds.
+    job_store: str = "mongo"
+    scheduling_workers: int = 2
+    job_lease: float = 30.0
+    job_poll_interval: float = 1.0
+    job_max_attempts: int = 3
+    job_retry_delay: float = 5.0
+    job_retention: float = 24 * 3600.0
+
+    # Background re-solving of stale schedules: a schedule is stale at the earliest deadline
+    # of its dynamic tasks or RESOLVE_MAX_AGE seconds after it was solved, and is re-solved
+    # up to RESOLVE_JITTER seconds later. Every RESOLVE_INTERVAL seconds (0 disables the worker)
+    # up to RESOLVE_BATCH due users are claimed for RESOLVE_LEASE seconds and re-solved,
+    # RESOLVE_CONCURRENCY at a time.
+    resolve_interval: float = 30.0
+    resolve_batch: int = 50
+    resolve_concurrency: int = 2
+    resolve_max_age: float = 6 * 3600.0
+    resolve_jitter: float = 900.0
+    resolve_lease: float = 300.0
+
+    # Compaction: every ARCHIVE_INTERVAL seconds (0 disables it) one replica, holding a lease of
+    # ARCHIVE_LEASE seconds, moves the slots and tasks that ended more than ARCHIVE_RETENTION
+    # seconds ago to the archived_slots and archived_tasks collections. Archived documents
+    # expire ARCHIVE_TTL seconds after they ended (0 keeps them).
+    archive_interval: float = 3600.0
+    archive_retention: float = 30 * 24 * 3600.0
+    archive_lease: float = 600.0
+    archive_ttl: float = 0.0
+
+    # Refuse task sets that cannot all fit around their fixed tasks before solving them,
+    # unless the request allows a partial schedule
+    feasibility_check: bool = True
+
+    # Task sets up to this size are scheduled in-process instead of by the solver,
+    # which is also used for any size while no solver replica is available
+    local_solver_max_tasks: int = 8
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """
+        Build a configuration from environment variables.
+
+        Args:
+            environ (Mapping | None): Variables to read, defaults to os.environ
+
+        Returns:
+            Config: The configuration with defaults for missing variables
+        """
+        if environ is None:
+            environ = os.environ
+
+        values = {}
+        for name, field in cls.__dataclass_fields__.items():
+            raw = environ.get(name.upper())
+            if raw is None or raw == "":
+                continue
+            values[name] = _parse_value(raw, field.type)
+        return cls(**values)
+
+
+def _parse_value(raw, field_type):
+    if field_type in (int, "int"):
+        return int(raw)
+    if field_type in (float, "float"):
+        return float(raw)
+    if field_type in (bool, "bool"):
+        return raw.strip().lower() in ("1", "true", "yes", "on")
+    return raw
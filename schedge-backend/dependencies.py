@@ -0,0 +1,366 @@
+"""
+Per-user task dependency graphs.
+
+A task's `dependencies` lists the IDs of tasks that must be done before it.
+`DependencyGraph` keeps these edges together with a topological order, which
+is maintained incrementally with the Pearce-Kelly algorithm: adding an edge
+that already agrees with the order costs nothing, and otherwise only the tasks
+between its two ends in the order are visited. The same search finds the
+cycle an edge would close, so invalid edits are rejected before they are
+written.
+
+`DependencyIndex` caches one graph per user, keyed by the user's state
+version, so that a graph is rebuilt from the database only after a write it
+did not see (e.g. from another replica).
+"""
+import asyncio
+import contextlib
+from collections import OrderedDict
+
+
+class DependencyError(ValueError):
+    """Raised for dependencies that reference unknown tasks or form a cycle."""
+
+
+class DependencyGraph:
+    """
+    Dependency edges of one user's tasks and a topological order of them.
+
+    References to tasks that do not exist (e.g. deleted ones) are kept aside
+    as dangling, so that they can be reported.
+
+    Args:
+        tasks (Iterable[tuple[str, Iterable[str]]]): (task ID, dependency IDs) pairs
+        version (int | None): State version the tasks were read at
+    """
+
+    def __init__(self, tasks=(), version=None):
+        self.version = version
+        # Task -> tasks it depends on, and the reverse
+        self.dependencies = {}
+        self.dependents = {}
+        # Task -> references to tasks that do not exist
+        self.missing = {}
+        # Task -> rank; ranks are distinct and increase along the order, with gaps
+        self.rank = {}
+        self.next_rank = 0
+        # Edges dropped while loading because they closed a cycle
+        self.rejected = []
+        self._order = None
+
+        tasks = [(task_id, list(dependencies)) for task_id, dependencies in tasks]
+        for task_id, _ in tasks:
+            self._add_node(task_id)
+        for task_id, dependencies in tasks:
+            for dependency in dict.fromkeys(dependencies):
+                if dependency not in self.rank:
+                    self.missing.setdefault(task_id, set()).add(dependency)
+                    continue
+                try:
+                    self._add_edge(task_id, dependency)
+                except DependencyError:
+                    self.rejected.append((task_id, dependency))
+
+    def __contains__(self, task_id):
+        return task_id in self.rank
+
+    def __len__(self):
+        return len(self.rank)
+
+    def _add_node(self, task_id):
+        if task_id in self.rank:
+            return
+        self.dependencies[task_id] = set()
+        self.dependents[task_id] = set()
+        self.rank[task_id] = self.next_rank
+        self.next_rank += 1
+        self._order = None
+
+    def _add_edge(self, task_id, dependency):
+        """
+        Record that `task_id` depends on `dependency`, reordering if needed.
+
+        Raises:
+            DependencyError: If the edge closes a cycle; the graph is unchanged
+        """
+        if dependency in self.dependencies[task_id]:
+            return
+        if task_id == dependency:
+            raise DependencyError(f"Task {task_id} cannot depend on itself")
+
+        lower, upper = self.rank[task_id], self.rank[dependency]
+        if upper < lower:
+            # The dependency already comes first
+            self.dependencies[task_id].add(dependency)
+            self.dependents[dependency].add(task_id)
+            return
+
+        # Tasks after task_id, up to the dependency's rank, that transitively depend on task_id
+        forward, parent = [], {task_id: None}
+        stack = [task_id]
+        while stack:
+            node = stack.pop()
+            forward.append(node)
+            for dependent in self.dependents[node]:
+                if dependent == dependency:
+                    parent[dependent] = node
+                    raise DependencyError(f"Dependency cycle: {self._cycle(parent, dependency)}")
+                if dependent not in parent and self.rank[dependent] < upper:
+                    parent[dependent] = node
+                    stack.append(dependent)
+
+        # Tasks before the dependency, down to task_id's rank, that it transitively depends on
+        backward, seen = [], {dependency}
+        stack = [dependency]
+        while stack:
+            node = stack.pop()
+            backward.append(node)
+            for prerequisite in self.dependencies[node]:
+                if prerequisite not in seen and self.rank[prerequisite] > lower:
+                    seen.add(prerequisite)
+                    stack.append(prerequisite)
+
+        # Reuse the ranks of both sets: the dependency's side first, then task_id's
+        backward.sort(key=self.rank.__getitem__)
+        forward.sort(key=self.rank.__getitem__)
+        ranks = sorted(self.rank[node] for node in backward + forward)
+        for node, rank in zip(backward + forward, ranks):
+            self.rank[node] = rank
+
+        self.dependencies[task_id].add(dependency)
+        self.dependents[dependency].add(task_id)
+        self._order = None
+
+    @staticmethod
+    def _cycle(parent, dependency):
+        # parent links lead from the dependency back to the task it would be added to
+        chain = [dependency]
+        while parent[chain[-1]] is not None:
+            chain.append(parent[chain[-1]])
+        # chain = [dependency, ..., task]; each element depends on the next
+        return " -> ".join([chain[-1]] + chain)
+
+    def _remove_edge(self, task_id, dependency):
+        self.dependencies[task_id].discard(dependency)
+        self.dependents[dependency].discard(task_id)
+
+    def check_new(self, dependencies):
+        """
+        Check the dependencies of a task that is about to be created.
+
+        A new task has no dependents, so it cannot close a cycle; only
+        unknown references are rejected.
+
+        Raises:
+            DependencyError: If a dependency does not exist
+        """
+        for dependency in dependencies:
+            if dependency not in self.rank:
+                raise DependencyError(f"Unknown dependency: {dependency}")
+
+    def add_task(self, task_id, dependencies):
+        """
+        Add a created task.
+
+        Raises:
+            DependencyError: If a dependency does not exist; the graph is unchanged
+        """
+        dependencies = list(dict.fromkeys(dependencies))
+        self.check_new(dependencies)
+        self._add_node(task_id)
+        for dependency in dependencies:
+            self._add_edge(task_id, dependency)
+
+    def set_dependencies(self, task_id, dependencies):
+        """
+        Replace a task's dependencies.
+
+        References that were already dangling may stay; new ones must exist.
+
+        Args:
+            task_id (str): The task
+            dependencies (Iterable[str]): Its new dependencies
+
+        Returns:
+            list[str]: The previous dependencies, to restore them if the write fails
+
+        Raises:
+            DependencyError: For unknown dependencies and cycles; the graph is unchanged
+        """
+        dependencies = list(dict.fromkeys(dependencies))
+        old_edges = set(self.dependencies[task_id])
+        old_missing = set(self.missing.get(task_id, ()))
+        previous = list(old_edges | old_missing)
+
+        missing = {dependency for dependency in dependencies if dependency not in self.rank}
+        unknown = sorted(missing - old_missing)
+        if unknown:
+            raise DependencyError(f"Unknown dependency: {unknown[0]}")
+
+        wanted = set(dependencies) - missing
+        for dependency in old_edges - wanted:
+            self._remove_edge(task_id, dependency)
+        added = []
+        try:
+            for dependency in dependencies:
+                if dependency in wanted and dependency not in old_edges:
+                    self._add_edge(task_id, dependency)
+                    added.append(dependency)
+        except DependencyError:
+            # Removing the new edges restores an acyclic graph, so the old ones fit back in
+            for dependency in added:
+                self._remove_edge(task_id, dependency)
+            for dependency in old_edges - wanted:
+                self._add_edge(task_id, dependency)
+            raise
+
+        if missing:
+            self.missing[task_id] = missing
+        else:
+            self.missing.pop(task_id, None)
+        self._order = None
+        return previous
+
+    def restore(self, task_id, previous):
+        """Undo `set_dependencies` after the write it was checked for failed."""
+        self.missing[task_id] = self.missing.get(task_id, set()) | {
+            dependency for dependency in previous if dependency not in self.rank
+        }
+        self.set_dependencies(task_id, previous)
+
+    def remove_task(self, task_id):
+        """Remove a deleted task; tasks depending on it now have a dangling reference."""
+        if task_id not in self.rank:
+            return
+        for dependent in self.dependents.pop(task_id):
+            self.dependencies[dependent].discard(task_id)
+            self.missing.setdefault(dependent, set()).add(task_id)
+        for dependency in self.dependencies.pop(task_id):
+            self.dependents[dependency].discard(task_id)
+        self.missing.pop(task_id, None)
+        del self.rank[task_id]
+        self._order = None
+
+    def order(self):
+        """
+        Returns:
+            list[str]: Task IDs, every task after the tasks it depends on
+        """
+        if self._order is None:
+            self._order = sorted(self.rank, key=self.rank.__getitem__)
+        return self._order
+
+    def dangling(self):
+        """
+        Returns:
+            dict[str, list[str]]: Task ID -> references to tasks that do not exist
+        """
+        return {task_id: sorted(missing) for task_id, missing in self.missing.items() if missing}
+
+
+def sort_tasks(tasks, graph):
+    """
+    Order tasks along a graph's topological order, dropping dangling references.
+
+    Args:
+        tasks (list[dict]): Tasks with string `id`s, e.g. after `fix_object_id`
+        graph (DependencyGraph): Graph of the same tasks
+
+    Returns:
+        list[dict]: The sorted tasks; tasks unknown to the graph come last
+    """
+    position = {task_id: index for index, task_id in enumerate(graph.order())}
+    result = []
+    for task in sorted(tasks, key=lambda task: position.get(task["id"], len(position))):
+        dangling = graph.missing.get(task["id"])
+        if dangling:
+            task = {**task, "dependencies": [item for item in task["dependencies"] if item not in dangling]}
+        result.append(task)
+    return result
+
+
+class DependencyIndex:
+    """
+    Cache of users' dependency graphs.
+
+    Args:
+        max_users (int): Graphs kept, least recently used ones are evicted
+    """
+
+    def __init__(self, max_users=10000):
+        self.max_users = max_users
+        self.graphs = OrderedDict()
+        self._locks = {}
+        self.builds = 0
+
+    def cached(self, user_id, version):
+        """
+        Returns:
+            DependencyGraph | None: The user's graph if it is up to date with `version`
+        """
+        graph = self.graphs.get(user_id)
+        if graph is None or graph.version != version:
+            return None
+        self.graphs.move_to_end(user_id)
+        return graph
+
+    def store(self, user_id, graph):
+        self.graphs[user_id] = graph
+        self.graphs.move_to_end(user_id)
+        while len(self.graphs) > self.max_users:
+            self.graphs.popitem(last=False)
+
+    async def get(self, db, user_id, version):
+        """
+        The user's graph at `version`, rebuilt from the database if the cached one is older.
+
+        Args:
+            db (AsyncDatabase): The database
+            user_id (int): The user
+            version (int): The user's current state version, read before calling
+        """
+        graph = self.cached(user_id, version)
+        if graph is None:
+            tasks = await db.tasks.find({"userId": user_id}, {"_id": 1, "dependencies": 1}).to_list(None)
+            graph = DependencyGraph(
+                ((str(task["_id"]), task.get("dependencies") or []) for task in tasks),
+                version=version,
+            )
+            self.builds += 1
+            self.store(user_id, graph)
+        return graph
+
+    def committed(self, user_id, graph, version):
+        """
+        Record that a write applied to `graph` produced state `version`.
+
+        If another write happened in between, the graph is dropped and
+        rebuilt on next use.
+        """
+        if graph.version is not None and version == graph.version + 1:
+            graph.version = version
+        else:
+            self.invalidate(user_id)
+
+    def invalidate(self, user_id):
+        self.graphs.pop(user_id, None)
+
+    @contextlib.asynccontextmanager
+    async def editing(self, user_id):
+        """Serialize the edits of one user's tasks and slots on this replica."""
+        lock, users = self._locks.get(user_id, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[user_id] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[user_id]
+            if users == 1:
+                del self._locks[user_id]
+            else:
+                self._locks[user_id] = (lock, users - 1)
+
+    def stats(self):
+        return {"users": len(self.graphs), "builds": self.builds}
@@ -0,0 +1,294 @@
+"""
+Event-loop health and request timing.
+
+- `LoopMonitor` measures event-loop lag continuously. A watchdog thread logs
+  the stack of the loop thread, labelled with the aiohttp handler it is in,
+  whenever the loop stops ticking for longer than a threshold.
+- `timing_middleware` records the duration of every request per route.
+- `SamplingProfiler` samples the loop thread's stack from another thread and
+  produces collapsed stacks (the input format of flamegraph.pl and speedscope).
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from aiohttp import hdrs, web
+
+from solver_client import percentile
+
+logger = logging.getLogger(__name__)
+
+# Recent samples kept for percentiles
+WINDOW = 1024
+# Deepest stack recorded by the watchdog and the profiler
+MAX_DEPTH = 64
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.splitext(os.path.basename(code.co_filename))[0]}:{code.co_name}"
+
+
+def frame_stack(frame, max_depth=MAX_DEPTH):
+    """
+    Returns:
+        list: Frames from the outermost to `frame`, the innermost
+    """
+    frames = []
+    while frame is not None and len(frames) < max_depth:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def collapse(frames):
+    """Format a stack as `outer;...;inner`."""
+    return ";".join(frame_label(frame) for frame in frames)
+
+
+def summarize(samples):
+    """
+    Returns:
+        dict: p50, p99 and max of a sequence of seconds, in milliseconds
+    """
+    if not samples:
+        return {"p50": None, "p99": None, "max": None}
+    return {
+        "p50": round(percentile(samples, 0.5) * 1000, 3),
+        "p99": round(percentile(samples, 0.99) * 1000, 3),
+        "max": round(max(samples) * 1000, 3),
+    }
+
+
+class LoopMonitor:
+    """
+    Continuous event-loop lag measurement with a blocking watchdog.
+
+    A coroutine sleeps for `interval` and records how late it wakes up.
+    A daemon thread watches the time of the last wake-up; when the loop has
+    been stuck for `block_threshold` it logs the loop thread's current stack
+    once per stall, naming the handler found on it.
+
+    Args:
+        interval (float): Seconds between lag samples
+        block_threshold (float): Stall, in seconds, after which the stack is logged
+    """
+
+    def __init__(self, interval=0.05, block_threshold=0.1):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.lags = deque(maxlen=WINDOW)
+        self.max_lag = 0.0
+        self.stalls = 0
+        # Code objects of request handlers, registered by timing_middleware
+        self.handler_names = {}
+        self.thread_id = None
+        self._heartbeat = time.monotonic()
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(interval=config.loop_lag_interval, block_threshold=config.loop_block_threshold)
+
+    async def start(self):
+        self.thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._measure())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def close(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+            self._thread = None
+
+    async def _measure(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            self._heartbeat = time.monotonic()
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(self.block_threshold / 2):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.block_threshold or reported == heartbeat:
+                continue
+            reported = heartbeat
+            self.stalls += 1
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            frames = frame_stack(frame)
+            logger.warning(
+                f"Event loop blocked for {stalled * 1000:.0f} ms in {self.describe(frames)}: {collapse(frames)}"
+            )
+
+    def describe(self, frames):
+        """Name the innermost request handler on a stack, or the innermost frame."""
+        for frame in reversed(frames):
+            name = self.handler_names.get(frame.f_code)
+            if name is not None:
+                return name
+        return frame_label(frames[-1]) if frames else "unknown"
+
+    def stats(self):
+        return {
+            "lag_ms": summarize(self.lags),
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "stalls": self.stalls,
+        }
+
+
+class RequestTimings:
+    """
+    Per-route request durations.
+    """
+
+    def __init__(self):
+        self.routes = {}
+
+    def record(self, route, seconds, status):
+        entry = self.routes.get(route)
+        if entry is None:
+            entry = self.routes[route] = {"count": 0, "errors": 0, "total": 0.0, "samples": deque(maxlen=WINDOW)}
+        entry["count"] += 1
+        entry["total"] += seconds
+        entry["samples"].append(seconds)
+        if status >= 500:
+            entry["errors"] += 1
+
+    def stats(self):
+        return {
+            route: {
+                "count": entry["count"],
+                "errors": entry["errors"],
+                "mean_ms": round(entry["total"] / entry["count"] * 1000, 3),
+                **summarize(entry["samples"]),
+            }
+            for route, entry in sorted(self.routes.items())
+        }
+
+
+def route_name(request):
+    resource = request.match_info.route.resource
+    # Unmatched paths share one entry so that scans cannot grow the table
+    path = resource.canonical if resource is not None else "(unmatched)"
+    return f"{request.method} {path}"
+
+
+def timing_middleware(monitor, timings, slow_threshold=1.0):
+    """
+    Build a middleware that times every handler.
+
+    Durations are recorded per route in `timings`, sent back in a
+    Server-Timing header and logged when above `slow_threshold` seconds.
+    Handlers are registered with `monitor` so that stalls are attributed
+    to them. WebSocket connections are not timed.
+
+    Args:
+        monitor (LoopMonitor): The loop monitor
+        timings (RequestTimings): Where durations are recorded
+        slow_threshold (float): Duration, in seconds, above which a request is logged
+
+    Returns:
+        Callable: The aiohttp middleware
+    """
+
+    @web.middleware
+    async def middleware(request, handler):
+        name = route_name(request)
+        # `handler` is the next middleware; the route's own handler is what shows up on stacks
+        code = getattr(request.match_info.handler, "__code__", None)
+        if code is not None and code not in monitor.handler_names:
+            monitor.handler_names[code] = name
+
+        if request.headers.get(hdrs.UPGRADE, "").lower() == "websocket":
+            return await handler(request)
+
+        started = time.perf_counter()
+        response, status = None, 500
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            timings.record(name, elapsed, status)
+            if elapsed >= slow_threshold:
+                logger.warning(f"Slow request {name}: {elapsed * 1000:.0f} ms (status {status})")
+            if response is not None and not response.prepared:
+                response.headers["Server-Timing"] = f"app;dur={elapsed * 1000:.1f}"
+
+    return middleware
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for one thread, usually the event loop's.
+
+    The target's stack is read from another thread with `sys._current_frames`
+    `hz` times a second, so the cost to the target is one GIL hand-over
+    per sample.
+
+    Args:
+        thread_id (int): Identifier of the thread to sample
+        hz (int): Samples per second
+    """
+
+    def __init__(self, thread_id, hz=100):
+        self.thread_id = thread_id
+        self.hz = hz
+        self.samples = Counter()
+        self.count = 0
+
+    def run(self, seconds):
+        """
+        Sample for `seconds`, blocking the calling thread.
+
+        Returns:
+            Counter: Number of samples per collapsed stack
+        """
+        period = 1.0 / self.hz
+        deadline = time.monotonic() + seconds
+        next_sample = time.monotonic()
+        while next_sample < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[collapse(frame_stack(frame))] += 1
+                self.count += 1
+            del frame
+            next_sample += period
+            time.sleep(max(0.0, next_sample - time.monotonic()))
+        return self.samples
+
+    def collapsed(self):
+        """
+        Returns:
+            str: One `stack count` line per distinct stack, most frequent first
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
@@ -0,0 +1,203 @@
+"""
+Capacity analysis of a task set, before it is solved.
+
+The solver has no way to tell an impossible task set from a hard one: it
+places what it can and silently leaves the rest out. Two necessary
+conditions find most overloaded sets in milliseconds, so that they are
+refused with the tasks that cannot all fit instead, unless the caller
+accepts a partial schedule:
+
+- for every window from a kickoff to a deadline, the work of the tasks that
+  must be done within it fits into the time left free by fixed tasks;
+- every continuous task, and every piece of a project, fits into a single
+  gap between fixed tasks within its own window.
+
+Free time comes from prefix sums over the 5-minute buckets of the local
+solver, counted generously (a bucket is busy only if a fixed task covers it
+completely, and windows are widened to whole buckets), so a set that is
+reported certainly has no complete schedule; one that passes may still have none.
+The work of all windows is compared at once: for distinct start times S and
+deadlines D, demand[i, j], the work of the tasks starting at or after S[i]
+and due by D[j], is a 2D suffix/prefix sum over a (start, deadline) histogram.
+
+Tasks whose deadline has passed are left out, the solver skips them anyway,
+and so are tasks kicking off after the solver's horizon.
+"""
+import numpy as np
+
+from local_solver import (
+    BUCKET, HORIZON, IDLE_STEP, format_time, parse_duration, parse_time, round_up_to_five_minutes,
+)
+
+# Distinct start times and deadlines compared; larger sets are compared on evenly spaced ones
+MAX_POINTS = 1024
+# Overloaded windows and tasks reported
+MAX_REPORTED = 5
+
+
+def demands(tasks, now):
+    """
+    The dynamic tasks still to be scheduled.
+
+    Tasks with invalid data are left for the solver to reject.
+
+    Returns:
+        list[tuple[str, int, int, int, int]]: (task ID, start, deadline, work, piece) in
+            seconds: the earliest start, the work in total and in one contiguous piece
+    """
+    result = []
+    for task in tasks:
+        try:
+            if task["type"] not in ("continuous", "project"):
+                continue
+            work = piece = parse_duration(task["duration"])
+            kickoff, deadline = parse_time(task["kickoff"]), parse_time(task["deadline"])
+            if task["type"] == "project":
+                piece = parse_duration(task["timings"]["work"])
+                if piece <= 0 or work > piece * 1000:
+                    continue
+                # The solver places whole pieces
+                work = -(-work // piece) * piece
+        except (KeyError, TypeError, AttributeError, ValueError):
+            continue
+        if work <= 0 or deadline <= now or kickoff > now + HORIZON:
+            continue
+        result.append((str(task["id"]), max(kickoff, now), deadline, work, piece))
+    return result
+
+
+def busy_buckets(tasks, origin, buckets):
+    """
+    Returns:
+        np.ndarray: Whether each 5-minute bucket from `origin` is completely covered by a fixed task
+    """
+    occupied = np.zeros(buckets + 1, dtype=np.int32)
+    for task in tasks:
+        if task.get("type") != "fixed":
+            continue
+        try:
+            start, end = parse_time(task["start"]), parse_time(task["end"])
+        except (KeyError, TypeError, AttributeError, ValueError):
+            continue
+        first = min(max(-(-(start - origin) // BUCKET), 0), buckets)
+        last = min(max((end - origin) // BUCKET, 0), buckets)
+        if first < last:
+            occupied[first] += 1
+            occupied[last] -= 1
+    return np.cumsum(occupied[:-1]) > 0
+
+
+def analyze(tasks, now):
+    """
+    Check whether the dynamic tasks can fit around the fixed ones.
+
+    Args:
+        tasks (list[dict]): Raw tasks, with ids, as sent to the solver
+        now (datetime): Start of the schedule; rounded up to 5 minutes like the solver does
+
+    Returns:
+        dict: {"windows": [...], "tasks": [...]}, both empty if no overload was found.
+            A window is {"from", "to", "requiredMinutes", "freeMinutes", "tasks"};
+            a task is {"task", "from", "to", "pieceMinutes", "longestFreeMinutes"}.
+            The most overloaded ones come first.
+    """
+    analysis = {"windows": [], "tasks": []}
+    origin = round_up_to_five_minutes(int(now.timestamp()))
+    dynamic = demands(tasks, origin)
+    if not dynamic:
+        return analysis
+
+    ids = [task_id for task_id, _, _, _, _ in dynamic]
+    start, deadline, work, piece = (np.array(column, dtype=np.int64) for column in list(zip(*dynamic))[1:])
+
+    # Nothing is placed after the solver's horizon; time beyond it is counted as free
+    until = min(int(deadline.max()), origin + HORIZON + IDLE_STEP + int(piece.max()))
+    buckets = -(-(until - origin) // BUCKET)
+    busy = busy_buckets(tasks, origin, buckets)
+    prefix = np.concatenate(([0], np.cumsum(~busy))).astype(np.int64)
+
+    def free_until(moment, round_up):
+        bucket = -(-(moment - origin) // BUCKET) if round_up else (moment - origin) // BUCKET
+        return (prefix[np.minimum(bucket, buckets)] + np.maximum(bucket - buckets, 0)) * BUCKET
+
+    # Every window [start, deadline) of a task
+    starts = thin(np.unique(start))
+    deadlines = thin(np.unique(deadline))
+    histogram = np.zeros((len(starts), len(deadlines)), dtype=np.int64)
+    # Rounded to the closest compared start at or before, and deadline at or after
+    rows = np.searchsorted(starts, start, side="right") - 1
+    columns = np.searchsorted(deadlines, deadline, side="left")
+    np.add.at(histogram, (rows, columns), work)
+    demand = np.cumsum(np.cumsum(histogram[::-1], axis=0)[::-1], axis=1)
+    free = free_until(deadlines, True)[None, :] - free_until(starts, False)[:, None]
+    excess = demand - np.maximum(free, 0)
+
+    # The most overloaded window per deadline
+    worst = excess.argmax(axis=0)
+    overloaded = [(int(excess[row, column]), row, column) for column, row in enumerate(worst) if excess[row, column] > 0]
+    for _, row, column in sorted(overloaded, reverse=True)[:MAX_REPORTED]:
+        inside = (start >= starts[row]) & (deadline <= deadlines[column])
+        analysis["windows"].append({
+            "from": format_time(int(starts[row])),
+            "to": format_time(int(deadlines[column])),
+            "requiredMinutes": int(demand[row, column]) // 60,
+            "freeMinutes": max(int(free[row, column]), 0) // 60,
+            "tasks": list(dict.fromkeys(ids[index] for index in np.flatnonzero(inside))),
+        })
+
+    # Longest free run within each task's window, from the length of the run at every bucket
+    busy_at = np.flatnonzero(busy)
+    next_busy = np.full(buckets, np.iinfo(np.int64).max // 2, dtype=np.int64)
+    if busy_at.size:
+        following = np.searchsorted(busy_at, np.arange(buckets), side="left")
+        has_next = following < busy_at.size
+        next_busy[has_next] = busy_at[following[has_next]]
+    runs = next_busy - np.arange(buckets)
+    cramped = []
+    for index in range(len(dynamic)):
+        first = int((start[index] - origin) // BUCKET)
+        last = int(-(-(deadline[index] - origin) // BUCKET))
+        longest = last - max(first, buckets) if last > buckets else 0
+        if first < buckets:
+            stop = min(last, buckets)
+            longest = max(longest, int(np.minimum(runs[first:stop], last - np.arange(first, stop)).max()))
+        if longest * BUCKET < piece[index]:
+            cramped.append((int(piece[index]) - longest * BUCKET, index, longest))
+    for _, index, longest in sorted(cramped, key=lambda item: (-item[0], item[1]))[:MAX_REPORTED]:
+        analysis["tasks"].append({
+            "task": ids[index],
+            "from": format_time(int(start[index])),
+            "to": format_time(int(deadline[index])),
+            "pieceMinutes": int(piece[index]) // 60,
+            "longestFreeMinutes": longest * BUCKET // 60,
+        })
+    return analysis
+
+
+def thin(points):
+    """Evenly spaced points, the first and the last included, if there are more than MAX_POINTS."""
+    if len(points) <= MAX_POINTS:
+        return points
+    return points[np.unique(np.linspace(0, len(points) - 1, MAX_POINTS).astype(np.int64))]
+
+
+def describe(analysis):
+    """
+    Returns:
+        str: A message about the most overloaded window or task
+    """
+    count = len(analysis["windows"]) + len(analysis["tasks"])
+    more = f" (and {count - 1} more)" if count > 1 else ""
+    if analysis["windows"]:
+        window = analysis["windows"][0]
+        return (
+            f"Tasks {', '.join(window['tasks'])} need {window['requiredMinutes']} minutes between "
+            f"{window['from']} and {window['to']}, but only {window['freeMinutes']} are free{more}"
+        )
+    if analysis["tasks"]:
+        task = analysis["tasks"][0]
+        return (
+            f"Task {task['task']} needs {task['pieceMinutes']} uninterrupted minutes between "
+            f"{task['from']} and {task['to']}, but at most {task['longestFreeMinutes']} are free in a row{more}"
+        )
+    return "Tasks fit"
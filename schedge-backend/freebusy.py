@@ -0,0 +1,445 @@
+"""
+Per-user busy time: fixed tasks, occurrences of recurring fixed tasks and
+scheduled slots.
+
+`IntervalSet` keeps intervals grouped into blocks of overlapping ones. Blocks
+are disjoint, so they are sorted by their starts and by their ends at the same
+time, and the blocks that meet a range are found with two binary searches:
+a free/busy query over a range costs O(log n + k) for k blocks in it, and a
+fixed task is checked for overlaps in O(log n) when fixed tasks do not
+overlap each other. Recurring fixed tasks are kept as their rules and
+expanded only over the range in question, like `expand_tasks` does for the
+solver; a recurring task being written is checked over the solver's horizon.
+
+`BusyIndex` caches one `BusyTimes` per user, keyed by the user's state
+version like `DependencyIndex`, and is updated in place by the task writes
+and schedule commits of this replica.
+"""
+import bisect
+import heapq
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from local_solver import HORIZON, format_time, parse_time
+from recurrence import expand_task
+
+
+class OverlapError(ValueError):
+    """Raised for fixed tasks that overlap another fixed task."""
+
+
+def task_interval(document):
+    """
+    Returns:
+        tuple[int, int] | None: (start, end) in seconds since the epoch of a fixed task
+            or a slot, None if it has no valid times
+    """
+    try:
+        start, end = parse_time(document["start"]), parse_time(document["end"])
+    except (KeyError, TypeError, AttributeError, ValueError):
+        return None
+    return (start, end) if start < end else None
+
+
+def fixed_interval(task):
+    """
+    Returns:
+        tuple[int, int] | None: (start, end) of a single fixed task, None for other
+            tasks; recurring ones are covered by `fixed_series`
+    """
+    if task.get("type") != "fixed" or task.get("recurrence"):
+        return None
+    return task_interval(task)
+
+
+def fixed_series(task):
+    """
+    Returns:
+        dict | None: The times and rule of a recurring fixed task, None for other tasks
+    """
+    if task.get("type") != "fixed" or not task.get("recurrence"):
+        return None
+    return {field: task.get(field) for field in ("start", "end", "recurrence")}
+
+
+def series_intervals(task_id, series, start, end):
+    """
+    The occurrences of a recurring fixed task that overlap [start, end).
+
+    Args:
+        task_id (str): The task
+        series (dict): Its times and rule, see `fixed_series`
+        start (int): Start of the range in seconds since the epoch
+        end (int): End of the range in seconds since the epoch
+
+    Returns:
+        list[tuple[str, int, int]]: (occurrence ID, start, end) triples; none for broken
+            rules, which the solver leaves out as well
+    """
+    try:
+        occurrences = expand_task(
+            {**series, "type": "fixed", "id": task_id},
+            datetime.fromtimestamp(start, timezone.utc),
+            datetime.fromtimestamp(end, timezone.utc),
+        )
+    except (KeyError, TypeError, ValueError):
+        return []
+    intervals = []
+    for occurrence in occurrences:
+        interval = task_interval(occurrence)
+        # An override may have moved the occurrence out of the range
+        if interval is not None and interval[0] < end and interval[1] > start:
+            intervals.append((occurrence["id"], *interval))
+    return intervals
+
+
+class IntervalSet:
+    """
+    Half-open intervals [start, end) with keys, grouped into sorted disjoint blocks.
+
+    Intervals that only touch are kept in separate blocks.
+
+    Args:
+        intervals (Iterable[tuple[Hashable, int, int]]): (key, start, end) triples
+    """
+
+    def __init__(self, intervals=()):
+        # Key -> (start, end)
+        self.intervals = {}
+        # Blocks, as parallel lists: bounds and the keys of the intervals in them
+        self.starts = []
+        self.ends = []
+        self.members = []
+        # Sorted, every interval lands at the end or merges into the last block
+        for key, start, end in sorted(intervals, key=lambda item: item[1:]):
+            self.add(key, start, end)
+
+    def __contains__(self, key):
+        return key in self.intervals
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def _span(self, start, end):
+        """Range of the blocks that overlap [start, end)."""
+        first = bisect.bisect_right(self.ends, start)
+        return first, bisect.bisect_left(self.starts, end, first)
+
+    def add(self, key, start, end):
+        """Add an interval, or move the one with this key; empty intervals are ignored."""
+        self.remove(key)
+        if end <= start:
+            return
+        self.intervals[key] = (start, end)
+        first, last = self._span(start, end)
+        members = {key}
+        if first < last:
+            start = min(start, self.starts[first])
+            end = max(end, self.ends[last - 1])
+            members.update(*self.members[first:last])
+        self.starts[first:last] = [start]
+        self.ends[first:last] = [end]
+        self.members[first:last] = [members]
+
+    def remove(self, key):
+        """
+        Returns:
+            tuple[int, int] | None: The removed interval, None if there was none
+        """
+        interval = self.intervals.pop(key, None)
+        if interval is None:
+            return None
+        block = bisect.bisect_right(self.ends, interval[0])
+        rest = sorted(
+            (self.intervals[member] + (member,) for member in self.members[block] if member != key)
+        )
+        # The remaining intervals of the block may fall apart into several blocks
+        starts, ends, members = [], [], []
+        for start, end, member in rest:
+            if ends and start < ends[-1]:
+                ends[-1] = max(ends[-1], end)
+                members[-1].add(member)
+            else:
+                starts.append(start)
+                ends.append(end)
+                members.append({member})
+        self.starts[block:block + 1] = starts
+        self.ends[block:block + 1] = ends
+        self.members[block:block + 1] = members
+        return interval
+
+    def blocks(self, start, end):
+        """
+        Returns:
+            list[tuple[int, int]]: Bounds of the blocks that overlap [start, end), in order
+        """
+        first, last = self._span(start, end)
+        return list(zip(self.starts[first:last], self.ends[first:last]))
+
+    def overlapping(self, start, end):
+        """
+        Returns:
+            list: Keys of the intervals that overlap [start, end), by start
+        """
+        first, last = self._span(start, end)
+        found = []
+        for block in range(first, last):
+            for key in self.members[block]:
+                key_start, key_end = self.intervals[key]
+                if key_start < end and key_end > start:
+                    found.append((key_start, key))
+        return [key for _, key in sorted(found)]
+
+
+class BusyTimes:
+    """
+    The fixed tasks and slots of one user.
+
+    Args:
+        fixed (Iterable[tuple[str, int, int]]): (task ID, start, end) of fixed tasks
+        slots (Iterable[tuple[int, int]]): (start, end) of scheduled slots
+        version (int | None): State version the documents were read at
+        series (Iterable[tuple[str, dict]]): (task ID, times and rule) of recurring fixed tasks
+    """
+
+    def __init__(self, fixed=(), slots=(), version=None, series=()):
+        self.version = version
+        self.fixed = IntervalSet(fixed)
+        self.slots = IntervalSet((index, start, end) for index, (start, end) in enumerate(slots))
+        self.series = dict(series)
+
+    def occurrences(self, start, end, skip=None):
+        """
+        Returns:
+            list[tuple[str, int, int]]: (occurrence ID, start, end) of the recurring fixed
+                tasks overlapping [start, end), except those of the task `skip`, by start
+        """
+        found = []
+        for task_id, series in self.series.items():
+            if task_id != skip:
+                found.extend(series_intervals(task_id, series, start, end))
+        return sorted(found, key=lambda item: item[1:])
+
+    def _check(self, start, end, task_id, occurrences):
+        for other in self.fixed.overlapping(start, end):
+            if other != task_id:
+                raise OverlapError(f"Overlaps fixed task {other}")
+        for other in occurrences.overlapping(start, end):
+            raise OverlapError(f"Overlaps fixed task {other}")
+
+    def check_fixed(self, start, end, task_id=None):
+        """
+        Check a fixed task that is about to be created or moved.
+
+        Args:
+            start (int): Start in seconds since the epoch
+            end (int): End in seconds since the epoch
+            task_id (str | None): The task being moved, which may overlap its old times
+
+        Raises:
+            OverlapError: If it overlaps another fixed task or an occurrence of a recurring
+                one; a task that keeps its times is not checked, so fixed tasks that
+                already overlap stay editable
+        """
+        if task_id is not None and self.fixed.intervals.get(task_id) == (start, end):
+            return
+        self._check(start, end, task_id, IntervalSet(self.occurrences(start, end, skip=task_id)))
+
+    def check_series(self, series, start, end, task_id=None):
+        """
+        Check the occurrences within [start, end) of a recurring fixed task that is
+        about to be created or changed, like `check_fixed`.
+
+        Args:
+            series (dict): Its times and rule, see `fixed_series`
+            start (int): Start of the range in seconds since the epoch
+            end (int): End of the range in seconds since the epoch
+            task_id (str | None): The task being changed
+
+        Raises:
+            OverlapError: If an occurrence overlaps another fixed task or an occurrence
+                of another recurring one
+        """
+        if task_id is not None and self.series.get(task_id) == series:
+            return
+        occurrences = IntervalSet(self.occurrences(start, end, skip=task_id))
+        for _, occurrence_start, occurrence_end in series_intervals(task_id or "", series, start, end):
+            self._check(occurrence_start, occurrence_end, task_id, occurrences)
+
+    def check_task(self, task, now, task_id=None):
+        """
+        Check a task that is about to be created or changed, if it is a fixed one;
+        occurrences of a recurring task are checked within the solver's horizon from `now`.
+
+        Raises:
+            OverlapError: See `check_fixed` and `check_series`
+        """
+        interval = fixed_interval(task)
+        if interval is not None:
+            self.check_fixed(*interval, task_id=task_id)
+        series = fixed_series(task)
+        if series is not None:
+            self.check_series(series, now, now + HORIZON, task_id=task_id)
+
+    def set_fixed(self, task_id, interval):
+        """
+        Record the times of a fixed task, or that the task is not fixed.
+
+        Args:
+            task_id (str): The task
+            interval (tuple[int, int] | None): Its new times, None if it is not a fixed task
+
+        Returns:
+            tuple[int, int] | None: The previous times, to restore them if the write fails
+        """
+        if interval is None:
+            return self.fixed.remove(task_id)
+        previous = self.fixed.intervals.get(task_id)
+        self.fixed.add(task_id, *interval)
+        return previous
+
+    def set_series(self, task_id, series):
+        """
+        Record the times and rule of a recurring fixed task, or that the task is not one.
+
+        Returns:
+            dict | None: The previous times and rule
+        """
+        if series is None:
+            return self.series.pop(task_id, None)
+        previous = self.series.get(task_id)
+        self.series[task_id] = series
+        return previous
+
+    def set_task(self, task_id, task):
+        """
+        Record the times of a task that was written, whichever kind it is.
+
+        Args:
+            task_id (str): The task
+            task (dict | None): The task as written, None if it was deleted
+
+        Returns:
+            tuple: The previous times, for `restore_task` if the write fails
+        """
+        task = task or {}
+        return self.set_fixed(task_id, fixed_interval(task)), self.set_series(task_id, fixed_series(task))
+
+    def restore_task(self, task_id, previous):
+        interval, series = previous
+        self.set_fixed(task_id, interval)
+        self.set_series(task_id, series)
+
+    def replace_slots(self, slots):
+        """Replace the slots after a schedule was committed."""
+        self.slots = IntervalSet((index, start, end) for index, (start, end) in enumerate(slots))
+
+    def busy(self, start, end):
+        """
+        Returns:
+            list[tuple[int, int]]: Disjoint busy intervals within [start, end), in order;
+                touching intervals are merged
+        """
+        merged = []
+        occurrences = [(occurrence_start, occurrence_end) for _, occurrence_start, occurrence_end
+                       in self.occurrences(start, end)]
+        blocks = heapq.merge(self.fixed.blocks(start, end), self.slots.blocks(start, end), occurrences)
+        for block_start, block_end in blocks:
+            block_start, block_end = max(block_start, start), min(block_end, end)
+            if merged and block_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], block_end)
+            else:
+                merged.append([block_start, block_end])
+        return [tuple(interval) for interval in merged]
+
+    def free(self, start, end, minimum=0, busy=None):
+        """
+        Returns:
+            list[tuple[int, int]]: The gaps between busy intervals within [start, end)
+                that last at least `minimum` seconds
+        """
+        gaps, cursor = [], start
+        for busy_start, busy_end in (self.busy(start, end) if busy is None else busy) + [(end, end)]:
+            if busy_start - cursor >= max(minimum, 1):
+                gaps.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+        return gaps
+
+
+def format_intervals(intervals):
+    return [{"start": format_time(start), "end": format_time(end)} for start, end in intervals]
+
+
+class BusyIndex:
+    """
+    Cache of users' busy times.
+
+    Args:
+        max_users (int): Users kept, least recently used ones are evicted
+    """
+
+    def __init__(self, max_users=10000):
+        self.max_users = max_users
+        self.users = OrderedDict()
+        self.builds = 0
+
+    def cached(self, user_id, version):
+        """
+        Returns:
+            BusyTimes | None: The user's busy times if they are up to date with `version`
+        """
+        busy = self.users.get(user_id)
+        if busy is None or busy.version != version:
+            return None
+        self.users.move_to_end(user_id)
+        return busy
+
+    def store(self, user_id, busy):
+        self.users[user_id] = busy
+        self.users.move_to_end(user_id)
+        while len(self.users) > self.max_users:
+            self.users.popitem(last=False)
+
+    async def get(self, db, user_id, version):
+        """
+        The user's busy times at `version`, reloaded from the database if the cached ones are older.
+
+        Args:
+            db (AsyncDatabase): The database
+            user_id (int): The user
+            version (int): The user's current state version, read before calling
+        """
+        busy = self.cached(user_id, version)
+        if busy is None:
+            projection = {"_id": 1, "start": 1, "end": 1}
+            query = {"userId": user_id, "type": "fixed"}
+            tasks = await db.tasks.find(query, {**projection, "type": 1, "recurrence": 1}).to_list(None)
+            slots = await db.slots.find({"userId": user_id}, projection).to_list(None)
+            fixed = ((str(task["_id"]), fixed_interval(task)) for task in tasks)
+            busy = BusyTimes(
+                ((task_id, *interval) for task_id, interval in fixed if interval is not None),
+                (interval for interval in map(task_interval, slots) if interval is not None),
+                version=version,
+                series=((str(task["_id"]), fixed_series(task)) for task in tasks if task.get("recurrence")),
+            )
+            self.builds += 1
+            self.store(user_id, busy)
+        return busy
+
+    def committed(self, user_id, busy, version):
+        """
+        Record that a write applied to `busy` produced state `version`.
+
+        If another write happened in between, the busy times are dropped and
+        reloaded on next use.
+        """
+        if busy.version is not None and version == busy.version + 1:
+            busy.version = version
+        else:
+            self.invalidate(user_id)
+
+    def invalidate(self, user_id):
+        self.users.pop(user_id, None)
+
+    def stats(self):
+        return {"users": len(self.users), "builds": self.builds}
@@ -0,0 +1,332 @@
+"""
+Incremental iCalendar (RFC 5545) reading and writing.
+
+Only what schedge needs is supported: VEVENTs are read into fixed tasks
+and slots are written out as VEVENTs. Recurrence rules are ignored,
+i.e. only the first occurrence of a recurring event is imported.
+"""
+import re
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+PRODID = "-//schedge//schedge//EN"
+DEFAULT_COLOR = "#3498DB"
+# Longest unfolded content line accepted, in bytes
+MAX_LINE_LENGTH = 64 * 1024
+# Longest line written, in octets, excluding the line break
+FOLD_LENGTH = 75
+
+DURATION_RE = re.compile(
+    r"^(?P<sign>[+-])?P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?"
+    r"(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$"
+)
+
+
+class ICalError(ValueError):
+    """Raised for input that is not a readable iCalendar stream."""
+
+
+async def iter_lines(chunks, max_length=MAX_LINE_LENGTH):
+    """
+    Split a byte stream into unfolded content lines.
+
+    Folding is undone on bytes, before decoding, since a fold may split
+    a multi-byte character.
+
+    Args:
+        chunks (AsyncIterable[bytes]): The stream, in chunks of any size
+        max_length (int): Longest line accepted, in bytes
+
+    Yields:
+        str: Content lines without line breaks
+    """
+    buffer = bytearray()
+    current = None
+
+    def take(raw):
+        nonlocal current
+        raw = raw.rstrip(b"\r")
+        if not raw:
+            return None
+        if raw[:1] in (b" ", b"\t"):
+            if current is not None:
+                current += raw[1:]
+                if len(current) > max_length:
+                    raise ICalError("Content line too long")
+            return None
+        finished, current = current, bytearray(raw)
+        return finished
+
+    async for chunk in chunks:
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b"\n", start)) >= 0:
+            finished = take(buffer[start:end])
+            start = end + 1
+            if finished is not None:
+                yield finished.decode("utf-8", errors="replace")
+        del buffer[:start]
+        if len(buffer) > max_length:
+            raise ICalError("Content line too long")
+
+    finished = take(buffer)
+    if finished is not None:
+        yield finished.decode("utf-8", errors="replace")
+    if current is not None:
+        yield current.decode("utf-8", errors="replace")
+
+
+def _split_unquoted(text, separator):
+    parts, start, quoted = [], 0, False
+    for index, char in enumerate(text):
+        if char == '"':
+            quoted = not quoted
+        elif char == separator and not quoted:
+            parts.append(text[start:index])
+            start = index + 1
+    parts.append(text[start:])
+    return parts
+
+
+def parse_content_line(line):
+    """
+    Parse a content line such as `DTSTART;TZID=Europe/Moscow:20250501T100000`.
+
+    Args:
+        line (str): An unfolded content line
+
+    Returns:
+        tuple[str, dict[str, str], str]: Upper-case name, parameters and value
+    """
+    quoted = False
+    for index, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ":" and not quoted:
+            break
+    else:
+        raise ICalError(f"Malformed content line: {line[:80]}")
+
+    name, *raw_params = _split_unquoted(line[:index], ";")
+    params = {}
+    for param in raw_params:
+        key, _, value = param.partition("=")
+        params[key.strip().upper()] = value.strip().strip('"')
+    return name.strip().upper(), params, line[index + 1:]
+
+
+async def iter_events(lines):
+    """
+    Collect the properties of every VEVENT in a stream of content lines.
+
+    Properties of nested components (e.g. VALARM) are skipped, and only
+    the first occurrence of a property is kept.
+
+    Args:
+        lines (AsyncIterable[str]): Lines from `iter_lines`
+
+    Yields:
+        dict[str, tuple[dict, str]]: Property name -> (parameters, value)
+    """
+    stack = []
+    event = None
+    async for line in lines:
+        name, params, value = parse_content_line(line)
+        if name == "BEGIN":
+            stack.append(value.strip().upper())
+            if stack[-1] == "VEVENT":
+                event = {}
+        elif name == "END":
+            component = value.strip().upper()
+            if not stack or stack[-1] != component:
+                raise ICalError(f"Unexpected END:{component}")
+            stack.pop()
+            if component == "VEVENT":
+                yield event
+                event = None
+        elif event is not None and stack[-1] == "VEVENT":
+            event.setdefault(name, (params, value))
+
+
+def unescape_text(value):
+    """Undo TEXT escaping (`\\n`, `\\,`, `\\;`, `\\\\`)."""
+    return re.sub(r"\\([nN,;\\])", lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+
+
+def escape_text(value):
+    """Escape a string for a TEXT property value."""
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def parse_ical_datetime(value, params):
+    """
+    Parse a DATE or DATE-TIME value.
+
+    UTC (`Z`) and TZID times are converted to aware datetimes; floating
+    times and unknown time zones are taken as UTC.
+
+    Args:
+        value (str): e.g. "20250501T100000Z" or "20250501"
+        params (dict): The property's parameters
+
+    Returns:
+        tuple[datetime, bool]: The aware datetime and whether the value was a DATE
+    """
+    value = value.strip()
+    try:
+        if params.get("VALUE", "").upper() == "DATE" or len(value) == 8:
+            day = datetime.strptime(value, "%Y%m%d").date()
+            return datetime(day.year, day.month, day.day, tzinfo=timezone.utc), True
+        if value.endswith("Z"):
+            return datetime.strptime(value[:-1], "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc), False
+        parsed = datetime.strptime(value, "%Y%m%dT%H%M%S")
+    except ValueError:
+        raise ICalError(f"Invalid date-time: {value}")
+
+    tz = timezone.utc
+    if "TZID" in params:
+        try:
+            tz = ZoneInfo(params["TZID"])
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    return parsed.replace(tzinfo=tz).astimezone(timezone.utc), False
+
+
+def parse_ical_duration(value):
+    """
+    Parse a DURATION value such as "PT1H30M" or "P1W".
+
+    Returns:
+        timedelta: The duration
+    """
+    match = DURATION_RE.match(value.strip())
+    if not match or value.strip() in ("P", "PT"):
+        raise ICalError(f"Invalid duration: {value}")
+    parts = {key: int(amount) for key, amount in match.groupdict().items() if key != "sign" and amount}
+    duration = timedelta(**parts)
+    return -duration if match.group("sign") == "-" else duration
+
+
+def event_to_task(event):
+    """
+    Turn VEVENT properties into a raw fixed task.
+
+    Args:
+        event (dict): Properties from `iter_events`
+
+    Returns:
+        dict | None: The task, or None for cancelled events and events without DTSTART
+    """
+    if "DTSTART" not in event:
+        return None
+    if event.get("STATUS", ({}, ""))[1].strip().upper() == "CANCELLED":
+        return None
+
+    params, value = event["DTSTART"]
+    start, is_date = parse_ical_datetime(value, params)
+    if "DTEND" in event:
+        params, value = event["DTEND"]
+        end, _ = parse_ical_datetime(value, params)
+    elif "DURATION" in event:
+        end = start + parse_ical_duration(event["DURATION"][1])
+    elif is_date:
+        end = start + timedelta(days=1)
+    else:
+        end = start
+
+    description = event.get("DESCRIPTION")
+    return {
+        "id": event.get("UID", ({}, ""))[1].strip(),
+        "type": "fixed",
+        "name": unescape_text(event.get("SUMMARY", ({}, ""))[1]).strip() or "Imported event",
+        "description": unescape_text(description[1]) if description else None,
+        "color": DEFAULT_COLOR,
+        "leisure": False,
+        "dependencies": [],
+        "nonce": 1,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+    }
+
+
+def fold_line(line):
+    """
+    Encode a content line, folding it at 75 octets without splitting characters.
+
+    Returns:
+        bytes: The line with CRLF line breaks
+    """
+    data = line.encode()
+    if len(data) <= FOLD_LENGTH:
+        return data + b"\r\n"
+
+    pieces, start, limit = [], 0, FOLD_LENGTH
+    while len(data) - start > limit:
+        end = start + limit
+        # Do not cut inside a UTF-8 sequence
+        while data[end] & 0xC0 == 0x80:
+            end -= 1
+        pieces.append(data[start:end])
+        start, limit = end, FOLD_LENGTH - 1
+    pieces.append(data[start:])
+    return b"\r\n ".join(pieces) + b"\r\n"
+
+
+def format_ical_datetime(value):
+    """
+    Format an ISO 8601 string or datetime as a UTC DATE-TIME, e.g. "20250501T100000Z".
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def calendar_header(name="schedge"):
+    """
+    Returns:
+        bytes: The lines opening a VCALENDAR
+    """
+    return b"".join(fold_line(line) for line in (
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{escape_text(name)}",
+    ))
+
+
+CALENDAR_FOOTER = b"END:VCALENDAR\r\n"
+
+
+def slot_to_event(slot, stamp):
+    """
+    Format a slot as a VEVENT.
+
+    Args:
+        slot (dict): A slot as stored in the database
+        stamp (str): DTSTAMP value shared by the whole export
+
+    Returns:
+        bytes: The VEVENT lines
+    """
+    task = slot.get("task") or {}
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{slot.get('_id', slot.get('id'))}@schedge",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{format_ical_datetime(slot['start'])}",
+        f"DTEND:{format_ical_datetime(slot['end'])}",
+        f"SUMMARY:{escape_text(task.get('name') or '')}",
+    ]
+    if task.get("description"):
+        lines.append(f"DESCRIPTION:{escape_text(task['description'])}")
+    if task.get("leisure"):
+        lines.append("CATEGORIES:Leisure")
+    lines.append("TRANSP:OPAQUE")
+    lines.append("END:VEVENT")
+    return b"".join(fold_line(line) for line in lines)
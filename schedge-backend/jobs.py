@@ -0,0 +1,624 @@
+"""
+Durable queue of asynchronous scheduling jobs.
+
+`POST /compute_slot_request` without `sync` stores a job instead of solving
+on the pod that received the request. Jobs are claimed by `JobWorker`s,
+which run in standalone worker processes (`python worker.py`, or a backend
+with ROLE=all), so the number of workers scales independently of the HTTP
+tier.
+
+A claimed job is leased to its worker for a while and the worker renews the
+lease while the job runs. If the worker dies, the lease runs out and another
+worker claims the job again. Each user has at most one queued job: a request
+arriving while one is queued is merged into it, since a job schedules the
+tasks stored when it runs. A user's queued job is not claimed while another
+of their jobs is running, so schedules are written in request order.
+
+`MongoJobStore` keeps jobs in the `jobs` collection. `MemoryJobStore` keeps
+them in the process, for local runs and tests without a shared database.
+`JobListener` sends the new state to the WebSocket clients of this process
+when a job has finished in another process, or when another process has
+announced a change made by background work (re-solving, compaction).
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import bson
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+# Not a job: a state change made outside a job, for the JobListeners of other processes
+ANNOUNCED = "announced"
+
+# Claimable jobs looked at per claim, so that jobs of users with a running job can be skipped
+CLAIM_CANDIDATES = 20
+
+
+class PermanentJobError(Exception):
+    """
+    Raised by a job's run when running it again cannot succeed, e.g. because the
+    solver rejected the user's tasks. The job fails without further attempts.
+
+    Attributes:
+        details (dict | None): Stored on the job next to the error, e.g. why the tasks cannot fit
+    """
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
+def make_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def new_job(user_id, params, stream, traceparent, now):
+    return {
+        "_id": bson.ObjectId(),
+        "userId": user_id,
+        "status": QUEUED,
+        "params": params,
+        "stream": stream,
+        "traceparent": traceparent,
+        "attempts": 0,
+        "createdAt": now,
+        "availableAt": now,
+    }
+
+
+class MongoJobStore:
+    """
+    Jobs in a Mongo collection, shared by every backend and worker process.
+
+    Args:
+        db (AsyncDatabase): The database
+        retention (float): Seconds finished jobs are kept
+    """
+
+    def __init__(self, db, retention=24 * 3600.0):
+        self.jobs = db.jobs
+        self.retention = retention
+
+    async def ensure_indexes(self):
+        # One queued job per user; concurrent enqueues of the same user collide here
+        await self.jobs.create_index(
+            [("userId", ASCENDING)], unique=True, name="userId_queued",
+            partialFilterExpression={"status": QUEUED},
+        )
+        await self.jobs.create_index([("status", ASCENDING), ("availableAt", ASCENDING)])
+        await self.jobs.create_index([("status", ASCENDING), ("leaseUntil", ASCENDING)])
+        await self.jobs.create_index([("userId", ASCENDING), ("finishedAt", ASCENDING)])
+        await self.jobs.create_index([("finishedAt", ASCENDING)], expireAfterSeconds=int(self.retention))
+
+    async def enqueue(self, user_id, params=None, stream=False, traceparent=None, now=None):
+        """
+        Queue a scheduling job, merging it into the user's queued job if there is one.
+
+        Returns:
+            ObjectId: ID of the queued job
+        """
+        now = now or utcnow()
+        for _ in range(2):
+            try:
+                doc = await self.jobs.find_one_and_update(
+                    {"userId": user_id, "status": QUEUED},
+                    {
+                        "$set": {"params": params, "stream": stream, "traceparent": traceparent},
+                        # A queued retry waiting for its delay runs now that the user asked again
+                        "$min": {"availableAt": now},
+                        "$setOnInsert": {"attempts": 0, "createdAt": now},
+                    },
+                    upsert=True,
+                    projection={"_id": 1},
+                    return_document=ReturnDocument.AFTER,
+                )
+                return doc["_id"]
+            except DuplicateKeyError:
+                # A concurrent request inserted the user's queued job first; merge into it
+                continue
+        raise RuntimeError(f"Could not queue a job for user {user_id}")
+
+    async def claim(self, worker_id, lease, max_attempts, now=None):
+        """
+        Lease the oldest claimable job to a worker.
+
+        A job is claimable when it is queued and due, or when it is running
+        but its lease has expired (its worker died) and it has attempts left.
+
+        Returns:
+            dict | None: The claimed job
+        """
+        now = now or utcnow()
+        candidates = await self.jobs.find(
+            {"$or": [
+                {"status": QUEUED, "availableAt": {"$lte": now}},
+                {"status": RUNNING, "leaseUntil": {"$lte": now}, "attempts": {"$lt": max_attempts}},
+            ]},
+            {"userId": 1, "status": 1},
+        ).sort("availableAt", ASCENDING).limit(CLAIM_CANDIDATES).to_list(None)
+        if not candidates:
+            return None
+
+        busy = set(await self.jobs.distinct("userId", {
+            "userId": {"$in": list({candidate["userId"] for candidate in candidates})},
+            "status": RUNNING,
+            "leaseUntil": {"$gt": now},
+        }))
+        for candidate in candidates:
+            if candidate["userId"] in busy:
+                continue
+            query = {"_id": candidate["_id"], "status": candidate["status"]}
+            if candidate["status"] == QUEUED:
+                query["availableAt"] = {"$lte": now}
+            else:
+                query["leaseUntil"] = {"$lte": now}
+            job = await self.jobs.find_one_and_update(
+                query,
+                {
+                    "$set": {"status": RUNNING, "worker": worker_id, "startedAt": now,
+                             "leaseUntil": now + timedelta(seconds=lease)},
+                    "$inc": {"attempts": 1},
+                },
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is not None:
+                return job
+        return None
+
+    async def heartbeat(self, job_id, worker_id, lease, now=None):
+        """
+        Extend a running job's lease.
+
+        Returns:
+            bool: False if the job is no longer leased to the worker
+        """
+        now = now or utcnow()
+        result = await self.jobs.update_one(
+            {"_id": job_id, "worker": worker_id, "status": RUNNING},
+            {"$set": {"leaseUntil": now + timedelta(seconds=lease)}},
+        )
+        return result.matched_count == 1
+
+    async def complete(self, job_id, worker_id, error=None, retry_at=None, now=None, details=None):
+        """
+        Finish a running job, or queue it again for `retry_at` after an error.
+        `details` are kept on a finished job, see `PermanentJobError`.
+
+        Returns:
+            bool: False if the job was no longer leased to the worker
+        """
+        now = now or utcnow()
+        query = {"_id": job_id, "worker": worker_id, "status": RUNNING}
+        if error is not None and retry_at is not None:
+            try:
+                result = await self.jobs.update_one(query, {
+                    "$set": {"status": QUEUED, "availableAt": retry_at, "error": error},
+                    "$unset": {"leaseUntil": ""},
+                })
+                return result.matched_count == 1
+            except DuplicateKeyError:
+                # The user has queued a newer job, which replaces the retry
+                pass
+        result = await self.jobs.update_one(query, {
+            "$set": {"status": FAILED if error is not None else DONE, "error": error, "details": details,
+                     "finishedAt": now},
+            "$unset": {"leaseUntil": ""},
+        })
+        return result.matched_count == 1
+
+    async def release(self, job_id, worker_id, now=None):
+        """Give a running job up, e.g. on shutdown, so that another worker claims it right away."""
+        now = now or utcnow()
+        await self.jobs.update_one(
+            {"_id": job_id, "worker": worker_id, "status": RUNNING},
+            {"$set": {"leaseUntil": now}, "$inc": {"attempts": -1}},
+        )
+
+    async def expire(self, max_attempts, now=None):
+        """
+        Fail jobs whose lease expired on their last attempt.
+
+        Returns:
+            int: Jobs failed
+        """
+        now = now or utcnow()
+        result = await self.jobs.update_many(
+            {"status": RUNNING, "leaseUntil": {"$lte": now}, "attempts": {"$gte": max_attempts}},
+            {"$set": {"status": FAILED, "error": "Worker lease expired", "finishedAt": now},
+             "$unset": {"leaseUntil": ""}},
+        )
+        return result.modified_count
+
+    async def announce(self, user_id, worker_id, now=None):
+        """
+        Record that a user's state was changed outside a job by `worker_id`, so that
+        the JobListeners of other processes emit it; kept like a finished job.
+        """
+        now = now or utcnow()
+        await self.jobs.insert_one(
+            {"userId": user_id, "status": ANNOUNCED, "worker": worker_id, "createdAt": now, "finishedAt": now}
+        )
+
+    async def get(self, job_id):
+        return await self.jobs.find_one({"_id": job_id})
+
+    async def finished(self, user_ids, since, worker_id):
+        """
+        Returns:
+            list[dict]: `userId`, `finishedAt` and `details` of the jobs of `user_ids` finished
+                after `since` by workers other than `worker_id`
+        """
+        return await self.jobs.find(
+            {"userId": {"$in": list(user_ids)}, "finishedAt": {"$gt": since}, "worker": {"$ne": worker_id}},
+            {"userId": 1, "finishedAt": 1, "details": 1},
+        ).to_list(None)
+
+    async def counts(self):
+        """
+        Returns:
+            dict[str, int]: Number of jobs per status
+        """
+        groups = await (await self.jobs.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])).to_list(None)
+        return {group["_id"]: group["count"] for group in groups}
+
+
+class MemoryJobStore:
+    """
+    Jobs held in this process, with the semantics of `MongoJobStore`.
+
+    Only workers of the same process see the jobs, so it suits local runs
+    and tests, not deployments with several processes.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    async def enqueue(self, user_id, params=None, stream=False, traceparent=None, now=None):
+        now = now or utcnow()
+        for job in self.jobs.values():
+            if job["userId"] == user_id and job["status"] == QUEUED:
+                job.update(params=params, stream=stream, traceparent=traceparent,
+                           availableAt=min(job["availableAt"], now))
+                return job["_id"]
+        job = new_job(user_id, params, stream, traceparent, now)
+        self.jobs[job["_id"]] = job
+        return job["_id"]
+
+    async def claim(self, worker_id, lease, max_attempts, now=None):
+        now = now or utcnow()
+        busy = {
+            job["userId"] for job in self.jobs.values()
+            if job["status"] == RUNNING and job["leaseUntil"] > now
+        }
+        candidates = sorted(
+            (job for job in self.jobs.values()
+             if job["userId"] not in busy and (
+                 (job["status"] == QUEUED and job["availableAt"] <= now)
+                 or (job["status"] == RUNNING and job["leaseUntil"] <= now and job["attempts"] < max_attempts))),
+            key=lambda job: job["availableAt"],
+        )
+        if not candidates:
+            return None
+        job = candidates[0]
+        job.update(status=RUNNING, worker=worker_id, startedAt=now, leaseUntil=now + timedelta(seconds=lease),
+                   attempts=job["attempts"] + 1)
+        return dict(job)
+
+    def _leased(self, job_id, worker_id):
+        job = self.jobs.get(job_id)
+        if job is None or job["status"] != RUNNING or job.get("worker") != worker_id:
+            return None
+        return job
+
+    async def heartbeat(self, job_id, worker_id, lease, now=None):
+        job = self._leased(job_id, worker_id)
+        if job is None:
+            return False
+        job["leaseUntil"] = (now or utcnow()) + timedelta(seconds=lease)
+        return True
+
+    async def complete(self, job_id, worker_id, error=None, retry_at=None, now=None, details=None):
+        job = self._leased(job_id, worker_id)
+        if job is None:
+            return False
+        job.pop("leaseUntil", None)
+        queued = any(other["userId"] == job["userId"] and other["status"] == QUEUED for other in self.jobs.values())
+        if error is not None and retry_at is not None and not queued:
+            job.update(status=QUEUED, availableAt=retry_at, error=error)
+        else:
+            job.update(status=FAILED if error is not None else DONE, error=error, details=details,
+                       finishedAt=now or utcnow())
+        return True
+
+    async def release(self, job_id, worker_id, now=None):
+        job = self._leased(job_id, worker_id)
+        if job is not None:
+            job.update(leaseUntil=now or utcnow(), attempts=job["attempts"] - 1)
+
+    async def expire(self, max_attempts, now=None):
+        now = now or utcnow()
+        expired = 0
+        for job in self.jobs.values():
+            if job["status"] == RUNNING and job["leaseUntil"] <= now and job["attempts"] >= max_attempts:
+                job.pop("leaseUntil")
+                job.update(status=FAILED, error="Worker lease expired", finishedAt=now)
+                expired += 1
+        return expired
+
+    async def announce(self, user_id, worker_id, now=None):
+        now = now or utcnow()
+        job_id = bson.ObjectId()
+        self.jobs[job_id] = {
+            "_id": job_id, "userId": user_id, "status": ANNOUNCED, "worker": worker_id,
+            "createdAt": now, "finishedAt": now,
+        }
+
+    async def get(self, job_id):
+        job = self.jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    async def finished(self, user_ids, since, worker_id):
+        user_ids = set(user_ids)
+        return [
+            {"userId": job["userId"], "finishedAt": job["finishedAt"], "details": job.get("details")}
+            for job in self.jobs.values()
+            if job["userId"] in user_ids and job.get("finishedAt") and job["finishedAt"] > since
+            and job.get("worker") != worker_id
+        ]
+
+    async def counts(self):
+        counts = {}
+        for job in self.jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return counts
+
+
+class JobWorker:
+    """
+    Claims jobs from a store and runs them, up to `concurrency` at a time.
+
+    The lease of a running job is renewed every third of `lease`; if the
+    renewal fails (the job was re-claimed after a stall), the job is
+    cancelled, and the worker waits for it to stop before taking other work.
+    Failed jobs are queued again after `retry_delay` seconds, doubling with
+    every attempt, until `max_attempts` is reached; a job that raises
+    `PermanentJobError` fails right away.
+
+    Args:
+        store (MongoJobStore | MemoryJobStore): Where jobs are queued
+        run (Callable[[dict], Awaitable[str | None]]): Runs a job, returns an error message or None,
+            raises PermanentJobError if retrying cannot help
+        background (BackgroundTasks): Holds the running jobs, accounted to their users
+        worker_id (str | None): Identifies this worker in the store, generated if omitted
+        concurrency (int): Most jobs running at once
+        lease (float): Seconds a claim lasts without renewal
+        poll_interval (float): Seconds between claims while the queue is empty
+        max_attempts (int): Runs of a job before it fails for good
+        retry_delay (float): Seconds before the first retry
+    """
+
+    def __init__(self, store, run, background, worker_id=None, concurrency=2, lease=30.0, poll_interval=1.0,
+                 max_attempts=3, retry_delay=5.0):
+        self.store = store
+        self.run = run
+        self.background = background
+        self.worker_id = worker_id or make_worker_id()
+        self.concurrency = concurrency
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.slots = asyncio.Semaphore(concurrency)
+        self.running = {}
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.lost = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    @classmethod
+    def from_config(cls, store, run, background, config, worker_id=None):
+        return cls(
+            store,
+            run,
+            background,
+            worker_id=worker_id,
+            concurrency=config.scheduling_workers,
+            lease=config.job_lease,
+            poll_interval=config.job_poll_interval,
+            max_attempts=config.job_max_attempts,
+            retry_delay=config.job_retry_delay,
+        )
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def wake(self):
+        """Claim right away instead of at the next poll, e.g. after a job was queued."""
+        self._wakeup.set()
+
+    async def close(self):
+        """Stop claiming and give running jobs back to the queue."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        tasks = list(self.running.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def renew(self, job):
+        """
+        Extend the lease of a job this worker runs, e.g. right before the job writes its result.
+
+        Returns:
+            bool: False if another worker has claimed the job since
+        """
+        return await self.store.heartbeat(job["_id"], self.worker_id, self.lease)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_expiry = loop.time()
+        while True:
+            await self.slots.acquire()
+            # Cleared before claiming, so that a job queued during the claim is not missed
+            self._wakeup.clear()
+            try:
+                if loop.time() >= next_expiry:
+                    next_expiry = loop.time() + self.lease
+                    expired = await self.store.expire(self.max_attempts)
+                    if expired:
+                        self.failed += expired
+                        logger.warning(f"{expired} scheduling jobs failed after their worker's lease expired")
+                job = await self.store.claim(self.worker_id, self.lease, self.max_attempts)
+            except Exception as e:
+                logger.error(f"Error claiming a scheduling job: {e!r}")
+                job = None
+            if job is None:
+                self.slots.release()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.running[job["_id"]] = self.background.spawn(job["userId"], self._execute(job), job)
+
+    async def _execute(self, job):
+        work = asyncio.ensure_future(self.run(job))
+        try:
+            while True:
+                done, _ = await asyncio.wait({work}, timeout=self.lease / 3)
+                if done:
+                    break
+                if not await self.renew(job):
+                    self.lost += 1
+                    logger.warning(f"Lost the lease of scheduling job {job['_id']} of user {job['userId']}")
+                    work.cancel()
+                    # The new owner is running the job; this run must not write anything after it
+                    await asyncio.gather(work, return_exceptions=True)
+                    return
+            permanent, details = False, None
+            try:
+                error = work.result()
+            except PermanentJobError as e:
+                error, permanent, details = str(e), True, e.details
+            except Exception as e:
+                error = repr(e)
+            await self.finish(job, error, permanent, details)
+        except asyncio.CancelledError:
+            work.cancel()
+            await self.store.release(job["_id"], self.worker_id)
+            raise
+        finally:
+            self.running.pop(job["_id"], None)
+            self.slots.release()
+            # A slot is free, and a job of the same user may have been queued meanwhile
+            self.wake()
+
+    async def finish(self, job, error, permanent=False, details=None):
+        if error is None:
+            self.completed += 1
+            await self.store.complete(job["_id"], self.worker_id)
+            return
+        logger.warning(f"Scheduling job {job['_id']} of user {job['userId']} failed "
+                       f"(attempt {job['attempts']}): {error}")
+        if job["attempts"] < self.max_attempts and not permanent:
+            self.retried += 1
+            retry_at = utcnow() + timedelta(seconds=self.retry_delay * 2 ** (job["attempts"] - 1))
+            await self.store.complete(job["_id"], self.worker_id, error, retry_at)
+        else:
+            self.failed += 1
+            await self.store.complete(job["_id"], self.worker_id, error, details=details)
+
+    def stats(self):
+        return {
+            "worker": self.worker_id,
+            "running": len(self.running),
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "lost_leases": self.lost,
+        }
+
+
+class JobListener:
+    """
+    Emits the state of users connected to this process when another
+    process finishes one of their jobs or announces a change of their state.
+
+    Args:
+        store (MongoJobStore): Where jobs are queued
+        connections (dict): User ID -> WebSocket connections of this process
+        emit (Callable[[int, dict | None], Awaitable]): Sends a user's state to their connections,
+            with the details of their last finished job
+        worker_id (str | None): This process's worker, whose jobs emit state themselves
+        interval (float): Seconds between polls
+    """
+
+    def __init__(self, store, connections, emit, worker_id=None, interval=1.0):
+        self.store = store
+        self.connections = connections
+        self.emit = emit
+        self.worker_id = worker_id
+        self.interval = interval
+        self.since = utcnow()
+        self.emitted = 0
+        self._task = None
+
+    async def start(self):
+        self.since = utcnow()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Error polling finished scheduling jobs: {e!r}")
+
+    async def poll(self):
+        if not self.connections:
+            self.since = utcnow()
+            return
+        finished = await self.store.finished(list(self.connections), self.since, self.worker_id)
+        if not finished:
+            return
+        # Times written by the database's clients, not ours
+        self.since = max(job["finishedAt"] for job in finished)
+        last = {job["userId"]: job for job in sorted(finished, key=lambda job: job["finishedAt"])}
+        for user_id, job in last.items():
+            self.emitted += 1
+            await self.emit(user_id, job.get("details"))
@@ -0,0 +1,229 @@
+"""
+In-process port of the solver's `monte_carlo_schedule`.
+
+Used for small problems, where the HTTP round trip to the solver costs more
+than the search, and as a fallback while no solver replica is available.
+
+Time is tracked in whole seconds; fixed tasks are projected onto an occupancy
+mask of 5-minute buckets, so a candidate placement is checked against every
+fixed task at once with a prefix sum. The solver always starts at a time
+rounded up to 5 minutes, so for fixed tasks on 5-minute boundaries the mask is
+exact; other fixed tasks are widened to whole buckets.
+
+Since the solver scores every schedule equally, its result is the first
+complete pass of the randomized greedy search, which is what this module
+computes. Given the same seed the random choices differ from the solver's.
+"""
+import re
+from datetime import datetime, timezone
+
+import numpy as np
+
+from solver_client import SolverError
+
+BUCKET = 5 * 60
+HORIZON = 28 * 24 * 60 * 60
+# When nothing fits, t advances by IDLE_STEP and is rounded to a multiple of IDLE_ROUNDING
+IDLE_STEP = 30 * 60
+IDLE_ROUNDING = 10 * 60
+DEFAULT_BUDGET = 1_000_000
+
+DURATION_RE = re.compile(
+    r"^P?(?:(?P<years>\d+)Y)?(?:(?P<months>\d+)M)?(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?"
+    r"(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$"
+)
+
+
+def parse_duration(value):
+    """
+    Parse an ISO 8601 duration the way the solver does (a year is 365 days, a month 30).
+
+    Args:
+        value (str): e.g. "PT1H30M"
+
+    Returns:
+        int: The duration in seconds
+    """
+    match = DURATION_RE.match(value) if value[:1] in ("P", "T") else None
+    if not match:
+        raise ValueError(f"Invalid duration format: {value}")
+    parts = {key: int(amount or 0) for key, amount in match.groupdict().items()}
+    days = parts["years"] * 365 + parts["months"] * 30 + parts["weeks"] * 7 + parts["days"]
+    return days * 86400 + parts["hours"] * 3600 + parts["minutes"] * 60 + parts["seconds"]
+
+
+def parse_time(value):
+    """
+    Returns:
+        int: Seconds since the epoch of an ISO 8601 date-time (UTC if naive)
+    """
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def format_time(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+def round_up_to_five_minutes(seconds):
+    return (seconds + BUCKET - 1) // BUCKET * BUCKET
+
+
+def round_to(seconds, step):
+    """Round to the nearest multiple of `step`, halves up (chrono's `duration_round`)."""
+    down = seconds % step
+    if down == 0:
+        return seconds
+    up = step - down
+    return seconds + up if up <= down else seconds - down
+
+
+def monte_carlo_schedule(tasks, now, seed=0, budget=DEFAULT_BUDGET):
+    """
+    Place the dynamic tasks around the fixed ones.
+
+    Starting at `now`, repeatedly pick a random task that has kicked off,
+    still meets its deadline and fits before the next fixed task. Non-leisure
+    tasks may only follow leisure time (a leisure task or idle time).
+
+    Args:
+        tasks (list[dict]): Raw tasks, with ids
+        now (int): Start of the schedule, in seconds since the epoch
+        seed (int): Seed of the random choices
+        budget (int): Search budget, decremented by the number of dynamic slots on every step
+
+    Returns:
+        list[tuple[int, int, int]]: (start, end, index into `tasks`) of every slot,
+            fixed slots first
+
+    Raises:
+        ValueError: For tasks the solver would reject
+        SolverError: If no schedule was found within the budget
+    """
+    fixed, dynamic = [], []
+    for index, task in enumerate(tasks):
+        leisure = bool(task["leisure"])
+        if task["type"] == "fixed":
+            fixed.append((str(task["id"]), parse_time(task["start"]), parse_time(task["end"]), leisure, index))
+        elif task["type"] in ("continuous", "project"):
+            duration = parse_duration(task["duration"])
+            kickoff, deadline = parse_time(task["kickoff"]), parse_time(task["deadline"])
+            if task["type"] == "continuous":
+                dynamic.append((duration, kickoff, deadline, leisure, index))
+                continue
+            work = parse_duration(task["timings"]["work"])
+            if duration > work * 1000:
+                raise SolverError("Failed to generate schedule: too many pieces in a project", status=404)
+            pieces = -(-duration // work) if duration > 0 else 0
+            dynamic.extend([(work, kickoff, deadline, leisure, index)] * pieces)
+        else:
+            raise ValueError(f"Unknown task type: {task['type']}")
+
+    # Same order as the solver's sorted predefined slots
+    fixed.sort()
+    slots = [(start, end, index) for _, start, end, _, index in fixed]
+    if not dynamic:
+        return slots
+
+    duration, kickoff, deadline, leisure, owner = (np.array(column) for column in zip(*dynamic))
+    duration = duration.astype(np.int64)
+    kickoff = kickoff.astype(np.int64)
+    deadline = deadline.astype(np.int64)
+    leisure = leisure.astype(bool)
+    count = len(dynamic)
+
+    # Occupancy of fixed tasks in 5-minute buckets from `origin`
+    origin = now - now % BUCKET
+    buckets = -(-(now + HORIZON + IDLE_STEP + int(duration.max()) - origin) // BUCKET)
+    occupied = np.zeros(buckets, dtype=np.int32)
+    fixed_start = np.array([start for _, start, _, _, _ in fixed], dtype=np.int64)
+    fixed_end = np.array([end for _, _, end, _, _ in fixed], dtype=np.int64)
+    if fixed:
+        first = np.clip((fixed_start - origin) // BUCKET, 0, buckets)
+        last = np.clip(-(-(fixed_end - origin) // BUCKET), 0, buckets)
+        np.add.at(occupied, first[first < last], 1)
+        np.add.at(occupied, last[(first < last) & (last < buckets)], -1)
+        occupied = np.cumsum(occupied)
+    prefix = np.concatenate(([0], np.cumsum(occupied > 0)))
+
+    rng = np.random.default_rng(seed)
+    used = np.zeros(count, dtype=bool)
+    t = now
+    last_was_leisure = False
+
+    while t <= now + HORIZON:
+        free = ~used
+        started = kickoff <= t
+        ends = t + duration
+        outdated = free & started & (ends > deadline)
+        if np.count_nonzero(outdated) == count:
+            break
+
+        budget -= count
+        if budget < 0:
+            raise SolverError("Failed to generate schedule: search budget exhausted", status=404)
+
+        pending = free & ~started
+        if pending.any():
+            t = int(kickoff[pending].min())
+            last_was_leisure = True
+            continue
+
+        first = (t - origin) // BUCKET
+        last = np.minimum(-(-(ends - origin) // BUCKET), buckets)
+        busy = prefix[last] > prefix[first]
+        options = np.flatnonzero(free & ~outdated & ~busy & (leisure | last_was_leisure))
+        if options.size == 0:
+            t = round_to(t + IDLE_STEP, IDLE_ROUNDING)
+            last_was_leisure = True
+            continue
+
+        inside = np.flatnonzero((fixed_start < t) & (t < fixed_end))
+        if inside.size:
+            t = int(fixed_end[inside[0]])
+
+        choice = int(options[rng.integers(options.size)])
+        used[choice] = True
+        slots.append((t, t + int(duration[choice]), int(owner[choice])))
+        t += int(duration[choice])
+        last_was_leisure = bool(leisure[choice])
+
+    return slots
+
+
+def solve(tasks, now=None, seed=None, budget_ms=None):
+    """
+    Local equivalent of the solver's POST /schedule.
+
+    Args:
+        tasks (list[dict]): Raw tasks as sent to the solver
+        now (datetime | None): Defaults to the current time; rounded up to 5 minutes
+        seed (int | None): Seed of the random choices, 0 by default
+        budget_ms (int | None): Time limit; like the solver, which checks it
+            between passes, only a limit of 0 stops the single pass needed
+
+    Returns:
+        list[dict]: Slots in the solver's format
+
+    Raises:
+        SolverError: With status 400 for invalid tasks and 404 if there is no schedule
+    """
+    if budget_ms is not None and budget_ms <= 0:
+        raise SolverError("Failed to generate schedule", status=404)
+
+    now = round_up_to_five_minutes(int((now or datetime.now(timezone.utc)).timestamp()))
+    try:
+        slots = monte_carlo_schedule(tasks, now, seed or 0)
+    except (KeyError, TypeError, ValueError):
+        raise SolverError("Invalid task data", status=400)
+
+    return [
+        {
+            "start": format_time(start),
+            "end": format_time(end),
+            "task": {key: value for key, value in tasks[index].items() if key != "userId"},
+        }
+        for start, end, index in slots
+    ]
@@ -8,48 +8,130 @@ import json
 import uuid
 import dotenv
 import os
-from pymongo import AsyncMongoClient
+from pymongo import AsyncMongoClient, ASCENDING, ReturnDocument
+from pymongo.asynchronous.database import AsyncDatabase
 import bson
-from jsonschema import validate, ValidationError
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from jsonschema import ValidationError
 import logging
 import functools
-from datetime import datetime, timedelta
+import contextlib
+import hashlib
+import hmac
+import threading
+from datetime import datetime, timedelta, timezone
 import re
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-dotenv.load_dotenv()
+from archive import ARCHIVES, Compactor, ensure_archive_indexes, read_history
+from compression import compression_middleware, parse_encoding_list, strip_encoding_suffix
+from config import Config
+from dependencies import DependencyError, DependencyIndex, sort_tasks
+from feasibility import analyze, describe
+from diagnostics import LoopMonitor, RequestTimings, SamplingProfiler, timing_middleware
+from freebusy import BusyIndex, OverlapError, format_intervals, task_interval
+from ical import (
+    CALENDAR_FOOTER,
+    ICalError,
+    calendar_header,
+    event_to_task,
+    format_ical_datetime,
+    iter_events,
+    iter_lines,
+    slot_to_event,
+)
+from jobs import JobListener, JobWorker, MemoryJobStore, MongoJobStore, PermanentJobError, make_worker_id
+import local_solver
+from memory import BackgroundTasks, MemoryMonitor
+from offload import Offloader
+from replicas import CAUSAL_KEY, ReplicaRouter, causal_middleware
+from recurrence import (
+    OVERRIDE_FIELDS,
+    RecurrenceError,
+    Series,
+    expand_tasks,
+    parse_occurrence_key,
+    validate_rule,
+)
+from resolver import ResolveWorker, record_solve
+from solver_client import SolverBatcher, SolverClient, SolverError
+import tracing
+from capture import TrafficRecorder, capture_middleware
+from tracing import MongoTracingListener, Tracer, tracing_middleware
+import ws_codec
 
-MONGO_URI = os.environ.get("MONGO_URI")
-DB_NAME = os.environ.get("DB_NAME", "schedge")
-SOLVER_SERVER_URL = os.environ.get("SOLVER_SERVER_URL")
-BACKEND_HOST_ADDRESS = os.environ.get("BACKEND_HOST_ADDRESS", "localhost")
-BACKEND_PORT = os.environ.get("BACKEND_PORT", "5000")
+logger = logging.getLogger(__name__)
 
 # Constants for limits
 MAX_TASKS_PER_USER = 500  # Maximum number of tasks a user can create
 MIN_DURATION_MINUTES = 5  # Minimum task duration in minutes
 MAX_DURATION_DAYS = 3     # Maximum task duration in days
+IMPORT_BATCH_SIZE = 500   # Tasks inserted per insert_many during a calendar import
+IMPORT_MAX_ERRORS = 10    # Distinct errors reported back by a calendar import
+ICS_CHUNK_SIZE = 64 * 1024  # Bytes read or written at a time by calendar import and export
+MAX_RANGE_DAYS = 366      # Longest read window of /freebusy and /task
+HISTORY_PAGE_SIZE = 50    # Archived documents per page of /history by default
+HISTORY_MAX_PAGE_SIZE = 500
+ROLES = ("api", "worker", "all")  # See Config.role
+# Identifies this process's announcements when it runs no JobWorker, see announce_state
+PROCESS_ID = make_worker_id()
+
+# Reads whose decoding and encoding may be offloaded fetch raw BSON,
+# which is passed to worker processes as a single bytes object
+RAW_CODEC = CodecOptions(document_class=RawBSONDocument)
+
+# Application resources; the ones set in create_app always exist, the others
+# only once init_resources has run (and the optional workers only if enabled)
+CONFIG_KEY = web.AppKey("config", Config)
+READY_KEY = web.AppKey("ready", bool)
+LOOP_MONITOR_KEY = web.AppKey("loop_monitor", LoopMonitor)
+TRACER_KEY = web.AppKey("tracer", Tracer)
+TRAFFIC_RECORDER_KEY = web.AppKey("traffic_recorder", TrafficRecorder)
+REQUEST_TIMINGS_KEY = web.AppKey("request_timings", RequestTimings)
+PROFILE_LOCK_KEY = web.AppKey("profile_lock", asyncio.Lock)
+SNAPSHOT_LOCK_KEY = web.AppKey("snapshot_lock", asyncio.Lock)
+DEPENDENCY_INDEX_KEY = web.AppKey("dependency_index", DependencyIndex)
+BUSY_INDEX_KEY = web.AppKey("busy_index", BusyIndex)
+REPLICAS_KEY = web.AppKey("replicas", ReplicaRouter)
+SOLVE_LIMIT_KEY = web.AppKey("solve_limit", asyncio.Semaphore)
+# User ID -> connection ID -> WebSocketResponse
+CONNECTIONS_KEY = web.AppKey("connections", dict)
+BACKGROUND_TASKS_KEY = web.AppKey("background_tasks", BackgroundTasks)
+MEMORY_MONITOR_KEY = web.AppKey("memory_monitor", MemoryMonitor)
+MONGO_KEY = web.AppKey("mongo", AsyncMongoClient)
+DB_KEY = web.AppKey("db", AsyncDatabase)
+SOLVER_SESSION_KEY = web.AppKey("solver_session", aiohttp.ClientSession)
+SOLVER_KEY = web.AppKey("solver", SolverClient)
+SOLVER_BATCHER_KEY = web.AppKey("solver_batcher", SolverBatcher)
+OFFLOADER_KEY = web.AppKey("offloader", Offloader)
+JOB_STORE_KEY = web.AppKey("job_store", MongoJobStore)
+JOB_WORKER_KEY = web.AppKey("job_worker", JobWorker)
+JOB_LISTENER_KEY = web.AppKey("job_listener", JobListener)
+RESOLVE_WORKER_KEY = web.AppKey("resolve_worker", ResolveWorker)
+COMPACTOR_KEY = web.AppKey("compactor", Compactor)
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "schema.json")
+
 
-client = AsyncMongoClient(MONGO_URI)
-db = client[DB_NAME]
+@functools.cache
+def load_schema():
+    """
+    Load the schema definitions from static/schema.json.
 
-# Global dictionary to hold WebSocket connections by user_id
-# This allows us to send real-time updates to connected clients,
-# unless a client is connected to a different server instance.
-# In theory, this should be managed by a more robust solution like Redis Pub/Sub
-# or a message broker, but for simplicity, we use an in-memory dictionary.
-# TODO: Replace with something more robust
-CONNECTIONS = {}
+    The file is read on first use rather than at import time, and
+    resolved relative to this module instead of the working directory.
 
-try:
-    with open("static/schema.json") as schema_file:
-        SCHEMA = json.load(schema_file)
-    logger.info("Successfully loaded schema.json")
-except Exception as e:
-    logger.error(f"Failed to load schema.json: {e}")
-    SCHEMA = {}
+    Returns:
+        dict: The schema definitions, or an empty dict if loading failed
+    """
+    try:
+        with open(SCHEMA_PATH) as schema_file:
+            schema = json.load(schema_file)
+        logger.info("Successfully loaded schema.json")
+        return schema
+    except Exception as e:
+        logger.error(f"Failed to load schema.json: {e}")
+        return {}
 
 
 @functools.cache
@@ -66,14 +148,34 @@ def get_schema(schema_type):
     Raises:
         ValueError: If the requested schema type doesn't exist in definitions
     """
-    if "definitions" in SCHEMA and schema_type in SCHEMA["definitions"]:
+    schema = load_schema()
+    if "definitions" in schema and schema_type in schema["definitions"]:
         return {
             "$ref": f"#/definitions/{schema_type}",
-            **SCHEMA
+            **schema
         }
     raise ValueError(f"Schema type '{schema_type}' not found in definitions")
 
 
+@functools.cache
+def get_validator(schema_type):
+    """
+    Build a reusable validator for a schema type.
+
+    Compiling the validator once avoids re-checking the schema itself
+    on every call, which `jsonschema.validate` does.
+
+    Args:
+        schema_type (str): The schema type to build a validator for
+
+    Returns:
+        jsonschema.protocols.Validator: The compiled validator
+    """
+    schema = get_schema(schema_type)
+    validator_class = jsonschema.validators.validator_for(schema)
+    return validator_class(schema, format_checker=jsonschema.FormatChecker())
+
+
 def validate_schema(obj, schema_type):
     """
     Validate an object against a JSON schema.
@@ -86,11 +188,9 @@ def validate_schema(obj, schema_type):
         tuple: (bool, str) - Success flag and error message if validation fails
     """
     try:
-        validate(
-            instance=obj,
-            schema=get_schema(schema_type),
-            format_checker=jsonschema.FormatChecker()
-        )
+        error = jsonschema.exceptions.best_match(get_validator(schema_type).iter_errors(obj))
+        if error is not None:
+            raise error
         return True, None
     except ValidationError as e:
         return False, f"Schema validation failed: {e.message}. Details: {e.path} - {e.validator} ({e.validator_value})"
@@ -113,6 +213,73 @@ def safe_int(value, param_name="Parameter"):
         return False, f"{param_name} must be an integer"
 
 
+def parse_expected_nonce(request):
+    """
+    Read the expected task nonce from the If-Match header.
+
+    The header holds the nonce the client last saw, optionally quoted
+    (e.g. `If-Match: "3"`). A missing header or `*` means any nonce.
+
+    Args:
+        request (Request): The HTTP request object
+
+    Returns:
+        tuple: (bool, int | None | str) - Success flag and the expected nonce
+            (None if unconditional), or an error message
+    """
+    value = request.headers.get("If-Match")
+    if value is None or value.strip() == "*":
+        return True, None
+    value = value.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    return safe_int(value.strip('"'), "If-Match nonce")
+
+
+async def explain_missing_task(db, obj_id, user_id, expected_nonce, other_user_status=404):
+    """
+    Build the error response for a conditional write that matched nothing.
+
+    Only called on the failure path, so successful writes stay
+    a single round trip.
+
+    Args:
+        db (AsyncDatabase): The database
+        obj_id (ObjectId): The task ID
+        user_id (int): The user that attempted the write
+        expected_nonce (int | None): The nonce the write was conditioned on
+        other_user_status (int): Status to use if the task belongs to another user
+
+    Returns:
+        Response: 404, `other_user_status` or 409 JSON response
+    """
+    existing_task = await db.tasks.find_one({"_id": obj_id}, {"userId": 1, "nonce": 1})
+    if not existing_task:
+        return web.json_response({
+            "status": "error",
+            "message": "Task not found"
+        }, status=404)
+
+    if existing_task.get("userId") != user_id:
+        return web.json_response({
+            "status": "error",
+            "message": "Task not found" if other_user_status == 404 else "Task belongs to a different user"
+        }, status=other_user_status)
+
+    if expected_nonce is None:
+        # Deleted and re-created in between, treat as a missing task
+        return web.json_response({
+            "status": "error",
+            "message": "Task not found"
+        }, status=404)
+
+    return web.json_response({
+        "status": "error",
+        "message": f"Task was modified concurrently: expected nonce {expected_nonce}, "
+                   f"current nonce {existing_task.get('nonce')}"
+    }, status=409)
+
+
 def fix_object_id(obj):
     """
     Convert MongoDB ObjectId instances to strings and rename _id to id.
@@ -145,41 +312,308 @@ def fix_object_id(obj):
     return obj
 
 
-async def emit_state(user_id):
+async def find_raw(collection, query, session=None):
     """
-    Emit the current state (tasks and slots) to all WebSocket connections for a user
+    Fetch documents without decoding them.
 
     Args:
-        user_id (int): The user ID to emit state for
+        collection (AsyncCollection): The collection to query
+        query (dict): The filter
+        session (AsyncClientSession | None): The session to read in
+
+    Returns:
+        bytes: The matching documents as concatenated BSON
     """
-    try:
-        tasks = await db.tasks.find({"userId": user_id}).to_list(None)
-        slots = await db.slots.find({"userId": user_id}).to_list(None)
+    cursor = collection.with_options(codec_options=RAW_CODEC).find(query, session=session)
+    return b"".join([document.raw async for document in cursor])
 
-        fixed_tasks = fix_object_id(tasks)
-        fixed_slots = fix_object_id(slots)
 
-        message = json.dumps({
-            "userId": user_id,
-            "tasks": fixed_tasks,
-            "slots": fixed_slots,
-        })
+def render_state(user_id, tasks_blob, slots_blob, envelope=False, infeasible=None):
+    """
+    Encode a user's state as JSON. Runs in an offload worker for large states.
+
+    Args:
+        user_id (int): The user ID
+        tasks_blob (bytes): Tasks as returned by `find_raw`
+        slots_blob (bytes): Slots as returned by `find_raw`
+        envelope (bool): Wrap the state in a {"status": "ok", "result": ...} response
+        infeasible (dict | None): Why the tasks were not scheduled, see `emit_state`
+
+    Returns:
+        str: The JSON text
+    """
+    state = {
+        "userId": user_id,
+        "tasks": fix_object_id(bson.decode_all(tasks_blob)),
+        "slots": fix_object_id(bson.decode_all(slots_blob)),
+    }
+    if infeasible is not None:
+        state["infeasible"] = infeasible
+    if envelope:
+        return json.dumps({"status": "ok", "result": state})
+    return json.dumps(state)
+
+
+def render_state_msgpack(user_id, tasks_blob, slots_blob, infeasible=None):
+    """
+    Encode a user's state for `schedge.msgpack` WebSocket connections.
+    Runs in an offload worker for large states.
+
+    Args:
+        user_id (int): The user ID
+        tasks_blob (bytes): Tasks as returned by `find_raw`
+        slots_blob (bytes): Slots as returned by `find_raw`
+        infeasible (dict | None): Why the tasks were not scheduled, see `emit_state`
+
+    Returns:
+        bytes: The MessagePack frame
+    """
+    return ws_codec.encode_state(
+        user_id,
+        fix_object_id(bson.decode_all(tasks_blob)),
+        fix_object_id(bson.decode_all(slots_blob)),
+        infeasible=infeasible,
+    )
+
+
+def render_documents(blob):
+    """
+    Encode a list of documents as a JSON response body. Runs in an offload worker for large lists.
+
+    Args:
+        blob (bytes): Documents as returned by `find_raw`
+
+    Returns:
+        str: The JSON text
+    """
+    return json.dumps({"status": "ok", "result": fix_object_id(bson.decode_all(blob))})
+
+
+def render_expanded_tasks(blob, start, end):
+    """
+    Encode tasks as a JSON response body, recurring ones replaced by their
+    occurrences in [start, end). Runs in an offload worker for large lists.
+
+    Args:
+        blob (bytes): Tasks as returned by `find_raw`
+        start (int): Start of the window, in seconds since the epoch
+        end (int): End of the window, in seconds since the epoch
+
+    Returns:
+        str: The JSON text
+    """
+    tasks, broken = expand_tasks(
+        fix_object_id(bson.decode_all(blob)),
+        datetime.fromtimestamp(start, timezone.utc),
+        datetime.fromtimestamp(end, timezone.utc),
+    )
+    if broken:
+        logger.warning(f"Recurring tasks with invalid times left out: {broken}")
+    return json.dumps({"status": "ok", "result": tasks})
+
+
+async def bump_state_version(db, user_id, replicas=None):
+    """
+    Increment the user's state version after a mutation.
+
+    Must be called after the mutation is written, so that a reader that
+    observes the new version also observes the new data. Reads from
+    secondaries get the same guarantee by waiting for the time of this
+    write, which `replicas` remembers.
+
+    Args:
+        db (AsyncDatabase): The database
+        user_id (int): The user whose state changed
+        replicas (ReplicaRouter | None): The router of the user's state reads
+
+    Returns:
+        int: The new version
+    """
+    async with replicas.writing(user_id) if replicas is not None else contextlib.nullcontext() as session:
+        doc = await db.state_versions.find_one_and_update(
+            {"_id": user_id},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+    return doc["version"]
+
+
+async def get_state_version(db, user_id, session=None):
+    """
+    Args:
+        db (AsyncDatabase): The database
+        user_id (int): The user ID
+        session (AsyncClientSession | None): The session to read in
+
+    Returns:
+        int: The user's current state version, 0 if the user never changed anything
+    """
+    doc = await db.state_versions.find_one({"_id": user_id}, session=session)
+    return doc.get("version", 0) if doc else 0
+
+
+def make_etag(kind, user_id, version, query=None):
+    """
+    Build a strong ETag for one representation of a user's state.
+
+    Args:
+        kind (str): The resource, e.g. "state", "task" or "slot"
+        user_id (int): The user ID
+        version (int): The user's state version
+        query (tuple | None): The parsed query parameters the representation depends on;
+            equivalent queries give the same ETag
+
+    Returns:
+        str: The quoted ETag value
+    """
+    if query is None:
+        return f'"{kind}-{user_id}-{version}"'
+    digest = hashlib.blake2b(repr(query).encode(), digest_size=8).hexdigest()
+    return f'"{kind}-{user_id}-{version}-{digest}"'
+
+
+def matching_etag(request, etag):
+    """
+    Check the request's If-None-Match header against an ETag.
+
+    Tags of compressed representations (see compression.add_encoding_suffix)
+    match the ETag they were derived from.
+
+    Args:
+        request (Request): The HTTP request object
+        etag (str): The current ETag of the resource
+
+    Returns:
+        str | None: The matching tag as sent by the client, to be echoed
+            in the 304 response, or None if the client's copy is stale
+    """
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return None
+    for candidate in (candidate.strip() for candidate in header.split(",")):
+        if candidate == "*":
+            return etag
+        if strip_encoding_suffix(candidate) == etag:
+            return candidate
+    return None
+
+
+def not_modified(etag):
+    return web.Response(status=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
-        # Only send to connections for this user_id
-        if user_id in CONNECTIONS:
-            for connection_id, ws in list(CONNECTIONS[user_id].items()):
+
+def user_protocols(app, user_id):
+    """
+    Returns:
+        set[str | None]: Subprotocols of a user's WebSocket connections, None for plain JSON
+    """
+    return {ws.ws_protocol for ws in app[CONNECTIONS_KEY].get(user_id, {}).values()}
+
+
+async def send_to_user(app, user_id, message, binary=None):
+    """
+    Send a message to all WebSocket connections of a user
+
+    Connections that negotiated `schedge.msgpack` get `binary`, the others
+    `message`. A connection whose encoding was not rendered (it connected
+    while the message was being prepared) is skipped.
+
+    Args:
+        app (Application): The application holding the connections
+        user_id (int): The user ID to send the message to
+        message (str | None): The message as JSON text
+        binary (bytes | None): The same message encoded by ws_codec
+    """
+    connections = app[CONNECTIONS_KEY]
+
+    # Only send to connections for this user_id
+    if user_id in connections:
+        attributes = {
+            "user.id": user_id,
+            "connections": len(connections[user_id]),
+            "message.size": len(message) if message is not None else 0,
+            "message.binary_size": len(binary) if binary is not None else 0,
+        }
+        with tracing.span("broadcast", attributes=attributes):
+            for connection_id, ws in list(connections[user_id].items()):
                 try:
-                    await ws.send_str(message)
+                    if ws.ws_protocol == ws_codec.MSGPACK_PROTOCOL:
+                        if binary is not None:
+                            await ws.send_bytes(binary)
+                    elif message is not None:
+                        await ws.send_str(message)
                 except Exception as e:
                     logger.error(f"Error sending state to connection {connection_id}: {e}")
-                    CONNECTIONS[user_id].pop(connection_id, None)
+                    connections[user_id].pop(connection_id, None)
                     # Remove user entry if no connections left
-                    if not CONNECTIONS[user_id]:
-                        CONNECTIONS.pop(user_id, None)
+                    if not connections[user_id]:
+                        connections.pop(user_id, None)
+
+
+async def emit_state(app, user_id, infeasible=None, anchor=False):
+    """
+    Emit the current state (tasks and slots) to all WebSocket connections for a user
+
+    Args:
+        app (Application): The application holding the database and connections
+        user_id (int): The user ID to emit state for
+        infeasible (dict | None): Why the user's tasks were not scheduled, see feasibility.analyze;
+            sent as the `infeasible` field of the message
+        anchor (bool): The state changed on another replica, see `ReplicaRouter.reading`
+    """
+    try:
+        protocols = user_protocols(app, user_id)
+        if not protocols:
+            return
+        async with app[REPLICAS_KEY].reading(user_id, anchor=anchor) as reader:
+            tasks = await find_raw(reader.db.tasks, {"userId": user_id}, reader.session)
+            slots = await find_raw(reader.db.slots, {"userId": user_id}, reader.session)
+
+        # Only the encodings some connection of the user asked for are rendered
+        size = len(tasks) + len(slots)
+        message = binary = None
+        if protocols - {ws_codec.MSGPACK_PROTOCOL}:
+            message = await app[OFFLOADER_KEY].run(size, render_state, user_id, tasks, slots, False, infeasible)
+        if ws_codec.MSGPACK_PROTOCOL in protocols:
+            binary = await app[OFFLOADER_KEY].run(size, render_state_msgpack, user_id, tasks, slots, infeasible)
+
+        await send_to_user(app, user_id, message, binary)
     except Exception as e:
         logger.error(f"Error in emit_state: {e}")
 
 
+async def emit_provisional_state(app, user_id, tasks, slots):
+    """
+    Emit a schedule that is still being improved by the solver.
+
+    The message has the same shape as the one sent by `emit_state`, with
+    an extra `"provisional": true` field. Nothing is written to the database.
+
+    Args:
+        app (Application): The application holding the connections
+        user_id (int): The user ID to emit state for
+        tasks (list[dict]): The user's tasks, already passed through fix_object_id
+        slots (list[dict]): The provisional slots returned by the solver
+    """
+    try:
+        protocols = user_protocols(app, user_id)
+        message = binary = None
+        if protocols - {ws_codec.MSGPACK_PROTOCOL}:
+            message = json.dumps({
+                "userId": user_id,
+                "tasks": tasks,
+                "slots": slots,
+                "provisional": True,
+            })
+        if ws_codec.MSGPACK_PROTOCOL in protocols:
+            binary = ws_codec.encode_state(user_id, tasks, slots, provisional=True)
+        await send_to_user(app, user_id, message, binary)
+    except Exception as e:
+        logger.error(f"Error in emit_provisional_state: {e}")
+
+
 async def route_user_state(request):
     """
     Handler for GET /user/{user_id}/state
@@ -201,22 +635,23 @@ async def route_user_state(request):
             }, status=400)
 
         user_id = user_id_or_error
-        tasks = await db.tasks.find({"userId": user_id}).to_list(None)
-        slots = await db.slots.find({"userId": user_id}).to_list(None)
 
-        fixed_tasks = fix_object_id(tasks)
-        fixed_slots = fix_object_id(slots)
+        async with request.app[REPLICAS_KEY].reading(user_id, request.get(CAUSAL_KEY)) as reader:
+            # The version must be read before the data, see bump_state_version
+            etag = make_etag("state", user_id, await get_state_version(reader.db, user_id, reader.session))
+            matched = matching_etag(request, etag)
+            if matched:
+                return not_modified(matched)
 
-        result = {
-            "userId": user_id,
-            "tasks": fixed_tasks,
-            "slots": fixed_slots,
-        }
+            tasks = await find_raw(reader.db.tasks, {"userId": user_id}, reader.session)
+            slots = await find_raw(reader.db.slots, {"userId": user_id}, reader.session)
 
-        return web.json_response({
-            "status": "ok",
-            "result": result,
-        })
+        body = await request.app[OFFLOADER_KEY].run(
+            len(tasks) + len(slots), render_state, user_id, tasks, slots, True,
+        )
+
+        return web.Response(text=body, content_type="application/json",
+                            headers={"ETag": etag, "Cache-Control": "no-cache"})
     except Exception as e:
         logger.error(f"Error in route_user_state: {e}")
         return web.json_response({
@@ -227,9 +662,10 @@ async def route_user_state(request):
 
 async def route_user_tasks(request):
     """
-    Handler for GET /user/{user_id}/task
+    Handler for GET /user/{user_id}/task?from=&to=
 
-    Retrieves all tasks for a user.
+    Retrieves all tasks for a user. Recurring tasks are returned as stored,
+    or, with `from` and `to`, replaced by their occurrences in that window.
 
     Args:
         request (Request): The HTTP request object
@@ -246,13 +682,31 @@ async def route_user_tasks(request):
             }, status=400)
 
         user_id = user_id_or_error
-        tasks = await db.tasks.find({"userId": user_id}).to_list(None)
-        fixed_tasks = fix_object_id(tasks)
 
-        return web.json_response({
-            "status": "ok",
-            "result": fixed_tasks,
-        })
+        window = None
+        if "from" in request.query or "to" in request.query:
+            success, window_or_error = parse_time_range(request.query)
+            if not success:
+                return web.json_response({
+                    "status": "error",
+                    "message": window_or_error
+                }, status=400)
+            window = window_or_error
+
+        async with request.app[REPLICAS_KEY].reading(user_id, request.get(CAUSAL_KEY)) as reader:
+            etag = make_etag("task", user_id, await get_state_version(reader.db, user_id, reader.session), window)
+            matched = matching_etag(request, etag)
+            if matched:
+                return not_modified(matched)
+
+            tasks = await find_raw(reader.db.tasks, {"userId": user_id}, reader.session)
+        if window is None:
+            body = await request.app[OFFLOADER_KEY].run(len(tasks), render_documents, tasks)
+        else:
+            body = await request.app[OFFLOADER_KEY].run(len(tasks), render_expanded_tasks, tasks, *window)
+
+        return web.Response(text=body, content_type="application/json",
+                            headers={"ETag": etag, "Cache-Control": "no-cache"})
     except Exception as e:
         logger.error(f"Error in route_user_tasks: {e}")
         return web.json_response({
@@ -283,7 +737,7 @@ async def route_user_task(request):
             }, status=400)
 
         obj_id = obj_id_or_error
-        task = await db.tasks.find_one({"_id": obj_id})
+        task = await request.app[DB_KEY].tasks.find_one({"_id": obj_id})
         if task:
             fixed_task = fix_object_id(task)
 
@@ -417,8 +871,73 @@ def normalize_task_dates(task):
             if "bigBreak" in timings:
                 timings["bigBreak"] = normalize_duration(timings["bigBreak"])
 
+    recurrence = task.get("recurrence")
+    if isinstance(recurrence, dict):
+        if isinstance(recurrence.get("until"), str):
+            recurrence["until"] = normalize_datetime(recurrence["until"])
+        overrides = recurrence.get("overrides")
+        if isinstance(overrides, dict):
+            for override in overrides.values():
+                normalize_override(override)
+
     return task
 
+
+def normalize_override(override):
+    """
+    Normalize the date/time and duration fields of an occurrence override in place.
+
+    Args:
+        override (dict): Fields of one occurrence of a recurring task
+    """
+    if not isinstance(override, dict):
+        return
+    for field in ("start", "end", "kickoff", "deadline"):
+        if isinstance(override.get(field), str):
+            override[field] = normalize_datetime(override[field])
+    if isinstance(override.get("duration"), str):
+        override["duration"] = normalize_duration(override["duration"])
+
+def parse_task_body(body):
+    """
+    Parse, normalize and validate a task sent by a client.
+    Runs in an offload worker for large bodies.
+
+    Args:
+        body (bytes): The raw request body
+
+    Returns:
+        tuple: (task, None) if the task is valid, (None, error message) otherwise
+    """
+    try:
+        task = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None, "Invalid JSON in request body"
+    return prepare_task(task)
+
+
+def prepare_task(task):
+    """
+    Normalize and validate a task.
+
+    Args:
+        task (dict): Task data
+
+    Returns:
+        tuple: (task, None) if the task is valid, (None, error message) otherwise
+    """
+    # Normalize task dates and durations
+    task = normalize_task_dates(task)
+
+    valid, error = validate_schema(task, "RawTask")
+    if not valid:
+        return None, error
+    error = validate_rule(task)
+    if error:
+        return None, error
+    return task, None
+
+
 async def route_user_task_create(request):
     """
     Handler for POST /user/{user_id}/task
@@ -442,27 +961,16 @@ async def route_user_task_create(request):
         user_id = user_id_or_error
 
         # Check if user has reached the task limit
-        task_count = await db.tasks.count_documents({"userId": user_id})
+        task_count = await request.app[DB_KEY].tasks.count_documents({"userId": user_id})
         if task_count >= MAX_TASKS_PER_USER:
             return web.json_response({
                 "status": "error",
                 "message": f"Maximum number of tasks ({MAX_TASKS_PER_USER}) reached for this user"
             }, status=400)
 
-        try:
-            task = await request.json()
-        except json.JSONDecodeError:
-            return web.json_response({
-                "status": "error",
-                "message": "Invalid JSON in request body"
-            }, status=400)
-
-        # Normalize task dates and durations
-        task = normalize_task_dates(task)
-
-        # Validate task before insertion
-        valid, error = validate_schema(task, "RawTask")
-        if not valid:
+        body = await request.read()
+        task, error = await request.app[OFFLOADER_KEY].run(len(body), parse_task_body, body)
+        if error:
             return web.json_response({
                 "status": "error",
                 "message": error
@@ -479,18 +987,46 @@ async def route_user_task_create(request):
 
         # Insert task
         try:
-            result = await db.tasks.insert_one(task)
-            if not result.inserted_id:
-                return web.json_response({
-                    "status": "error",
-                    "message": "Failed to insert task"
-                }, status=500)
-
-            # Update task with the new ID
-            task["_id"] = result.inserted_id
-            fixed_task = fix_object_id(task)
-
-            await emit_state(user_id)
+            db = request.app[DB_KEY]
+            index = request.app[DEPENDENCY_INDEX_KEY]
+            busy_index = request.app[BUSY_INDEX_KEY]
+            async with index.editing(user_id):
+                version = await get_state_version(db, user_id)
+                graph = await index.get(db, user_id, version)
+                try:
+                    graph.check_new(task["dependencies"])
+                except DependencyError as e:
+                    return web.json_response({
+                        "status": "error",
+                        "message": str(e)
+                    }, status=400)
+
+                busy = await busy_index.get(db, user_id, version)
+                try:
+                    busy.check_task(task, int(datetime.now(timezone.utc).timestamp()))
+                except OverlapError as e:
+                    return web.json_response({
+                        "status": "error",
+                        "message": str(e)
+                    }, status=409)
+
+                result = await db.tasks.insert_one(task)
+                if not result.inserted_id:
+                    return web.json_response({
+                        "status": "error",
+                        "message": "Failed to insert task"
+                    }, status=500)
+
+                # Update task with the new ID
+                task["_id"] = result.inserted_id
+                fixed_task = fix_object_id(task)
+
+                graph.add_task(str(result.inserted_id), task["dependencies"])
+                busy.set_task(str(result.inserted_id), task)
+                version = await bump_state_version(db, user_id, request.app[REPLICAS_KEY])
+                index.committed(user_id, graph, version)
+                busy_index.committed(user_id, busy, version)
+            await emit_state(request.app, user_id)
             return web.json_response({
                 "status": "ok",
                 "result": fixed_task,
@@ -542,46 +1078,109 @@ async def route_user_task_update(request):
 
         obj_id = obj_id_or_error
 
-        try:
-            task = await request.json()
-        except json.JSONDecodeError:
+        body = await request.read()
+        task, error = await request.app[OFFLOADER_KEY].run(len(body), parse_task_body, body)
+        if error:
             return web.json_response({
                 "status": "error",
-                "message": "Invalid JSON in request body"
+                "message": error
             }, status=400)
 
-        # Normalize task dates and durations
-        task = normalize_task_dates(task)
-
-        valid, error = validate_schema(task, "RawTask")
-        if not valid:
+        # Check user ID consistency if present
+        if "userId" in task and task["userId"] != user_id:
             return web.json_response({
                 "status": "error",
-                "message": error
+                "message": "User ID in task does not match URL parameter"
             }, status=400)
 
-        existing_task = await db.tasks.find_one({"_id": obj_id})
-        if not existing_task or existing_task.get("userId") != user_id:
+        success, nonce_or_error = parse_expected_nonce(request)
+        if not success:
             return web.json_response({
                 "status": "error",
-                "message": "Task not found"
-            }, status=404)
-
-        result = await db.tasks.update_one({"_id": obj_id}, {"$set": task})
-
-        if result.matched_count:
-            updated_task = await db.tasks.find_one({"_id": obj_id})
-            fixed_task = fix_object_id(updated_task)
+                "message": nonce_or_error
+            }, status=400)
 
-            await emit_state(user_id)
-            return web.json_response({
-                "status": "ok",
-                "result": fixed_task,
-            })
+        expected_nonce = nonce_or_error
+        query = {"_id": obj_id, "userId": user_id}
+        if expected_nonce is not None:
+            query["nonce"] = expected_nonce
+
+        # The nonce is owned by the server: every write bumps it atomically
+        task.pop("nonce", None)
+        task.pop("_id", None)
+
+        db = request.app[DB_KEY]
+        index = request.app[DEPENDENCY_INDEX_KEY]
+        busy_index = request.app[BUSY_INDEX_KEY]
+        fixed = task.get("type") == "fixed"
+        async with index.editing(user_id):
+            # The version lives in its own collection, so reading and bumping it cannot
+            # share the task's find_one_and_update: the read proves the cached indexes
+            # have seen writes made by other processes, and the bump has to follow the
+            # write. Cold indexes load concurrently, and the busy times are only needed
+            # to check a fixed task or to keep already cached ones current.
+            version = await get_state_version(db, user_id)
+            if not fixed:
+                graph = await index.get(db, user_id, version)
+                busy = busy_index.cached(user_id, version)
+            else:
+                graph, busy = await asyncio.gather(
+                    index.get(db, user_id, version),
+                    busy_index.get(db, user_id, version),
+                )
+            key = str(obj_id)
+            previous = None
+            previous_times = None
+            # A task missing from the graph does not belong to the user; the update reports that
+            if key in graph:
+                if fixed:
+                    try:
+                        busy.check_task(task, int(datetime.now(timezone.utc).timestamp()), task_id=key)
+                    except OverlapError as e:
+                        return web.json_response({
+                            "status": "error",
+                            "message": str(e)
+                        }, status=409)
+                try:
+                    previous = graph.set_dependencies(key, task["dependencies"])
+                except DependencyError as e:
+                    return web.json_response({
+                        "status": "error",
+                        "message": str(e)
+                    }, status=400)
+                if busy is not None:
+                    previous_times = busy.set_task(key, task)
+
+            try:
+                updated_task = await db.tasks.find_one_and_update(
+                    query,
+                    {"$set": task, "$inc": {"nonce": 1}},
+                    return_document=ReturnDocument.AFTER,
+                )
+            except Exception:
+                index.invalidate(user_id)
+                busy_index.invalidate(user_id)
+                raise
+            if updated_task is None:
+                if previous is not None:
+                    graph.restore(key, previous)
+                    if busy is not None:
+                        busy.restore_task(key, previous_times)
+                return await explain_missing_task(db, obj_id, user_id, expected_nonce)
+
+            version = await bump_state_version(db, user_id, request.app[REPLICAS_KEY])
+            index.committed(user_id, graph, version)
+            if busy is not None:
+                # The stored task keeps fields the body left out, such as its recurrence rule
+                busy.set_task(key, updated_task)
+                busy_index.committed(user_id, busy, version)
+
+        fixed_task = fix_object_id(updated_task)
+        await emit_state(request.app, user_id)
         return web.json_response({
-            "status": "error",
-            "message": "Task not found"
-        }, status=404)
+            "status": "ok",
+            "result": fixed_task,
+        })
     except Exception as e:
         logger.error(f"Error in route_user_task_update: {e}")
         return web.json_response({
@@ -622,32 +1221,41 @@ async def route_user_task_delete(request):
 
         obj_id = obj_id_or_error
 
-        # Check if task exists and belongs to user
-        existing_task = await db.tasks.find_one({"_id": obj_id})
-        if not existing_task:
-            return web.json_response({
-                "status": "error",
-                "message": "Task not found"
-            }, status=404)
-
-        if existing_task.get("userId") != user_id:
+        success, nonce_or_error = parse_expected_nonce(request)
+        if not success:
             return web.json_response({
                 "status": "error",
-                "message": "Task belongs to a different user"
-            }, status=403)
-
-        result = await db.tasks.delete_one({"_id": obj_id})
+                "message": nonce_or_error
+            }, status=400)
 
-        if result.deleted_count:
-            await emit_state(user_id)
-            return web.json_response({
-                "status": "ok",
-                "message": "Task deleted"
-            }, status=200)
+        expected_nonce = nonce_or_error
+        query = {"_id": obj_id, "userId": user_id}
+        if expected_nonce is not None:
+            query["nonce"] = expected_nonce
+
+        db = request.app[DB_KEY]
+        index = request.app[DEPENDENCY_INDEX_KEY]
+        async with index.editing(user_id):
+            deleted_task = await db.tasks.find_one_and_delete(query, projection={"_id": 1})
+            if deleted_task is None:
+                return await explain_missing_task(db, obj_id, user_id, expected_nonce, other_user_status=403)
+
+            version = await bump_state_version(db, user_id, request.app[REPLICAS_KEY])
+            # Tasks that depended on the deleted one are left with a dangling reference
+            graph = index.graphs.get(user_id)
+            if graph is not None:
+                graph.remove_task(str(obj_id))
+                index.committed(user_id, graph, version)
+            busy_index = request.app[BUSY_INDEX_KEY]
+            busy = busy_index.users.get(user_id)
+            if busy is not None:
+                busy.set_task(str(obj_id), None)
+                busy_index.committed(user_id, busy, version)
+        await emit_state(request.app, user_id)
         return web.json_response({
-            "status": "error",
-            "message": "Task not found"
-        }, status=404)
+            "status": "ok",
+            "message": "Task deleted"
+        }, status=200)
     except Exception as e:
         logger.error(f"Error in route_user_task_delete: {e}")
         return web.json_response({
@@ -656,20 +1264,251 @@ async def route_user_task_delete(request):
         }, status=500)
 
 
-async def route_user_slots(request):
+async def update_occurrence(request, override):
     """
-    Handler for GET /user/{user_id}/slot
-
-    Retrieves all slots for a user.
+    Override or cancel one occurrence of a recurring task.
 
     Args:
-        request (Request): The HTTP request object
+        request (Request): The request to /user/{user_id}/task/{task_id}/occurrence/{occurrence}
+        override (dict | None): Fields of the occurrence to change, None to cancel it
 
     Returns:
-        Response: JSON response with slots or error
+        Response: JSON response with the updated recurring task or error
     """
-    try:
-        success, user_id_or_error = safe_int(request.match_info['user_id'], "User ID")
+    success, user_id_or_error = safe_int(request.match_info['user_id'], "User ID")
+    if not success:
+        return web.json_response({
+            "status": "error",
+            "message": user_id_or_error
+        }, status=400)
+
+    user_id = user_id_or_error
+    success, obj_id_or_error = safe_object_id(request.match_info['task_id'])
+    if not success:
+        return web.json_response({
+            "status": "error",
+            "message": obj_id_or_error
+        }, status=400)
+
+    obj_id = obj_id_or_error
+    key = request.match_info['occurrence']
+    try:
+        moment = parse_occurrence_key(key)
+    except RecurrenceError as e:
+        return web.json_response({
+            "status": "error",
+            "message": str(e)
+        }, status=400)
+
+    success, nonce_or_error = parse_expected_nonce(request)
+    if not success:
+        return web.json_response({
+            "status": "error",
+            "message": nonce_or_error
+        }, status=400)
+
+    expected_nonce = nonce_or_error
+    db = request.app[DB_KEY]
+    index = request.app[DEPENDENCY_INDEX_KEY]
+    busy_index = request.app[BUSY_INDEX_KEY]
+    async with index.editing(user_id):
+        version = await get_state_version(db, user_id)
+        task = await db.tasks.find_one({"_id": obj_id, "userId": user_id})
+        if task is None or (expected_nonce is not None and task.get("nonce") != expected_nonce):
+            return await explain_missing_task(db, obj_id, user_id, expected_nonce)
+        if not task.get("recurrence"):
+            return web.json_response({
+                "status": "error",
+                "message": "Task is not recurring"
+            }, status=400)
+        if not Series(task).contains(moment):
+            return web.json_response({
+                "status": "error",
+                "message": f"Task has no occurrence {key}"
+            }, status=404)
+
+        if override is None:
+            update = {
+                "$addToSet": {"recurrence.exceptions": key},
+                "$unset": {f"recurrence.overrides.{key}": ""},
+            }
+        else:
+            instance = {field: value for field, value in fix_object_id(task).items() if field != "recurrence"}
+            valid, error = validate_schema({**instance, **override}, "RawTask")
+            if not valid:
+                return web.json_response({
+                    "status": "error",
+                    "message": error
+                }, status=400)
+            update = {
+                "$set": {f"recurrence.overrides.{key}": override},
+                "$pull": {"recurrence.exceptions": key},
+            }
+        update["$inc"] = {"nonce": 1}
+
+        # Conditioned on the nonce that was read, so that concurrent edits of the rule are not lost
+        updated_task = await db.tasks.find_one_and_update(
+            {"_id": obj_id, "userId": user_id, "nonce": task.get("nonce")},
+            update,
+            return_document=ReturnDocument.AFTER,
+        )
+        if updated_task is None:
+            return await explain_missing_task(db, obj_id, user_id, task.get("nonce"))
+
+        # Dependencies did not change; the busy times get the new rule
+        new_version = await bump_state_version(db, user_id, request.app[REPLICAS_KEY])
+        busy = busy_index.cached(user_id, version)
+        if busy is not None:
+            busy.set_task(str(obj_id), updated_task)
+        for cache, cached in ((index, index.cached(user_id, version)), (busy_index, busy)):
+            if cached is not None:
+                cache.committed(user_id, cached, new_version)
+
+    await emit_state(request.app, user_id)
+    return web.json_response({
+        "status": "ok",
+        "result": fix_object_id(updated_task),
+    })
+
+
+async def route_user_occurrence_update(request):
+    """
+    Handler for PUT /user/{user_id}/task/{task_id}/occurrence/{occurrence}
+
+    Overrides fields of one occurrence of a recurring task, e.g. moves it.
+    The body holds the fields to change (see `OVERRIDE_FIELDS`); it replaces
+    an earlier override of the same occurrence and restores it if it was cancelled.
+
+    Args:
+        request (Request): The HTTP request object with the override in JSON body
+
+    Returns:
+        Response: JSON response with the updated recurring task or error
+    """
+    try:
+        try:
+            override = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return web.json_response({
+                "status": "error",
+                "message": "Invalid JSON in request body"
+            }, status=400)
+        if not isinstance(override, dict) or not override:
+            return web.json_response({
+                "status": "error",
+                "message": "Override must be a non-empty object"
+            }, status=400)
+        unknown = sorted(set(override) - set(OVERRIDE_FIELDS))
+        if unknown:
+            return web.json_response({
+                "status": "error",
+                "message": f"Field cannot be overridden: {unknown[0]}"
+            }, status=400)
+        normalize_override(override)
+        return await update_occurrence(request, override)
+    except Exception as e:
+        logger.error(f"Error in route_user_occurrence_update: {e}")
+        return web.json_response({
+            "status": "error",
+            "message": str(e)
+        }, status=500)
+
+
+async def route_user_occurrence_delete(request):
+    """
+    Handler for DELETE /user/{user_id}/task/{task_id}/occurrence/{occurrence}
+
+    Cancels one occurrence of a recurring task; it still counts towards the rule's `count`.
+
+    Args:
+        request (Request): The HTTP request object
+
+    Returns:
+        Response: JSON response with the updated recurring task or error
+    """
+    try:
+        return await update_occurrence(request, None)
+    except Exception as e:
+        logger.error(f"Error in route_user_occurrence_delete: {e}")
+        return web.json_response({
+            "status": "error",
+            "message": str(e)
+        }, status=500)
+
+
+async def route_user_slots(request):
+    """
+    Handler for GET /user/{user_id}/slot
+
+    Retrieves all slots for a user.
+
+    Args:
+        request (Request): The HTTP request object
+
+    Returns:
+        Response: JSON response with slots or error
+    """
+    try:
+        success, user_id_or_error = safe_int(request.match_info['user_id'], "User ID")
+        if not success:
+            return web.json_response({
+                "status": "error",
+                "message": user_id_or_error
+            }, status=400)
+
+        user_id = user_id_or_error
+
+        async with request.app[REPLICAS_KEY].reading(user_id, request.get(CAUSAL_KEY)) as reader:
+            etag = make_etag("slot", user_id, await get_state_version(reader.db, user_id, reader.session))
+            matched = matching_etag(request, etag)
+            if matched:
+                return not_modified(matched)
+
+            slots = await find_raw(reader.db.slots, {"userId": user_id}, reader.session)
+        body = await request.app[OFFLOADER_KEY].run(len(slots), render_documents, slots)
+
+        return web.Response(text=body, content_type="application/json",
+                            headers={"ETag": etag, "Cache-Control": "no-cache"})
+    except Exception as e:
+        logger.error(f"Error in route_user_slots: {e}")
+        return web.json_response({
+            "status": "error",
+            "message": str(e)
+        }, status=500)
+
+
+def render_archived(documents):
+    """
+    Returns:
+        list[dict]: Archived documents with string IDs and ISO 8601 archive times
+    """
+    result = []
+    for document in fix_object_id(documents):
+        for field in ("endsAt", "archivedAt"):
+            if isinstance(document.get(field), datetime):
+                moment = document[field]
+                if moment.tzinfo is None:
+                    moment = moment.replace(tzinfo=timezone.utc)
+                document[field] = moment.isoformat()
+        result.append(document)
+    return result
+
+
+async def route_user_history(request):
+    """
+    Handler for GET /user/{user_id}/history/{kind}?cursor=&limit=
+
+    Pages through a user's archived slots or tasks (`kind` is "slots" or "tasks"),
+    most recently ended first.
+
+    Args:
+        request (Request): The HTTP request object
+
+    Returns:
+        Response: JSON response with a page of archived documents and the next cursor, or error
+    """
+    try:
+        success, user_id_or_error = safe_int(request.match_info['user_id'], "User ID")
         if not success:
             return web.json_response({
                 "status": "error",
@@ -677,54 +1516,634 @@ async def route_user_slots(request):
             }, status=400)
 
         user_id = user_id_or_error
-        slots = await db.slots.find({"userId": user_id}).to_list(None)
-        fixed_slots = fix_object_id(slots)
+        kind = request.match_info['kind']
+        if kind not in ARCHIVES:
+            return web.json_response({
+                "status": "error",
+                "message": f"Unknown history: {kind}, expected one of {', '.join(ARCHIVES)}"
+            }, status=404)
+
+        limit = HISTORY_PAGE_SIZE
+        if request.query.get("limit"):
+            success, limit = safe_int(request.query["limit"], "limit")
+            if not success:
+                return web.json_response({
+                    "status": "error",
+                    "message": limit
+                }, status=400)
+            if not 1 <= limit <= HISTORY_MAX_PAGE_SIZE:
+                return web.json_response({
+                    "status": "error",
+                    "message": f"limit must be between 1 and {HISTORY_MAX_PAGE_SIZE}"
+                }, status=400)
+
+        try:
+            documents, cursor = await read_history(
+                request.app[DB_KEY], user_id, kind, request.query.get("cursor") or None, limit
+            )
+        except ValueError as e:
+            return web.json_response({
+                "status": "error",
+                "message": str(e)
+            }, status=400)
 
         return web.json_response({
             "status": "ok",
-            "result": fixed_slots,
+            "result": {"items": render_archived(documents), "next": cursor},
         })
     except Exception as e:
-        logger.error(f"Error in route_user_slots: {e}")
+        logger.error(f"Error in route_user_history: {e}")
         return web.json_response({
             "status": "error",
             "message": str(e)
         }, status=500)
 
 
-async def do_scheduling(user_id, tasks) -> str | None:
+async def route_user_dependencies(request):
+    """
+    Handler for GET /user/{user_id}/dependencies
+
+    Reports the user's task dependency graph: a topological order of the tasks,
+    references to tasks that no longer exist, and dependencies ignored because
+    they form a cycle (only possible in data written before cycles were rejected).
+
+    Args:
+        request (Request): The HTTP request object
+
+    Returns:
+        Response: JSON response with the graph report or error
+    """
+    try:
+        success, user_id_or_error = safe_int(request.match_info['user_id'], "User ID")
+        if not success:
+            return web.json_response({
+                "status": "error",
+                "message": user_id_or_error
+            }, status=400)
+
+        user_id = user_id_or_error
+        db = request.app[DB_KEY]
+
+        version = await get_state_version(db, user_id)
+        etag = make_etag("dependencies", user_id, version)
+        matched = matching_etag(request, etag)
+        if matched:
+            return not_modified(matched)
+
+        graph = await request.app[DEPENDENCY_INDEX_KEY].get(db, user_id, version)
+        return web.json_response({
+            "status": "ok",
+            "result": {
+                "order": graph.order(),
+                "dangling": graph.dangling(),
+                "cycles": [list(edge) for edge in graph.rejected],
+            },
+        }, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    except Exception as e:
+        logger.error(f"Error in route_user_dependencies: {e}")
+        return web.json_response({
+            "status": "error",
+            "message": str(e)
+        }, status=500)
+
+
+def parse_time_range(query):
+    """
+    Parse the `from` and `to` query parameters of a read window.
+
+    Args:
+        query (Mapping): Query parameters, `from` and `to` are ISO 8601 date-times
+
+    Returns:
+        tuple: (bool, tuple[int, int] | str) - Success flag and the range in seconds
+            since the epoch, or an error message
+    """
+    bounds = []
+    for name in ("from", "to"):
+        if not query.get(name):
+            return False, f"Missing query parameter: {name}"
+        try:
+            bounds.append(local_solver.parse_time(query[name]))
+        except ValueError:
+            return False, f"Invalid date-time for {name}: {query[name]}"
+    start, end = bounds
+    if end <= start:
+        return False, "to must be after from"
+    if end - start > MAX_RANGE_DAYS * 86400:
+        return False, f"The range cannot be longer than {MAX_RANGE_DAYS} days"
+    return True, (start, end)
+
+
+def parse_freebusy_query(query):
+    """
+    Parse the query of GET /user/{user_id}/freebusy.
+
+    Args:
+        query (Mapping): Query parameters: `from` and `to` (ISO 8601 date-times)
+            and optionally `min` (minutes)
+
+    Returns:
+        tuple: (bool, tuple[int, int, int] | str) - Success flag and the range and the
+            shortest free interval in seconds, or an error message
+    """
+    success, range_or_error = parse_time_range(query)
+    if not success:
+        return False, range_or_error
+    start, end = range_or_error
+
+    minimum = 0
+    if query.get("min"):
+        success, minimum = safe_int(query["min"], "min")
+        if not success:
+            return False, minimum
+        if minimum < 0:
+            return False, "min must not be negative"
+    return True, (start, end, minimum * 60)
+
+
+async def route_user_freebusy(request):
+    """
+    Handler for GET /user/{user_id}/freebusy?from=&to=&min=
+
+    Reports when a user is busy (fixed tasks and scheduled slots) and free
+    between `from` and `to`. Free intervals shorter than `min` minutes are
+    left out.
+
+    Args:
+        request (Request): The HTTP request object
+
+    Returns:
+        Response: JSON response with busy and free intervals or error
+    """
+    try:
+        success, user_id_or_error = safe_int(request.match_info['user_id'], "User ID")
+        if not success:
+            return web.json_response({
+                "status": "error",
+                "message": user_id_or_error
+            }, status=400)
+
+        user_id = user_id_or_error
+        success, query_or_error = parse_freebusy_query(request.query)
+        if not success:
+            return web.json_response({
+                "status": "error",
+                "message": query_or_error
+            }, status=400)
+
+        start, end, minimum = query_or_error
+        db = request.app[DB_KEY]
+
+        version = await get_state_version(db, user_id)
+        etag = make_etag("freebusy", user_id, version, (start, end, minimum))
+        matched = matching_etag(request, etag)
+        if matched:
+            return not_modified(matched)
+
+        times = await request.app[BUSY_INDEX_KEY].get(db, user_id, version)
+        busy = times.busy(start, end)
+        return web.json_response({
+            "status": "ok",
+            "result": {
+                "from": local_solver.format_time(start),
+                "to": local_solver.format_time(end),
+                "busy": format_intervals(busy),
+                "free": format_intervals(times.free(start, end, minimum, busy)),
+            },
+        }, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    except Exception as e:
+        logger.error(f"Error in route_user_freebusy: {e}")
+        return web.json_response({
+            "status": "error",
+            "message": str(e)
+        }, status=500)
+
+
+async def route_user_import_ics(request):
+    """
+    Handler for POST /user/{user_id}/import.ics
+
+    Imports the events of an iCalendar upload as fixed tasks.
+
+    The body is parsed as it arrives and tasks are inserted in batches,
+    so memory use does not grow with the size of the calendar. Events are
+    normalized and validated like tasks sent to POST /task; events that
+    fail validation, overlap a fixed task or exceed the task limit are
+    skipped and counted.
+
+    Args:
+        request (Request): The HTTP request object with a text/calendar body
+
+    Returns:
+        Response: JSON response with import counts or error
+    """
+    try:
+        success, user_id_or_error = safe_int(request.match_info['user_id'], "User ID")
+        if not success:
+            return web.json_response({
+                "status": "error",
+                "message": user_id_or_error
+            }, status=400)
+
+        user_id = user_id_or_error
+        db = request.app[DB_KEY]
+
+        capacity = MAX_TASKS_PER_USER - await db.tasks.count_documents({"userId": user_id})
+        imported, skipped, errors = 0, 0, []
+        batch = []
+
+        async def flush():
+            nonlocal imported
+            if batch:
+                await db.tasks.insert_many(batch, ordered=False)
+                imported += len(batch)
+                batch.clear()
+
+        index = request.app[DEPENDENCY_INDEX_KEY]
+        busy_index = request.app[BUSY_INDEX_KEY]
+        # Held for the whole upload, so that events are checked against fixed tasks created meanwhile
+        async with index.editing(user_id):
+            busy = await busy_index.get(db, user_id, await get_state_version(db, user_id))
+            now = int(datetime.now(timezone.utc).timestamp())
+            completed = False
+            try:
+                async for event in iter_events(iter_lines(request.content.iter_chunked(ICS_CHUNK_SIZE))):
+                    try:
+                        task = event_to_task(event)
+                    except ICalError as e:
+                        task, error = None, str(e)
+                    else:
+                        if task is None:
+                            continue
+                        task, error = prepare_task(task)
+
+                    if error is None and imported + len(batch) >= capacity:
+                        error = f"Maximum number of tasks ({MAX_TASKS_PER_USER}) reached for this user"
+                    if error is None:
+                        try:
+                            busy.check_task(task, now)
+                        except OverlapError as e:
+                            error = str(e)
+                    if error is not None:
+                        skipped += 1
+                        if error not in errors and len(errors) < IMPORT_MAX_ERRORS:
+                            errors.append(error)
+                        continue
+
+                    task["userId"] = user_id
+                    # Known before the insert, so that later events are checked against this one
+                    task["_id"] = bson.ObjectId()
+                    busy.set_task(str(task["_id"]), task)
+                    batch.append(task)
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        await flush()
+                await flush()
+                completed = True
+            except ICalError as e:
+                return web.json_response({
+                    "status": "error",
+                    "message": f"Invalid calendar after importing {imported} events: {e}"
+                }, status=400)
+            finally:
+                version = await bump_state_version(db, user_id, request.app[REPLICAS_KEY]) if imported else None
+                if not completed:
+                    # Events that were checked but not inserted are still in the busy times
+                    busy_index.invalidate(user_id)
+                elif imported:
+                    busy_index.committed(user_id, busy, version)
+                if imported:
+                    await emit_state(request.app, user_id)
+
+        return web.json_response({
+            "status": "ok",
+            "result": {"imported": imported, "skipped": skipped, "errors": errors},
+        }, status=201)
+    except Exception as e:
+        logger.error(f"Error in route_user_import_ics: {e}")
+        return web.json_response({
+            "status": "error",
+            "message": str(e)
+        }, status=500)
+
+
+async def route_user_export_ics(request):
+    """
+    Handler for GET /user/{user_id}/export.ics
+
+    Streams a user's slots as an iCalendar file straight from the database cursor.
+
+    Args:
+        request (Request): The HTTP request object
+
+    Returns:
+        StreamResponse: The calendar, or a JSON error response
+    """
+    success, user_id_or_error = safe_int(request.match_info['user_id'], "User ID")
+    if not success:
+        return web.json_response({
+            "status": "error",
+            "message": user_id_or_error
+        }, status=400)
+
+    user_id = user_id_or_error
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/calendar; charset=utf-8",
+        "Content-Disposition": f'attachment; filename="schedge-{user_id}.ics"',
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    })
+    response.enable_compression()
+    await response.prepare(request)
+
+    stamp = format_ical_datetime(datetime.now().astimezone())
+    buffer = bytearray(calendar_header())
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(SOLVER_SERVER_URL, json=fix_object_id(tasks)) as resp:
-                if resp.status != 200:
-                    error_message = await resp.text()
-                    logger.error(f"Error in do_scheduling ({resp.status}): {error_message}")
-                    return f"Solver server returned error: {error_message}"
+        async for slot in request.app[DB_KEY].slots.find({"userId": user_id}):
+            buffer += slot_to_event(slot, stamp)
+            if len(buffer) >= ICS_CHUNK_SIZE:
+                await response.write(bytes(buffer))
+                buffer.clear()
+    except Exception as e:
+        # The headers are already sent: abort the connection so that clients
+        # see a failed download rather than a calendar with missing events
+        logger.error(f"Error in route_user_export_ics: {e}")
+        raise
+
+    buffer += CALENDAR_FOOTER
+    await response.write(bytes(buffer))
+    await response.write_eof()
+    return response
 
-                response_data = await resp.json()
 
-        slots = response_data
-        for slot in slots:
-            slot["userId"] = user_id
+def parse_scheduling_options(options):
+    """
+    Extract solver parameters from compute_slot_request options.
+
+    Args:
+        options (dict): The request options, may contain
+            `stream` (bool), `budgetMs` (int, milliseconds), `seed` (int)
+            and `allowPartial` (bool)
+
+    Returns:
+        tuple: (bool, dict | str) - Success flag and the solver query
+            parameters, or an error message; `allow_partial` is taken out
+            by do_scheduling before the solver sees them
+    """
+    params = {}
+    if "allowPartial" in options and options["allowPartial"] is not None:
+        if not isinstance(options["allowPartial"], bool):
+            return False, "allowPartial must be a boolean"
+        if options["allowPartial"]:
+            params["allow_partial"] = True
+    if "budgetMs" in options and options["budgetMs"] is not None:
+        budget = options["budgetMs"]
+        if isinstance(budget, bool) or not isinstance(budget, int) or budget <= 0:
+            return False, "budgetMs must be a positive integer"
+        params["budget_ms"] = budget
+    if "seed" in options and options["seed"] is not None:
+        seed = options["seed"]
+        if isinstance(seed, bool) or not isinstance(seed, int) or not 0 <= seed < 2 ** 64:
+            return False, "seed must be a non-negative 64-bit integer"
+        params["seed"] = seed
+    return True, params
+
+
+async def solve_remotely(app, user_id, tasks, params=None, stream=False):
+    """
+    Schedule with the solver service, unless the task set is small
+    or the solver is unavailable.
 
-        await db.slots.delete_many({"userId": user_id})
-        if slots:
-            await db.slots.insert_many(slots)
+    Args:
+        app (Application): The application
+        user_id (int): The user to schedule for
+        tasks (list[dict]): Tasks in the solver's format
+        params (dict | None): Solver query parameters (budget_ms, seed)
+        stream (bool): Forward provisional schedules over the WebSocket
 
-        await emit_state(user_id)
+    Returns:
+        list[dict] | None: The slots, or None if the tasks should be scheduled locally
+    """
+    solver = app[SOLVER_KEY]
+    if len(tasks) <= app[CONFIG_KEY].local_solver_max_tasks or not solver.available():
+        return None
+    try:
+        if stream:
+            async def on_progress(slots):
+                await emit_provisional_state(app, user_id, tasks, slots)
+
+            return await solver.stream(tasks, on_progress, params)
+        return await app[SOLVER_BATCHER_KEY].schedule(tasks, params)
+    except SolverError as e:
+        if not e.retryable:
+            raise
+        logger.warning(f"Solver unavailable, scheduling locally: {e.message}")
         return None
+
+
+async def solve_locally(app, tasks, params=None):
+    """
+    Schedule with the in-process solver: inline for small task sets,
+    in the offload pool for larger ones.
+    """
+    params = params or {}
+    args = (tasks, None, params.get("seed"), params.get("budget_ms"))
+    if len(tasks) <= app[CONFIG_KEY].local_solver_max_tasks:
+        return local_solver.solve(*args)
+    return await app[OFFLOADER_KEY].submit(local_solver.solve, *args)
+
+
+async def check_feasibility(app, tasks, now):
+    """
+    Find task sets that cannot fit around their fixed tasks before they reach a solver:
+    inline for small task sets, in the offload pool for larger ones.
+
+    Returns:
+        dict | None: The overloaded windows and tasks (see feasibility.analyze),
+            None if the tasks may fit
+    """
+    if len(tasks) <= app[CONFIG_KEY].local_solver_max_tasks:
+        analysis = analyze(tasks, now)
+    else:
+        analysis = await app[OFFLOADER_KEY].submit(analyze, tasks, now)
+    if analysis["windows"] or analysis["tasks"]:
+        return analysis
+    return None
+
+
+async def do_scheduling(app, user_id, tasks, params=None, stream=False,
+                        confirm=None) -> tuple[str | None, int, dict | None]:
+    """
+    Solve a user's tasks and replace their slots with the result.
+
+    Args:
+        app (Application): The application
+        user_id (int): The user to schedule for
+        tasks (list[dict]): The user's tasks as stored in the database
+        params (dict | None): Solver query parameters (budget_ms, seed), and
+            allow_partial to schedule tasks that cannot all fit as far as they go
+        stream (bool): Forward provisional schedules over the WebSocket
+            while the solver is still searching
+        confirm (Callable[[], Awaitable[bool]] | None): Checked right before the slots
+            are replaced; the result is dropped if it returns False
+
+    Returns:
+        tuple[str | None, int, dict | None]: An error message, or None on success; the
+            HTTP status of the outcome, 4xx if solving the same tasks again cannot succeed;
+            and the analysis of tasks that cannot all fit around the fixed ones. Such tasks
+            are not solved (422) unless allow_partial is set
+    """
+    db = app[DB_KEY]
+    params = dict(params or {})
+    allow_partial = params.pop("allow_partial", False)
+    with tracing.span("scheduling", attributes={"user.id": user_id, "tasks": len(tasks), "stream": stream}) as span:
+        try:
+            # Dependencies before their dependents, without references to deleted tasks
+            graph = await app[DEPENDENCY_INDEX_KEY].get(db, user_id, await get_state_version(db, user_id))
+            # Recurring tasks become their occurrences within the solver's horizon
+            now = datetime.now(timezone.utc)
+            fixed_tasks, broken = expand_tasks(
+                sort_tasks(fix_object_id(tasks), graph), now, now + timedelta(seconds=local_solver.HORIZON)
+            )
+            if broken:
+                logger.warning(f"Recurring tasks of user {user_id} with invalid times left out: {broken}")
+            analysis = None
+            if app[CONFIG_KEY].feasibility_check:
+                with tracing.span("feasibility"):
+                    analysis = await check_feasibility(app, fixed_tasks, now)
+                if analysis is not None:
+                    logger.info(f"Tasks of user {user_id} cannot all be scheduled: {describe(analysis)}")
+                    if not allow_partial:
+                        # The solver would leave some of them out; the user decides what to drop
+                        return describe(analysis), 422, analysis
+            async with app[SOLVE_LIMIT_KEY]:
+                with tracing.span("solve.remote"):
+                    slots = await solve_remotely(app, user_id, fixed_tasks, params, stream)
+                if slots is None:
+                    with tracing.span("solve.local"):
+                        slots = await solve_locally(app, fixed_tasks, params)
+
+            for slot in slots:
+                slot["userId"] = user_id
+
+            with tracing.span("slots.replace", attributes={"slots": len(slots)}):
+                async with app[DEPENDENCY_INDEX_KEY].editing(user_id):
+                    if confirm is not None and not await confirm():
+                        return "Scheduling was taken over before the result was saved", 409, None
+                    await db.slots.delete_many({"userId": user_id})
+                    if slots:
+                        await db.slots.insert_many(slots)
+
+                    version = await bump_state_version(db, user_id, app[REPLICAS_KEY])
+                    busy_index = app[BUSY_INDEX_KEY]
+                    busy = busy_index.users.get(user_id)
+                    if busy is not None:
+                        busy.replace_slots(interval for interval in map(task_interval, slots) if interval is not None)
+                        busy_index.committed(user_id, busy, version)
+            config = app[CONFIG_KEY]
+            try:
+                await record_solve(db, user_id, fixed_tasks, config.resolve_max_age, config.resolve_jitter)
+            except Exception as e:
+                # The new slots are saved; only the next background re-solve is affected
+                logger.error(f"Failed to record solve time for user {user_id}: {e}")
+            await emit_state(app, user_id)
+            return None, 201, analysis
+        except SolverError as e:
+            logger.error(f"Error in do_scheduling ({e.status}): {e.message}")
+            if span is not None:
+                span.record_exception(e)
+            # The solver rejects the same tasks again, e.g. as invalid or impossible to schedule
+            status = 422 if e.status is not None and 400 <= e.status < 500 else 500
+            return f"Solver server returned error: {e.message}", status, None
+        except Exception as e:
+            logger.error(f"Error in do_scheduling: {e}")
+            if span is not None:
+                span.record_exception(e)
+            return f"Unknown scheduling error: {str(e)}", 500, None
+
+
+async def run_job(app, job):
+    """
+    Run a queued scheduling job on the tasks stored now; used by the JobWorker.
+
+    Returns:
+        str | None: An error message, or None on success
+
+    Raises:
+        PermanentJobError: If running the job again cannot succeed
+    """
+    attributes = {"user.id": job["userId"], "job.id": str(job["_id"]), "job.attempt": job["attempts"]}
+    # Continues the trace of the request that queued the job
+    with app[TRACER_KEY].span("job", attributes=attributes, parent=tracing.parse_traceparent(job.get("traceparent"))):
+        tasks = await app[DB_KEY].tasks.find({"userId": job["userId"]}).to_list(None)
+        # Another worker may have claimed the job while it was solving
+        confirm = functools.partial(app[JOB_WORKER_KEY].renew, job)
+        error, status, analysis = await do_scheduling(
+            app, job["userId"], tasks, job.get("params"), job.get("stream", False), confirm
+        )
+        if error is not None and status < 500:
+            if analysis is not None:
+                # Connections of other processes get it from the job through their JobListener
+                await emit_state(app, job["userId"], analysis)
+            raise PermanentJobError(error, analysis)
+        return error
+
+
+async def resolve_user(app, user_id):
+    """
+    Re-solve a user's schedule from the tasks currently stored; used by the ResolveWorker.
+
+    Returns:
+        str | None: An error message, or None on success
+    """
+    tasks = await app[DB_KEY].tasks.find({"userId": user_id}).to_list(None)
+    error, _status, _analysis = await do_scheduling(app, user_id, tasks)
+    if error is None:
+        await announce_state(app, user_id)
+    return error
+
+
+async def announce_state(app, user_id):
+    """
+    Let the JobListeners of the other processes emit a state that background work of
+    this process changed outside a job; their WebSocket clients do not see it otherwise.
+    """
+    if app[CONFIG_KEY].job_store == "memory":
+        return
+    worker_id = app[JOB_WORKER_KEY].worker_id if JOB_WORKER_KEY in app else PROCESS_ID
+    try:
+        await app[JOB_STORE_KEY].announce(user_id, worker_id)
     except Exception as e:
-        logger.error(f"Error in do_scheduling: {e}")
-        return f"Unknown scheduling error: {str(e)}"
+        logger.error(f"Failed to announce the new state of user {user_id}: {e}")
+
+
+async def commit_compaction(app, user_id):
+    """
+    Record that the Compactor moved some of a user's slots or tasks to the archive;
+    called while it holds the user's editing lock, like the writes of do_scheduling.
+    """
+    # The cached graph and busy times still hold the moved documents
+    app[DEPENDENCY_INDEX_KEY].invalidate(user_id)
+    app[BUSY_INDEX_KEY].invalidate(user_id)
+    await bump_state_version(app[DB_KEY], user_id, app[REPLICAS_KEY])
+
+
+async def publish_compaction(app, user_id):
+    """
+    Publish that the Compactor moved some of a user's slots or tasks to the archive.
+    """
+    await emit_state(app, user_id)
+    await announce_state(app, user_id)
 
 
 async def route_user_compute_slot_request(request):
     """
     Handler for POST /user/{user_id}/compute_slot_request
 
-    Initiates the scheduling process for a user's tasks.
+    Initiates the scheduling process for a user's tasks. With `sync`, the
+    schedule is computed before responding; otherwise a job is queued for
+    the scheduling workers and its ID returned.
 
-    Note: if scheduling operations fails, the user will not be notified
+    Note: if an asynchronous job fails, the user will not be notified
 
     Args:
         request (Request): The HTTP request object
@@ -742,8 +2161,6 @@ async def route_user_compute_slot_request(request):
 
         user_id = user_id_or_error
 
-        tasks = await db.tasks.find({"userId": user_id}).to_list(None)
-
         options = await request.json()
         if not isinstance(options, dict):
             return web.json_response({
@@ -751,19 +2168,50 @@ async def route_user_compute_slot_request(request):
                 "message": "Invalid options format, expected JSON object"
             }, status=400)
 
+        success, params_or_error = parse_scheduling_options(options)
+        if not success:
+            return web.json_response({
+                "status": "error",
+                "message": params_or_error
+            }, status=400)
+
+        params = params_or_error
+        stream = bool(options.get("stream"))
+
         if "sync" in options and options["sync"]:
-            error = await do_scheduling(user_id, tasks)
+            tasks = await request.app[DB_KEY].tasks.find({"userId": user_id}).to_list(None)
+            error, status, analysis = await do_scheduling(request.app, user_id, tasks, params, stream)
+            if error and analysis is not None:
+                return web.json_response({
+                    "status": "error",
+                    "message": error,
+                    "result": analysis,
+                }, status=status)
             if error:
                 return web.json_response({
                     "status": "error",
                     "message": error
-                }, status=500)
-        else:
-            asyncio.create_task(do_scheduling(user_id, tasks))
+                }, status=status)
+            if analysis is not None:
+                # With allowPartial: saved as far as it goes, the warning names what did not fit
+                return web.json_response({
+                    "status": "ok",
+                    "result": {"warning": describe(analysis), **analysis},
+                }, status=201)
+            return web.json_response({
+                "status": "ok",
+                "result": None,
+            }, status=201)
+
+        # The job carries the trace of this request to whichever worker runs it
+        traceparent = tracing.inject({}).get("traceparent")
+        job_id = await request.app[JOB_STORE_KEY].enqueue(user_id, params, stream, traceparent)
+        if JOB_WORKER_KEY in request.app:
+            request.app[JOB_WORKER_KEY].wake()
 
         return web.json_response({
             "status": "ok",
-            "result": None,
+            "result": {"jobId": str(job_id)},
         }, status=201)
     except Exception as e:
         logger.error(f"Error in route_user_compute_slot_request: {e}")
@@ -774,12 +2222,72 @@ async def route_user_compute_slot_request(request):
 
 
 
+async def route_user_job(request):
+    """
+    Handler for GET /user/{user_id}/job/{job_id}
+
+    Reports the progress of an asynchronous scheduling job.
+
+    Args:
+        request (Request): The HTTP request object
+
+    Returns:
+        Response: JSON response with the job's status or error
+    """
+    try:
+        success, user_id_or_error = safe_int(request.match_info['user_id'], "User ID")
+        if not success:
+            return web.json_response({
+                "status": "error",
+                "message": user_id_or_error
+            }, status=400)
+
+        user_id = user_id_or_error
+
+        success, job_id_or_error = safe_object_id(request.match_info['job_id'])
+        if not success:
+            return web.json_response({
+                "status": "error",
+                "message": job_id_or_error
+            }, status=400)
+
+        job = await request.app[JOB_STORE_KEY].get(job_id_or_error)
+        if job is None or job["userId"] != user_id:
+            return web.json_response({
+                "status": "error",
+                "message": "Job not found"
+            }, status=404)
+
+        return web.json_response({
+            "status": "ok",
+            "result": {
+                "id": str(job["_id"]),
+                "status": job["status"],
+                "attempts": job["attempts"],
+                "error": job.get("error"),
+                "details": job.get("details"),
+                **{
+                    field: job[field].isoformat() if job.get(field) else None
+                    for field in ("createdAt", "startedAt", "finishedAt")
+                },
+            },
+        })
+    except Exception as e:
+        logger.error(f"Error in route_user_job: {e}")
+        return web.json_response({
+            "status": "error",
+            "message": str(e)
+        }, status=500)
+
+
 async def websocket_handler(request):
     """
     Handler for GET /user/{user_id}/ws
 
     Establishes a WebSocket connection for real-time updates.
-    Stores the connection in the CONNECTIONS dictionary organized by user_id.
+    Stores the connection in the app's connections dictionary organized by user_id.
+    Clients offering the `schedge.msgpack` subprotocol get binary MessagePack
+    frames (see ws_codec.py), the others JSON text.
 
     Args:
         request (Request): The HTTP request object for the WebSocket upgrade
@@ -787,7 +2295,9 @@ async def websocket_handler(request):
     Returns:
         WebSocketResponse: The established WebSocket connection
     """
-    ws = web.WebSocketResponse()
+    # permessage-deflate is negotiated with the client when enabled, and so is
+    # the binary schedge.msgpack encoding (see ws_codec.py) if it is installed
+    ws = web.WebSocketResponse(compress=request.app[CONFIG_KEY].ws_compress, protocols=ws_codec.available_protocols())
 
     try:
         success, user_id_or_error = safe_int(request.match_info['user_id'], "User ID")
@@ -800,30 +2310,39 @@ async def websocket_handler(request):
         await ws.prepare(request)
 
         connection_id = uuid.uuid4()
+        connections = request.app[CONNECTIONS_KEY]
 
         # Initialize user dict if not exists
-        if user_id not in CONNECTIONS:
-            CONNECTIONS[user_id] = {}
+        if user_id not in connections:
+            connections[user_id] = {}
 
         # Store connection
-        CONNECTIONS[user_id][connection_id] = ws
+        connections[user_id][connection_id] = ws
+
+        recorder = request.app[TRAFFIC_RECORDER_KEY]
+        if recorder is not None:
+            recorder.ws_open(connection_id, user_id, request.path)
 
         try:
             async for msg in ws:
                 if msg.type == WSMsgType.TEXT:
+                    if recorder is not None:
+                        recorder.ws_message(connection_id, msg.data)
                     if msg.data == "ping":
-                        await emit_state(user_id)
+                        await emit_state(request.app, user_id)
                     else:
                         logger.info(f"Received unknown message: {msg.data}")
                 elif msg.type == WSMsgType.ERROR:
                     logger.error(f"WebSocket connection closed with exception {ws.exception()}")
         finally:
+            if recorder is not None:
+                recorder.ws_close(connection_id)
             # Clean up the connection
-            if user_id in CONNECTIONS:
-                CONNECTIONS[user_id].pop(connection_id, None)
+            if user_id in connections:
+                connections[user_id].pop(connection_id, None)
                 # Remove user entry if no connections left
-                if not CONNECTIONS[user_id]:
-                    CONNECTIONS.pop(user_id, None)
+                if not connections[user_id]:
+                    connections.pop(user_id, None)
         return ws
     except Exception as e:
         logger.error(f"Error in websocket_handler: {e}")
@@ -832,28 +2351,483 @@ async def websocket_handler(request):
         return ws
 
 
-app = web.Application()
-app.router.add_get("/api/v0/user/{user_id}/state", route_user_state)
-app.router.add_get("/api/v0/user/{user_id}/task", route_user_tasks)
-app.router.add_get("/api/v0/user/{user_id}/task/{task_id}", route_user_task)
-app.router.add_post("/api/v0/user/{user_id}/task", route_user_task_create)
-app.router.add_put("/api/v0/user/{user_id}/task/{task_id}", route_user_task_update)
-app.router.add_delete("/api/v0/user/{user_id}/task/{task_id}", route_user_task_delete)
-app.router.add_get("/api/v0/user/{user_id}/slot", route_user_slots)
-app.router.add_post("/api/v0/user/{user_id}/compute_slot_request", route_user_compute_slot_request)
-app.router.add_get("/api/v0/user/{user_id}/ws", websocket_handler)
-
-cors = aiohttp_cors.setup(app, defaults={
-    "*": aiohttp_cors.ResourceOptions(
-        allow_credentials=True,
-        expose_headers="*",
-        allow_headers="*",
-        allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+async def route_ready(request):
+    """
+    Handler for GET /api/v0/ready
+
+    Readiness probe. Passes only once the Mongo connection pool is warm.
+
+    Args:
+        request (Request): The HTTP request object
+
+    Returns:
+        Response: JSON response with status 200 when ready, 503 otherwise
+    """
+    app = request.app
+    if not app[READY_KEY]:
+        app[READY_KEY] = await warm_up(app)
+
+    if app[READY_KEY]:
+        return web.json_response({"status": "ok", "result": None})
+    return web.json_response({
+        "status": "error",
+        "message": "Backend is not ready"
+    }, status=503)
+
+
+def check_admin(request):
+    """
+    Authorize a request to an admin endpoint.
+
+    Args:
+        request (Request): The HTTP request object
+
+    Returns:
+        Response | None: An error response, or None if the request may proceed
+    """
+    token = request.app[CONFIG_KEY].admin_token
+    if not token:
+        return web.json_response({
+            "status": "error",
+            "message": "Admin endpoints are disabled"
+        }, status=404)
+
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(credentials.strip().encode(), token.encode()):
+        return web.json_response({
+            "status": "error",
+            "message": "Invalid admin token"
+        }, status=403)
+    return None
+
+
+async def route_admin_metrics(request):
+    """
+    Handler for GET /api/v0/admin/metrics
+
+    Reports event-loop lag, per-route request timings and offload and solver counters.
+
+    Args:
+        request (Request): The HTTP request object
+
+    Returns:
+        Response: JSON response with the metrics or error
+    """
+    error = check_admin(request)
+    if error:
+        return error
+
+    app = request.app
+    result = {
+        "loop": app[LOOP_MONITOR_KEY].stats(),
+        "routes": app[REQUEST_TIMINGS_KEY].stats(),
+    }
+    if OFFLOADER_KEY in app:
+        result["offload"] = {"inline": app[OFFLOADER_KEY].inline, "offloaded": app[OFFLOADER_KEY].offloaded}
+    if SOLVER_KEY in app:
+        result["solver"] = app[SOLVER_KEY].stats()
+    if app[TRACER_KEY].exporter is not None:
+        result["tracing"] = app[TRACER_KEY].exporter.stats()
+    if app[TRAFFIC_RECORDER_KEY] is not None:
+        result["capture"] = app[TRAFFIC_RECORDER_KEY].stats()
+    result["dependencies"] = app[DEPENDENCY_INDEX_KEY].stats()
+    result["busy"] = app[BUSY_INDEX_KEY].stats()
+    result["replicas"] = app[REPLICAS_KEY].stats()
+    if RESOLVE_WORKER_KEY in app:
+        result["resolver"] = app[RESOLVE_WORKER_KEY].stats()
+    if COMPACTOR_KEY in app:
+        result["compactor"] = app[COMPACTOR_KEY].stats()
+    result["background_tasks"] = app[BACKGROUND_TASKS_KEY].stats()
+    if JOB_STORE_KEY in app:
+        result["jobs"] = {"counts": await app[JOB_STORE_KEY].counts()}
+        if JOB_WORKER_KEY in app:
+            result["jobs"].update(app[JOB_WORKER_KEY].stats())
+    result["memory"] = app[MEMORY_MONITOR_KEY].stats()
+    return web.json_response({"status": "ok", "result": result})
+
+
+async def route_admin_profile(request):
+    """
+    Handler for GET /api/v0/admin/profile?seconds=10&hz=100
+
+    Samples the event loop thread's stack for the given time and returns
+    collapsed stacks (one `frame;frame;frame count` line per stack),
+    ready for flamegraph.pl or speedscope. One profile runs at a time.
+
+    Args:
+        request (Request): The HTTP request object
+
+    Returns:
+        Response: text/plain profile or JSON error
+    """
+    error = check_admin(request)
+    if error:
+        return error
+
+    try:
+        seconds = float(request.query.get("seconds", "10"))
+        hz = int(request.query.get("hz", "100"))
+    except ValueError:
+        return web.json_response({
+            "status": "error",
+            "message": "seconds and hz must be numbers"
+        }, status=400)
+
+    max_seconds = request.app[CONFIG_KEY].profile_max_seconds
+    if not 0 < seconds <= max_seconds or not 1 <= hz <= 1000:
+        return web.json_response({
+            "status": "error",
+            "message": f"seconds must be in (0, {max_seconds}] and hz in [1, 1000]"
+        }, status=400)
+
+    lock = request.app[PROFILE_LOCK_KEY]
+    if lock.locked():
+        return web.json_response({
+            "status": "error",
+            "message": "A profile is already running"
+        }, status=409)
+
+    async with lock:
+        profiler = SamplingProfiler(threading.get_ident(), hz)
+        await asyncio.get_running_loop().run_in_executor(None, profiler.run, seconds)
+
+    return web.Response(text=profiler.collapsed(), content_type="text/plain",
+                        headers={"X-Profile-Samples": str(profiler.count)})
+
+
+async def route_admin_memory(request):
+    """
+    Handler for GET /api/v0/admin/memory?users=20
+
+    Reports process memory, the memory alerts that are firing and the users
+    holding the most memory: their WebSocket connections, pending background
+    tasks and approximate bytes held in caches and queues.
+
+    Args:
+        request (Request): The HTTP request object
+
+    Returns:
+        Response: JSON response with the usage or error
+    """
+    error = check_admin(request)
+    if error:
+        return error
+
+    success, count_or_error = safe_int(request.query.get("users", "20"), "users")
+    if not success or count_or_error < 0:
+        return web.json_response({
+            "status": "error",
+            "message": count_or_error if not success else "users must not be negative"
+        }, status=400)
+
+    monitor = request.app[MEMORY_MONITOR_KEY]
+    usage = await monitor.usage()
+    largest = sorted(usage.items(), key=lambda item: item[1]["bytes"], reverse=True)[:count_or_error]
+    return web.json_response({"status": "ok", "result": {
+        **monitor.stats(),
+        "background_tasks": request.app[BACKGROUND_TASKS_KEY].stats(),
+        "totals": {
+            "users": len(usage),
+            "connections": sum(user["connections"] for user in usage.values()),
+            "closed_connections": sum(user["closed_connections"] for user in usage.values()),
+            "background_tasks": sum(user["background_tasks"] for user in usage.values()),
+            "bytes": sum(user["bytes"] for user in usage.values()),
+        },
+        "users": [{"user_id": user_id, **user} for user_id, user in largest],
+    }})
+
+
+async def route_admin_memory_snapshot(request):
+    """
+    Handler for POST /api/v0/admin/memory/snapshot?top=20&key=lineno
+
+    Takes a tracemalloc snapshot and returns the allocation sites whose
+    memory changed the most since the previous one. The first call starts
+    tracing (which slows allocations down) and only records the baseline;
+    DELETE on the same path stops tracing.
+
+    Args:
+        request (Request): The HTTP request object
+
+    Returns:
+        Response: JSON response with the differences or error
+    """
+    error = check_admin(request)
+    if error:
+        return error
+
+    monitor = request.app[MEMORY_MONITOR_KEY]
+    if request.method == "DELETE":
+        monitor.stop_tracing()
+        return web.json_response({"status": "ok", "result": None})
+
+    key = request.query.get("key", "lineno")
+    success, top_or_error = safe_int(request.query.get("top", "20"), "top")
+    if not success or key not in ("lineno", "filename", "traceback"):
+        return web.json_response({
+            "status": "error",
+            "message": top_or_error if not success else "key must be lineno, filename or traceback"
+        }, status=400)
+
+    lock = request.app[SNAPSHOT_LOCK_KEY]
+    if lock.locked():
+        return web.json_response({
+            "status": "error",
+            "message": "A snapshot is already being taken"
+        }, status=409)
+
+    async with lock:
+        result = await asyncio.get_running_loop().run_in_executor(None, monitor.snapshot, top_or_error, key)
+    return web.json_response({"status": "ok", "result": result})
+
+
+async def ensure_indexes(db):
+    """
+    Create the indexes every per-user query relies on.
+
+    Args:
+        db (AsyncDatabase): The database to create indexes in
+    """
+    await db.tasks.create_index([("userId", ASCENDING)])
+    await db.slots.create_index([("userId", ASCENDING)])
+    await db.schedules.create_index([("resolveAfter", ASCENDING)], sparse=True)
+
+
+async def warm_up(app):
+    """
+    Open the minimum number of pooled Mongo connections and compile validators,
+    so that the first requests do not pay for it.
+
+    Args:
+        app (Application): The application to warm up
+
+    Returns:
+        bool: Whether warm-up succeeded within the configured timeout
+    """
+    config = app[CONFIG_KEY]
+    get_validator("RawTask")
+    try:
+        pings = [app[DB_KEY].command("ping") for _ in range(max(1, config.mongo_min_pool_size))]
+        await asyncio.wait_for(asyncio.gather(*pings), timeout=config.warmup_timeout)
+        await asyncio.wait_for(ensure_indexes(app[DB_KEY]), timeout=config.warmup_timeout)
+        await asyncio.wait_for(ensure_archive_indexes(app[DB_KEY], config.archive_ttl), timeout=config.warmup_timeout)
+        await asyncio.wait_for(app[JOB_STORE_KEY].ensure_indexes(), timeout=config.warmup_timeout)
+        return True
+    except Exception as e:
+        logger.error(f"Warm-up failed: {e!r}")
+        return False
+
+
+async def init_resources(app):
+    """
+    on_startup hook: create the Mongo client, the solver client,
+    compiled validators and indexes.
+    """
+    config = app[CONFIG_KEY]
+    app[MONGO_KEY] = AsyncMongoClient(
+        config.mongo_uri,
+        minPoolSize=config.mongo_min_pool_size,
+        maxPoolSize=config.mongo_max_pool_size,
+        event_listeners=[MongoTracingListener()],
+    )
+    # Writes with the configured write concern; state reads go through app[REPLICAS_KEY]
+    app[DB_KEY] = app[REPLICAS_KEY].connect(app[MONGO_KEY], config.db_name)
+    app[SOLVER_SESSION_KEY] = aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=config.solver_timeout),
+    )
+    app[SOLVER_KEY] = SolverClient.from_config(app[SOLVER_SESSION_KEY], config)
+    await app[SOLVER_KEY].start()
+    app[SOLVER_BATCHER_KEY] = SolverBatcher.from_config(app[SOLVER_KEY], config)
+    await app[LOOP_MONITOR_KEY].start()
+    if app[TRACER_KEY].exporter is not None:
+        await app[TRACER_KEY].exporter.start()
+    if app[TRAFFIC_RECORDER_KEY] is not None:
+        await app[TRAFFIC_RECORDER_KEY].start()
+    app[OFFLOADER_KEY] = Offloader.from_config(config)
+    await app[OFFLOADER_KEY].start()
+    # Background work runs in worker processes (python worker.py), not in the HTTP pods
+    background = config.role in ("worker", "all")
+    if background and config.resolve_interval > 0:
+        app[RESOLVE_WORKER_KEY] = ResolveWorker.from_config(app[DB_KEY], functools.partial(resolve_user, app), config)
+        await app[RESOLVE_WORKER_KEY].start()
+    if background and config.archive_interval > 0:
+        app[COMPACTOR_KEY] = Compactor.from_config(
+            app[DB_KEY],
+            functools.partial(publish_compaction, app),
+            config,
+            editing=app[DEPENDENCY_INDEX_KEY].editing,
+            committed=functools.partial(commit_compaction, app),
+        )
+        await app[COMPACTOR_KEY].start()
+    if config.memory_check_interval > 0:
+        await app[MEMORY_MONITOR_KEY].start()
+    if config.job_store == "memory":
+        app[JOB_STORE_KEY] = MemoryJobStore()
+    else:
+        app[JOB_STORE_KEY] = MongoJobStore(app[DB_KEY], config.job_retention)
+    if background and config.scheduling_workers > 0:
+        app[JOB_WORKER_KEY] = JobWorker.from_config(
+            app[JOB_STORE_KEY], functools.partial(run_job, app), app[BACKGROUND_TASKS_KEY], config
+        )
+        await app[JOB_WORKER_KEY].start()
+    if config.role != "worker" and config.job_store != "memory":
+        # Jobs run by other processes cannot reach this process's WebSocket clients
+        worker_id = app[JOB_WORKER_KEY].worker_id if JOB_WORKER_KEY in app else PROCESS_ID
+        app[JOB_LISTENER_KEY] = JobListener(
+            app[JOB_STORE_KEY], app[CONNECTIONS_KEY], functools.partial(emit_state, app, anchor=True), worker_id,
+            config.job_poll_interval,
+        )
+        await app[JOB_LISTENER_KEY].start()
+    app[READY_KEY] = await warm_up(app)
+
+
+async def release_resources(app):
+    """
+    on_cleanup hook: close everything opened by `init_resources`.
+    """
+    await app[LOOP_MONITOR_KEY].close()
+    await app[MEMORY_MONITOR_KEY].close()
+    if app[TRACER_KEY].exporter is not None:
+        await app[TRACER_KEY].exporter.close()
+    if app[TRAFFIC_RECORDER_KEY] is not None:
+        await app[TRAFFIC_RECORDER_KEY].close()
+    if RESOLVE_WORKER_KEY in app:
+        await app[RESOLVE_WORKER_KEY].close()
+    if COMPACTOR_KEY in app:
+        await app[COMPACTOR_KEY].close()
+    if JOB_LISTENER_KEY in app:
+        await app[JOB_LISTENER_KEY].close()
+    if JOB_WORKER_KEY in app:
+        await app[JOB_WORKER_KEY].close()
+    await app[BACKGROUND_TASKS_KEY].close()
+    if OFFLOADER_KEY in app:
+        await app[OFFLOADER_KEY].close()
+    if SOLVER_BATCHER_KEY in app:
+        await app[SOLVER_BATCHER_KEY].close()
+    if SOLVER_KEY in app:
+        await app[SOLVER_KEY].close()
+    if SOLVER_SESSION_KEY in app:
+        await app[SOLVER_SESSION_KEY].close()
+    if MONGO_KEY in app:
+        await app[MONGO_KEY].close()
+
+
+def create_app(config=None):
+    """
+    Build the aiohttp application.
+
+    No connections are opened here; resources are created in on_startup
+    and released in on_cleanup.
+
+    Args:
+        config (Config | None): Configuration, read from the environment if omitted
+
+    Returns:
+        Application: The configured application
+    """
+    if config is None:
+        config = Config.from_env()
+    if config.role not in ROLES:
+        raise ValueError(f"Unknown role {config.role!r}, expected one of {', '.join(ROLES)}")
+    if config.job_store == "memory" and config.role == "api":
+        raise ValueError("JOB_STORE=memory keeps jobs in this process, which needs ROLE=all to run them")
+
+    loop_monitor = LoopMonitor.from_config(config)
+    request_timings = RequestTimings()
+
+    tracer = Tracer.from_config(config)
+    traffic_recorder = TrafficRecorder.from_config(config)
+    replicas = ReplicaRouter.from_config(config)
+
+    middlewares = [
+        tracing_middleware(tracer),
+        timing_middleware(loop_monitor, request_timings, config.slow_request_threshold),
+        compression_middleware(
+            parse_encoding_list(config.compression_encodings),
+            min_size=config.compression_min_size,
+            executor_size=config.compression_executor_size,
+        ),
+        causal_middleware(replicas),
+    ]
+    if traffic_recorder is not None:
+        # Innermost, so that it sees uncompressed responses
+        middlewares.append(capture_middleware(traffic_recorder))
+    app = web.Application(middlewares=middlewares)
+    app[CONFIG_KEY] = config
+    app[READY_KEY] = False
+    app[LOOP_MONITOR_KEY] = loop_monitor
+    app[TRACER_KEY] = tracer
+    app[TRAFFIC_RECORDER_KEY] = traffic_recorder
+    app[REQUEST_TIMINGS_KEY] = request_timings
+    app[PROFILE_LOCK_KEY] = asyncio.Lock()
+    app[DEPENDENCY_INDEX_KEY] = DependencyIndex(config.dependency_cache_users)
+    app[BUSY_INDEX_KEY] = BusyIndex(config.busy_cache_users)
+    app[REPLICAS_KEY] = replicas
+    # Scheduling jobs solving at once, interactive and background alike
+    app[SOLVE_LIMIT_KEY] = asyncio.Semaphore(config.solver_max_concurrency)
+
+    # Dictionary to hold WebSocket connections by user_id
+    # This allows us to send real-time updates to connected clients,
+    # unless a client is connected to a different server instance.
+    # In theory, this should be managed by a more robust solution like Redis Pub/Sub
+    # or a message broker, but for simplicity, we use an in-memory dictionary.
+    # TODO: Replace with something more robust
+    app[CONNECTIONS_KEY] = {}
+    # Scheduling jobs running in this process, held until they finish
+    app[BACKGROUND_TASKS_KEY] = BackgroundTasks()
+    app[MEMORY_MONITOR_KEY] = MemoryMonitor.from_config(
+        app[CONNECTIONS_KEY], app[BACKGROUND_TASKS_KEY], app[DEPENDENCY_INDEX_KEY], config
     )
-})
+    app[SNAPSHOT_LOCK_KEY] = asyncio.Lock()
+
+    app.on_startup.append(init_resources)
+    app.on_cleanup.append(release_resources)
+
+    app.router.add_get("/api/v0/ready", route_ready)
+    app.router.add_get("/api/v0/admin/metrics", route_admin_metrics)
+    app.router.add_get("/api/v0/admin/profile", route_admin_profile)
+    app.router.add_get("/api/v0/admin/memory", route_admin_memory)
+    app.router.add_post("/api/v0/admin/memory/snapshot", route_admin_memory_snapshot)
+    app.router.add_delete("/api/v0/admin/memory/snapshot", route_admin_memory_snapshot)
+    app.router.add_get("/api/v0/user/{user_id}/state", route_user_state)
+    app.router.add_get("/api/v0/user/{user_id}/task", route_user_tasks)
+    app.router.add_get("/api/v0/user/{user_id}/task/{task_id}", route_user_task)
+    app.router.add_post("/api/v0/user/{user_id}/task", route_user_task_create)
+    app.router.add_put("/api/v0/user/{user_id}/task/{task_id}", route_user_task_update)
+    app.router.add_delete("/api/v0/user/{user_id}/task/{task_id}", route_user_task_delete)
+    app.router.add_put("/api/v0/user/{user_id}/task/{task_id}/occurrence/{occurrence}", route_user_occurrence_update)
+    app.router.add_delete("/api/v0/user/{user_id}/task/{task_id}/occurrence/{occurrence}", route_user_occurrence_delete)
+    app.router.add_get("/api/v0/user/{user_id}/slot", route_user_slots)
+    app.router.add_get("/api/v0/user/{user_id}/dependencies", route_user_dependencies)
+    app.router.add_get("/api/v0/user/{user_id}/freebusy", route_user_freebusy)
+    app.router.add_get("/api/v0/user/{user_id}/history/{kind}", route_user_history)
+    app.router.add_post("/api/v0/user/{user_id}/import.ics", route_user_import_ics)
+    app.router.add_get("/api/v0/user/{user_id}/export.ics", route_user_export_ics)
+    app.router.add_post("/api/v0/user/{user_id}/compute_slot_request", route_user_compute_slot_request)
+    app.router.add_get("/api/v0/user/{user_id}/job/{job_id}", route_user_job)
+    app.router.add_get("/api/v0/user/{user_id}/ws", websocket_handler)
+
+    cors = aiohttp_cors.setup(app, defaults={
+        "*": aiohttp_cors.ResourceOptions(
+            allow_credentials=True,
+            expose_headers="*",
+            allow_headers="*",
+            allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+        )
+    })
+
+    for route in list(app.router.routes()):
+        cors.add(route)
+
+    return app
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    dotenv.load_dotenv()
+    config = Config.from_env()
+    web.run_app(create_app(config), host=config.backend_host_address, port=config.backend_port)
 
-for route in list(app.router.routes()):
-    cors.add(route)
 
 if __name__ == "__main__":
-    web.run_app(app, host=BACKEND_HOST_ADDRESS, port=int(BACKEND_PORT))
+    main()
@@ -0,0 +1,349 @@
+"""
+Memory accounting and leak hunting.
+
+- `BackgroundTasks` keeps fire-and-forget tasks (e.g. asynchronous scheduling
+  jobs) referenced per user until they finish, logs their failures and
+  cancels them on shutdown.
+- `MemoryMonitor` periodically accounts what the backend holds per user:
+  WebSocket connections, pending background tasks and approximate bytes in
+  the dependency cache and in the inputs of pending tasks. It drops
+  connections that are already closed and logs a warning whenever a
+  threshold is crossed, and again when usage is back below it.
+- `MemoryMonitor.snapshot` diffs tracemalloc snapshots on demand, so growth
+  can be traced to the lines allocating it without restarting the process.
+"""
+import asyncio
+import gc
+import logging
+import os
+import sys
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+# Users accounted between two yields to the event loop
+USAGE_CHUNK = 100
+# Allocations made by the tracing itself are left out of snapshot diffs
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def approximate_size(value, seen=None):
+    """
+    Approximate the memory held by a value and everything it references.
+
+    Containers and the attributes of plain objects are followed; shared
+    objects are counted once.
+
+    Returns:
+        int: Size in bytes, as reported by sys.getsizeof
+    """
+    seen = set() if seen is None else seen
+    size = 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, "__dict__") and not isinstance(item, type):
+            stack.append(vars(item))
+    return size
+
+
+def resident_bytes():
+    """
+    Returns:
+        int | None: Resident set size of this process, None where /proc is unavailable
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class BackgroundTasks:
+    """
+    Fire-and-forget tasks of each user.
+
+    The event loop keeps only weak references to tasks, so a task nobody
+    holds may disappear mid-flight; tasks started here are held until they
+    finish, together with a payload whose size is accounted to the user.
+    """
+
+    def __init__(self):
+        # User ID -> {task: payload}
+        self.tasks = {}
+        self.started = 0
+        self.failed = 0
+
+    def spawn(self, user_id, coroutine, payload=None):
+        """
+        Run a coroutine on its own task.
+
+        Args:
+            user_id (int): The user the task works for
+            coroutine (Coroutine): The work
+            payload: Data the task keeps alive, e.g. the user's tasks
+
+        Returns:
+            Task: The started task
+        """
+        task = asyncio.create_task(coroutine)
+        self.tasks.setdefault(user_id, {})[task] = payload
+        self.started += 1
+        task.add_done_callback(lambda task: self._done(user_id, task))
+        return task
+
+    def _done(self, user_id, task):
+        tasks = self.tasks.get(user_id)
+        if tasks is not None:
+            tasks.pop(task, None)
+            if not tasks:
+                del self.tasks[user_id]
+        if not task.cancelled() and task.exception() is not None:
+            self.failed += 1
+            logger.error(f"Background task of user {user_id} failed: {task.exception()!r}")
+
+    def pending(self, user_id):
+        return len(self.tasks.get(user_id, ()))
+
+    def __len__(self):
+        return sum(len(tasks) for tasks in self.tasks.values())
+
+    async def close(self):
+        tasks = [task for user_tasks in self.tasks.values() for task in user_tasks]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        return {"pending": len(self), "users": len(self.tasks), "started": self.started, "failed": self.failed}
+
+
+class MemoryMonitor:
+    """
+    Per-user memory accounting with threshold alerts.
+
+    Args:
+        connections (dict): User ID -> {connection ID: WebSocketResponse}
+        background (BackgroundTasks): Fire-and-forget tasks
+        dependency_index (DependencyIndex): Cached dependency graphs
+        interval (float): Seconds between checks
+        rss_limit (int): Resident bytes of the process above which to alert, 0 to disable
+        user_bytes_limit (int): Approximate bytes held for one user above which to alert, 0 to disable
+        user_connections_limit (int): WebSocket connections of one user above which to alert, 0 to disable
+        user_tasks_limit (int): Pending background tasks of one user above which to alert, 0 to disable
+        trace_frames (int): Frames stored per allocation once tracemalloc is started
+    """
+
+    def __init__(self, connections, background, dependency_index, interval=60.0, rss_limit=0,
+                 user_bytes_limit=0, user_connections_limit=0, user_tasks_limit=0, trace_frames=1):
+        self.connections = connections
+        self.background = background
+        self.dependency_index = dependency_index
+        self.interval = interval
+        self.rss_limit = rss_limit
+        self.limits = {
+            "bytes": user_bytes_limit,
+            "connections": user_connections_limit,
+            "background_tasks": user_tasks_limit,
+        }
+        self.trace_frames = trace_frames
+        # (user ID or "process", metric) -> value of the alerts that are firing
+        self.alerts = {}
+        self.fired = 0
+        self.reaped = 0
+        self.checks = 0
+        self.baseline = None
+        self._task = None
+
+    @classmethod
+    def from_config(cls, connections, background, dependency_index, config):
+        return cls(
+            connections,
+            background,
+            dependency_index,
+            interval=config.memory_check_interval,
+            rss_limit=config.memory_alert_rss_mb * 1024 * 1024,
+            user_bytes_limit=config.memory_alert_user_bytes,
+            user_connections_limit=config.memory_alert_user_connections,
+            user_tasks_limit=config.memory_alert_user_tasks,
+            trace_frames=config.memory_trace_frames,
+        )
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.baseline is not None:
+            self.stop_tracing()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Error checking memory usage: {e!r}")
+
+    def reap(self):
+        """
+        Drop WebSocket connections that are closed but still registered.
+
+        Returns:
+            int: Connections dropped
+        """
+        reaped = 0
+        for user_id, user_connections in list(self.connections.items()):
+            for connection_id, ws in list(user_connections.items()):
+                if ws.closed:
+                    del user_connections[connection_id]
+                    reaped += 1
+            if not user_connections:
+                self.connections.pop(user_id, None)
+        self.reaped += reaped
+        return reaped
+
+    def user_usage(self, user_id):
+        """
+        Returns:
+            dict: Connections, pending background tasks and approximate bytes held for a user
+        """
+        connections = self.connections.get(user_id, {})
+        graph = self.dependency_index.graphs.get(user_id)
+        payloads = self.background.tasks.get(user_id, {})
+        held = {
+            "dependencies": approximate_size(graph) if graph is not None else 0,
+            "background_tasks": sum(approximate_size(payload) for payload in payloads.values()),
+        }
+        return {
+            "connections": len(connections),
+            "closed_connections": sum(1 for ws in connections.values() if ws.closed),
+            "background_tasks": len(payloads),
+            "bytes": sum(held.values()),
+            "held": held,
+        }
+
+    async def usage(self):
+        """
+        Account every user the backend holds something for.
+
+        Yields to the event loop every USAGE_CHUNK users, so that a large
+        cache does not stall requests.
+
+        Returns:
+            dict[int, dict]: User ID -> `user_usage`
+        """
+        users = set(self.connections) | set(self.background.tasks) | set(self.dependency_index.graphs)
+        result = {}
+        for position, user_id in enumerate(users, 1):
+            result[user_id] = self.user_usage(user_id)
+            if position % USAGE_CHUNK == 0:
+                await asyncio.sleep(0)
+        return result
+
+    def _alert(self, subject, metric, value, limit):
+        key = (subject, metric)
+        name = "the process" if subject == "process" else f"user {subject}"
+        if limit and value > limit:
+            if key not in self.alerts:
+                self.fired += 1
+                logger.warning(f"Memory alert: {metric} of {name} is {value}, above {limit}")
+            self.alerts[key] = value
+        elif key in self.alerts:
+            del self.alerts[key]
+            logger.info(f"Memory alert cleared: {metric} of {name} is {value}, limit {limit}")
+
+    async def check(self):
+        """
+        Reap closed connections, account usage and update the alerts.
+
+        Returns:
+            dict[int, dict]: The per-user usage
+        """
+        self.checks += 1
+        self.reap()
+        usage = await self.usage()
+        rss = resident_bytes()
+        if rss is not None:
+            self._alert("process", "rss", rss, self.rss_limit)
+        for subject, metric in list(self.alerts):
+            # Users who no longer hold anything clear their alerts
+            if subject != "process" and subject not in usage:
+                self._alert(subject, metric, 0, self.limits[metric])
+        for user_id, user in usage.items():
+            for metric, limit in self.limits.items():
+                self._alert(user_id, metric, user[metric], limit)
+        return usage
+
+    def snapshot(self, top=20, key="lineno"):
+        """
+        Compare a tracemalloc snapshot with the previous one.
+
+        The first call starts tracing and only records the baseline. Blocks
+        while the snapshot is taken, so it should run off the event loop.
+
+        Args:
+            top (int): Largest differences returned
+            key (str): Grouping of allocations: "lineno", "filename" or "traceback"
+
+        Returns:
+            dict: Whether tracing just started, and the top differences since the previous snapshot
+        """
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(self.trace_frames)
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        baseline, self.baseline = self.baseline, snapshot
+        traced, peak = tracemalloc.get_traced_memory()
+        result = {"started": started, "traced_bytes": traced, "peak_bytes": peak, "differences": []}
+        if baseline is None:
+            return result
+        for stat in snapshot.compare_to(baseline, key)[:top]:
+            result["differences"].append({
+                "where": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                "size": stat.size,
+                "size_diff": stat.size_diff,
+                "count": stat.count,
+                "count_diff": stat.count_diff,
+            })
+        return result
+
+    def stop_tracing(self):
+        self.baseline = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def stats(self):
+        return {
+            "rss_bytes": resident_bytes(),
+            "gc_garbage": len(gc.garbage),
+            "asyncio_tasks": len(asyncio.all_tasks()),
+            "tracing": tracemalloc.is_tracing(),
+            "checks": self.checks,
+            "reaped_connections": self.reaped,
+            "alerts_fired": self.fired,
+            "alerts": [
+                {"subject": subject, "metric": metric, "value": value}
+                for (subject, metric), value in sorted(self.alerts.items(), key=str)
+            ],
+        }
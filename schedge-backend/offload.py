@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def _noop():
+    return None
+
+
+class Offloader:
+    """
+    Runs CPU-heavy work items either inline or in a process pool.
+
+    Items whose input is at least `threshold` bytes go to the pool, everything
+    else runs inline on the event loop, where it is cheaper than the round trip
+    to a worker. Callers should pass compact inputs (bytes rather than nested
+    dicts) so that pickling stays cheap.
+
+    Worker processes are started with the "spawn" method: forking a process
+    that runs an event loop and Mongo client threads is not safe.
+
+    Args:
+        workers (int): Number of worker processes, 0 runs everything inline
+        threshold (int): Smallest input size, in bytes, sent to the pool
+    """
+
+    def __init__(self, workers=0, threshold=256 * 1024):
+        self.workers = workers
+        self.threshold = threshold
+        self.pool = None
+        self.offloaded = 0
+        self.inline = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(workers=config.offload_workers, threshold=config.offload_threshold)
+
+    async def start(self):
+        """Start the workers and wait until each of them is up."""
+        if self.workers <= 0:
+            return
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, _noop) for _ in range(self.workers)))
+        logger.info(f"Started {self.workers} offload workers")
+
+    async def close(self):
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            await asyncio.get_running_loop().run_in_executor(None, pool.shutdown)
+
+    async def run(self, size, func, *args):
+        """
+        Run `func(*args)`, in the pool if the input is large enough.
+
+        Args:
+            size (int): Size of the input in bytes
+            func (Callable): A picklable, module-level function
+            *args: Picklable arguments
+
+        Returns:
+            The function's result
+        """
+        if self.pool is None or size < self.threshold:
+            self.inline += 1
+            return func(*args)
+        self.offloaded += 1
+        return await asyncio.get_running_loop().run_in_executor(self.pool, func, *args)
+
+    async def submit(self, func, *args):
+        """
+        Run `func(*args)` in the pool whatever the size of its input,
+        or inline if there is no pool.
+        """
+        if self.pool is None:
+            self.inline += 1
+            return func(*args)
+        self.offloaded += 1
+        return await asyncio.get_running_loop().run_in_executor(self.pool, func, *args)
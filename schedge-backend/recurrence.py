@@ -0,0 +1,229 @@
+"""
+Recurring tasks.
+
+A task with a `recurrence` rule is stored once and stands for a series of
+occurrences, e.g. reading every day or a sync every Monday:
+
+    {"freq": "weekly", "interval": 1, "byDay": ["MO"], "count": 10,
+     "exceptions": ["20250512T090000Z"],
+     "overrides": {"20250519T090000Z": {"start": "...", "end": "..."}}}
+
+The rule follows RFC 5545 RRULE semantics for FREQ, INTERVAL, BYDAY (weekly
+rules only, weeks start on Monday), COUNT and UNTIL. The first occurrence is
+the task itself (for weekly rules, if its day is in `byDay`); later ones are
+shifted by whole days or weeks, all times of the task (`start`/`end` or
+`kickoff`/`deadline`) by the same amount.
+Occurrences are keyed by their original anchor time (`start` for fixed
+tasks, `kickoff` otherwise) in UTC, in iCalendar DATE-TIME form, and keep
+that key when an override moves them. Exceptions are still counted by COUNT.
+
+Occurrences are never stored: `expand_tasks` turns a series into concrete
+tasks only for a window, e.g. the solver's horizon, in O(k) for k
+occurrences in it, however long ago the series started.
+"""
+from datetime import datetime, timedelta, timezone
+
+from ical import format_ical_datetime
+
+FREQUENCIES = {"daily": timedelta(days=1), "weekly": timedelta(weeks=1)}
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+TIME_FIELDS = ("start", "end", "kickoff", "deadline")
+# Fields an override may change
+OVERRIDE_FIELDS = ("name", "description", "color", "leisure", "start", "end", "kickoff", "deadline", "duration")
+KEY_FORMAT = "%Y%m%dT%H%M%SZ"
+
+
+class RecurrenceError(ValueError):
+    """Raised for invalid rules and occurrences that a rule does not produce."""
+
+
+def parse_time(value):
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return moment if moment.tzinfo is not None else moment.replace(tzinfo=timezone.utc)
+
+
+def occurrence_key(moment):
+    """
+    Returns:
+        str: The key of the occurrence anchored at `moment`, e.g. "20250501T090000Z"
+    """
+    return format_ical_datetime(moment)
+
+
+def parse_occurrence_key(key):
+    """
+    Returns:
+        datetime: The anchor time of an occurrence key
+
+    Raises:
+        RecurrenceError: If the key is malformed
+    """
+    try:
+        return datetime.strptime(key, KEY_FORMAT).replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        raise RecurrenceError(f"Invalid occurrence: {key}") from None
+
+
+def anchor_field(task):
+    return "start" if task.get("type") == "fixed" else "kickoff"
+
+
+def span_field(task):
+    return "end" if task.get("type") == "fixed" else "deadline"
+
+
+def validate_rule(task):
+    """
+    Check the rule of a task that passed schema validation.
+
+    Returns:
+        str | None: An error message, or None if the task has no rule or a valid one
+    """
+    rule = task.get("recurrence")
+    if rule is None:
+        return None
+    if rule.get("byDay") and rule["freq"] != "weekly":
+        return "byDay is only supported for weekly recurrence"
+    for key in list(rule.get("exceptions") or []) + list(rule.get("overrides") or {}):
+        try:
+            parse_occurrence_key(key)
+        except RecurrenceError as e:
+            return str(e)
+    for override in (rule.get("overrides") or {}).values():
+        unknown = sorted(set(override) - set(OVERRIDE_FIELDS))
+        if unknown:
+            return f"Field cannot be overridden: {unknown[0]}"
+    return None
+
+
+class Series:
+    """
+    The occurrences of a recurring task.
+
+    Occurrences fall into periods of `interval` days or weeks from the
+    first one; a weekly period holds one occurrence per day in `byDay`.
+
+    Args:
+        task (dict): A task with a `recurrence` rule and valid times
+    """
+
+    def __init__(self, task):
+        rule = task["recurrence"]
+        self.anchor = parse_time(task[anchor_field(task)])
+        # Occurrences overlapping a window may start before it by up to this much
+        self.length = max(parse_time(task[span_field(task)]) - self.anchor, timedelta(0))
+        self.period = FREQUENCIES[rule["freq"]] * rule.get("interval", 1)
+        self.count = rule.get("count")
+        self.until = parse_time(rule["until"]) if rule.get("until") else None
+
+        if rule["freq"] == "weekly":
+            weekday = self.anchor.weekday()
+            days = sorted({WEEKDAYS.index(day) for day in rule.get("byDay") or ()} or {weekday})
+            # Periods start on the Monday of the first occurrence's week
+            self.base = self.anchor - timedelta(days=weekday)
+            self.offsets = [timedelta(days=day) for day in days]
+            self.first_offsets = [timedelta(days=day) for day in days if day >= weekday]
+        else:
+            self.base = self.anchor
+            self.offsets = self.first_offsets = [timedelta(0)]
+
+    def _before(self, period):
+        """Occurrences in the periods before `period`, for COUNT."""
+        if period == 0:
+            return 0
+        return len(self.first_offsets) + (period - 1) * len(self.offsets)
+
+    def between(self, start, end):
+        """
+        Yields:
+            datetime: Anchor times of the occurrences that overlap [start, end), in order
+        """
+        period = max(0, (start - self.length - self.base) // self.period)
+        while True:
+            period_start = self.base + period * self.period
+            if period_start >= end:
+                return
+            before = self._before(period)
+            for index, offset in enumerate(self.first_offsets if period == 0 else self.offsets):
+                if self.count is not None and before + index >= self.count:
+                    return
+                moment = period_start + offset
+                if self.until is not None and moment > self.until:
+                    return
+                if moment >= end:
+                    return
+                if moment + self.length > start or (not self.length and moment >= start):
+                    yield moment
+            period += 1
+
+    def contains(self, moment):
+        """Whether the rule produces an occurrence anchored at `moment`."""
+        return moment in self.between(moment, moment + timedelta(microseconds=1))
+
+
+def expand_task(task, start, end):
+    """
+    The occurrences of a recurring task that overlap [start, end).
+
+    Args:
+        task (dict): A task with a string `id` and a `recurrence` rule
+        start (datetime): Start of the window (aware)
+        end (datetime): End of the window (aware)
+
+    Returns:
+        list[dict]: One task per occurrence, without `recurrence`, with the ID
+            "<task ID>@<occurrence key>" and `recurrenceId`/`occurrence` fields
+    """
+    rule = task["recurrence"]
+    exceptions = set(rule.get("exceptions") or ())
+    overrides = rule.get("overrides") or {}
+    series = Series(task)
+    base = {field: value for field, value in task.items() if field != "recurrence"}
+    times = {field: parse_time(task[field]) for field in TIME_FIELDS if task.get(field)}
+
+    instances = []
+    for moment in series.between(start, end):
+        key = occurrence_key(moment)
+        if key in exceptions:
+            continue
+        shift = moment - series.anchor
+        instance = dict(base)
+        for field, value in times.items():
+            instance[field] = (value + shift).isoformat()
+        instance.update(overrides.get(key) or {})
+        instance["id"] = f"{task['id']}@{key}"
+        instance["recurrenceId"] = task["id"]
+        instance["occurrence"] = key
+        instances.append(instance)
+    return instances
+
+
+def expand_tasks(tasks, start, end):
+    """
+    Replace recurring tasks with their occurrences in a window, keeping the order.
+
+    Dependencies on recurring tasks are dropped: a task cannot depend on a
+    whole series. Tasks with broken rules are left out and logged by the caller.
+
+    Args:
+        tasks (list[dict]): Tasks with string `id`s, e.g. after `fix_object_id`
+        start (datetime): Start of the window (aware)
+        end (datetime): End of the window (aware)
+
+    Returns:
+        tuple[list[dict], list[str]]: The expanded tasks, and the IDs of tasks that
+            could not be expanded
+    """
+    recurring = {task["id"] for task in tasks if task.get("recurrence")}
+    result, broken = [], []
+    for task in tasks:
+        if recurring and any(dependency in recurring for dependency in task.get("dependencies") or ()):
+            task = {**task, "dependencies": [item for item in task["dependencies"] if item not in recurring]}
+        if task["id"] not in recurring:
+            result.append(task)
+            continue
+        try:
+            result.extend(expand_task(task, start, end))
+        except (KeyError, TypeError, ValueError):
+            broken.append(task["id"])
+    return result, broken
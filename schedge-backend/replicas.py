@@ -0,0 +1,304 @@
+"""
+Routing of reads to replica set secondaries, with causal consistency.
+
+Reads of a user's state (GET /state, /task and /slot, and the states pushed
+over WebSockets) outnumber writes by far, so they may go to the members
+picked by a configurable read preference instead of the primary. Writes,
+and the reads they depend on (nonce checks, the caches of dependencies and
+busy times), stay on the primary with a configurable write concern.
+
+A secondary may lag behind the primary, so every state read runs in a
+causally consistent session that has been advanced to the operation time
+of the latest write the reader should see. The secondary then waits until
+it has replicated that far before answering:
+
+- writes on this replica remember their operation time per user, so reads
+  and WebSocket updates on this replica see them;
+- every response to a /user/{user_id}/... request carries the latest known
+  time in an X-Causal-Token header; clients send it back with later
+  requests, so they see their own writes whichever replica they reach.
+
+A token is bound to the user it was issued for and holds the cluster time
+signed by the database, so it cannot be used to make a secondary wait for a
+time that does not exist. With the "primary" read preference (the default)
+no sessions are started and no tokens are issued.
+"""
+import base64
+import binascii
+import contextlib
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import bson
+from aiohttp import web
+from bson.errors import BSONError
+from pymongo import WriteConcern
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+TOKEN_HEADER = "X-Causal-Token"
+# Where the middleware keeps the times of a request's token
+CAUSAL_KEY = "causal_times"
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+class TokenError(ValueError):
+    """Raised for malformed causal tokens."""
+
+
+def make_read_preference(name, max_staleness=0.0):
+    """
+    Args:
+        name (str): A read preference mode, e.g. "secondaryPreferred"
+        max_staleness (float): Seconds a member may lag behind the primary, 0 for no limit
+
+    Returns:
+        ServerMode: The read preference
+
+    Raises:
+        ValueError: For unknown modes and staleness limits the driver rejects
+    """
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {name}, expected one of {', '.join(READ_PREFERENCES)}")
+    if name == "primary":
+        if max_staleness:
+            raise ValueError("The primary read preference does not take a staleness limit")
+        return Primary()
+    return READ_PREFERENCES[name](max_staleness=int(max_staleness) if max_staleness else -1)
+
+
+def make_write_concern(value):
+    """
+    Args:
+        value (str): "majority" or a number of members, e.g. "1"
+
+    Returns:
+        WriteConcern: The write concern
+    """
+    return WriteConcern(w=int(value) if value.isdigit() else value)
+
+
+def later(first, second):
+    """
+    Returns:
+        tuple | None: The later of two (operation time, cluster time) pairs, either may be None
+    """
+    if first is None or second is None:
+        return first or second
+    operation_time = max(first[0], second[0])
+    cluster_times = [times[1] for times in (first, second) if times[1] is not None]
+    cluster_time = max(cluster_times, key=lambda time: time["clusterTime"], default=None)
+    return operation_time, cluster_time
+
+
+def encode_token(user_id, times):
+    """
+    Returns:
+        str: A token for a user's reads to see everything up to `times`
+    """
+    operation_time, cluster_time = times
+    document = {"u": user_id, "o": operation_time}
+    if cluster_time is not None:
+        document["c"] = cluster_time
+    return base64.urlsafe_b64encode(bson.encode(document)).decode().rstrip("=")
+
+
+def decode_token(token, user_id):
+    """
+    Returns:
+        tuple | None: The (operation time, cluster time) of a token, None if it was issued for another user
+
+    Raises:
+        TokenError: If the token is malformed
+    """
+    try:
+        document = bson.decode(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        operation_time, cluster_time = document["o"], document.get("c")
+        if not isinstance(operation_time, bson.Timestamp):
+            raise TypeError(operation_time)
+        if cluster_time is not None and not isinstance(cluster_time.get("clusterTime"), bson.Timestamp):
+            raise TypeError(cluster_time)
+    except (binascii.Error, BSONError, KeyError, TypeError, AttributeError, ValueError):
+        raise TokenError(f"Invalid {TOKEN_HEADER}") from None
+    if document.get("u") != user_id:
+        return None
+    return operation_time, cluster_time
+
+
+@dataclass(frozen=True)
+class Reader:
+    """A database to read a user's state from, and the session to read it in (None on the primary)."""
+    db: object
+    session: object = None
+
+
+class ReplicaRouter:
+    """
+    Sends state reads to the members chosen by a read preference, in sessions
+    that see every write their user should see.
+
+    Call `connect` once the Mongo client exists.
+
+    Args:
+        read_preference (ServerMode): Where state reads go
+        read_concern (str): Read concern of state reads, e.g. "majority"
+        write_concern (WriteConcern): Write concern of every write
+        max_users (int): Users whose latest write is remembered, least recently written ones are forgotten
+    """
+
+    def __init__(self, read_preference=None, read_concern="majority", write_concern=None, max_users=10000):
+        self.read_preference = read_preference or Primary()
+        self.read_concern = ReadConcern(read_concern)
+        self.write_concern = write_concern or WriteConcern()
+        self.max_users = max_users
+        # User ID -> (operation time, cluster time) of the latest write of this replica
+        self.users = OrderedDict()
+        self.client = None
+        self.db = None
+        self.reads = None
+        self.sessions = 0
+        self.anchored = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            read_preference=make_read_preference(config.mongo_read_preference, config.mongo_max_staleness),
+            read_concern=config.mongo_read_concern,
+            write_concern=make_write_concern(config.mongo_write_concern),
+            max_users=config.causal_cache_users,
+        )
+
+    @property
+    def causal(self):
+        """Whether state reads may reach a member that lags behind the primary."""
+        return self.read_preference.mode != Primary().mode
+
+    def connect(self, client, db_name):
+        """
+        Returns:
+            AsyncDatabase: The database for writes and the reads they depend on
+        """
+        self.client = client
+        self.db = client.get_database(db_name, write_concern=self.write_concern)
+        self.reads = client.get_database(
+            db_name, read_preference=self.read_preference, read_concern=self.read_concern,
+            write_concern=self.write_concern,
+        )
+        return self.db
+
+    def remember(self, user_id, session):
+        """Record that a write of a user's state happened in `session`."""
+        if session is None or session.operation_time is None:
+            return
+        self.users[user_id] = later(self.users.get(user_id), (session.operation_time, session.cluster_time))
+        self.users.move_to_end(user_id)
+        while len(self.users) > self.max_users:
+            self.users.popitem(last=False)
+
+    def token(self, user_id, times=None):
+        """
+        Returns:
+            str | None: A token covering a user's writes known here and `times`, None if there are none
+        """
+        if not self.causal:
+            return None
+        times = later(self.users.get(user_id), times)
+        return encode_token(user_id, times) if times is not None else None
+
+    @contextlib.asynccontextmanager
+    async def writing(self, user_id):
+        """
+        Yields:
+            AsyncClientSession | None: A session for the write that a user's later reads
+                must see, None with the "primary" read preference
+        """
+        if not self.causal:
+            yield None
+            return
+        async with self.client.start_session(causal_consistency=True) as session:
+            yield session
+            self.remember(user_id, session)
+
+    @contextlib.asynccontextmanager
+    async def reading(self, user_id, times=None, anchor=False):
+        """
+        Read a user's state.
+
+        Args:
+            user_id (int): The user
+            times (tuple | None): (operation time, cluster time) from the client's token
+            anchor (bool): Read the user's state version from the primary first, for
+                writes this replica has not seen (e.g. jobs finished by another process)
+
+        Yields:
+            Reader: The database and session to read in
+        """
+        if not self.causal:
+            yield Reader(self.db)
+            return
+        async with self.client.start_session(causal_consistency=True) as session:
+            self.sessions += 1
+            times = later(self.users.get(user_id), times)
+            if times is not None:
+                operation_time, cluster_time = times
+                if cluster_time is not None:
+                    session.advance_cluster_time(cluster_time)
+                session.advance_operation_time(operation_time)
+            if anchor:
+                self.anchored += 1
+                await self.db.state_versions.find_one({"_id": user_id}, {"_id": 1}, session=session)
+            yield Reader(self.reads, session)
+
+    def stats(self):
+        return {
+            "readPreference": self.read_preference.mongos_mode,
+            "users": len(self.users),
+            "sessions": self.sessions,
+            "anchored": self.anchored,
+        }
+
+
+def causal_middleware(router):
+    """
+    Build a middleware that reads and issues causal tokens on /user/{user_id}/... requests.
+
+    Args:
+        router (ReplicaRouter): The router
+
+    Returns:
+        Callable: The aiohttp middleware
+    """
+
+    @web.middleware
+    async def middleware(request, handler):
+        try:
+            user_id = int(request.match_info.get("user_id", ""))
+        except ValueError:
+            user_id = None
+        if user_id is None or not router.causal:
+            return await handler(request)
+
+        token = request.headers.get(TOKEN_HEADER)
+        if token:
+            try:
+                request[CAUSAL_KEY] = decode_token(token, user_id)
+            except TokenError as e:
+                return web.json_response({
+                    "status": "error",
+                    "message": str(e)
+                }, status=400)
+
+        response = await handler(request)
+        if not response.prepared:
+            token = router.token(user_id, request.get(CAUSAL_KEY))
+            if token is not None:
+                response.headers[TOKEN_HEADER] = token
+        return response
+
+    return middleware
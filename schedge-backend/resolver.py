@@ -0,0 +1,203 @@
+"""
+Background re-solving of schedules that time has made stale.
+
+A schedule is planned from the moment it is solved, so it drifts out of date
+as time passes: the earliest deadline of a dynamic task is the first point at
+which the plan no longer holds, and any plan is considered stale after
+`max_age`. `record_solve` stores, per user, when the schedule was solved and
+when it goes stale, plus the time it is due for re-solving: the stale time
+with random jitter, so that schedules solved together (e.g. by everyone on
+Monday morning) are re-solved spread out rather than all at once.
+
+`ResolveWorker` periodically claims due users and re-solves them a few at a
+time, spacing the jobs over the scan interval. Claims are atomic, so several
+backend replicas can run the worker against the same database.
+"""
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+DYNAMIC_TYPES = ("continuous", "project")
+
+
+def parse_deadline(value):
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+
+def stale_at(tasks, solved_at, max_age):
+    """
+    When a schedule solved at `solved_at` goes stale.
+
+    Args:
+        tasks (list[dict]): The tasks that were scheduled
+        solved_at (datetime): When the schedule was solved (aware)
+        max_age (float): Seconds after which any schedule is stale
+
+    Returns:
+        datetime | None: The earliest upcoming deadline of a dynamic task, capped at
+            `solved_at + max_age`; None if no dynamic task is left to plan
+    """
+    deadlines = [
+        deadline
+        for task in tasks
+        if task.get("type") in DYNAMIC_TYPES
+        for deadline in [parse_deadline(task.get("deadline"))]
+        if deadline is not None and deadline > solved_at
+    ]
+    if not deadlines:
+        return None
+    return min(min(deadlines), solved_at + timedelta(seconds=max_age))
+
+
+async def record_solve(db, user_id, tasks, max_age, jitter, now=None):
+    """
+    Remember that a user's schedule was just solved and when to re-solve it.
+
+    Args:
+        db (AsyncDatabase): The database
+        user_id (int): The user
+        tasks (list[dict]): The tasks that were scheduled
+        max_age (float): Seconds after which any schedule is stale
+        jitter (float): Largest random delay, in seconds, added to the stale time
+        now (datetime | None): Solve time, the current time by default
+    """
+    now = now or datetime.now(timezone.utc)
+    stale = stale_at(tasks, now, max_age)
+    update = {"$set": {"solvedAt": now, "staleAt": stale}}
+    if stale is None:
+        update["$unset"] = {"resolveAfter": ""}
+    else:
+        update["$set"]["resolveAfter"] = stale + timedelta(seconds=random.uniform(0, jitter))
+    await db.schedules.update_one({"_id": user_id}, update, upsert=True)
+
+
+class ResolveWorker:
+    """
+    Re-solves stale schedules in the background.
+
+    Every `interval` seconds, up to `batch` users whose re-solve time has
+    passed are claimed and re-solved, at most `concurrency` at a time, with
+    their start times spread over the interval. A claim pushes the user's
+    re-solve time `lease` seconds ahead, which is also the retry delay after
+    a failure.
+
+    Args:
+        db (AsyncDatabase): The database
+        solve (Callable[[int], Awaitable[str | None]]): Re-solves a user, returns an error message or None
+        interval (float): Seconds between scans
+        batch (int): Most users claimed per scan
+        concurrency (int): Most re-solves running at once
+        lease (float): Seconds a claim lasts
+    """
+
+    def __init__(self, db, solve, interval=30.0, batch=50, concurrency=2, lease=300.0):
+        self.db = db
+        self.solve = solve
+        self.interval = interval
+        self.batch = batch
+        self.lease = lease
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.resolved = 0
+        self.failed = 0
+        self.scans = 0
+        self._task = None
+        self._jobs = set()
+
+    @classmethod
+    def from_config(cls, db, solve, config):
+        return cls(
+            db,
+            solve,
+            interval=config.resolve_interval,
+            batch=config.resolve_batch,
+            concurrency=config.resolve_concurrency,
+            lease=config.resolve_lease,
+        )
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for job in list(self._jobs):
+            job.cancel()
+        if self._jobs:
+            await asyncio.gather(*self._jobs, return_exceptions=True)
+
+    async def _run(self):
+        # Replicas started together should not scan in lockstep
+        await asyncio.sleep(random.uniform(0, self.interval))
+        while True:
+            try:
+                await self.scan()
+            except Exception as e:
+                logger.error(f"Error scanning for stale schedules: {e!r}")
+            await asyncio.sleep(self.interval)
+
+    async def claim(self, now=None):
+        """
+        Claim the users that are due for a re-solve.
+
+        Returns:
+            list[int]: IDs of the claimed users, most overdue first
+        """
+        now = now or datetime.now(timezone.utc)
+        due = await self.db.schedules.find(
+            {"resolveAfter": {"$lte": now}}, {"_id": 1}
+        ).sort("resolveAfter", 1).limit(self.batch).to_list(None)
+
+        claimed = []
+        for doc in due:
+            # Another replica may have claimed the user in the meantime
+            doc = await self.db.schedules.find_one_and_update(
+                {"_id": doc["_id"], "resolveAfter": {"$lte": now}},
+                {"$set": {"resolveAfter": now + timedelta(seconds=self.lease)}},
+                projection={"_id": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+            if doc is not None:
+                claimed.append(doc["_id"])
+        return claimed
+
+    async def scan(self):
+        """Claim due users and start their re-solves, spread over one interval."""
+        self.scans += 1
+        claimed = await self.claim()
+        if not claimed:
+            return
+        spacing = self.interval / len(claimed)
+        for position, user_id in enumerate(claimed):
+            job = asyncio.create_task(self._resolve(user_id, position * spacing))
+            self._jobs.add(job)
+            job.add_done_callback(self._jobs.discard)
+
+    async def _resolve(self, user_id, delay):
+        await asyncio.sleep(delay)
+        async with self.semaphore:
+            try:
+                error = await self.solve(user_id)
+            except Exception as e:
+                error = repr(e)
+        if error:
+            self.failed += 1
+            logger.warning(f"Background re-solve of user {user_id} failed: {error}")
+        else:
+            self.resolved += 1
+
+    def stats(self):
+        return {"scans": self.scans, "resolved": self.resolved, "failed": self.failed, "running": len(self._jobs)}
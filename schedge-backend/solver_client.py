@@ -0,0 +1,600 @@
+import asyncio
+import contextvars
+import json
+import logging
+import random
+import socket
+import time
+from collections import deque
+from urllib.parse import urlsplit, urlunsplit
+
+import aiohttp
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Number of latency samples kept for the hedging threshold
+LATENCY_WINDOW = 256
+# Hedging stays off until this many samples have been collected
+MIN_HEDGE_SAMPLES = 20
+
+
+class SolverError(Exception):
+    """
+    Raised when the solver could not produce a result.
+
+    Attributes:
+        message (str): Human readable description of the failure
+        status (int | None): HTTP status returned by the solver, if any
+        retryable (bool): Whether another replica might succeed
+    """
+
+    def __init__(self, message, status=None, retryable=False):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retryable = retryable
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker.
+
+    The circuit opens after `failure_threshold` consecutive failures.
+    Once `reset_timeout` seconds have passed, a single trial request is let
+    through (half-open); its outcome closes or re-opens the circuit.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def available(self):
+        """Whether a request may be sent without claiming the trial slot."""
+        state = self.state
+        return state == self.CLOSED or (state == self.HALF_OPEN and not self.trial_in_flight)
+
+    def acquire(self):
+        """
+        Claim permission to send a request.
+
+        Returns:
+            bool: True if the request may be sent
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+        self.trial_in_flight = False
+
+    def release(self):
+        """Give back a trial slot without recording an outcome (e.g. on cancellation)."""
+        self.trial_in_flight = False
+
+
+class Endpoint:
+    """
+    A single solver replica.
+
+    Args:
+        base_url (str): scheme://host:port of the replica
+        host_header (str | None): Host header to send when base_url is an IP
+        breaker (CircuitBreaker): The breaker guarding this replica
+    """
+
+    def __init__(self, base_url, breaker, host_header=None):
+        self.base_url = base_url
+        self.host_header = host_header
+        self.breaker = breaker
+        self.outstanding = 0
+
+    def __repr__(self):
+        return f"Endpoint({self.base_url!r}, outstanding={self.outstanding}, {self.breaker.state})"
+
+
+def percentile(samples, quantile):
+    """
+    Nearest-rank percentile of a sequence of numbers.
+
+    Args:
+        samples (Sequence[float]): The samples, in any order
+        quantile (float): Quantile in [0, 1]
+
+    Returns:
+        float | None: The percentile, or None for an empty sequence
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(quantile * len(ordered))) - 1))
+    return ordered[index]
+
+
+def parse_solver_urls(value):
+    """
+    Split a comma-separated SOLVER_SERVER_URL into base URLs and the request path.
+
+    All URLs are expected to share the same path (e.g. /schedule).
+
+    Args:
+        value (str | None): The configured value
+
+    Returns:
+        tuple: (list[str], str) - Base URLs and the schedule path
+    """
+    urls = [url.strip() for url in (value or "").split(",") if url.strip()]
+    bases = []
+    path = "/schedule"
+    for url in urls:
+        parts = urlsplit(url)
+        bases.append(urlunsplit((parts.scheme, parts.netloc, "", "", "")))
+        if parts.path not in ("", "/"):
+            path = parts.path
+    return bases, path
+
+
+async def iter_ndjson(content):
+    """
+    Decode newline-delimited JSON from an aiohttp stream.
+
+    Unlike iterating the stream directly, lines are not limited in length,
+    which matters for large schedules.
+
+    Args:
+        content (aiohttp.StreamReader): The response body
+
+    Yields:
+        The decoded JSON value of every non-empty line
+    """
+    buffer = bytearray()
+    searched = 0
+    async for chunk in content.iter_any():
+        buffer.extend(chunk)
+        while (end := buffer.find(b"\n", searched)) != -1:
+            line = bytes(buffer[:end])
+            del buffer[:end + 1]
+            searched = 0
+            if line.strip():
+                yield json.loads(line)
+        searched = len(buffer)
+    if buffer.strip():
+        yield json.loads(bytes(buffer))
+
+
+class SolverClient:
+    """
+    Client for a pool of solver replicas.
+
+    Requests go to the available replica with the fewest outstanding requests.
+    With hedging enabled, a request still running after the observed p95
+    latency is duplicated to a second replica; whichever finishes first wins
+    and the other is cancelled.
+
+    Args:
+        session (aiohttp.ClientSession): Session used for all solver calls
+        urls (str | None): Comma-separated solver URLs
+        resolve_dns (bool): Expand every host into one endpoint per resolved address
+        dns_refresh (float): Seconds between DNS re-resolutions
+        failure_threshold (int): Consecutive failures before a circuit opens
+        reset_timeout (float): Seconds an open circuit waits before a trial request
+        hedge (bool): Whether to hedge slow requests
+        hedge_quantile (float): Latency quantile used as the hedging threshold
+        hedge_min_delay (float): Lower bound for the hedging threshold, in seconds
+    """
+
+    def __init__(self, session, urls, *, resolve_dns=False, dns_refresh=30.0,
+                 failure_threshold=5, reset_timeout=30.0,
+                 hedge=False, hedge_quantile=0.95, hedge_min_delay=0.5):
+        self.session = session
+        self.base_urls, self.schedule_path = parse_solver_urls(urls)
+        self.resolve_dns = resolve_dns
+        self.dns_refresh = dns_refresh
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.endpoints = {base: self._new_endpoint(base) for base in self.base_urls}
+        self._refresh_task = None
+
+    @classmethod
+    def from_config(cls, session, config):
+        return cls(
+            session,
+            config.solver_server_url,
+            resolve_dns=config.solver_resolve_dns,
+            dns_refresh=config.solver_dns_refresh,
+            failure_threshold=config.solver_failure_threshold,
+            reset_timeout=config.solver_reset_timeout,
+            hedge=config.solver_hedge,
+            hedge_quantile=config.solver_hedge_quantile,
+            hedge_min_delay=config.solver_hedge_min_delay,
+        )
+
+    def _new_endpoint(self, base_url, host_header=None):
+        return Endpoint(base_url, CircuitBreaker(self.failure_threshold, self.reset_timeout), host_header)
+
+    async def start(self):
+        if self.resolve_dns:
+            await self.refresh_endpoints()
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def close(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.dns_refresh)
+            try:
+                await self.refresh_endpoints()
+            except Exception as e:
+                logger.error(f"Error refreshing solver endpoints: {e}")
+
+    async def refresh_endpoints(self):
+        """
+        Re-resolve every configured host and update the endpoint set.
+
+        Endpoints that are still present keep their breaker and counters.
+        If a host fails to resolve, its previous endpoints are kept.
+        """
+        loop = asyncio.get_running_loop()
+        resolved = {}
+        for base in self.base_urls:
+            parts = urlsplit(base)
+            port = parts.port or (443 if parts.scheme == "https" else 80)
+            try:
+                infos = await loop.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+            except OSError as e:
+                logger.error(f"Failed to resolve solver host {parts.hostname}: {e}")
+                resolved.update({url: ep for url, ep in self.endpoints.items()
+                                 if ep.host_header == parts.netloc or url == base})
+                continue
+            for family, _, _, _, sockaddr in infos:
+                address = f"[{sockaddr[0]}]" if family == socket.AF_INET6 else sockaddr[0]
+                url = f"{parts.scheme}://{address}:{port}"
+                resolved[url] = self.endpoints.get(url) or self._new_endpoint(url, parts.netloc)
+
+        if resolved:
+            if set(resolved) != set(self.endpoints):
+                logger.info(f"Solver endpoints: {sorted(resolved)}")
+            self.endpoints = resolved
+
+    def available(self):
+        """Whether at least one replica currently accepts requests."""
+        return any(ep.breaker.available() for ep in self.endpoints.values())
+
+    def pick(self, exclude=()):
+        """
+        Choose the available endpoint with the fewest outstanding requests.
+
+        Ties are broken randomly so that idle replicas share the load.
+
+        Args:
+            exclude (Collection[Endpoint]): Endpoints not to consider
+
+        Returns:
+            Endpoint | None: The chosen endpoint, or None if none is available
+        """
+        candidates = [ep for ep in self.endpoints.values()
+                      if ep not in exclude and ep.breaker.available()]
+        random.shuffle(candidates)
+        candidates.sort(key=lambda ep: ep.outstanding)
+        for endpoint in candidates:
+            if endpoint.breaker.acquire():
+                return endpoint
+        return None
+
+    def hedge_delay(self):
+        """
+        Returns:
+            float | None: Seconds to wait before hedging, or None to not hedge
+        """
+        if not self.hedge or len(self.endpoints) < 2 or len(self.latencies) < MIN_HEDGE_SAMPLES:
+            return None
+        return max(self.hedge_min_delay, percentile(self.latencies, self.hedge_quantile))
+
+    async def _call(self, endpoint, path, body, params=None, read=None):
+        attributes = {"server.address": endpoint.base_url, "url.path": path, "request.size": len(body)}
+        with tracing.span("solver.request", tracing.CLIENT, attributes):
+            return await self._post(endpoint, path, body, params, read)
+
+    async def _post(self, endpoint, path, body, params=None, read=None):
+        headers = tracing.inject({"Content-Type": "application/json"})
+        if endpoint.host_header:
+            headers["Host"] = endpoint.host_header
+
+        endpoint.outstanding += 1
+        started = time.monotonic()
+        try:
+            async with self.session.post(endpoint.base_url + path, data=body, params=params, headers=headers) as resp:
+                span = tracing.current_span()
+                if span is not None:
+                    span.set_attribute("http.response.status_code", resp.status)
+                if resp.status >= 500:
+                    message = await resp.text()
+                    raise SolverError(message, resp.status, retryable=True)
+                if resp.status != 200:
+                    # The replica is healthy, the problem is the request itself
+                    endpoint.breaker.record_success()
+                    raise SolverError(await resp.text(), resp.status)
+                result = await (read(resp) if read is not None else resp.json())
+            endpoint.breaker.record_success()
+            if read is None:
+                self.latencies.append(time.monotonic() - started)
+            return result
+        except SolverError as e:
+            if e.retryable:
+                endpoint.breaker.record_failure()
+            else:
+                endpoint.breaker.release()
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            endpoint.breaker.record_failure()
+            raise SolverError(f"{endpoint.base_url}: {e!r}", retryable=True)
+        except asyncio.CancelledError:
+            endpoint.breaker.release()
+            raise
+        finally:
+            endpoint.outstanding -= 1
+
+    async def request(self, path, payload, params=None):
+        """
+        Send a JSON payload to one replica, hedging to a second one if slow.
+
+        Args:
+            path (str): Request path on the solver, e.g. /schedule
+            payload: JSON-serializable request body
+            params (dict | None): Query parameters
+
+        Returns:
+            The decoded JSON response
+
+        Raises:
+            SolverError: If no replica is available or all attempts failed
+        """
+        body = json.dumps(payload)
+        primary = self.pick()
+        if primary is None:
+            raise SolverError("No solver replica available", retryable=True)
+
+        first = asyncio.ensure_future(self._call(primary, path, body, params))
+        delay = self.hedge_delay()
+        if delay is None:
+            return await first
+
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                secondary = self.pick(exclude=(primary,))
+                if secondary is not None:
+                    logger.info(f"Hedging solver request to {secondary.base_url} after {delay:.2f}s")
+                    pending.add(asyncio.ensure_future(self._call(secondary, path, body, params)))
+
+            error = None
+            while done or pending:
+                for attempt in done:
+                    if attempt.exception() is None:
+                        return attempt.result()
+                    error = attempt.exception()
+                    if not getattr(error, "retryable", False):
+                        raise error
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            raise error
+        finally:
+            for attempt in pending:
+                attempt.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def schedule(self, tasks, params=None):
+        """
+        Solve a single task set.
+
+        Args:
+            tasks (list[dict]): Tasks in RawTask format
+            params (dict | None): Search limits (budget_ms, seed)
+
+        Returns:
+            list[dict]: Slots in RawSlot format
+        """
+        return await self.request(self.schedule_path, tasks, params)
+
+    async def stream(self, tasks, on_progress, params=None):
+        """
+        Solve a task set through the streaming endpoint.
+
+        The solver sends its best schedule so far at intervals; each one is
+        passed to `on_progress` before the final schedule is returned.
+        Streams are not hedged.
+
+        Args:
+            tasks (list[dict]): Tasks in RawTask format
+            on_progress (Callable[[list[dict]], Awaitable]): Called with every provisional schedule
+            params (dict | None): Search limits (budget_ms, seed, interval_ms)
+
+        Returns:
+            list[dict]: The final slots in RawSlot format
+
+        Raises:
+            SolverError: If no replica is available or the solver failed
+        """
+        async def read(resp):
+            span = tracing.current_span()
+            async for event in iter_ndjson(resp.content):
+                if event.get("type") == "progress":
+                    if span is not None:
+                        span.add_event("progress")
+                    await on_progress(event.get("slots") or [])
+                elif event.get("type") == "final":
+                    return event.get("slots") or []
+                elif event.get("type") == "error":
+                    raise SolverError(event.get("error") or "Unknown solver error", event.get("status"))
+            raise SolverError("Solver stream ended without a result", retryable=True)
+
+        endpoint = self.pick()
+        if endpoint is None:
+            raise SolverError("No solver replica available", retryable=True)
+        path = self.schedule_path.rstrip("/") + "/stream"
+        return await self._call(endpoint, path, json.dumps(tasks), params, read)
+
+    def stats(self):
+        return {
+            "endpoints": [
+                {"url": ep.base_url, "outstanding": ep.outstanding, "circuit": ep.breaker.state}
+                for ep in self.endpoints.values()
+            ],
+            "p95": percentile(self.latencies, 0.95),
+        }
+
+
+class SolverBatcher:
+    """
+    Coalesces scheduling jobs of different users into batch requests.
+
+    Jobs arriving within `window` seconds of each other are sent together to
+    the solver's batch endpoint, which solves them in parallel. A batch is
+    sent early once it holds `max_size` jobs. Jobs with more than `max_tasks`
+    tasks, or all jobs when `window` is 0, go straight to the solver.
+
+    Args:
+        client (SolverClient): Client used to reach the solver
+        window (float): Seconds to wait for more jobs before sending a batch
+        max_size (int): Maximum number of jobs in one batch
+        max_tasks (int): Largest task set that is still batched
+    """
+
+    def __init__(self, client, window=0.01, max_size=32, max_tasks=50):
+        self.client = client
+        self.window = window
+        self.max_size = max_size
+        self.max_tasks = max_tasks
+        self._pending = []
+        self._timer = None
+        self._in_flight = set()
+
+    @classmethod
+    def from_config(cls, client, config):
+        return cls(
+            client,
+            window=config.solver_batch_window,
+            max_size=config.solver_batch_max_size,
+            max_tasks=config.solver_batch_max_tasks,
+        )
+
+    @property
+    def batch_path(self):
+        return self.client.schedule_path.rstrip("/") + "/batch"
+
+    async def schedule(self, tasks, params=None):
+        """
+        Solve a single task set, possibly as part of a batch.
+
+        Jobs with search limits in `params` are never batched.
+
+        Args:
+            tasks (list[dict]): Tasks in RawTask format
+            params (dict | None): Search limits (budget_ms, seed)
+
+        Returns:
+            list[dict]: Slots in RawSlot format
+
+        Raises:
+            SolverError: If the solver could not produce a schedule
+        """
+        if params or self.window <= 0 or self.max_size <= 1 or len(tasks) > self.max_tasks:
+            return await self.client.schedule(tasks, params)
+
+        with tracing.span("solver.batch", attributes={"tasks": len(tasks)}):
+            future = asyncio.get_running_loop().create_future()
+            self._pending.append((str(len(self._pending)), tasks, future))
+            if len(self._pending) >= self.max_size:
+                self.flush()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+            return await future
+
+    def flush(self):
+        """Send all pending jobs as one batch."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        # A batch serves several traces: keep its request out of the first job's one
+        task = asyncio.create_task(self._send(batch), context=contextvars.Context())
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, batch):
+        futures = {job_id: future for job_id, _, future in batch}
+        try:
+            if len(batch) == 1:
+                job_id, tasks, _ = batch[0]
+                results = [{"id": job_id, "status": 200, "slots": await self.client.schedule(tasks)}]
+            else:
+                payload = [{"id": job_id, "tasks": tasks} for job_id, tasks, _ in batch]
+                results = await self.client.request(self.batch_path, payload)
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for result in results:
+            future = futures.pop(result.get("id"), None)
+            if future is None or future.done():
+                continue
+            if result.get("status") == 200:
+                future.set_result(result.get("slots") or [])
+            else:
+                future.set_exception(SolverError(result.get("error") or "Unknown solver error", result.get("status")))
+
+        for future in futures.values():
+            if not future.done():
+                future.set_exception(SolverError("Solver returned no result for the job"))
+
+    async def close(self):
+        self.flush()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
@@ -0,0 +1,96 @@
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+from config import Config
+from main import DB_KEY, MONGO_KEY, READY_KEY, SOLVER_SESSION_KEY, create_app, make_etag, matching_etag, parse_expected_nonce, parse_scheduling_options
+
+
+def test_config_from_env():
+    config = Config.from_env({
+        "MONGO_URI": "mongodb://example:27017",
+        "BACKEND_PORT": "6001",
+        "WARMUP_TIMEOUT": "2.5",
+        "DB_NAME": "",
+    })
+    assert config.mongo_uri == "mongodb://example:27017"
+    assert config.backend_port == 6001
+    assert config.warmup_timeout == 2.5
+    assert config.db_name == "schedge"
+
+
+def test_create_app_is_lazy():
+    app = create_app(Config())
+    assert isinstance(app, web.Application)
+    # Resources are only created in on_startup
+    assert MONGO_KEY not in app
+    assert DB_KEY not in app
+    assert SOLVER_SESSION_KEY not in app
+    assert app[READY_KEY] is False
+
+    paths = {route.resource.canonical for route in app.router.routes()}
+    assert "/api/v0/ready" in paths
+    assert "/api/v0/user/{user_id}/state" in paths
+
+
+def test_create_app_checks_the_role():
+    assert Config().role == "api"
+    create_app(Config(role="all", job_store="memory"))
+    with pytest.raises(ValueError, match="Unknown role"):
+        create_app(Config(role="everything"))
+    # Nothing in an API process would run jobs kept in its memory
+    with pytest.raises(ValueError, match="ROLE=all"):
+        create_app(Config(job_store="memory"))
+
+
+def test_parse_scheduling_options():
+    assert parse_scheduling_options({}) == (True, {})
+    assert parse_scheduling_options({"allowPartial": True}) == (True, {"allow_partial": True})
+    assert parse_scheduling_options({"allowPartial": False}) == (True, {})
+    assert parse_scheduling_options({"allowPartial": "yes"}) == (False, "allowPartial must be a boolean")
+    assert parse_scheduling_options({"sync": True, "budgetMs": 500, "seed": 42}) == (
+        True, {"budget_ms": 500, "seed": 42}
+    )
+    assert parse_scheduling_options({"budgetMs": None}) == (True, {})
+
+    assert not parse_scheduling_options({"budgetMs": 0})[0]
+    assert not parse_scheduling_options({"budgetMs": "500"})[0]
+    assert not parse_scheduling_options({"seed": -1})[0]
+    assert not parse_scheduling_options({"seed": True})[0]
+
+
+def test_parse_expected_nonce():
+    assert parse_expected_nonce(make_mocked_request("PUT", "/")) == (True, None)
+    assert parse_expected_nonce(make_mocked_request("PUT", "/", headers={"If-Match": "*"})) == (True, None)
+    assert parse_expected_nonce(make_mocked_request("PUT", "/", headers={"If-Match": '"3"'})) == (True, 3)
+    assert parse_expected_nonce(make_mocked_request("PUT", "/", headers={"If-Match": 'W/"4"'})) == (True, 4)
+    assert parse_expected_nonce(make_mocked_request("PUT", "/", headers={"If-Match": "5"})) == (True, 5)
+    assert not parse_expected_nonce(make_mocked_request("PUT", "/", headers={"If-Match": '"abc"'}))[0]
+
+
+def test_matching_etag():
+    etag = make_etag("state", 1, 7)
+    assert etag == '"state-1-7"'
+    assert matching_etag(make_mocked_request("GET", "/"), etag) is None
+    assert matching_etag(make_mocked_request("GET", "/", headers={"If-None-Match": etag}), etag) == etag
+    assert matching_etag(make_mocked_request("GET", "/", headers={"If-None-Match": f'"x", {etag}'}), etag) == etag
+    assert matching_etag(make_mocked_request("GET", "/", headers={"If-None-Match": "*"}), etag) == etag
+    assert matching_etag(make_mocked_request("GET", "/", headers={"If-None-Match": '"state-1-6"'}), etag) is None
+    # Tags of compressed representations are echoed back as sent
+    assert matching_etag(make_mocked_request("GET", "/", headers={"If-None-Match": '"state-1-7-gzip"'}), etag) == '"state-1-7-gzip"'
+    # Different resources of the same version never share an ETag
+    assert make_etag("task", 1, 7) != etag
+
+
+def test_make_etag_query():
+    etag = make_etag("freebusy", 1, 7, (0, 3600, 0))
+    assert etag == make_etag("freebusy", 1, 7, (0, 3600, 0))
+    assert etag.startswith('"freebusy-1-7-') and etag.endswith('"')
+    # Representations of different windows of the same version never share an ETag
+    assert etag != make_etag("freebusy", 1, 7, (0, 7200, 0))
+    assert etag != make_etag("freebusy", 1, 7, (0, 3600, 900))
+    assert etag != make_etag("freebusy", 1, 7)
+    assert etag != make_etag("freebusy", 1, 8, (0, 3600, 0))
+    # /task without a window keeps the plain ETag
+    assert make_etag("task", 1, 7, None) == '"task-1-7"'
+    assert make_etag("task", 1, 7, (0, 3600)) != make_etag("task", 1, 7, (3600, 7200))
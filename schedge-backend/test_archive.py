@@ -0,0 +1,167 @@
+import asyncio
+import contextlib
+from datetime import datetime, timezone
+
+import bson
+import pytest
+
+from archive import Compactor, decode_cursor, encode_cursor, ends_at, expired, history_query
+from main import render_archived
+
+
+def at(day, hour=0):
+    return datetime(2025, 5, day, hour, tzinfo=timezone.utc)
+
+
+def reading(**rule):
+    return {
+        "type": "continuous",
+        "duration": "PT90M",
+        "kickoff": "2025-05-01T08:00:00+03:00",
+        "deadline": "2025-05-01T20:00:00+03:00",
+        "recurrence": rule,
+    }
+
+
+def test_ends_at():
+    assert ends_at({"start": "2025-05-01T08:00:00Z", "end": "2025-05-01T09:00:00Z"}, "slots") == at(1, 9)
+    fixed = {"type": "fixed", "start": "2025-05-01T08:00:00Z", "end": "2025-05-01T09:00:00Z"}
+    assert ends_at(fixed, "tasks") == at(1, 9)
+    continuous = {**reading(), "recurrence": None}
+    assert ends_at(continuous, "tasks") == at(1, 17)
+    assert ends_at({"type": "continuous", "deadline": "soon"}, "tasks") is None
+    assert ends_at({"start": "2025-05-01T08:00:00Z"}, "slots") is None
+
+
+def test_series_end_at_their_last_occurrence():
+    assert ends_at(reading(freq="daily", count=3), "tasks") == at(3, 17)
+    assert ends_at(reading(freq="weekly", until="2025-05-15T05:00:00+00:00"), "tasks") == at(15, 17)
+    # Series without count or until never end
+    assert ends_at(reading(freq="daily"), "tasks") is None
+    moved = reading(freq="daily", count=3, overrides={"20250503T050000Z": {"deadline": "2025-05-20T00:00:00Z"}})
+    assert ends_at(moved, "tasks") == at(20)
+
+
+def test_expired():
+    slots = [
+        {"start": "2025-05-01T08:00:00Z", "end": "2025-05-01T09:00:00Z"},
+        {"start": "2025-05-09T08:00:00Z", "end": "2025-05-09T09:00:00Z"},
+        {"start": "broken", "end": "broken"},
+    ]
+    assert expired(slots, "slots", at(5)) == [(slots[0], at(1, 9))]
+
+
+def test_cursors_round_trip():
+    object_id = bson.ObjectId()
+    cursor = encode_cursor({"endsAt": datetime(2025, 5, 1, 9), "_id": object_id})
+    assert cursor == f"1746090000000.{object_id}"
+    assert decode_cursor(cursor) == (at(1, 9), object_id)
+    for invalid in ("", "1746090000000", "soon.665f1c", f"1746090000000.{object_id}x"):
+        with pytest.raises(ValueError, match="^Invalid cursor"):
+            decode_cursor(invalid)
+
+
+def test_history_query():
+    assert history_query(7) == {"userId": 7}
+    object_id = bson.ObjectId()
+    assert history_query(7, f"1746090000000.{object_id}") == {
+        "userId": 7,
+        "$or": [{"endsAt": {"$lt": at(1, 9)}}, {"endsAt": at(1, 9), "_id": {"$lt": object_id}}],
+    }
+
+
+def test_render_archived():
+    object_id = bson.ObjectId()
+    documents = [{"_id": object_id, "userId": 7, "endsAt": datetime(2025, 5, 1, 9), "archivedAt": at(31)}]
+    assert render_archived(documents) == [{
+        "id": str(object_id),
+        "userId": 7,
+        "endsAt": "2025-05-01T09:00:00+00:00",
+        "archivedAt": "2025-05-31T00:00:00+00:00",
+    }]
+
+
+class FakeCollection:
+    """Just enough of a collection for Compactor.compact_user."""
+
+    def __init__(self, documents=()):
+        self.documents = {document["_id"]: dict(document) for document in documents}
+
+    @staticmethod
+    def matches(document, query):
+        for field, value in query.items():
+            if field == "$or":
+                if not any(FakeCollection.matches(document, item) for item in value):
+                    return False
+            elif isinstance(value, dict):
+                if document.get(field) not in value["$in"]:
+                    return False
+            elif document.get(field) != value:
+                return False
+        return True
+
+    def find(self, query, projection=None):
+        found = [dict(document) for document in self.documents.values() if self.matches(document, query)]
+
+        class Cursor:
+            async def to_list(self, length):
+                return found
+
+        return Cursor()
+
+    async def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            self.documents[request._filter["_id"]] = request._doc
+
+    async def delete_many(self, query):
+        deleted = [key for key, document in self.documents.items() if self.matches(document, query)]
+        for key in deleted:
+            del self.documents[key]
+
+        class Result:
+            deleted_count = len(deleted)
+
+        return Result()
+
+
+class FakeDatabase(dict):
+    def __getattr__(self, name):
+        return self[name]
+
+
+def test_compaction_commits_each_user_under_the_editing_lock():
+    slot = {"_id": bson.ObjectId(), "userId": 1, "start": "2025-05-01T08:00:00Z", "end": "2025-05-01T09:00:00Z"}
+    task = {"_id": bson.ObjectId(), "userId": 1, "type": "fixed", "nonce": 2,
+            "start": "2025-05-01T08:00:00Z", "end": "2025-05-01T09:00:00Z"}
+    db = FakeDatabase(
+        slots=FakeCollection([slot, {**slot, "_id": bson.ObjectId(), "userId": 2}]),
+        tasks=FakeCollection([task]),
+        archived_slots=FakeCollection(),
+        archived_tasks=FakeCollection(),
+    )
+    events = []
+
+    @contextlib.asynccontextmanager
+    async def editing(user_id):
+        events.append(("lock", user_id))
+        yield
+        events.append(("unlock", user_id))
+
+    async def committed(user_id):
+        events.append(("committed", user_id))
+
+    async def changed(user_id):
+        events.append(("changed", user_id))
+
+    async def run():
+        compactor = Compactor(db, changed, retention=86400, editing=editing, committed=committed)
+        first = await compactor.compact_user(1, at(3))
+        second = await compactor.compact_user(1, at(3))
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == {"tasks": 1, "slots": 1} and second == {"tasks": 0, "slots": 0}
+    assert list(db["archived_tasks"].documents) == [task["_id"]]
+    assert list(db["slots"].documents.values())[0]["userId"] == 2
+    # The state version is bumped before the lock is released, the state published after it
+    assert events == [("lock", 1), ("committed", 1), ("unlock", 1), ("changed", 1), ("lock", 1), ("unlock", 1)]
@@ -0,0 +1,25 @@
+import copy
+
+from benchmarks.bench_hot_paths import CASES, compare, run_suite
+from benchmarks.fixtures import make_raw_tasks
+from main import prepare_task
+
+
+def test_raw_tasks_need_normalizing_and_pass_validation():
+    for raw in make_raw_tasks(50):
+        task, error = prepare_task(copy.deepcopy(raw))
+        assert error is None
+        assert task != raw
+
+
+def test_suite_runs_every_case():
+    results = run_suite(list(CASES), [1, 5], repeat=1, sample_seconds=0)
+    assert set(results) == {f"{name}[{count}]" for name in CASES for count in (1, 5)}
+    assert all(result["best"] > 0 and result["inner"] == 1 for result in results.values())
+
+
+def test_compare_flags_changes_beyond_the_threshold():
+    baseline = {"a[1]": {"best": 1.0}, "b[1]": {"best": 1.0}, "c[1]": {"best": 1.0}, "gone[1]": {"best": 1.0}}
+    results = {"a[1]": {"best": 1.2}, "b[1]": {"best": 1.3}, "c[1]": {"best": 0.7}, "added[1]": {"best": 1.0}}
+    verdicts = {key: verdict for key, _, _, verdict in compare(baseline, results, 0.25)}
+    assert verdicts == {"a[1]": "ok", "b[1]": "regressed", "c[1]": "improved", "added[1]": "new", "gone[1]": "missing"}
@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+from aiohttp import WSMsgType, web
+from aiohttp.test_utils import TestClient, TestServer
+
+from benchmarks.replay import Replayer, json_diff, load
+from capture import TrafficRecorder, body_digest, capture_middleware, normalize, redact
+
+
+def test_redact_and_normalize():
+    task = {"id": "a", "name": "Dentist", "description": None, "timings": {"work": "PT25M"}}
+    assert redact([task]) == [{"id": "a", "name": "xxxxxxx", "description": None, "timings": {"work": "PT25M"}}]
+    assert normalize({"_id": 1, "version": 2, "tasks": [{"_id": 3, "id": "a"}]}) == {"tasks": [{"id": "a"}]}
+    assert body_digest(b'{"a": 1, "version": 1}') == body_digest(b'{"version": 2, "a": 1}')
+    assert body_digest(b"not json") != body_digest(b"not json!")
+
+
+def test_json_diff():
+    assert json_diff({"a": [1, 2]}, {"a": [1, 2]}) == []
+    assert json_diff({"a": [1, 2], "b": 1}, {"a": [1, 3], "c": 1}) == ["$.a[1]", "$.b", "$.c"]
+    assert json_diff([1], [1, 2]) == ["$ (length 1 != 2)"]
+
+
+def make_app(recorder, build):
+    versions = iter(range(1, 100))
+
+    async def create(request):
+        task = await request.json()
+        return web.json_response({"status": "ok", "result": task, "version": next(versions)}, status=201)
+
+    async def state(request):
+        return web.json_response({"status": "ok", "result": {"build": build}})
+
+    async def websocket(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        if recorder is not None:
+            recorder.ws_open("c1", 1, request.path)
+        async for msg in ws:
+            if msg.type == WSMsgType.TEXT:
+                if recorder is not None:
+                    recorder.ws_message("c1", msg.data)
+                await ws.send_str("state")
+        if recorder is not None:
+            recorder.ws_close("c1")
+        return ws
+
+    async def admin(request):
+        return web.json_response({})
+
+    middlewares = [capture_middleware(recorder)] if recorder is not None else []
+    app = web.Application(middlewares=middlewares)
+    app.router.add_post("/api/v0/user/{user_id}/task", create)
+    app.router.add_get("/api/v0/user/{user_id}/state", state)
+    app.router.add_get("/api/v0/user/{user_id}/ws", websocket)
+    app.router.add_get("/api/v0/admin/metrics", admin)
+    return app
+
+
+def test_capture_and_replay(tmp_path, capsys):
+    path = tmp_path / "capture.jsonl"
+
+    async def capture():
+        recorder = TrafficRecorder(str(path), interval=60)
+        await recorder.start()
+        async with TestClient(TestServer(make_app(recorder, "a"))) as client:
+            await client.post("/api/v0/user/1/task", json={"id": "a", "name": "Secret plan"},
+                              headers={"Authorization": "Bearer x"})
+            await client.get("/api/v0/user/1/state")
+            await client.get("/api/v0/admin/metrics")
+            ws = await client.ws_connect("/api/v0/user/1/ws")
+            await ws.send_str("ping")
+            await ws.receive()
+            await ws.close()
+        await recorder.close()
+
+    asyncio.run(capture())
+    entries = load(path)
+    assert [entry["type"] for entry in entries] == ["http", "http", "ws_open", "ws_message", "ws_close"]
+    create = entries[0]
+    assert create["user_id"] == 1
+    assert create["route"] == "/api/v0/user/{user_id}/task"
+    assert create["status"] == 201
+    assert json.loads(create["body"]) == {"id": "a", "name": "xxxxxxxxxxx"}
+    assert "Authorization" not in create["headers"]
+    assert entries[3]["data"] == "ping"
+
+    async def replay():
+        # The second target is a different build, so its state differs
+        async with TestServer(make_app(None, "a")) as first, TestServer(make_app(None, "b")) as second:
+            async with TestClient(TestServer(web.Application())) as helper:
+                single = Replayer(helper.session, [str(first.make_url("")).rstrip("/")], speed=100)
+                await single.run(entries)
+                double = Replayer(helper.session, [str(server.make_url("")).rstrip("/") for server in (first, second)],
+                                  speed=100)
+                await double.run(entries)
+        return single, double
+
+    single, double = asyncio.run(replay())
+    # Requests are concurrent, so results come in completion order
+    assert [result["difference"] for result in single.results] == [None, None]
+    assert sorted(result["difference"] or "" for result in double.results) == ["", "body differs at $.result.build"]
+    assert not single.errors and not single.sockets
+
+    double.report()
+    output = capsys.readouterr().out
+    assert "POST /api/v0/user/{user_id}/task" in output
+    assert "2 requests replayed, 0 skipped, 1 responses differ" in output
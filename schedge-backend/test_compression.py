@@ -0,0 +1,79 @@
+import asyncio
+import gzip
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from compression import (
+    add_encoding_suffix,
+    choose_encoding,
+    compress,
+    compression_middleware,
+    parse_accept_encoding,
+    strip_encoding_suffix,
+)
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding("gzip, br;q=0.5, zstd;q=0") == {"gzip": 1.0, "br": 0.5, "zstd": 0.0}
+    assert parse_accept_encoding("") == {}
+    assert parse_accept_encoding("gzip;q=abc") == {"gzip": 0.0}
+
+
+def test_choose_encoding():
+    supported = ["zstd", "br", "gzip"]
+    assert choose_encoding(None, supported) is None
+    assert choose_encoding("identity", supported) is None
+    assert choose_encoding("gzip, deflate", supported) == "gzip"
+    # Server preference breaks ties
+    assert choose_encoding("gzip, br, zstd", supported) == "zstd"
+    # Client quality values win over server preference
+    assert choose_encoding("gzip, br;q=0.5", supported) == "gzip"
+    assert choose_encoding("*", supported) == "zstd"
+    assert choose_encoding("*, zstd;q=0", supported) == "br"
+
+
+def test_etag_suffix():
+    assert add_encoding_suffix('"state-1-2"', "gzip") == '"state-1-2-gzip"'
+    assert strip_encoding_suffix('"state-1-2-gzip"') == '"state-1-2"'
+    assert strip_encoding_suffix('"state-1-2"') == '"state-1-2"'
+
+
+def test_compress_gzip_roundtrip():
+    data = b'{"name": "Reading"}' * 100
+    assert gzip.decompress(compress(data, "gzip")) == data
+
+
+async def run_middleware(path, headers):
+    async def large(request):
+        return web.json_response({"items": ["x" * 10] * 200}, headers={"ETag": '"state-1-1"'})
+
+    async def small(request):
+        return web.json_response({"status": "ok"})
+
+    app = web.Application(middlewares=[compression_middleware(["gzip"], min_size=1024, executor_size=2048)])
+    app.router.add_get("/large", large)
+    app.router.add_get("/small", small)
+
+    async with TestClient(TestServer(app)) as client:
+        response = await client.get(path, headers=headers, auto_decompress=False)
+        return response.status, response.headers.copy(), await response.read()
+
+
+def test_middleware_compresses_large_bodies():
+    status, headers, body = asyncio.run(run_middleware("/large", {"Accept-Encoding": "gzip"}))
+    assert status == 200
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["ETag"] == '"state-1-1-gzip"'
+    assert "Accept-Encoding" in headers["Vary"]
+    assert gzip.decompress(body).startswith(b'{"items"')
+
+
+def test_middleware_skips_small_bodies_and_unsupported_clients():
+    _, headers, _ = asyncio.run(run_middleware("/small", {"Accept-Encoding": "gzip"}))
+    assert "Content-Encoding" not in headers
+
+    _, headers, body = asyncio.run(run_middleware("/large", {"Accept-Encoding": "identity"}))
+    assert "Content-Encoding" not in headers
+    assert headers["ETag"] == '"state-1-1"'
+    assert body.startswith(b'{"items"')
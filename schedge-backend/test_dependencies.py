@@ -0,0 +1,161 @@
+import asyncio
+import random
+
+import pytest
+
+from dependencies import DependencyError, DependencyGraph, DependencyIndex, sort_tasks
+
+
+def assert_topological(graph):
+    position = {task_id: index for index, task_id in enumerate(graph.order())}
+    assert len(position) == len(graph)
+    for task_id, dependencies in graph.dependencies.items():
+        for dependency in dependencies:
+            assert position[dependency] < position[task_id]
+
+
+def test_load_orders_tasks_and_reports_problems():
+    graph = DependencyGraph([
+        ("c", ["b"]),
+        ("b", ["a", "gone"]),
+        ("a", []),
+        ("x", ["y"]),
+        ("y", ["x"]),
+    ])
+    assert_topological(graph)
+    assert graph.order().index("a") < graph.order().index("b") < graph.order().index("c")
+    assert graph.dangling() == {"b": ["gone"]}
+    assert graph.rejected == [("y", "x")]
+
+
+def test_cycles_are_rejected_with_their_path():
+    graph = DependencyGraph([("a", []), ("b", ["a"]), ("c", ["b"])])
+    with pytest.raises(DependencyError, match=r"^Dependency cycle: a -> c -> b -> a$"):
+        graph.set_dependencies("a", ["c"])
+    with pytest.raises(DependencyError, match="cannot depend on itself"):
+        graph.set_dependencies("b", ["b"])
+    # Unchanged after a rejected edit
+    assert graph.dependencies == {"a": set(), "b": {"a"}, "c": {"b"}}
+    assert_topological(graph)
+
+
+def test_failed_update_keeps_the_old_edges():
+    graph = DependencyGraph([("a", []), ("b", []), ("c", ["a"])])
+    with pytest.raises(DependencyError):
+        # b -> c is fine on its own, c -> ... -> c is not
+        graph.set_dependencies("a", ["b", "c"])
+    assert graph.dependencies["a"] == set()
+    assert graph.dependencies["c"] == {"a"}
+    assert_topological(graph)
+
+
+def test_unknown_and_dangling_references():
+    graph = DependencyGraph([("a", []), ("b", ["a"])])
+    with pytest.raises(DependencyError, match="Unknown dependency: nope"):
+        graph.check_new(["a", "nope"])
+    with pytest.raises(DependencyError, match="Unknown dependency: nope"):
+        graph.set_dependencies("b", ["nope"])
+
+    graph.remove_task("a")
+    assert graph.dangling() == {"b": ["a"]}
+    # A reference that is already dangling may be kept, e.g. when only the name changes
+    assert graph.set_dependencies("b", ["a"]) == ["a"]
+    assert graph.dangling() == {"b": ["a"]}
+    graph.set_dependencies("b", [])
+    assert graph.dangling() == {}
+
+
+def test_restore_undoes_an_edit():
+    graph = DependencyGraph([("a", []), ("b", ["a", "gone"]), ("c", [])])
+    previous = graph.set_dependencies("b", ["c"])
+    assert graph.dangling() == {}
+    graph.restore("b", previous)
+    assert graph.dependencies["b"] == {"a"}
+    assert graph.dangling() == {"b": ["gone"]}
+
+
+def test_incremental_edits_match_a_full_check():
+    rng = random.Random(7)
+    nodes = [str(index) for index in range(40)]
+    graph = DependencyGraph((node, []) for node in nodes)
+    edges = {node: set() for node in nodes}
+
+    def reaches(start, goal):
+        stack, seen = [start], set()
+        while stack:
+            node = stack.pop()
+            if node == goal:
+                return True
+            if node not in seen:
+                seen.add(node)
+                stack.extend(edges[node])
+        return False
+
+    for _ in range(600):
+        task, dependency = rng.sample(nodes, 2)
+        wanted = set(edges[task])
+        if rng.random() < 0.3 and wanted:
+            wanted.discard(rng.choice(sorted(wanted)))
+        else:
+            wanted.add(dependency)
+        # Cyclic iff the new dependency already (transitively) depends on the task
+        cyclic = dependency in wanted - edges[task] and reaches(dependency, task)
+        try:
+            graph.set_dependencies(task, sorted(wanted))
+        except DependencyError:
+            assert cyclic
+        else:
+            assert not cyclic
+            edges[task] = wanted
+        assert graph.dependencies == edges
+        assert_topological(graph)
+
+
+def test_sort_tasks():
+    graph = DependencyGraph([("b", ["a", "gone"]), ("a", [])])
+    tasks = [
+        {"id": "b", "dependencies": ["a", "gone"]},
+        {"id": "new", "dependencies": []},
+        {"id": "a", "dependencies": []},
+    ]
+    assert sort_tasks(tasks, graph) == [
+        {"id": "a", "dependencies": []},
+        {"id": "b", "dependencies": ["a"]},
+        {"id": "new", "dependencies": []},
+    ]
+
+
+def test_index_tracks_versions():
+    index = DependencyIndex(max_users=2)
+    graph = DependencyGraph([("a", [])], version=3)
+    index.store(1, graph)
+    assert index.cached(1, 3) is graph
+    assert index.cached(1, 4) is None
+
+    index.committed(1, graph, 4)
+    assert index.cached(1, 4) is graph
+    # Another write happened in between
+    index.committed(1, graph, 6)
+    assert index.cached(1, 6) is None
+
+    for user_id in (1, 2, 3):
+        index.store(user_id, DependencyGraph(version=0))
+    assert list(index.graphs) == [2, 3]
+
+
+def test_editing_serializes_and_cleans_up():
+    index = DependencyIndex()
+    events = []
+
+    async def edit(name):
+        async with index.editing(1):
+            events.append(f"{name} start")
+            await asyncio.sleep(0)
+            events.append(f"{name} end")
+
+    async def run():
+        await asyncio.gather(edit("a"), edit("b"))
+
+    asyncio.run(run())
+    assert events == ["a start", "a end", "b start", "b end"]
+    assert index._locks == {}
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import threading
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from config import Config
+from diagnostics import LoopMonitor, RequestTimings, SamplingProfiler, timing_middleware
+from main import create_app
+
+
+def busy_wait(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def blocking_handler(request):
+    busy_wait(0.3)
+    return web.json_response({"status": "ok"})
+
+
+async def quick_handler(request):
+    return web.json_response({"status": "ok"})
+
+
+def test_watchdog_names_the_blocking_handler(caplog):
+    async def run():
+        monitor = LoopMonitor(interval=0.01, block_threshold=0.1)
+        timings = RequestTimings()
+        app = web.Application(middlewares=[timing_middleware(monitor, timings)])
+        app.router.add_get("/block", blocking_handler)
+        app.router.add_get("/quick", quick_handler)
+        await monitor.start()
+        try:
+            async with TestClient(TestServer(app)) as client:
+                response = await client.get("/quick")
+                assert response.headers["Server-Timing"].startswith("app;dur=")
+                await client.get("/block")
+                await client.get("/missing")
+        finally:
+            await monitor.close()
+        return monitor, timings
+
+    with caplog.at_level(logging.WARNING, logger="diagnostics"):
+        monitor, timings = asyncio.run(run())
+
+    assert monitor.stalls >= 1
+    assert monitor.stats()["max_lag_ms"] >= 100
+    blocked = [record.getMessage() for record in caplog.records if "blocked" in record.getMessage()]
+    assert blocked and "in GET /block" in blocked[0]
+    assert "test_diagnostics:busy_wait" in blocked[0]
+
+    stats = timings.stats()
+    assert stats["GET /block"]["count"] == 1
+    assert stats["GET /block"]["max"] >= 300
+    assert "GET (unmatched)" in stats
+
+
+def test_sampling_profiler_collapses_stacks():
+    target = threading.get_ident()
+    profiler = SamplingProfiler(target, hz=200)
+    thread = threading.Thread(target=profiler.run, args=(0.2,))
+    thread.start()
+    busy_wait(0.25)
+    thread.join()
+
+    assert profiler.count > 10
+    lines = profiler.collapsed().splitlines()
+    stack, count = lines[0].rsplit(" ", 1)
+    assert stack.endswith("test_diagnostics:busy_wait")
+    assert int(count) > 0
+
+
+def test_admin_endpoints_require_a_token():
+    async def run(config, headers):
+        app = create_app(config)
+        app.on_startup.clear()
+        app.on_cleanup.clear()
+        async with TestClient(TestServer(app)) as client:
+            metrics = await client.get("/api/v0/admin/metrics", headers=headers)
+            profile = await client.get("/api/v0/admin/profile?seconds=0.05&hz=100", headers=headers)
+            return metrics.status, profile.status, await profile.text()
+
+    assert asyncio.run(run(Config(), {}))[:2] == (404, 404)
+    assert asyncio.run(run(Config(admin_token="secret"), {"Authorization": "Bearer wrong"}))[:2] == (403, 403)
+
+    metrics, profile, body = asyncio.run(run(Config(admin_token="secret"), {"Authorization": "Bearer secret"}))
+    assert (metrics, profile) == (200, 200)
+    # The loop was idle, waiting in the selector, while it was sampled
+    assert "selectors:select" in body
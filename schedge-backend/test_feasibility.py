@@ -0,0 +1,94 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from feasibility import analyze, describe
+from local_solver import SolverError, format_time, monte_carlo_schedule, solve
+
+NOW = datetime(2025, 5, 1, 8, tzinfo=timezone.utc)
+
+
+def at(hours):
+    return format_time(int((NOW + timedelta(hours=hours)).timestamp()))
+
+
+def fixed(task_id, start, end):
+    return {"id": task_id, "type": "fixed", "leisure": False, "start": at(start), "end": at(end)}
+
+
+def continuous(task_id, duration, kickoff, deadline, leisure=False):
+    return {
+        "id": task_id, "type": "continuous", "leisure": leisure,
+        "duration": duration, "kickoff": at(kickoff), "deadline": at(deadline),
+    }
+
+
+def test_tasks_that_fit():
+    tasks = [
+        fixed("meeting", 2, 3),
+        continuous("a", "PT2H", 0, 3),
+        continuous("b", "PT1H", 0, 4),
+        # Overdue, the solver skips it
+        continuous("late", "PT1H", -5, -1),
+    ]
+    assert analyze(tasks, NOW) == {"windows": [], "tasks": []}
+
+
+def test_overloaded_window():
+    tasks = [
+        fixed("meeting", 1, 2),
+        continuous("a", "PT1H", 0, 3),
+        continuous("b", "PT1H", 0, 3),
+        continuous("c", "PT30M", 0.5, 3),
+    ]
+    analysis = analyze(tasks, NOW)
+    assert analysis == {"windows": [{
+        "from": at(0), "to": at(3), "requiredMinutes": 150, "freeMinutes": 120, "tasks": ["a", "b", "c"],
+    }], "tasks": []}
+    assert describe(analysis) == f"Tasks a, b, c need 150 minutes between {at(0)} and {at(3)}, but only 120 are free"
+
+
+def test_projects_need_whole_pieces():
+    # 100 minutes of work take four 30-minute pieces
+    project = {**continuous("p", "PT100M", 0, 2), "type": "project", "timings": {"work": "PT30M"}}
+    assert analyze([project], NOW)["windows"] == []
+    assert analyze([{**project, "deadline": at(1.5)}], NOW)["windows"][0]["requiredMinutes"] == 120
+
+
+def test_pieces_must_fit_between_fixed_tasks():
+    tasks = [fixed("meeting", 1, 2), continuous("a", "PT90M", 0, 3)]
+    assert analyze(tasks, NOW) == {
+        "windows": [],
+        "tasks": [{"task": "a", "from": at(0), "to": at(3), "pieceMinutes": 90, "longestFreeMinutes": 60}],
+    }
+    # Time after the last fixed task is free
+    assert analyze([fixed("meeting", 1, 2), continuous("a", "PT90M", 0, 900)], NOW)["tasks"] == []
+
+
+def test_overloaded_sets_are_still_solved_partially():
+    tasks = [continuous(task_id, "PT2H", 0, 5) for task_id in ("a", "b", "c")]
+    assert analyze(tasks, NOW)["windows"][0]["tasks"] == ["a", "b", "c"]
+    # What a request with allowPartial gets: the solver still places what fits
+    assert len(solve(tasks, NOW)) == 2
+
+
+def test_schedulable_sets_are_never_reported():
+    rng = random.Random(5)
+    for _ in range(50):
+        tasks = []
+        for index in range(rng.randint(0, 6)):
+            start = rng.randint(0, 60) / 4
+            tasks.append(fixed(f"f{index}", start, start + rng.randint(1, 8) / 4))
+        for index in range(rng.randint(1, 6)):
+            kickoff = rng.randint(-8, 40) / 4
+            task = continuous(
+                f"d{index}", f"PT{rng.randint(1, 12) * 10}M", kickoff, kickoff + rng.randint(1, 48) / 4, rng.random() < 0.5,
+            )
+            tasks.append(task)
+        try:
+            slots = monte_carlo_schedule(tasks, int(NOW.timestamp()), seed=rng.randrange(100))
+        except SolverError:
+            continue
+        placed = {tasks[index]["id"] for _, _, index in slots}
+        analysis = analyze(tasks, NOW)
+        if all(task["id"] in placed for task in tasks):
+            assert analysis == {"windows": [], "tasks": []}
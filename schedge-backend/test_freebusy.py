@@ -0,0 +1,186 @@
+import random
+
+import pytest
+
+from freebusy import BusyIndex, BusyTimes, IntervalSet, OverlapError, fixed_interval, fixed_series, task_interval
+from main import parse_freebusy_query
+
+
+def brute_force_overlapping(intervals, start, end):
+    return sorted(
+        (key for key, (key_start, key_end) in intervals.items() if key_start < end and key_end > start),
+        key=lambda key: (intervals[key][0], key),
+    )
+
+
+def assert_blocks_valid(interval_set):
+    assert interval_set.starts == sorted(interval_set.starts)
+    for block in range(len(interval_set.starts)):
+        members = [interval_set.intervals[key] for key in interval_set.members[block]]
+        assert interval_set.starts[block] == min(start for start, _ in members)
+        assert interval_set.ends[block] == max(end for _, end in members)
+        if block:
+            assert interval_set.ends[block - 1] <= interval_set.starts[block]
+    assert sum(map(len, interval_set.members)) == len(interval_set)
+
+
+def test_incremental_edits_match_a_full_scan():
+    rng = random.Random(7)
+    interval_set = IntervalSet()
+    intervals = {}
+    for step in range(2000):
+        key = f"t{rng.randrange(60)}"
+        if rng.random() < 0.3:
+            assert interval_set.remove(key) == intervals.pop(key, None)
+        else:
+            start = rng.randrange(0, 1000)
+            intervals[key] = (start, start + rng.randrange(1, 80))
+            interval_set.add(key, *intervals[key])
+        if step % 50 == 0:
+            assert_blocks_valid(interval_set)
+            start = rng.randrange(-50, 1050)
+            end = start + rng.randrange(1, 200)
+            assert interval_set.overlapping(start, end) == brute_force_overlapping(intervals, start, end)
+    assert interval_set.intervals == intervals
+
+
+def test_removing_a_long_interval_splits_its_block():
+    interval_set = IntervalSet([("long", 0, 100), ("a", 10, 20), ("b", 50, 60), ("c", 100, 110)])
+    # Touching intervals stay in separate blocks
+    assert interval_set.blocks(0, 200) == [(0, 100), (100, 110)]
+    interval_set.remove("long")
+    assert interval_set.blocks(0, 200) == [(10, 20), (50, 60), (100, 110)]
+    assert interval_set.overlapping(15, 55) == ["a", "b"]
+
+
+def test_fixed_tasks_may_not_overlap():
+    busy = BusyTimes([("a", 100, 200), ("b", 300, 400)])
+    busy.check_fixed(200, 300)
+    with pytest.raises(OverlapError, match="^Overlaps fixed task b$"):
+        busy.check_fixed(250, 350)
+    # A task may overlap its own old times when it is moved
+    busy.check_fixed(150, 250, task_id="a")
+    with pytest.raises(OverlapError, match="^Overlaps fixed task b$"):
+        busy.check_fixed(150, 350, task_id="a")
+
+    previous = busy.set_fixed("a", (150, 250))
+    assert previous == (100, 200)
+    assert busy.set_fixed("a", None) == (150, 250)
+    assert busy.set_fixed("a", previous) is None
+    assert busy.fixed.intervals == {"a": (100, 200), "b": (300, 400)}
+
+
+def test_fixed_task_keeping_its_times_is_not_checked():
+    # Overlapping fixed tasks stored before the check existed
+    busy = BusyTimes([("a", 100, 300), ("b", 200, 400)])
+    busy.check_fixed(100, 300, task_id="a")
+    with pytest.raises(OverlapError, match="^Overlaps fixed task b$"):
+        busy.check_fixed(100, 350, task_id="a")
+    with pytest.raises(OverlapError, match="^Overlaps fixed task a$"):
+        busy.check_fixed(100, 300)
+
+
+# 2025-05-01T00:00:00Z
+DAY = 1746057600
+HOUR = 3600
+
+
+def test_recurring_fixed_tasks_are_busy_and_checked():
+    # Daily 09:00-10:00 for five days, without the third one
+    series = fixed_series({
+        "type": "fixed", "start": "2025-05-01T09:00:00Z", "end": "2025-05-01T10:00:00Z",
+        "recurrence": {"freq": "daily", "count": 5, "exceptions": ["20250503T090000Z"]},
+    })
+    busy = BusyTimes([("a", DAY + 86400 * 3 + 11 * HOUR, DAY + 86400 * 3 + 12 * HOUR)], series=[("s", series)])
+
+    assert busy.busy(DAY + 86400, DAY + 86400 * 3) == [(DAY + 86400 + 9 * HOUR, DAY + 86400 + 10 * HOUR)]
+    assert busy.busy(DAY + 86400 * 5, DAY + 86400 * 6) == []
+    with pytest.raises(OverlapError, match="^Overlaps fixed task s@20250502T090000Z$"):
+        busy.check_fixed(DAY + 86400 + 9 * HOUR + 1800, DAY + 86400 + 10 * HOUR + 1800)
+    busy.check_fixed(DAY + 86400 * 2 + 9 * HOUR, DAY + 86400 * 2 + 10 * HOUR)
+    # The task itself may move onto its own occurrences
+    busy.check_fixed(DAY + 86400 + 9 * HOUR, DAY + 86400 + 10 * HOUR, task_id="s")
+
+    # A daily series at 11:30 runs into the fixed task on the fourth day
+    task = {
+        "type": "fixed", "start": "2025-05-01T11:30:00Z", "end": "2025-05-01T12:30:00Z",
+        "recurrence": {"freq": "daily"},
+    }
+    with pytest.raises(OverlapError, match="^Overlaps fixed task a$"):
+        busy.check_task(task, DAY)
+    with pytest.raises(OverlapError, match="^Overlaps fixed task s@20250501T090000Z$"):
+        busy.check_task({**task, "start": "2025-05-01T08:30:00Z", "end": "2025-05-01T09:30:00Z"}, DAY)
+    busy.check_task({**task, "start": "2025-05-01T10:00:00Z", "end": "2025-05-01T11:00:00Z"}, DAY)
+    # Checked from now on: the conflict on the fourth day is in the past
+    busy.check_task(task, DAY + 86400 * 4)
+    # A series that keeps its times and rule is not checked
+    busy.check_task({**task, "start": "2025-05-01T09:00:00Z", "end": "2025-05-01T10:00:00Z",
+                     "recurrence": series["recurrence"]}, DAY, task_id="s")
+
+    previous = busy.set_task("s", {**task, "recurrence": None})
+    assert previous == (None, series)
+    assert busy.series == {} and busy.fixed.intervals["s"] == (DAY + 11 * HOUR + 1800, DAY + 12 * HOUR + 1800)
+    busy.restore_task("s", previous)
+    assert busy.series == {"s": series} and "s" not in busy.fixed
+    busy.set_task("s", None)
+    assert busy.series == {} and busy.busy(DAY, DAY + 86400 * 5) == [(DAY + 86400 * 3 + 11 * HOUR, DAY + 86400 * 3 + 12 * HOUR)]
+
+
+def test_busy_and_free_within_a_range():
+    busy = BusyTimes([("a", 100, 200), ("b", 400, 500)], [(100, 200), (200, 260), (450, 600), (900, 950)])
+    assert busy.busy(0, 1000) == [(100, 260), (400, 600), (900, 950)]
+    # Clipped to the range
+    assert busy.busy(150, 920) == [(150, 260), (400, 600), (900, 920)]
+    assert busy.free(0, 1000) == [(0, 100), (260, 400), (600, 900), (950, 1000)]
+    assert busy.free(0, 1000, minimum=140) == [(260, 400), (600, 900)]
+    assert busy.free(120, 240) == []
+
+    busy.replace_slots([(0, 50)])
+    assert busy.busy(0, 1000) == [(0, 50), (100, 200), (400, 500)]
+
+
+def test_task_interval():
+    assert task_interval({"start": "1970-01-01T00:01:00Z", "end": "1970-01-01T00:02:00+00:00"}) == (60, 120)
+    assert task_interval({"start": "1970-01-01T00:02:00Z", "end": "1970-01-01T00:01:00Z"}) is None
+    assert task_interval({"start": "soon", "end": "1970-01-01T00:01:00Z"}) is None
+    assert task_interval({"kickoff": "1970-01-01T00:01:00Z"}) is None
+
+
+def test_index_tracks_versions():
+    index = BusyIndex(max_users=2)
+    busy = BusyTimes(version=3)
+    index.store(1, busy)
+    assert index.cached(1, 3) is busy
+    index.committed(1, busy, 4)
+    assert index.cached(1, 4) is busy
+    # Another write happened in between
+    index.committed(1, busy, 6)
+    assert index.cached(1, 6) is None
+
+    for user_id in (1, 2, 3):
+        index.store(user_id, BusyTimes(version=0))
+    assert list(index.users) == [2, 3]
+
+
+def test_parse_freebusy_query():
+    assert parse_freebusy_query({
+        "from": "2025-05-01T00:00:00Z", "to": "2025-05-02T00:00:00+00:00", "min": "30",
+    }) == (True, (1746057600, 1746144000, 1800))
+    assert parse_freebusy_query({"from": "2025-05-01T00:00:00Z", "to": "2025-05-01T01:00:00Z"})[1][2] == 0
+
+    assert not parse_freebusy_query({"from": "2025-05-01T00:00:00Z"})[0]
+    assert not parse_freebusy_query({"from": "yesterday", "to": "2025-05-01T00:00:00Z"})[0]
+    assert not parse_freebusy_query({"from": "2025-05-01T00:00:00Z", "to": "2025-05-01T00:00:00Z"})[0]
+    assert not parse_freebusy_query({"from": "2025-05-01T00:00:00Z", "to": "2027-05-01T00:00:00Z"})[0]
+    assert not parse_freebusy_query({"from": "2025-05-01T00:00:00Z", "to": "2025-05-02T00:00:00Z", "min": "-5"})[0]
+
+
+def test_fixed_tasks_are_indexed_by_kind():
+    task = {"type": "fixed", "start": "1970-01-01T00:01:00Z", "end": "1970-01-01T00:02:00Z"}
+    assert fixed_interval(task) == (60, 120)
+    assert fixed_interval({**task, "recurrence": {"freq": "daily"}}) is None
+    assert fixed_interval({**task, "type": "continuous"}) is None
+    assert fixed_series(task) is None
+    assert fixed_series({**task, "recurrence": {"freq": "daily"}, "name": "Standup"}) == {
+        "start": task["start"], "end": task["end"], "recurrence": {"freq": "daily"},
+    }
@@ -0,0 +1,150 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from ical import (
+    ICalError,
+    calendar_header,
+    event_to_task,
+    fold_line,
+    iter_events,
+    iter_lines,
+    parse_content_line,
+    parse_ical_datetime,
+    parse_ical_duration,
+    slot_to_event,
+    unescape_text,
+)
+from main import prepare_task
+
+
+async def chunks_of(data, size):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def read_lines(data, size=7):
+    async def collect():
+        return [line async for line in iter_lines(chunks_of(data, size))]
+    return asyncio.run(collect())
+
+
+def read_events(data, size=7):
+    async def collect():
+        return [event async for event in iter_events(iter_lines(chunks_of(data, size)))]
+    return asyncio.run(collect())
+
+
+CALENDAR = (
+    "BEGIN:VCALENDAR\r\n"
+    "VERSION:2.0\r\n"
+    "BEGIN:VEVENT\r\n"
+    "UID:1@example.com\r\n"
+    "DTSTART;TZID=Europe/Moscow:20250501T100000\r\n"
+    "DURATION:PT1H30M\r\n"
+    "SUMMARY:Team\\, sync\r\n"
+    "DESCRIPTION:Agenda:\\nplanning\r\n"
+    "BEGIN:VALARM\r\n"
+    "TRIGGER:-PT15M\r\n"
+    "DESCRIPTION:Reminder\r\n"
+    "END:VALARM\r\n"
+    "END:VEVENT\r\n"
+    "BEGIN:VEVENT\r\n"
+    "DTSTART;VALUE=DATE:20250502\r\n"
+    "SUMMARY:Holiday\r\n"
+    "END:VEVENT\r\n"
+    "BEGIN:VEVENT\r\n"
+    "DTSTART:20250503T090000Z\r\n"
+    "STATUS:CANCELLED\r\n"
+    "END:VEVENT\r\n"
+    "END:VCALENDAR\r\n"
+).encode()
+
+
+def test_iter_lines_unfolds_across_chunks():
+    data = "SUMMARY:Встреча с\r\n  командой\nX:1".encode()
+    # A fold splitting a two-byte character must be joined before decoding
+    split = "SUMMARY:Вс".encode()
+    data_split = split[:-1] + b"\r\n " + split[-1:] + b"\r\n"
+    for size in (1, 3, 64):
+        assert read_lines(data, size) == ["SUMMARY:Встреча с командой", "X:1"]
+        assert read_lines(data_split, size) == ["SUMMARY:Вс"]
+
+
+def test_iter_lines_limits_line_length():
+    with pytest.raises(ICalError):
+        asyncio.run(_drain(iter_lines(chunks_of(b"X:" + b"a" * 100, 10), max_length=50)))
+
+
+async def _drain(lines):
+    return [line async for line in lines]
+
+
+def test_parse_content_line():
+    assert parse_content_line('ATTENDEE;CN="Doe; John":mailto:j@example.com') == (
+        "ATTENDEE", {"CN": "Doe; John"}, "mailto:j@example.com"
+    )
+    with pytest.raises(ICalError):
+        parse_content_line("NOVALUE")
+
+
+def test_parse_values():
+    assert parse_ical_datetime("20250501T100000Z", {}) == (datetime(2025, 5, 1, 10, tzinfo=timezone.utc), False)
+    assert parse_ical_datetime("20250501T100000", {"TZID": "Europe/Moscow"})[0].hour == 7
+    assert parse_ical_datetime("20250501T100000", {"TZID": "Nowhere/Else"})[0].hour == 10
+    assert parse_ical_datetime("20250501", {"VALUE": "DATE"})[1] is True
+    assert parse_ical_duration("PT1H30M").total_seconds() == 5400
+    assert parse_ical_duration("P1W").days == 7
+    with pytest.raises(ICalError):
+        parse_ical_duration("PT")
+    assert unescape_text("a\\,b\\;c\\nd\\\\") == "a,b;c\nd\\"
+
+
+def test_events_become_fixed_tasks():
+    events = read_events(CALENDAR)
+    assert len(events) == 3
+    # Properties of the nested VALARM are not merged into the event
+    assert events[0]["DESCRIPTION"][1] == "Agenda:\\nplanning"
+
+    task = event_to_task(events[0])
+    assert task["type"] == "fixed"
+    assert task["name"] == "Team, sync"
+    assert task["description"] == "Agenda:\nplanning"
+    assert task["start"] == "2025-05-01T07:00:00+00:00"
+    assert task["end"] == "2025-05-01T08:30:00+00:00"
+    assert prepare_task(task)[1] is None
+
+    # All-day events last a day
+    task = event_to_task(events[1])
+    assert task["end"] == "2025-05-03T00:00:00+00:00"
+
+    assert event_to_task(events[2]) is None
+
+
+def test_unbalanced_calendar_is_rejected():
+    with pytest.raises(ICalError):
+        read_events(b"BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nEND:VCALENDAR\r\n")
+
+
+def test_fold_line():
+    line = "DESCRIPTION:" + "ж" * 100
+    folded = fold_line(line)
+    assert all(len(part) <= 75 for part in folded.split(b"\r\n"))
+    assert read_lines(folded) == [line]
+
+
+def test_export_round_trip():
+    slot = {
+        "_id": "abc",
+        "start": "2025-05-01T10:00:00+00:00",
+        "end": "2025-05-01T10:25:00+00:00",
+        "task": {"name": "Reading; chapter 3", "description": "Notes, too"},
+    }
+    data = calendar_header() + slot_to_event(slot, "20250101T000000Z") + b"END:VCALENDAR\r\n"
+    (event,) = read_events(data)
+    task = event_to_task(event)
+    assert task["name"] == "Reading; chapter 3"
+    assert task["description"] == "Notes, too"
+    assert task["start"] == "2025-05-01T10:00:00+00:00"
+    assert task["end"] == "2025-05-01T10:25:00+00:00"
@@ -0,0 +1,257 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from jobs import ANNOUNCED, DONE, FAILED, QUEUED, RUNNING, JobListener, JobWorker, MemoryJobStore, PermanentJobError
+from memory import BackgroundTasks
+
+T0 = datetime(2025, 5, 1, 12, tzinfo=timezone.utc)
+
+
+def at(seconds):
+    return T0 + timedelta(seconds=seconds)
+
+
+def test_enqueue_merges_into_the_queued_job():
+    async def run():
+        store = MemoryJobStore()
+        first = await store.enqueue(1, {"seed": 1}, now=at(0))
+        second = await store.enqueue(1, {"seed": 2}, now=at(1))
+        other = await store.enqueue(2, now=at(1))
+        return store, first, second, other
+
+    store, first, second, other = asyncio.run(run())
+    assert first == second != other
+    assert store.jobs[first]["params"] == {"seed": 2}
+    assert store.jobs[first]["availableAt"] == at(0)
+
+
+def test_claim_runs_one_job_per_user_and_reclaims_expired_leases():
+    async def run():
+        store = MemoryJobStore()
+        first = await store.enqueue(1, now=at(0))
+        job = await store.claim("a", lease=10, max_attempts=2, now=at(0))
+        assert job["_id"] == first and job["attempts"] == 1
+        # Queued while the first job runs: waits for it
+        second = await store.enqueue(1, now=at(1))
+        assert second != first
+        assert await store.claim("b", lease=10, max_attempts=2, now=at(2)) is None
+
+        # Worker "a" dies; after its lease the first job is claimed again, still before the second
+        job = await store.claim("b", lease=10, max_attempts=2, now=at(11))
+        assert (job["_id"], job["worker"], job["attempts"]) == (first, "b", 2)
+        assert not await store.heartbeat(first, "a", lease=10, now=at(12))
+        assert not await store.complete(first, "a", now=at(12))
+        assert await store.complete(first, "b", now=at(12))
+        assert store.jobs[first]["status"] == DONE
+
+        job = await store.claim("b", lease=10, max_attempts=2, now=at(12))
+        assert job["_id"] == second
+
+        # Out of attempts after its lease expires twice
+        assert await store.claim("a", lease=10, max_attempts=2, now=at(23)) is not None
+        assert await store.claim("a", lease=10, max_attempts=2, now=at(34)) is None
+        assert await store.expire(max_attempts=2, now=at(34)) == 1
+        return store, second
+
+    store, second = asyncio.run(run())
+    assert store.jobs[second]["status"] == FAILED
+    assert store.jobs[second]["error"] == "Worker lease expired"
+
+
+def test_failed_job_is_retried_unless_a_newer_one_is_queued():
+    async def run():
+        store = MemoryJobStore()
+        first = await store.enqueue(1, now=at(0))
+        await store.claim("a", lease=10, max_attempts=3, now=at(0))
+        await store.complete(first, "a", "solver down", retry_at=at(5), now=at(1))
+        assert store.jobs[first]["status"] == QUEUED
+        assert await store.claim("a", lease=10, max_attempts=3, now=at(2)) is None
+        # Asking again makes the retry due right away
+        assert await store.enqueue(1, now=at(3)) == first
+        job = await store.claim("a", lease=10, max_attempts=3, now=at(3))
+        assert job["attempts"] == 2
+
+        newer = await store.enqueue(1, now=at(4))
+        await store.complete(first, "a", "solver down", retry_at=at(9), now=at(5))
+        return store, first, newer
+
+    store, first, newer = asyncio.run(run())
+    assert store.jobs[first]["status"] == FAILED
+    assert store.jobs[newer]["status"] == QUEUED
+
+
+def test_worker_runs_jobs_renews_leases_and_retries():
+    async def run():
+        store = MemoryJobStore()
+        calls = []
+        running = 0
+        most_running = 0
+
+        async def job_runner(job):
+            nonlocal running, most_running
+            calls.append((job["userId"], job["attempts"]))
+            running += 1
+            most_running = max(most_running, running)
+            try:
+                # Longer than the lease: only renewals keep other workers off
+                await asyncio.sleep(0.15)
+            finally:
+                running -= 1
+            if job["userId"] == 3 and job["attempts"] == 1:
+                return "solver down"
+            return None
+
+        background = BackgroundTasks()
+        workers = [
+            JobWorker(store, job_runner, background, worker_id=name, concurrency=2, lease=0.1,
+                      poll_interval=0.01, max_attempts=2, retry_delay=0.01)
+            for name in ("a", "b")
+        ]
+        for user_id in (1, 2, 3, 4, 5):
+            await store.enqueue(user_id)
+        for worker in workers:
+            await worker.start()
+        for _ in range(200):
+            if all(job["status"] in (DONE, FAILED) for job in store.jobs.values()):
+                break
+            await asyncio.sleep(0.02)
+        for worker in workers:
+            await worker.close()
+        return store, calls, most_running, workers
+
+    store, calls, most_running, workers = asyncio.run(run())
+    assert {job["status"] for job in store.jobs.values()} == {DONE}
+    assert sorted(calls) == [(1, 1), (2, 1), (3, 1), (3, 2), (4, 1), (5, 1)]
+    assert most_running <= 4
+    assert sum(worker.lost for worker in workers) == 0
+    assert sum(worker.retried for worker in workers) == 1
+
+
+def test_worker_stops_a_job_whose_lease_was_lost():
+    async def run():
+        store = MemoryJobStore()
+        started = asyncio.Event()
+        events = []
+
+        async def job_runner(job):
+            started.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                # Still winding down when the cancellation arrives
+                await asyncio.sleep(0.05)
+                events.append("stopped")
+                raise
+
+        worker = JobWorker(store, job_runner, BackgroundTasks(), worker_id="a", lease=0.06, poll_interval=0.01)
+        job_id = await store.enqueue(1)
+        await worker.start()
+        await asyncio.wait_for(started.wait(), 1)
+        # Another worker claimed the job after a stall
+        store.jobs[job_id].update(worker="b", leaseUntil=datetime.now(timezone.utc) + timedelta(minutes=1))
+        while worker.running:
+            await asyncio.sleep(0.005)
+        events.append("released")
+        await worker.close()
+        return events, worker.lost, store.jobs[job_id]
+
+    events, lost, job = asyncio.run(run())
+    assert events == ["stopped", "released"]
+    assert lost == 1
+    assert job["status"] == RUNNING and job["worker"] == "b"
+
+
+def test_permanent_errors_are_not_retried():
+    async def run():
+        store = MemoryJobStore()
+
+        async def job_runner(job):
+            raise PermanentJobError("Tasks a, b do not fit", {"tasks": ["a", "b"]})
+
+        worker = JobWorker(store, job_runner, BackgroundTasks(), worker_id="a", poll_interval=0.01,
+                           max_attempts=3, retry_delay=0.01)
+        job_id = await store.enqueue(1)
+        await worker.start()
+        for _ in range(100):
+            if store.jobs[job_id]["status"] == FAILED:
+                break
+            await asyncio.sleep(0.01)
+        await worker.close()
+        return store.jobs[job_id], worker
+
+    job, worker = asyncio.run(run())
+    assert job["status"] == FAILED and job["attempts"] == 1
+    assert job["error"] == "Tasks a, b do not fit" and job["details"] == {"tasks": ["a", "b"]}
+    assert worker.retried == 0 and worker.failed == 1
+
+
+def test_closing_a_worker_hands_running_jobs_back():
+    async def run():
+        store = MemoryJobStore()
+        started = asyncio.Event()
+
+        async def job_runner(job):
+            started.set()
+            await asyncio.sleep(60)
+
+        worker = JobWorker(store, job_runner, BackgroundTasks(), worker_id="a", poll_interval=0.01)
+        job_id = await store.enqueue(1)
+        await worker.start()
+        await asyncio.wait_for(started.wait(), 1)
+        await worker.close()
+        job = await store.claim("b", lease=10, max_attempts=1)
+        return job_id, job
+
+    job_id, job = asyncio.run(run())
+    assert job["_id"] == job_id and job["worker"] == "b" and job["attempts"] == 1
+
+
+def test_listener_emits_jobs_finished_elsewhere():
+    async def run():
+        store = MemoryJobStore()
+        emitted = []
+
+        async def emit(user_id, details):
+            emitted.append((user_id, details))
+
+        listener = JobListener(store, {1: {}, 2: {}}, emit, worker_id="here")
+        listener.since = at(0)
+        for user_id, worker in ((1, "elsewhere"), (2, "here"), (3, "elsewhere")):
+            job_id = await store.enqueue(user_id, now=at(0))
+            await store.claim(worker, lease=10, max_attempts=1, now=at(0))
+            await store.complete(job_id, worker, now=at(1))
+        # The details of the user's last job go along with their state
+        job_id = await store.enqueue(1, now=at(1))
+        await store.claim("elsewhere", lease=10, max_attempts=1, now=at(1))
+        await store.complete(job_id, "elsewhere", "Tasks a, b do not fit", now=at(2), details={"tasks": ["a", "b"]})
+        await listener.poll()
+        await listener.poll()
+        return emitted, store
+
+    emitted, store = asyncio.run(run())
+    assert emitted == [(1, {"tasks": ["a", "b"]})]
+    assert RUNNING not in {job["status"] for job in store.jobs.values()}
+
+
+def test_listener_emits_changes_announced_elsewhere():
+    async def run():
+        store = MemoryJobStore()
+        emitted = []
+
+        async def emit(user_id, details):
+            emitted.append(user_id)
+
+        listener = JobListener(store, {1: {}, 2: {}}, emit, worker_id="here")
+        listener.since = at(0)
+        await store.announce(1, "elsewhere", now=at(1))
+        await store.announce(2, "here", now=at(1))
+        await listener.poll()
+        await listener.poll()
+        # Announcements are never claimed as jobs
+        claimed = await store.claim("worker", lease=10, max_attempts=1, now=at(2))
+        return emitted, claimed, store
+
+    emitted, claimed, store = asyncio.run(run())
+    assert emitted == [1]
+    assert claimed is None
+    assert {job["status"] for job in store.jobs.values()} == {ANNOUNCED}
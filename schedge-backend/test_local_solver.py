@@ -0,0 +1,143 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from config import Config
+from local_solver import parse_duration, round_to, solve
+from main import CONFIG_KEY, OFFLOADER_KEY, SOLVER_KEY, solve_locally, solve_remotely
+from offload import Offloader
+from solver_client import SolverClient, SolverError
+
+NOW = datetime(2023, 10, 1, 9, tzinfo=timezone.utc)
+
+
+def base(task_id, leisure=False):
+    return {
+        "id": task_id,
+        "name": task_id,
+        "description": None,
+        "color": "#3498DB",
+        "leisure": leisure,
+        "dependencies": [],
+        "nonce": 1,
+        "userId": 1,
+    }
+
+
+def fixed(task_id, start, end, leisure=False):
+    return {**base(task_id, leisure), "type": "fixed", "start": start, "end": end}
+
+
+def continuous(task_id, duration, kickoff, deadline, leisure=False):
+    return {**base(task_id, leisure), "type": "continuous", "duration": duration,
+            "kickoff": kickoff, "deadline": deadline}
+
+
+def project(task_id, duration, kickoff, deadline, work="PT25M", leisure=False):
+    return {**base(task_id, leisure), "type": "project", "duration": duration,
+            "kickoff": kickoff, "deadline": deadline,
+            "timings": {"work": work, "smallBreak": "PT5M", "bigBreak": "PT15M", "numberOfSmallBreaks": 2}}
+
+
+def summary(slots):
+    return [(slot["task"]["id"], slot["start"][11:16], slot["end"][11:16]) for slot in slots]
+
+
+def test_parse_duration():
+    # Same cases as schedge-solver/src/duration.rs
+    assert parse_duration("P3Y6M4DT12H30M5S") == (3 * 365 + 6 * 30 + 4) * 86400 + 12 * 3600 + 30 * 60 + 5
+    assert parse_duration("T3600S") == 3600
+    assert parse_duration("P2W") == 2 * 7 * 86400
+    assert parse_duration("T1H30M") == 5400
+    with pytest.raises(ValueError):
+        parse_duration("Invalid")
+
+
+def test_round_to():
+    # Halves round up, like chrono's duration_round
+    assert round_to(10 * 3600 + 55 * 60, 600) == 11 * 3600
+    assert round_to(0, 600) == 0
+    assert round_to(601, 600) == 600
+    assert round_to(900, 600) == 1200
+
+
+def test_solve_example():
+    # schedge-solver/tests/golden.rs: solve_example
+    tasks = [
+        project("a", "PT2H", "2023-10-01T09:00:00Z", "2023-10-03T09:00:00Z"),
+        fixed("b", "2023-10-01T09:00:00Z", "2023-10-01T10:00:00Z"),
+    ]
+    slots = solve(tasks, NOW, seed=0)
+    assert summary(slots) == [
+        ("b", "09:00", "10:00"),
+        ("a", "10:00", "10:25"),
+        ("a", "11:00", "11:25"),
+        ("a", "12:00", "12:25"),
+        ("a", "13:00", "13:25"),
+        ("a", "14:00", "14:25"),
+    ]
+    assert slots[0]["start"] == "2023-10-01T09:00:00+00:00"
+    assert "userId" not in slots[0]["task"]
+
+
+def test_example_tasks():
+    # schedge-solver/tests/golden.rs: example_tasks
+    tasks = [
+        continuous("a", "PT90M", "2023-10-01T09:00:00Z", "2023-10-02T09:00:00Z"),
+        fixed("b", "2023-10-01T09:00:00Z", "2023-10-01T10:00:00Z", leisure=True),
+    ]
+    assert summary(solve(tasks, NOW)) == [("b", "09:00", "10:00"), ("a", "10:00", "11:30")]
+    # A zero time limit stops the search before the first pass
+    with pytest.raises(SolverError) as error:
+        solve(tasks, NOW, budget_ms=0)
+    assert error.value.status == 404
+
+
+def test_leisure_alternation():
+    tasks = [
+        continuous("work", "PT1H", "2023-10-01T09:00:00Z", "2023-10-02T09:00:00Z"),
+        continuous("walk", "PT30M", "2023-10-01T09:00:00Z", "2023-10-02T09:00:00Z", leisure=True),
+    ]
+    # Work may only follow leisure time, so the walk comes first
+    assert summary(solve(tasks, NOW)) == [("walk", "09:00", "09:30"), ("work", "09:30", "10:30")]
+
+
+def test_every_fixed_task_blocks_placement():
+    tasks = [
+        fixed("z", "2023-10-01T09:30:00Z", "2023-10-01T10:00:00Z", leisure=True),
+        fixed("y", "2023-10-01T10:30:00Z", "2023-10-01T11:00:00Z", leisure=True),
+        continuous("a", "PT45M", "2023-10-01T09:00:00Z", "2023-10-02T09:00:00Z"),
+    ]
+    slots = summary(solve(tasks, NOW))
+    assert slots[:2] == [("y", "10:30", "11:00"), ("z", "09:30", "10:00")]
+    assert slots[2] == ("a", "11:00", "11:45")
+
+
+def test_missed_deadlines_and_invalid_tasks():
+    tasks = [continuous("late", "PT2H", "2023-10-01T09:00:00Z", "2023-10-01T10:00:00Z")]
+    assert solve(tasks, NOW) == []
+
+    with pytest.raises(SolverError) as error:
+        solve([{"type": "fixed", "id": "x"}], NOW)
+    assert error.value.status == 400
+
+    with pytest.raises(SolverError):
+        solve([project("p", "P30D", "2023-10-01T09:00:00Z", "2023-11-01T09:00:00Z", work="PT1M")], NOW)
+
+
+def test_small_or_unavailable_problems_are_solved_locally():
+    tasks = [continuous("a", "PT1H", "2000-01-01T00:00:00Z", "2100-01-01T00:00:00Z", leisure=True)]
+    app = {
+        CONFIG_KEY: Config(local_solver_max_tasks=0),
+        SOLVER_KEY: SolverClient(None, None),
+        OFFLOADER_KEY: Offloader(),
+    }
+
+    async def run():
+        # No solver replica is configured, so the circuit counts as open
+        assert await solve_remotely(app, 1, tasks) is None
+        return await solve_locally(app, tasks, {"seed": 1})
+
+    (slot,) = asyncio.run(run())
+    assert slot["task"]["id"] == "a"
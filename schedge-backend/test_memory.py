@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import tracemalloc
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from config import Config
+from dependencies import DependencyGraph, DependencyIndex
+from main import CONNECTIONS_KEY, create_app
+from memory import BackgroundTasks, MemoryMonitor, approximate_size
+
+
+class FakeSocket:
+    def __init__(self, closed=False):
+        self.closed = closed
+
+
+def test_approximate_size_counts_shared_objects_once():
+    item = "x" * 1000
+    assert approximate_size([item, item]) < approximate_size([item, "y" * 1000])
+    assert approximate_size(DependencyGraph([("a", []), ("b", ["a"])])) > approximate_size({})
+
+
+def test_background_tasks_are_held_until_done(caplog):
+    async def run():
+        tasks = BackgroundTasks()
+        release = asyncio.Event()
+
+        async def wait():
+            await release.wait()
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        waiting = [tasks.spawn(1, wait(), ["payload"]), tasks.spawn(2, wait())]
+        failing = tasks.spawn(1, fail())
+        assert tasks.pending(1) == 2 and len(tasks) == 3
+        await asyncio.wait([failing])
+        assert tasks.pending(1) == 1
+
+        release.set()
+        await asyncio.wait(waiting)
+        assert len(tasks) == 0 and tasks.tasks == {}
+
+        tasks.spawn(3, asyncio.sleep(60))
+        await tasks.close()
+        await asyncio.sleep(0)
+        return tasks
+
+    with caplog.at_level(logging.ERROR, logger="memory"):
+        tasks = asyncio.run(run())
+    assert tasks.stats() == {"pending": 0, "users": 0, "started": 4, "failed": 1}
+    assert "Background task of user 1 failed: RuntimeError('boom')" in caplog.text
+
+
+def test_check_reaps_closed_sockets_and_alerts_once(caplog):
+    async def run():
+        connections = {1: {"a": FakeSocket(), "b": FakeSocket(closed=True)}, 2: {"c": FakeSocket(closed=True)}}
+        index = DependencyIndex()
+        index.store(3, DependencyGraph([(str(i), [str(i - 1)] if i else []) for i in range(200)]))
+        monitor = MemoryMonitor(connections, BackgroundTasks(), index,
+                                user_bytes_limit=10000, user_connections_limit=1)
+
+        usage = await monitor.check()
+        assert monitor.reaped == 2 and connections == {1: {"a": connections[1]["a"]}}
+        assert usage[1]["connections"] == 1 and usage[1]["bytes"] == 0
+        assert usage[3]["held"]["dependencies"] > 10000
+        assert [(alert["subject"], alert["metric"]) for alert in monitor.stats()["alerts"]] == [(3, "bytes")]
+
+        await monitor.check()
+        assert monitor.fired == 1
+
+        index.invalidate(3)
+        await monitor.check()
+        return monitor
+
+    with caplog.at_level(logging.INFO, logger="memory"):
+        monitor = asyncio.run(run())
+    assert monitor.alerts == {}
+    assert caplog.text.count("Memory alert: bytes of user 3") == 1
+    assert "Memory alert cleared: bytes of user 3" in caplog.text
+
+
+def test_snapshot_reports_growth():
+    monitor = MemoryMonitor({}, BackgroundTasks(), DependencyIndex())
+    was_tracing = tracemalloc.is_tracing()
+    try:
+        assert monitor.snapshot()["started"] is not was_tracing
+        retained = [bytearray(1000) for _ in range(1000)]
+        result = monitor.snapshot(top=5)
+        assert result["differences"]
+        assert any("test_memory.py" in where for where in result["differences"][0]["where"])
+        assert result["differences"][0]["size_diff"] >= 1000 * 1000
+        del retained
+    finally:
+        monitor.stop_tracing()
+    assert not tracemalloc.is_tracing()
+
+
+def test_admin_memory_endpoints():
+    async def run():
+        app = create_app(Config(admin_token="secret"))
+        app.on_startup.clear()
+        app.on_cleanup.clear()
+        app[CONNECTIONS_KEY][7] = {"a": FakeSocket()}
+        headers = {"Authorization": "Bearer secret"}
+        async with TestClient(TestServer(app)) as client:
+            usage = await (await client.get("/api/v0/admin/memory", headers=headers)).json()
+            bad = await client.get("/api/v0/admin/memory?users=x", headers=headers)
+            first = await (await client.post("/api/v0/admin/memory/snapshot", headers=headers)).json()
+            second = await (await client.post("/api/v0/admin/memory/snapshot?top=3", headers=headers)).json()
+            stopped = await client.delete("/api/v0/admin/memory/snapshot", headers=headers)
+            return usage, bad.status, first, second, stopped.status
+
+    usage, bad, first, second, stopped = asyncio.run(run())
+    assert usage["result"]["totals"]["connections"] == 1
+    assert usage["result"]["users"][0]["user_id"] == 7
+    assert bad == 400
+    assert first["result"]["started"] and first["result"]["differences"] == []
+    assert len(second["result"]["differences"]) <= 3
+    assert stopped == 200 and not tracemalloc.is_tracing()
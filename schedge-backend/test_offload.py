@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import bson
+
+from main import parse_task_body, render_documents, render_state
+from offload import Offloader
+
+
+def square(value):
+    return value * value
+
+
+def test_offloader_runs_small_items_inline():
+    async def run():
+        offloader = Offloader(workers=0, threshold=10)
+        await offloader.start()
+        result = await offloader.run(1_000, square, 7)
+        await offloader.close()
+        return offloader, result
+
+    offloader, result = asyncio.run(run())
+    assert result == 49
+    assert (offloader.inline, offloader.offloaded) == (1, 0)
+
+
+def test_offloader_sends_large_items_to_the_pool():
+    async def run():
+        offloader = Offloader(workers=1, threshold=10)
+        await offloader.start()
+        try:
+            small = await offloader.run(5, square, 3)
+            large = await offloader.run(10, square, 4)
+        finally:
+            await offloader.close()
+        return offloader, small, large
+
+    offloader, small, large = asyncio.run(run())
+    assert (small, large) == (9, 16)
+    assert (offloader.inline, offloader.offloaded) == (1, 1)
+
+
+def test_render_state_from_raw_bson():
+    task_id = bson.ObjectId()
+    tasks = bson.encode({"_id": task_id, "name": "Reading", "userId": 1})
+    slots = bson.encode({"_id": bson.ObjectId(), "start": "2025-05-01T10:00:00+00:00", "userId": 1})
+
+    state = json.loads(render_state(1, tasks, slots))
+    assert state["userId"] == 1
+    assert state["tasks"] == [{"name": "Reading", "userId": 1, "id": str(task_id)}]
+    assert len(state["slots"]) == 1
+
+    response = json.loads(render_state(1, tasks + tasks, b"", envelope=True))
+    assert response["status"] == "ok"
+    assert len(response["result"]["tasks"]) == 2
+    assert response["result"]["slots"] == []
+
+    assert json.loads(render_documents(b"")) == {"status": "ok", "result": []}
+
+
+def test_parse_task_body():
+    task, error = parse_task_body(json.dumps({
+        "id": "1",
+        "type": "fixed",
+        "name": "Gym",
+        "color": "#E74C3C",
+        "leisure": False,
+        "dependencies": [],
+        "nonce": 1,
+        "start": "2025-05-01T10:00:00Z",
+        "end": "2025-05-01T11:00:00Z",
+    }).encode())
+    assert error is None
+    assert task["start"] == "2025-05-01T10:00:00+00:00"
+
+    assert parse_task_body(b"{not json") == (None, "Invalid JSON in request body")
+    task, error = parse_task_body(b'{"type": "fixed"}')
+    assert task is None and error
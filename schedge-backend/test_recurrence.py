@@ -0,0 +1,132 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import bson
+
+from main import prepare_task, render_expanded_tasks
+from recurrence import Series, expand_task, expand_tasks, occurrence_key, validate_rule
+
+
+def at(day, hour=0):
+    return datetime(2025, 5, day, hour, tzinfo=timezone.utc)
+
+
+def reading(**rule):
+    return {
+        "id": "r",
+        "type": "continuous",
+        "name": "Reading",
+        "color": "#FFD700",
+        "leisure": False,
+        "dependencies": [],
+        "nonce": 1,
+        "duration": "PT90M",
+        # Thursday
+        "kickoff": "2025-05-01T08:00:00+03:00",
+        "deadline": "2025-05-01T20:00:00+03:00",
+        "recurrence": rule,
+    }
+
+
+def keys(task, start, end):
+    return [instance["occurrence"] for instance in expand_task(task, start, end)]
+
+
+def test_daily_occurrences_shift_every_time():
+    task = reading(freq="daily", interval=2, count=3)
+    instances = expand_task(task, at(1), at(31))
+    assert [instance["kickoff"] for instance in instances] == [
+        "2025-05-01T08:00:00+03:00", "2025-05-03T08:00:00+03:00", "2025-05-05T08:00:00+03:00",
+    ]
+    assert instances[1]["deadline"] == "2025-05-03T20:00:00+03:00"
+    assert instances[1]["id"] == "r@20250503T050000Z"
+    assert instances[1]["recurrenceId"] == "r"
+    assert "recurrence" not in instances[1]
+    # An occurrence that is still running counts as overlapping the window
+    assert keys(task, at(3, 16), at(4)) == ["20250503T050000Z"]
+
+
+def test_weekly_by_day_counts_from_the_first_occurrence():
+    task = reading(freq="weekly", byDay=["MO", "TH", "FR"], count=5)
+    # Thursday and Friday of the first week, then Monday, Thursday, Friday
+    assert keys(task, at(1), at(31)) == [
+        "20250501T050000Z", "20250502T050000Z", "20250505T050000Z", "20250508T050000Z", "20250509T050000Z",
+    ]
+    until = reading(freq="weekly", interval=2, until="2025-05-15T05:00:00+00:00")
+    assert keys(until, at(1), at(31)) == ["20250501T050000Z", "20250515T050000Z"]
+
+
+def test_windows_far_from_the_start_match_a_full_walk():
+    rng = random.Random(3)
+    for _ in range(200):
+        rule = {"freq": rng.choice(["daily", "weekly"]), "interval": rng.randint(1, 3)}
+        if rule["freq"] == "weekly" and rng.random() < 0.7:
+            rule["byDay"] = rng.sample(["MO", "TU", "WE", "TH", "FR", "SA", "SU"], rng.randint(1, 4))
+        if rng.random() < 0.5:
+            rule["count"] = rng.randint(1, 200)
+        series = Series(reading(**rule))
+        everything = list(series.between(at(1), at(1) + timedelta(days=3000)))
+        start = at(1) + timedelta(hours=rng.randint(-48, 24 * 700))
+        end = start + timedelta(hours=rng.randint(1, 24 * 30))
+        expected = [moment for moment in everything if moment + series.length > start and moment < end]
+        assert list(series.between(start, end)) == expected
+        for moment in expected:
+            assert series.contains(moment)
+            assert not series.contains(moment + timedelta(hours=1))
+
+
+def test_exceptions_and_overrides():
+    task = reading(
+        freq="daily",
+        exceptions=["20250502T050000Z"],
+        overrides={"20250503T050000Z": {"name": "Reading, short", "duration": "PT30M"}},
+    )
+    instances = expand_task(task, at(1), at(4))
+    assert [instance["occurrence"] for instance in instances] == ["20250501T050000Z", "20250503T050000Z"]
+    assert instances[1]["name"] == "Reading, short"
+    assert instances[1]["duration"] == "PT30M"
+    assert instances[0]["name"] == "Reading"
+
+
+def test_expand_tasks_keeps_order_and_drops_dependencies_on_series():
+    tasks = [
+        {"id": "a", "dependencies": []},
+        reading(freq="daily", count=2),
+        {"id": "b", "dependencies": ["a", "r"]},
+        {**reading(freq="daily"), "id": "broken", "kickoff": "soon"},
+    ]
+    expanded, broken = expand_tasks(tasks, at(1), at(31))
+    assert [task["id"] for task in expanded] == ["a", "r@20250501T050000Z", "r@20250502T050000Z", "b"]
+    assert expanded[-1]["dependencies"] == ["a"]
+    assert tasks[2]["dependencies"] == ["a", "r"]
+    assert broken == ["broken"]
+
+
+def test_rules_are_validated_and_normalized():
+    task = reading(
+        freq="weekly",
+        until="2025-06-01T10:00:40+00:00",
+        overrides={"20250508T050000Z": {"kickoff": "2025-05-08T09:00:31+03:00", "duration": "PT1H"}},
+    )
+    prepared, error = prepare_task(task)
+    assert error is None
+    assert prepared["recurrence"]["until"] == "2025-06-01T10:01:00+00:00"
+    assert prepared["recurrence"]["overrides"]["20250508T050000Z"] == {
+        "kickoff": "2025-05-08T09:01:00+03:00", "duration": "PT60M",
+    }
+
+    assert prepare_task(reading(freq="hourly"))[0] is None
+    assert prepare_task(reading(freq="daily", interval=0))[0] is None
+    assert validate_rule(reading(freq="daily", byDay=["MO"])) == "byDay is only supported for weekly recurrence"
+    assert validate_rule(reading(freq="daily", exceptions=["tomorrow"])) == "Invalid occurrence: tomorrow"
+    assert validate_rule(reading(freq="daily", overrides={"20250502T050000Z": {"type": "fixed"}})) == (
+        "Field cannot be overridden: type"
+    )
+
+
+def test_read_window_expands_stored_tasks():
+    task = {**reading(freq="daily", count=10), "_id": bson.ObjectId(), "userId": 1}
+    del task["id"]
+    blob = bson.encode(task)
+    body = render_expanded_tasks(blob, int(at(2).timestamp()), int(at(4).timestamp()))
+    assert occurrence_key(at(2, 5)) in body and occurrence_key(at(4, 5)) not in body
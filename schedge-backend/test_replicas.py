@@ -0,0 +1,129 @@
+import asyncio
+
+import bson
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from pymongo import AsyncMongoClient
+
+from replicas import (
+    CAUSAL_KEY, TOKEN_HEADER, ReplicaRouter, TokenError, causal_middleware, decode_token, encode_token, later,
+    make_read_preference, make_write_concern,
+)
+
+
+def cluster_time(seconds):
+    return {"clusterTime": bson.Timestamp(seconds, 1), "signature": {"hash": b"\0" * 20, "keyId": 7}}
+
+
+def offline_client():
+    # Sessions and read preferences need no server until a command runs
+    return AsyncMongoClient("mongodb://localhost:1/?replicaSet=rs0", connect=False, serverSelectionTimeoutMS=100)
+
+
+def test_tokens_round_trip_for_their_user():
+    times = (bson.Timestamp(100, 2), cluster_time(101))
+    token = encode_token(7, times)
+    assert decode_token(token, 7) == times
+    assert decode_token(token, 8) is None
+    assert decode_token(encode_token(7, (bson.Timestamp(100, 2), None)), 7) == (bson.Timestamp(100, 2), None)
+    for invalid in ("", "abc", token[:-4], encode_token(7, times).replace("A", "B", 3)):
+        with pytest.raises(TokenError):
+            decode_token(invalid, 7)
+
+
+def test_later_times_win():
+    early, late = (bson.Timestamp(100, 1), cluster_time(100)), (bson.Timestamp(200, 1), None)
+    assert later(early, None) == early
+    assert later(None, None) is None
+    assert later(early, late) == (bson.Timestamp(200, 1), cluster_time(100))
+
+
+def test_read_preferences_and_write_concerns():
+    assert make_read_preference("secondaryPreferred").mongos_mode == "secondaryPreferred"
+    assert make_read_preference("nearest", 120).max_staleness == 120
+    assert make_read_preference("secondary").max_staleness == -1
+    with pytest.raises(ValueError):
+        make_read_preference("replica")
+    with pytest.raises(ValueError):
+        make_read_preference("primary", 120)
+    assert make_write_concern("majority").document == {"w": "majority"}
+    assert make_write_concern("2").document == {"w": 2}
+
+
+def test_reads_on_the_primary_need_no_session():
+    async def run():
+        client = offline_client()
+        router = ReplicaRouter()
+        db = router.connect(client, "schedge")
+        async with router.reading(7) as reader:
+            assert reader.db is db and reader.session is None
+        async with router.writing(7) as session:
+            assert session is None
+        assert router.token(7) is None
+        await client.close()
+
+    asyncio.run(run())
+
+
+def test_reads_from_secondaries_wait_for_known_writes():
+    async def run():
+        client = offline_client()
+        router = ReplicaRouter(make_read_preference("secondary"), write_concern=make_write_concern("majority"), max_users=1)
+        db = router.connect(client, "schedge")
+        assert db.write_concern.document == {"w": "majority"}
+        assert router.reads.read_preference.mongos_mode == "secondary"
+        assert router.reads.read_concern.level == "majority"
+
+        async with router.writing(7) as session:
+            # As the reply of the write would
+            session.advance_cluster_time(cluster_time(100))
+            session.advance_operation_time(bson.Timestamp(100, 3))
+        async with router.reading(7) as reader:
+            assert reader.db is router.reads
+            assert reader.session.operation_time == bson.Timestamp(100, 3)
+        # A client's token from another replica may be newer
+        async with router.reading(7, (bson.Timestamp(200, 1), cluster_time(200))) as reader:
+            assert reader.session.operation_time == bson.Timestamp(200, 1)
+            assert reader.session.cluster_time == cluster_time(200)
+        assert decode_token(router.token(7), 7) == (bson.Timestamp(100, 3), cluster_time(100))
+
+        # Only the most recent writers are remembered
+        async with router.writing(8) as session:
+            session.advance_operation_time(bson.Timestamp(150, 1))
+        async with router.reading(7) as reader:
+            assert reader.session.operation_time is None
+        await client.close()
+
+    asyncio.run(run())
+
+
+def test_middleware_reads_and_issues_tokens():
+    router = ReplicaRouter(make_read_preference("secondaryPreferred"))
+    router.users[7] = (bson.Timestamp(100, 1), None)
+
+    async def handler(request):
+        return web.json_response({"times": repr(request.get(CAUSAL_KEY))})
+
+    async def run():
+        app = web.Application(middlewares=[causal_middleware(router)])
+        app.router.add_get("/user/{user_id}/state", handler)
+        app.router.add_get("/ready", handler)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get("/user/7/state")
+            assert decode_token(response.headers[TOKEN_HEADER], 7) == (bson.Timestamp(100, 1), None)
+
+            token = encode_token(8, (bson.Timestamp(300, 1), None))
+            response = await client.get("/user/8/state", headers={TOKEN_HEADER: token})
+            assert (await response.json())["times"] == repr((bson.Timestamp(300, 1), None))
+            assert response.headers[TOKEN_HEADER] == token
+            # A token of another user is ignored
+            response = await client.get("/user/7/state", headers={TOKEN_HEADER: token})
+            assert (await response.json())["times"] == "None"
+
+            response = await client.get("/user/7/state", headers={TOKEN_HEADER: "nonsense"})
+            assert response.status == 400
+            response = await client.get("/ready")
+            assert TOKEN_HEADER not in response.headers
+
+    asyncio.run(run())
@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from resolver import ResolveWorker, stale_at
+
+SOLVED = datetime(2025, 5, 5, 9, 0, tzinfo=timezone.utc)
+
+
+def task(kind, deadline=None):
+    result = {"type": kind}
+    if deadline is not None:
+        result["deadline"] = deadline
+    return result
+
+
+def test_stale_at_earliest_upcoming_deadline():
+    tasks = [
+        task("fixed"),
+        task("continuous", "2025-05-05T12:00:00+00:00"),
+        task("project", "2025-05-05T11:00:00Z"),
+        # Already past when solved, does not change anymore
+        task("continuous", "2025-05-04T12:00:00+00:00"),
+        task("continuous", "not a date"),
+    ]
+    assert stale_at(tasks, SOLVED, 6 * 3600) == datetime(2025, 5, 5, 11, 0, tzinfo=timezone.utc)
+    # Capped by the maximum age
+    assert stale_at(tasks, SOLVED, 3600) == SOLVED + timedelta(hours=1)
+    # Naive deadlines are UTC
+    assert stale_at([task("continuous", "2025-05-05T10:00:00")], SOLVED, 6 * 3600) == SOLVED + timedelta(hours=1)
+
+
+def test_nothing_left_to_plan():
+    assert stale_at([], SOLVED, 3600) is None
+    assert stale_at([task("fixed"), task("continuous", "2025-05-01T00:00:00Z")], SOLVED, 3600) is None
+
+
+class FixedClaims(ResolveWorker):
+    def __init__(self, users, **kwargs):
+        super().__init__(None, self.fake_solve, **kwargs)
+        self.users = users
+        self.started = []
+        self.running = 0
+        self.peak = 0
+
+    async def claim(self, now=None):
+        users, self.users = self.users, []
+        return users
+
+    async def fake_solve(self, user_id):
+        self.started.append((user_id, asyncio.get_running_loop().time()))
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.02)
+        self.running -= 1
+        return "no schedule" if user_id == 3 else None
+
+
+def test_scan_spreads_jobs_and_caps_concurrency():
+    async def run():
+        worker = FixedClaims([1, 2, 3, 4], interval=0.04, concurrency=2)
+        started = asyncio.get_running_loop().time()
+        await worker.scan()
+        await asyncio.gather(*worker._jobs)
+        return worker, started
+
+    worker, started = asyncio.run(run())
+    assert [user_id for user_id, _ in worker.started] == [1, 2, 3, 4]
+    offsets = [at - started for _, at in worker.started]
+    # Starts are 10 ms apart, not all at once
+    assert offsets[1] - offsets[0] >= 0.009
+    assert offsets[-1] >= 0.029
+    assert worker.peak <= 2
+    assert worker.stats() == {"scans": 1, "resolved": 3, "failed": 1, "running": 0}
+
+
+def test_close_cancels_pending_jobs():
+    async def run():
+        worker = FixedClaims([1, 2], interval=10, concurrency=1)
+        await worker.scan()
+        await asyncio.sleep(0.01)
+        await worker.close()
+        return worker
+
+    worker = asyncio.run(run())
+    # The second job was still waiting for its turn
+    assert [user_id for user_id, _ in worker.started] == [1]
+    assert not worker._jobs
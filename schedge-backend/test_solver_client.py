@@ -0,0 +1,225 @@
+import asyncio
+import json
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from solver_client import CircuitBreaker, SolverBatcher, SolverClient, SolverError, parse_solver_urls, percentile
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_parse_solver_urls():
+    bases, path = parse_solver_urls("http://a:6000/schedule, http://b:6000/schedule")
+    assert bases == ["http://a:6000", "http://b:6000"]
+    assert path == "/schedule"
+
+    bases, path = parse_solver_urls("http://solver:6000")
+    assert bases == ["http://solver:6000"]
+    assert path == "/schedule"
+
+
+def test_percentile():
+    assert percentile([], 0.95) is None
+    assert percentile(list(range(1, 101)), 0.95) == 95
+    assert percentile([3, 1, 2], 0.5) == 2
+
+
+def test_circuit_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.acquire()
+
+    clock.now = 10
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.acquire()
+    # Only one trial request is let through
+    assert not breaker.acquire()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 20
+    assert breaker.acquire()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_pick_least_outstanding():
+    client = SolverClient(None, "http://a:1/schedule,http://b:1/schedule,http://c:1/schedule")
+    a, b, c = client.endpoints.values()
+    a.outstanding, b.outstanding, c.outstanding = 3, 1, 2
+    assert client.pick() is b
+    assert client.pick(exclude=(b,)) is c
+
+    b.breaker.opened_at = b.breaker.clock()
+    assert client.pick() is c
+    assert client.available()
+
+
+def solver_app(delay, name):
+    async def schedule(request):
+        await asyncio.sleep(delay)
+        if name == "broken":
+            return web.Response(status=500, text="boom")
+        return web.json_response([{"replica": name}])
+
+    app = web.Application()
+    app.router.add_post("/schedule", schedule)
+    return app
+
+
+async def run_hedged(slow_delay, fast_delay):
+    slow = TestServer(solver_app(slow_delay, "slow"))
+    fast = TestServer(solver_app(fast_delay, "fast"))
+    await slow.start_server()
+    await fast.start_server()
+    try:
+        async with aiohttp.ClientSession() as session:
+            client = SolverClient(
+                session,
+                f"{slow.make_url('/schedule')},{fast.make_url('/schedule')}",
+                hedge=True, hedge_min_delay=0.05,
+            )
+            client.latencies.extend([0.01] * 50)
+            slow_endpoint = client.endpoints[str(slow.make_url("")).rstrip("/")]
+            # Make sure the slow replica gets the first attempt
+            next(ep for ep in client.endpoints.values() if ep is not slow_endpoint).outstanding = 1
+            result = await client.schedule([])
+            slow_endpoint_outstanding = slow_endpoint.outstanding
+            return result, slow_endpoint_outstanding
+    finally:
+        await slow.close()
+        await fast.close()
+
+
+def test_hedging_returns_fastest_and_cancels_loser():
+    result, slow_outstanding = asyncio.run(run_hedged(slow_delay=2.0, fast_delay=0.0))
+    assert result == [{"replica": "fast"}]
+    assert slow_outstanding == 0
+
+
+async def run_failing():
+    server = TestServer(solver_app(0, "broken"))
+    await server.start_server()
+    try:
+        async with aiohttp.ClientSession() as session:
+            client = SolverClient(session, str(server.make_url("/schedule")), failure_threshold=1)
+            with pytest.raises(SolverError) as error:
+                await client.schedule([])
+            assert error.value.retryable
+            assert not client.available()
+            with pytest.raises(SolverError):
+                await client.schedule([])
+    finally:
+        await server.close()
+
+
+def test_failures_open_circuit():
+    asyncio.run(run_failing())
+
+
+async def run_batched():
+    received = []
+
+    async def schedule_batch(request):
+        items = await request.json()
+        received.append(len(items))
+        return web.json_response([
+            {"id": item["id"], "status": 200, "slots": item["tasks"]} if item["tasks"]
+            else {"id": item["id"], "status": 404, "error": "Failed to generate schedule"}
+            for item in items
+        ])
+
+    app = web.Application()
+    app.router.add_post("/schedule/batch", schedule_batch)
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        async with aiohttp.ClientSession() as session:
+            client = SolverClient(session, str(server.make_url("/schedule")))
+            batcher = SolverBatcher(client, window=0.05, max_size=3)
+            results = await asyncio.gather(
+                batcher.schedule([{"user": 1}]),
+                batcher.schedule([{"user": 2}]),
+                batcher.schedule([]),
+                batcher.schedule([{"user": 4}]),
+                return_exceptions=True,
+            )
+            await batcher.close()
+            return received, results
+    finally:
+        await server.close()
+
+
+def test_batcher_groups_jobs():
+    received, results = asyncio.run(run_batched())
+    # The first three jobs fill a batch. The fourth one is sent on its own
+    # to /schedule once the window passes, which this fake solver does not serve.
+    assert received == [3]
+    assert results[0] == [{"user": 1}]
+    assert results[1] == [{"user": 2}]
+    assert isinstance(results[2], SolverError) and results[2].status == 404
+    assert isinstance(results[3], SolverError)
+
+
+async def run_stream(lines):
+    async def schedule_stream(request):
+        assert request.query["seed"] == "7"
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for line in lines:
+            await response.write(line)
+        return response
+
+    app = web.Application()
+    app.router.add_post("/schedule/stream", schedule_stream)
+    server = TestServer(app)
+    await server.start_server()
+    progress = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            client = SolverClient(session, str(server.make_url("/schedule")))
+
+            async def on_progress(slots):
+                progress.append(slots)
+
+            try:
+                return progress, await client.stream([], on_progress, {"seed": 7})
+            except SolverError as e:
+                return progress, e
+    finally:
+        await server.close()
+
+
+def test_stream_forwards_progress():
+    big = [{"start": "x" * 200_000}]
+    progress, result = asyncio.run(run_stream([
+        b'{"type": "progress", "slots": [1]}\n{"type": "prog',
+        b'ress", "slots": ' + json.dumps(big).encode() + b'}\n',
+        b'{"type": "final", "slots": [3]}\n',
+    ]))
+    assert progress == [[1], big]
+    assert result == [3]
+
+
+def test_stream_error_event():
+    progress, result = asyncio.run(run_stream([
+        b'{"type": "error", "status": 404, "error": "Failed to generate schedule"}\n',
+    ]))
+    assert progress == []
+    assert isinstance(result, SolverError) and result.status == 404
@@ -0,0 +1,141 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from solver_client import SolverClient
+from tracing import (
+    MongoTracingListener,
+    OtlpJsonExporter,
+    Tracer,
+    inject,
+    parse_traceparent,
+    span,
+    tracing_middleware,
+)
+
+TRACEPARENT = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+
+def test_parse_traceparent():
+    context = parse_traceparent(TRACEPARENT)
+    assert context.trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+    assert context.span_id == "00f067aa0ba902b7"
+    assert context.sampled
+    assert context.traceparent() == TRACEPARENT
+    assert not parse_traceparent(TRACEPARENT[:-1] + "0").sampled
+    assert parse_traceparent(None) is None
+    assert parse_traceparent("00-" + "0" * 32 + "-00f067aa0ba902b7-01") is None
+    assert parse_traceparent("garbage") is None
+
+
+def test_sampling_is_decided_per_trace():
+    exporter = OtlpJsonExporter()
+    assert not any(Tracer(exporter, 0.0).start_span("a").context.sampled for _ in range(100))
+    assert all(Tracer(exporter, 1.0).start_span("a").context.sampled for _ in range(100))
+    # Without an exporter nothing is recorded
+    assert not Tracer(None, 1.0).start_span("a").context.sampled
+
+    tracer = Tracer(exporter, 0.0)
+    with tracer.span("root", parent=parse_traceparent(TRACEPARENT)) as root:
+        with span("child") as child:
+            assert child.context.trace_id == root.context.trace_id
+            assert child.parent_id == root.context.span_id
+            assert child.context.sampled
+            assert inject({})["traceparent"] == child.context.traceparent()
+    assert [item.name for item in exporter.queue] == ["child", "root"]
+
+    # Outside a trace, child spans are no-ops
+    with span("orphan") as orphan:
+        assert orphan is None
+    assert inject({}) == {}
+
+
+def test_mongo_listener_records_commands_within_a_trace():
+    exporter = OtlpJsonExporter()
+    tracer = Tracer(exporter, 1.0)
+    listener = MongoTracingListener()
+
+    def event(request_id, **extra):
+        return SimpleNamespace(connection_id=("localhost", 27017), request_id=request_id, command_name="find",
+                               database_name="schedge", command={"find": "tasks"}, **extra)
+
+    listener.started(event(1))
+    listener.succeeded(event(1))
+    assert not exporter.queue
+
+    with tracer.span("root"):
+        listener.started(event(2))
+        listener.started(event(3))
+    listener.succeeded(event(2))
+    listener.failed(event(3, failure={"errmsg": "boom"}))
+
+    spans = {item.name: item for item in exporter.queue if item.name != "root"}
+    assert list(spans) == ["mongo.find"]
+    finds = [item for item in exporter.queue if item.name == "mongo.find"]
+    assert finds[0].attributes["db.collection.name"] == "tasks"
+    assert finds[1].status == (2, "boom")
+
+
+def test_trace_reaches_the_solver_and_background_tasks(tmp_path):
+    path = tmp_path / "spans.json"
+    received = {}
+
+    async def solver(request):
+        received["traceparent"] = request.headers.get("traceparent")
+        return web.json_response([])
+
+    async def run():
+        solver_app = web.Application()
+        solver_app.router.add_post("/schedule", solver)
+        exporter = OtlpJsonExporter(path=str(path), interval=60)
+        tracer = Tracer(exporter, 1.0)
+        background = []
+
+        async with TestServer(solver_app) as solver_server:
+            async with TestClient(TestServer(web.Application())) as helper:
+                client = SolverClient(helper.session, str(solver_server.make_url("/schedule")))
+
+                async def later():
+                    with span("background"):
+                        await asyncio.sleep(0)
+
+                async def handler(request):
+                    await client.schedule([])
+                    background.append(asyncio.create_task(later()))
+                    return web.json_response({"status": "ok"})
+
+                app = web.Application(middlewares=[tracing_middleware(tracer)])
+                app.router.add_post("/api/v0/user/{user_id}/compute_slot_request", handler)
+                async with TestClient(TestServer(app)) as api:
+                    response = await api.post("/api/v0/user/1/compute_slot_request")
+                    traceresponse = response.headers["traceresponse"]
+                await asyncio.gather(*background)
+        await exporter.start()
+        await exporter.close()
+        return traceresponse
+
+    traceresponse = asyncio.run(run())
+    trace_id = traceresponse.split("-")[1]
+    assert received["traceparent"].split("-")[1] == trace_id
+
+    (line,) = path.read_text().splitlines()
+    spans = json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    by_name = {item["name"]: item for item in spans}
+    assert set(by_name) == {"POST /api/v0/user/{user_id}/compute_slot_request", "solver.request", "background"}
+    assert {item["traceId"] for item in spans} == {trace_id}
+    root = by_name["POST /api/v0/user/{user_id}/compute_slot_request"]
+    assert by_name["solver.request"]["parentSpanId"] == root["spanId"]
+    assert by_name["background"]["parentSpanId"] == root["spanId"]
+    assert by_name["solver.request"]["kind"] == 3
+    assert {"key": "http.response.status_code", "value": {"intValue": "200"}} in root["attributes"]
+
+
+def test_exporter_drops_spans_when_full():
+    exporter = OtlpJsonExporter(max_queue=2)
+    tracer = Tracer(exporter, 1.0)
+    for _ in range(5):
+        tracer.start_span("a").end()
+    assert exporter.stats() == {"queued": 2, "exported": 0, "dropped": 3}
@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import msgpack
+from aiohttp.test_utils import TestClient, TestServer
+
+from benchmarks.fixtures import make_state
+from config import Config
+from main import CONNECTIONS_KEY, create_app, send_to_user
+from ws_codec import MSGPACK_PROTOCOL, compact_task, duration_minutes, encode_state, epoch_minutes
+
+
+def test_compact_values():
+    assert epoch_minutes("1970-01-01T01:30:00+00:00") == 90
+    assert epoch_minutes("2025-05-01T10:15:00Z") == epoch_minutes("2025-05-01T12:15:00+02:00")
+    # Not a whole minute, or not a time at all: sent as is
+    assert epoch_minutes("2025-05-01T10:15:30+00:00") == "2025-05-01T10:15:30+00:00"
+    assert epoch_minutes("soon") == "soon"
+    assert duration_minutes("PT90M") == 90
+    assert duration_minutes("P1D") == "P1D"
+
+    task = {"type": "project", "kickoff": "1970-01-01T00:05:00+00:00", "duration": "PT30M",
+            "timings": {"work": "PT25M", "smallBreak": "PT5M", "bigBreak": "PT15M", "numberOfSmallBreaks": 3}}
+    assert compact_task(task) == {"type": "project", "kickoff": 5, "duration": 30,
+                                  "timings": {"work": 25, "smallBreak": 5, "bigBreak": 15, "numberOfSmallBreaks": 3}}
+    assert task["duration"] == "PT30M"
+
+
+def test_encoded_state_is_smaller_and_keeps_the_structure():
+    state = make_state(50)
+    frame = encode_state(state["userId"], state["tasks"], state["slots"])
+    decoded = msgpack.unpackb(frame)
+    assert len(frame) < len(json.dumps(state)) * 0.8
+    assert decoded["userId"] == state["userId"]
+    assert [task["id"] for task in decoded["tasks"]] == [task["id"] for task in state["tasks"]]
+    slot, original = decoded["slots"][0], state["slots"][0]
+    assert slot["start"] == epoch_minutes(original["start"])
+    assert slot["task"]["name"] == original["task"]["name"]
+    assert "provisional" not in decoded
+    assert msgpack.unpackb(encode_state(1, [], [], provisional=True))["provisional"] is True
+    assert msgpack.unpackb(encode_state(1, [], [], infeasible={"windows": [], "tasks": []}))["infeasible"] == {
+        "windows": [], "tasks": [],
+    }
+
+
+def test_connections_get_the_encoding_they_negotiated():
+    async def run():
+        app = create_app(Config())
+        app.on_startup.clear()
+        app.on_cleanup.clear()
+        async with TestClient(TestServer(app)) as client:
+            binary_ws = await client.ws_connect("/api/v0/user/1/ws", protocols=(MSGPACK_PROTOCOL,))
+            text_ws = await client.ws_connect("/api/v0/user/1/ws")
+            while len(app[CONNECTIONS_KEY].get(1, {})) < 2:
+                await asyncio.sleep(0.01)
+            await send_to_user(app, 1, '{"userId": 1}', msgpack.packb({"userId": 1}))
+            received = (await binary_ws.receive(timeout=1), await text_ws.receive(timeout=1))
+            protocols = (binary_ws.protocol, text_ws.protocol)
+            await binary_ws.close()
+            await text_ws.close()
+            return protocols, received
+
+    protocols, (binary, text) = asyncio.run(run())
+    assert protocols == (MSGPACK_PROTOCOL, None)
+    assert msgpack.unpackb(binary.data) == {"userId": 1}
+    assert text.data == '{"userId": 1}'
@@ -0,0 +1,459 @@
+"""
+Minimal distributed tracing with W3C trace context and OTLP/JSON export.
+
+The current span lives in a context variable, so it follows `await` and is
+copied into tasks created with `asyncio.create_task`. Code that only wants to
+add a child span uses the module-level `span()`, which does nothing outside
+a trace. Root spans are started by `Tracer.span`, usually from
+`tracing_middleware`.
+
+Sampling is decided once per trace, from the trace ID, and inherited by
+every child span and by downstream services through the `traceparent` header.
+"""
+import asyncio
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import time
+from collections import deque
+
+import aiohttp
+from aiohttp import web
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds
+INTERNAL = 1
+SERVER = 2
+CLIENT = 3
+
+# OTLP status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class SpanContext:
+    """
+    Identifiers shared with the parent and children of a span.
+
+    Args:
+        trace_id (str): 32 hex digits
+        span_id (str): 16 hex digits
+        sampled (bool): Whether the trace is recorded
+    """
+
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id, span_id, sampled):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(header):
+    """
+    Parse a W3C traceparent header.
+
+    Args:
+        header (str | None): e.g. "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+    Returns:
+        SpanContext | None: The remote parent, or None if the header is missing or invalid
+    """
+    match = TRACEPARENT_RE.match((header or "").strip().lower())
+    if not match:
+        return None
+    trace_id, span_id, flags = match.groups()
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(trace_id, span_id, bool(int(flags, 16) & 1))
+
+
+class Span:
+    """
+    A timed operation. Only spans of sampled traces are exported.
+    """
+
+    __slots__ = ("tracer", "name", "context", "parent_id", "kind", "attributes",
+                 "events", "status", "start_ns", "end_ns")
+
+    def __init__(self, tracer, name, context, parent_id, kind, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.status = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key, value):
+        if self.context.sampled:
+            self.attributes[key] = value
+
+    def set_error(self, message):
+        self.status = (STATUS_ERROR, message)
+
+    def add_event(self, name, attributes=None):
+        if self.context.sampled:
+            self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes or {}})
+
+    def record_exception(self, exception):
+        self.set_error(str(exception))
+        self.add_event("exception", {
+            "exception.type": type(exception).__name__,
+            "exception.message": str(exception),
+        })
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self.context.sampled and self.tracer.exporter is not None:
+            self.tracer.exporter.export(self)
+
+
+class Tracer:
+    """
+    Creates spans and decides which traces are sampled.
+
+    Args:
+        exporter (OtlpJsonExporter | None): Where finished spans go; nothing is recorded without one
+        sample_ratio (float): Share of new traces that are recorded, in [0, 1]
+    """
+
+    def __init__(self, exporter=None, sample_ratio=1.0):
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio if exporter is not None else 0.0
+
+    @classmethod
+    def from_config(cls, config):
+        exporter = None
+        if config.trace_export_file or config.trace_export_url:
+            exporter = OtlpJsonExporter(
+                service_name=config.trace_service_name,
+                path=config.trace_export_file,
+                url=config.trace_export_url,
+                interval=config.trace_export_interval,
+                max_queue=config.trace_max_queue,
+            )
+        return cls(exporter, config.trace_sample_ratio)
+
+    def should_sample(self, trace_id):
+        # The low 56 bits of a trace ID are random, so this keeps `sample_ratio` of the traces
+        return int(trace_id[-14:], 16) < self.sample_ratio * (1 << 56)
+
+    def start_span(self, name, kind=INTERNAL, attributes=None, parent=None):
+        """
+        Start a span without making it current.
+
+        Args:
+            name (str): Span name
+            kind (int): INTERNAL, SERVER or CLIENT
+            attributes (dict | None): Initial attributes
+            parent (Span | SpanContext | None): Defaults to the current span
+
+        Returns:
+            Span: The started span; call `end()` when done
+        """
+        if parent is None:
+            parent = _current_span.get()
+        if isinstance(parent, Span):
+            parent = parent.context
+
+        span_id = f"{random.getrandbits(64):016x}"
+        if parent is not None:
+            context = SpanContext(parent.trace_id, span_id, parent.sampled)
+            return Span(self, name, context, parent.span_id, kind, attributes)
+
+        trace_id = f"{random.getrandbits(128):032x}"
+        context = SpanContext(trace_id, span_id, self.should_sample(trace_id))
+        return Span(self, name, context, None, kind, attributes)
+
+    @contextlib.contextmanager
+    def span(self, name, kind=INTERNAL, attributes=None, parent=None):
+        """
+        Run a block in a new current span, ending it afterwards.
+
+        Exceptions are recorded on the span and re-raised.
+        """
+        span = self.start_span(name, kind, attributes, parent)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            if not isinstance(e, (asyncio.CancelledError, GeneratorExit)):
+                span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextlib.contextmanager
+def span(name, kind=INTERNAL, attributes=None):
+    """
+    Child span of the current span; does nothing outside a trace.
+
+    Yields:
+        Span | None: The span, or None outside a trace
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    with parent.tracer.span(name, kind, attributes) as child:
+        yield child
+
+
+def inject(headers):
+    """
+    Add the current trace context to outgoing request headers.
+
+    Args:
+        headers (dict): Headers to update
+
+    Returns:
+        dict: The same headers
+    """
+    current = _current_span.get()
+    if current is not None:
+        headers["traceparent"] = current.context.traceparent()
+    return headers
+
+
+def tracing_middleware(tracer):
+    """
+    Build a middleware that runs every request in a server span.
+
+    The trace is continued from an incoming traceparent header, and the
+    span's context is returned in a traceresponse header.
+
+    Args:
+        tracer (Tracer): The tracer
+
+    Returns:
+        Callable: The aiohttp middleware
+    """
+
+    @web.middleware
+    async def middleware(request, handler):
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else "(unmatched)"
+        attributes = {
+            "http.request.method": request.method,
+            "http.route": route,
+            "url.path": request.path,
+        }
+        parent = parse_traceparent(request.headers.get("traceparent"))
+        with tracer.span(f"{request.method} {route}", SERVER, attributes, parent) as server_span:
+            response = await handler(request)
+            server_span.set_attribute("http.response.status_code", response.status)
+            if response.status >= 500:
+                server_span.set_error(f"HTTP {response.status}")
+            if not response.prepared:
+                response.headers["traceresponse"] = server_span.context.traceparent()
+            return response
+
+    return middleware
+
+
+class MongoTracingListener(monitoring.CommandListener):
+    """
+    Records a client span for every Mongo command issued within a trace.
+
+    Commands outside a trace (e.g. driver housekeeping) are ignored.
+    """
+
+    def __init__(self):
+        self._spans = {}
+
+    def started(self, event):
+        parent = _current_span.get()
+        if parent is None or not parent.context.sampled:
+            return
+        attributes = {
+            "db.system": "mongodb",
+            "db.namespace": event.database_name,
+            "db.operation.name": event.command_name,
+        }
+        collection = event.command.get(event.command_name)
+        if isinstance(collection, str):
+            attributes["db.collection.name"] = collection
+        span = parent.tracer.start_span(f"mongo.{event.command_name}", CLIENT, attributes, parent)
+        self._spans[(event.connection_id, event.request_id)] = span
+
+    def succeeded(self, event):
+        span = self._spans.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            span.end()
+
+    def failed(self, event):
+        span = self._spans.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            span.set_error(str(event.failure.get("errmsg", "command failed")))
+            span.end()
+
+
+def _attribute_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _attributes(attributes):
+    return [{"key": key, "value": _attribute_value(value)} for key, value in attributes.items()]
+
+
+def encode_otlp(service_name, spans):
+    """
+    Encode finished spans as an OTLP/JSON ExportTraceServiceRequest.
+
+    Args:
+        service_name (str): Value of the service.name resource attribute
+        spans (Iterable[Span]): Finished spans
+
+    Returns:
+        dict: The request body
+    """
+    encoded = []
+    for span in spans:
+        item = {
+            "traceId": span.context.trace_id,
+            "spanId": span.context.span_id,
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": _attributes(span.attributes),
+        }
+        if span.parent_id:
+            item["parentSpanId"] = span.parent_id
+        if span.events:
+            item["events"] = [
+                {"name": event["name"], "timeUnixNano": str(event["time_ns"]),
+                 "attributes": _attributes(event["attributes"])}
+                for event in span.events
+            ]
+        if span.status is not None:
+            item["status"] = {"code": span.status[0], "message": span.status[1]}
+        encoded.append(item)
+
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _attributes({"service.name": service_name})},
+            "scopeSpans": [{"scope": {"name": "schedge-backend"}, "spans": encoded}],
+        }]
+    }
+
+
+class OtlpJsonExporter:
+    """
+    Buffers finished spans and writes them in batches as OTLP/JSON.
+
+    Batches are appended to a file, one JSON document per line (the format of
+    the OpenTelemetry Collector's file exporter and otlpjsonfile receiver),
+    and/or posted to a collector's OTLP/HTTP endpoint, e.g.
+    http://collector:4318/v1/traces. When the buffer is full, new spans are
+    dropped and counted instead of slowing requests down.
+
+    Args:
+        service_name (str): service.name of the exported spans
+        path (str | None): File to append to
+        url (str | None): Collector endpoint to post to
+        interval (float): Seconds between exports
+        max_queue (int): Most spans buffered between exports
+    """
+
+    def __init__(self, service_name="schedge-backend", path=None, url=None, interval=5.0, max_queue=2048):
+        self.service_name = service_name
+        self.path = path
+        self.url = url
+        self.interval = interval
+        self.queue = deque()
+        self.max_queue = max_queue
+        self.exported = 0
+        self.dropped = 0
+        self._session = None
+        self._task = None
+
+    def export(self, span):
+        if len(self.queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self.queue.append(span)
+
+    async def start(self):
+        if self.url:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error exporting spans: {e!r}")
+
+    async def flush(self):
+        """Export everything buffered so far."""
+        if not self.queue:
+            return
+        spans = [self.queue.popleft() for _ in range(len(self.queue))]
+        body = json.dumps(encode_otlp(self.service_name, spans))
+        if self.path:
+            await asyncio.get_running_loop().run_in_executor(None, self._append, body)
+        if self.url and self._session is not None:
+            async with self._session.post(self.url, data=body, headers={"Content-Type": "application/json"}) as resp:
+                if resp.status >= 300:
+                    logger.error(f"Trace collector returned {resp.status}: {await resp.text()}")
+        self.exported += len(spans)
+
+    def _append(self, body):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(body + "\n")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error exporting spans: {e!r}")
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def stats(self):
+        return {"queued": len(self.queue), "exported": self.exported, "dropped": self.dropped}
@@ -0,0 +1,53 @@
+"""
+Standalone scheduling worker.
+
+Opens the same resources as the backend (Mongo, solver clients, offload
+pool) without the HTTP server, and runs the background work the backends
+leave to it (ROLE=worker): the scheduling jobs they queue (see jobs.py),
+the background re-solving (resolver.py) and the compaction (archive.py).
+It is configured with the backend's environment variables;
+SCHEDULING_WORKERS is the number of jobs it runs at once, and JOB_STORE
+must be "mongo" so that it shares the queue with the backends.
+
+Run from schedge-backend:
+    python worker.py
+"""
+import asyncio
+import dataclasses
+import logging
+import signal
+
+import dotenv
+
+from config import Config
+from main import JOB_WORKER_KEY, create_app, init_resources, release_resources
+
+logger = logging.getLogger(__name__)
+
+
+async def serve(config):
+    app = create_app(config)
+    await init_resources(app)
+    logger.info(f"Scheduling worker {app[JOB_WORKER_KEY].worker_id} started")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        # Running jobs are handed back to the queue for other workers
+        await release_resources(app)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    dotenv.load_dotenv()
+    config = Config.from_env()
+    if config.job_store != "mongo":
+        raise SystemExit("A standalone worker needs JOB_STORE=mongo to share jobs with the backends")
+    asyncio.run(serve(dataclasses.replace(config, role="worker", scheduling_workers=max(1, config.scheduling_workers))))
+
+
+if __name__ == "__main__":
+    main()
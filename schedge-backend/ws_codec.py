@@ -0,0 +1,117 @@
+"""
+Binary encoding of WebSocket messages: the `schedge.msgpack` subprotocol.
+
+Clients that offer `schedge.msgpack` in Sec-WebSocket-Protocol receive
+binary MessagePack frames instead of JSON text. The messages have the same
+structure as the JSON ones, with compact values:
+
+- times (`start`, `end`, `kickoff`, `deadline`) are integers, minutes since
+  the Unix epoch in UTC;
+- durations (`duration` and the `timings` of projects) are integers,
+  in minutes.
+
+Values that cannot be represented exactly this way (e.g. a time with
+seconds) are sent unchanged.
+"""
+import functools
+import re
+from datetime import datetime, timedelta, timezone
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_PROTOCOL = "schedge.msgpack"
+
+TIME_FIELDS = ("start", "end", "kickoff", "deadline")
+DURATION_FIELDS = ("work", "smallBreak", "bigBreak")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MINUTE = timedelta(minutes=1)
+DURATION_RE = re.compile(r"^PT(\d+)M$")
+
+
+def available_protocols():
+    """
+    Returns:
+        list[str]: WebSocket subprotocols this process can speak besides plain JSON
+    """
+    return [MSGPACK_PROTOCOL] if msgpack is not None else []
+
+
+@functools.lru_cache(maxsize=4096)
+def epoch_minutes(value):
+    """
+    Returns:
+        int | str: Minutes since the epoch of an ISO time, or the value if it is not a whole minute
+    """
+    try:
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return value
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    minutes, rest = divmod(moment - EPOCH, MINUTE)
+    return minutes if not rest else value
+
+
+@functools.lru_cache(maxsize=1024)
+def duration_minutes(value):
+    """
+    Returns:
+        int | str: Minutes of a normalized ISO duration ("PT90M"), or the value if it is not one
+    """
+    match = DURATION_RE.match(value) if isinstance(value, str) else None
+    return int(match.group(1)) if match else value
+
+
+def compact_timings(timings):
+    if not isinstance(timings, dict):
+        return timings
+    return {field: duration_minutes(value) if field in DURATION_FIELDS else value
+            for field, value in timings.items()}
+
+
+def compact_task(task):
+    """
+    Returns:
+        dict: A copy of a task (or a slot, with the task embedded in it) with compact times and durations
+    """
+    if not isinstance(task, dict):
+        return task
+    return {field: COMPACTORS[field](value) if field in COMPACTORS else value for field, value in task.items()}
+
+
+COMPACTORS = {
+    **{field: epoch_minutes for field in TIME_FIELDS},
+    "duration": duration_minutes,
+    "timings": compact_timings,
+    "task": compact_task,
+}
+
+
+def encode_state(user_id, tasks, slots, provisional=False, infeasible=None):
+    """
+    Encode a state message for `schedge.msgpack` connections.
+
+    Args:
+        user_id (int): The user ID
+        tasks (list[dict]): Tasks, already passed through fix_object_id
+        slots (list[dict]): Slots, already passed through fix_object_id
+        provisional (bool): Mark the schedule as provisional, as emit_provisional_state does
+        infeasible (dict | None): Why the tasks were not scheduled, see emit_state
+
+    Returns:
+        bytes: The MessagePack frame
+    """
+    message = {
+        "userId": user_id,
+        "tasks": [compact_task(task) for task in tasks],
+        "slots": [compact_task(slot) for slot in slots],
+    }
+    if provisional:
+        message["provisional"] = True
+    if infeasible is not None:
+        message["infeasible"] = infeasible
+    return msgpack.packb(message, use_bin_type=True)
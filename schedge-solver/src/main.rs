@@ -5,8 +5,13 @@ use chrono::{DateTime, Timelike, Utc};
 use serde::{Deserialize, Serialize};
 use std::env;
 use std::str::FromStr;
+use std::sync::{Arc, Mutex};
+use std::sync::atomic::AtomicBool;
+use std::sync::atomic::{AtomicUsize, Ordering as AtomicOrdering};
+use std::thread;
+use std::time::Instant;
 use smol_str::SmolStr;
-use schedge_solver::{monte_carlo_schedule, ProjectTimings, Slot, Task};
+use schedge_solver::{monte_carlo_schedule_with, ProjectTimings, ScheduleOptions, Slot, Task};
 use crate::duration::parse_duration;
 use log::{info, error};
 
@@ -17,7 +22,7 @@ struct RawBaseTask {
     description: Option<String>,
     color: String,
     leisure: bool,
-    dependencies: Vec<u32>,
+    dependencies: Vec<SmolStr>,
     nonce: i64,
 }
 
@@ -139,36 +144,229 @@ fn convert_to_raw_slots(slots: &[Slot], tasks: Vec<RawTask>) -> Vec<RawSlot> {
     raw_slots
 }
 
-#[post("/schedule")]
-async fn schedule(raw_tasks: web::Json<Vec<RawTask>>) -> impl Responder {
-    info!("Received scheduling request with tasks: {:?}", raw_tasks);
-    let now = round_up_to_five_minutes(Utc::now());
+enum SolveError {
+    InvalidTasks,
+    NoSchedule,
+}
+
+impl SolveError {
+    fn status(&self) -> u16 {
+        match self {
+            SolveError::InvalidTasks => 400,
+            SolveError::NoSchedule => 404,
+        }
+    }
+
+    fn message(&self) -> &'static str {
+        match self {
+            SolveError::InvalidTasks => "Invalid task data",
+            SolveError::NoSchedule => "Failed to generate schedule",
+        }
+    }
+
+    fn into_response(self) -> HttpResponse {
+        match self {
+            SolveError::InvalidTasks => HttpResponse::BadRequest().body(self.message()),
+            SolveError::NoSchedule => HttpResponse::NotFound().body(self.message()),
+        }
+    }
+}
+
+/// Optional search limits, passed as query parameters.
+#[derive(Debug, Clone, Default, Deserialize)]
+struct ScheduleQuery {
+    /// Wall-clock budget of the search in milliseconds
+    budget_ms: Option<u64>,
+    /// Seed for the random search, defaults to the current time
+    seed: Option<u64>,
+    /// Minimum delay between two progress events of a stream, in milliseconds
+    interval_ms: Option<u64>,
+    /// Set once nobody is waiting for the result any more
+    #[serde(skip)]
+    cancelled: Option<Arc<AtomicBool>>,
+}
+
+impl ScheduleQuery {
+    fn options(&self) -> ScheduleOptions {
+        ScheduleOptions {
+            time_limit: self.budget_ms.map(std::time::Duration::from_millis),
+            cancelled: self.cancelled.clone(),
+            ..ScheduleOptions::default()
+        }
+    }
+}
+
+fn solve(
+    raw_tasks: &[RawTask],
+    now: DateTime<Utc>,
+    query: &ScheduleQuery,
+    mut on_improvement: impl FnMut(Vec<RawSlot>) -> bool,
+) -> Result<Vec<RawSlot>, SolveError> {
     let tasks = raw_tasks
-        .0
         .iter()
         .map(|raw| raw_task_to_task(raw))
         .collect::<anyhow::Result<Vec<Task>>>();
 
     let Ok(tasks) = tasks else {
         error!("Failed to parse tasks from request.");
-        return HttpResponse::BadRequest().body("Invalid task data");
+        return Err(SolveError::InvalidTasks);
     };
 
     info!("Successfully parsed tasks. Starting scheduling...");
-    let schedule = match monte_carlo_schedule(&tasks, now, now.nanosecond() as u64) {
+    let seed = query.seed.unwrap_or(now.nanosecond() as u64);
+    let on_improvement = |slots: &[Slot]| on_improvement(convert_to_raw_slots(slots, raw_tasks.to_vec()));
+    let schedule = match monte_carlo_schedule_with(&tasks, now, seed, &query.options(), on_improvement) {
         Ok(schedule) => {
             info!("Successfully generated schedule.");
             schedule
         },
         Err(e) => {
             error!("Failed to generate schedule: {:?}", e);
-            return HttpResponse::NotFound().body("Failed to generate schedule");
+            return Err(SolveError::NoSchedule);
         }
     };
 
-    let raw_slots = convert_to_raw_slots(&schedule, raw_tasks.0.clone());
-    info!("Returning generated schedule as response.");
-    HttpResponse::Ok().json(raw_slots)
+    Ok(convert_to_raw_slots(&schedule, raw_tasks.to_vec()))
+}
+
+#[post("/schedule")]
+async fn schedule(raw_tasks: web::Json<Vec<RawTask>>, query: web::Query<ScheduleQuery>) -> impl Responder {
+    info!("Received scheduling request with tasks: {:?}", raw_tasks);
+    let now = round_up_to_five_minutes(Utc::now());
+
+    match solve(&raw_tasks.0, now, &query, |_| true) {
+        Ok(raw_slots) => {
+            info!("Returning generated schedule as response.");
+            HttpResponse::Ok().json(raw_slots)
+        }
+        Err(e) => e.into_response(),
+    }
+}
+
+#[derive(Debug, Deserialize)]
+struct BatchItem {
+    id: String,
+    tasks: Vec<RawTask>,
+}
+
+#[derive(Debug, Serialize)]
+struct BatchResult {
+    id: String,
+    status: u16,
+    #[serde(skip_serializing_if = "Option::is_none")]
+    slots: Option<Vec<RawSlot>>,
+    #[serde(skip_serializing_if = "Option::is_none")]
+    error: Option<&'static str>,
+}
+
+/// Solves every item of a batch, spreading the items over the available cores.
+fn solve_batch(items: Vec<BatchItem>, now: DateTime<Utc>) -> Vec<BatchResult> {
+    let workers = thread::available_parallelism()
+        .map(|n| n.get())
+        .unwrap_or(1)
+        .min(items.len())
+        .max(1);
+
+    let next = AtomicUsize::new(0);
+    let results: Vec<Mutex<Option<BatchResult>>> = items.iter().map(|_| Mutex::new(None)).collect();
+
+    thread::scope(|scope| {
+        for _ in 0..workers {
+            scope.spawn(|| loop {
+                let index = next.fetch_add(1, AtomicOrdering::Relaxed);
+                let Some(item) = items.get(index) else {
+                    break;
+                };
+                let result = match solve(&item.tasks, now, &ScheduleQuery::default(), |_| true) {
+                    Ok(slots) => BatchResult { id: item.id.clone(), status: 200, slots: Some(slots), error: None },
+                    Err(e) => BatchResult { id: item.id.clone(), status: e.status(), slots: None, error: Some(e.message()) },
+                };
+                *results[index].lock().unwrap() = Some(result);
+            });
+        }
+    });
+
+    results
+        .into_iter()
+        .map(|result| result.into_inner().unwrap().expect("every batch item is solved"))
+        .collect()
+}
+
+#[post("/schedule/batch")]
+async fn schedule_batch(items: web::Json<Vec<BatchItem>>) -> impl Responder {
+    info!("Received batch scheduling request with {} items", items.len());
+    let now = round_up_to_five_minutes(Utc::now());
+
+    // Solving is CPU-bound, keep it off the async workers
+    match web::block(move || solve_batch(items.into_inner(), now)).await {
+        Ok(results) => HttpResponse::Ok().json(results),
+        Err(e) => {
+            error!("Batch scheduling failed: {:?}", e);
+            HttpResponse::InternalServerError().body("Batch scheduling failed")
+        }
+    }
+}
+
+const DEFAULT_STREAM_INTERVAL_MS: u64 = 200;
+
+#[derive(Debug, Serialize)]
+#[serde(tag = "type", rename_all = "lowercase")]
+enum StreamEvent {
+    Progress { slots: Vec<RawSlot> },
+    Final { slots: Vec<RawSlot> },
+    Error { status: u16, error: &'static str },
+}
+
+/// Streams the best schedule found so far as newline-delimited JSON.
+///
+/// Every line is a `StreamEvent`: zero or more `progress` events followed
+/// by exactly one `final` or `error` event.
+#[post("/schedule/stream")]
+async fn schedule_stream(raw_tasks: web::Json<Vec<RawTask>>, query: web::Query<ScheduleQuery>) -> impl Responder {
+    info!("Received streaming scheduling request with {} tasks", raw_tasks.len());
+    let now = round_up_to_five_minutes(Utc::now());
+    let raw_tasks = raw_tasks.into_inner();
+    let mut query = query.into_inner();
+    let interval = std::time::Duration::from_millis(query.interval_ms.unwrap_or(DEFAULT_STREAM_INTERVAL_MS));
+
+    let (sender, receiver) = tokio::sync::mpsc::unbounded_channel::<StreamEvent>();
+
+    // The search checks the flag between attempts, so a client that goes
+    // away stops it even while no improvement is being reported
+    let cancelled = Arc::new(AtomicBool::new(false));
+    query.cancelled = Some(cancelled.clone());
+    let watcher = sender.clone();
+    actix_web::rt::spawn(async move {
+        watcher.closed().await;
+        cancelled.store(true, AtomicOrdering::Relaxed);
+    });
+
+    actix_web::rt::task::spawn_blocking(move || {
+        let mut last_sent: Option<Instant> = None;
+        let result = solve(&raw_tasks, now, &query, |slots| {
+            if last_sent.is_none_or(|t| t.elapsed() >= interval) {
+                last_sent = Some(Instant::now());
+                return sender.send(StreamEvent::Progress { slots }).is_ok();
+            }
+            !sender.is_closed()
+        });
+        let event = match result {
+            Ok(slots) => StreamEvent::Final { slots },
+            Err(e) => StreamEvent::Error { status: e.status(), error: e.message() },
+        };
+        let _ = sender.send(event);
+    });
+
+    let body = futures_util::stream::unfold(receiver, |mut receiver| async move {
+        let event = receiver.recv().await?;
+        let mut line = serde_json::to_vec(&event).unwrap_or_default();
+        line.push(b'\n');
+        Some((Ok::<_, std::convert::Infallible>(web::Bytes::from(line)), receiver))
+    });
+
+    HttpResponse::Ok()
+        .content_type("application/x-ndjson")
+        .streaming(body)
 }
 
 #[actix_web::main]
@@ -177,9 +375,19 @@ async fn main() -> std::io::Result<()> {
     info!("Starting Schedge Solver server...");
 
     let bind_addr = env::var("BIND_ADDR").unwrap_or_else(|_| "127.0.0.1:6000".to_string());
+    let json_limit = env::var("JSON_LIMIT")
+        .ok()
+        .and_then(|v| v.parse::<usize>().ok())
+        .unwrap_or(16 * 1024 * 1024);
 
-    HttpServer::new(|| App::new().service(schedule))
+    HttpServer::new(move || {
+        App::new()
+            .app_data(web::JsonConfig::default().limit(json_limit))
+            .service(schedule)
+            .service(schedule_batch)
+            .service(schedule_stream)
+    })
         .bind(&bind_addr)?
         .run()
         .await
-}
\ No newline at end of file
+}
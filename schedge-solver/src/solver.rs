@@ -1,5 +1,7 @@
 use std::cmp::Ordering;
 use std::ops::{Add, Div};
+use std::sync::Arc;
+use std::sync::atomic::{AtomicBool, Ordering as AtomicOrdering};
 use anyhow::bail;
 use chrono::{DateTime, Duration, DurationRound, Utc};
 use rand::prelude::IndexedRandom;
@@ -63,8 +65,58 @@ struct DynamicSlot {
     leisure: bool,
 }
 
+/// Limits for a single `monte_carlo_schedule_with` run.
+#[derive(Debug, Clone)]
+pub struct ScheduleOptions {
+    /// Search budget, decremented by the number of dynamic slots on every step
+    pub budget: i64,
+    /// Wall-clock limit for the search, checked between attempts
+    pub time_limit: Option<std::time::Duration>,
+    /// Stops the search between attempts once set, keeping the best schedule so far
+    pub cancelled: Option<Arc<AtomicBool>>,
+}
+
+impl Default for ScheduleOptions {
+    fn default() -> Self {
+        ScheduleOptions {
+            budget: 1000_000,
+            time_limit: None,
+            cancelled: None,
+        }
+    }
+}
+
+/// Share of a slot's value lost when it ends at its deadline instead of its kickoff
+const LATENESS_PENALTY: f64 = 0.5;
+
+/// Value of placing a dynamic slot: its minutes, discounted by how far into its
+/// window it ends. The discount is at most `LATENESS_PENALTY`, so placed work
+/// outweighs how early it runs.
+fn slot_score(slot: &DynamicSlot, end: DateTime<Utc>, now: DateTime<Utc>) -> f64 {
+    let opens = slot.kickoff.max(now);
+    let window = (slot.deadline - opens).num_seconds().max(1) as f64;
+    let lateness = ((end - opens).num_seconds() as f64 / window).clamp(0.0, 1.0);
+    slot.duration.num_seconds() as f64 / 60.0 * (1.0 - LATENESS_PENALTY * lateness)
+}
+
 pub fn monte_carlo_schedule(tasks: &[Task], now: DateTime<Utc>, seed: u64) -> anyhow::Result<Vec<Slot>> {
-    let mut budget = 1000_000;
+    monte_carlo_schedule_with(tasks, now, seed, &ScheduleOptions::default(), |_| true)
+}
+
+/// Anytime variant of `monte_carlo_schedule`.
+///
+/// Every attempt is scored by `slot_score` summed over its dynamic slots, and
+/// `on_improvement` is called with every schedule that beats the best one found so far.
+/// Returning `false` from it stops the search early and keeps that schedule.
+pub fn monte_carlo_schedule_with(
+    tasks: &[Task],
+    now: DateTime<Utc>,
+    seed: u64,
+    options: &ScheduleOptions,
+    mut on_improvement: impl FnMut(&[Slot]) -> bool,
+) -> anyhow::Result<Vec<Slot>> {
+    let started = std::time::Instant::now();
+    let mut budget = options.budget;
 
     let mut rng = rand::rngs::StdRng::seed_from_u64(seed);
 
@@ -138,11 +190,22 @@ pub fn monte_carlo_schedule(tasks: &[Task], now: DateTime<Utc>, seed: u64) -> an
     }
     
     if dynamic_slots.is_empty() {
+        on_improvement(&initial_slots);
         return Ok(initial_slots);
     }
 
     'outer: loop {
+        if let Some(time_limit) = options.time_limit {
+            if started.elapsed() >= time_limit {
+                break 'outer;
+            }
+        }
+        if options.cancelled.as_ref().is_some_and(|cancelled| cancelled.load(AtomicOrdering::Relaxed)) {
+            break 'outer;
+        }
+
         let mut slots: Vec<Slot> = initial_slots.clone();
+        let mut score = 0.0;
         let mut t = now;
         let mut last_was_leisure = false;
         let mut used = vec![false; dynamic_slots.len()];
@@ -215,15 +278,19 @@ pub fn monte_carlo_schedule(tasks: &[Task], now: DateTime<Utc>, seed: u64) -> an
                 end: t + task.duration,
                 task_id: task.id.clone(),
             });
+            score += slot_score(task, t + task.duration, now);
 
             t += task.duration;
             last_was_leisure = task.leisure;
         }
 
-        let score = 0.0;
         if score > best_score {
             best_score = score;
+            let keep_going = on_improvement(&slots);
             best_slots = Some(slots);
+            if !keep_going {
+                break 'outer;
+            }
         }
     }
 
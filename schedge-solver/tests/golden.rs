@@ -1,6 +1,8 @@
 use collapse::collapse;
 use chrono::{DateTime, Duration};
-use schedge_solver::{ProjectTimings, Task, monte_carlo_schedule};
+use std::sync::Arc;
+use std::sync::atomic::AtomicBool;
+use schedge_solver::{ProjectTimings, ScheduleOptions, Slot, Task, monte_carlo_schedule, monte_carlo_schedule_with};
 
 #[test]
 fn solve_example() {
@@ -69,4 +71,137 @@ fn solve_example() {
     "#);
     
     println!("Generated schedule: {:#?}", schedule);
-}
\ No newline at end of file
+}
+
+fn example_tasks() -> Vec<Task> {
+    vec![
+        Task::Continuous {
+            id: "a".into(),
+            duration: Duration::minutes(90),
+            kickoff: DateTime::parse_from_rfc3339("2023-10-01T09:00:00Z").unwrap().with_timezone(&chrono::Utc),
+            deadline: DateTime::parse_from_rfc3339("2023-10-02T09:00:00Z").unwrap().with_timezone(&chrono::Utc),
+            leisure: false,
+        },
+        Task::Fixed {
+            id: "b".into(),
+            start: DateTime::parse_from_rfc3339("2023-10-01T09:00:00Z").unwrap().with_timezone(&chrono::Utc),
+            end: DateTime::parse_from_rfc3339("2023-10-01T10:00:00Z").unwrap().with_timezone(&chrono::Utc),
+            leisure: true,
+        },
+    ]
+}
+
+#[test]
+fn anytime_reports_improvements() {
+    let now = DateTime::parse_from_rfc3339("2023-10-01T09:00:00Z").unwrap().with_timezone(&chrono::Utc);
+    let mut improvements: Vec<Vec<Slot>> = Vec::new();
+
+    let schedule = monte_carlo_schedule_with(&example_tasks(), now, 0, &ScheduleOptions::default(), |slots| {
+        improvements.push(slots.to_vec());
+        true
+    }).expect("Failed to schedule tasks");
+
+    assert!(!improvements.is_empty());
+    assert_eq!(improvements.last().unwrap(), &schedule);
+    assert_eq!(schedule, monte_carlo_schedule(&example_tasks(), now, 0).unwrap());
+}
+
+#[test]
+fn anytime_stops_early() {
+    let now = DateTime::parse_from_rfc3339("2023-10-01T09:00:00Z").unwrap().with_timezone(&chrono::Utc);
+    let mut calls = 0;
+
+    let schedule = monte_carlo_schedule_with(&example_tasks(), now, 0, &ScheduleOptions::default(), |_| {
+        calls += 1;
+        false
+    }).expect("Failed to schedule tasks");
+
+    assert_eq!(calls, 1);
+    assert_eq!(schedule.len(), 2);
+}
+
+#[test]
+fn anytime_respects_time_limit() {
+    let now = DateTime::parse_from_rfc3339("2023-10-01T09:00:00Z").unwrap().with_timezone(&chrono::Utc);
+    let options = ScheduleOptions {
+        time_limit: Some(std::time::Duration::ZERO),
+        ..ScheduleOptions::default()
+    };
+
+    assert!(monte_carlo_schedule_with(&example_tasks(), now, 0, &options, |_| true).is_err());
+}
+
+fn overloaded_tasks() -> Vec<Task> {
+    let now = DateTime::parse_from_rfc3339("2023-10-01T09:00:00Z").unwrap().with_timezone(&chrono::Utc);
+    let deadline = DateTime::parse_from_rfc3339("2023-10-01T12:00:00Z").unwrap().with_timezone(&chrono::Utc);
+    let continuous = |id: &str, minutes: i64, leisure: bool| Task::Continuous {
+        id: id.into(),
+        duration: Duration::minutes(minutes),
+        kickoff: now,
+        deadline,
+        leisure,
+    };
+    vec![
+        continuous("a", 60, false),
+        continuous("b", 30, true),
+        continuous("c", 60, false),
+        continuous("d", 30, true),
+        Task::Fixed {
+            id: "f".into(),
+            start: now,
+            end: DateTime::parse_from_rfc3339("2023-10-01T09:30:00Z").unwrap().with_timezone(&chrono::Utc),
+            leisure: true,
+        },
+    ]
+}
+
+#[test]
+fn anytime_keeps_improving() {
+    let now = DateTime::parse_from_rfc3339("2023-10-01T09:00:00Z").unwrap().with_timezone(&chrono::Utc);
+    let mut improvements: Vec<Vec<Slot>> = Vec::new();
+
+    let schedule = monte_carlo_schedule_with(&overloaded_tasks(), now, 0, &ScheduleOptions::default(), |slots| {
+        improvements.push(slots.to_vec());
+        true
+    }).expect("Failed to schedule tasks");
+
+    // Not everything fits before the deadline, so later attempts beat the first one
+    assert!(improvements.len() > 1);
+    assert_ne!(improvements[0], schedule);
+    assert_eq!(improvements.last().unwrap(), &schedule);
+    collapse::collapsed_eq!(&format!("{:#?}", schedule), r#"
+[
+    Slot {
+        start: 2023-10-01T09:00:00Z,
+        end: 2023-10-01T09:30:00Z,
+        task_id: "f",
+    },
+    Slot {
+        start: 2023-10-01T09:30:00Z,
+        end: 2023-10-01T10:30:00Z,
+        task_id: "c",
+    },
+    Slot {
+        start: 2023-10-01T10:30:00Z,
+        end: 2023-10-01T11:00:00Z,
+        task_id: "d",
+    },
+    Slot {
+        start: 2023-10-01T11:00:00Z,
+        end: 2023-10-01T12:00:00Z,
+        task_id: "a",
+    },
+]
+    "#);
+}
+
+#[test]
+fn anytime_stops_when_cancelled() {
+    let now = DateTime::parse_from_rfc3339("2023-10-01T09:00:00Z").unwrap().with_timezone(&chrono::Utc);
+    let options = ScheduleOptions {
+        cancelled: Some(Arc::new(AtomicBool::new(true))),
+        ..ScheduleOptions::default()
+    };
+
+    assert!(monte_carlo_schedule_with(&overloaded_tasks(), now, 0, &options, |_| true).is_err());
+}
@@ -1,6 +1,6 @@
 import {createEffect, createSignal, For, Match, Show, Switch} from "solid-js";
 import {PrimaryState} from "./App.tsx";
-import api, {Task} from "./api.ts";
+import api, {Interval, Task} from "./api.ts";
 import {ChevronDown, ChevronUp, CloudCheck, CloudCog} from "lucide-solid";
 import {DateTime, Duration} from "luxon";
 import {userId} from "./userStore.ts";
@@ -99,6 +99,48 @@ export const editableTaskFromTask = (task: Task): EditableTask => {
     };
 };
 
+const NEW_TASK_LENGTH = Duration.fromObject({hours: 1});
+const NEW_TASK_HORIZON = Duration.fromObject({days: 7});
+
+// Times for a new fixed task: the start of the first free interval, moved to
+// the next quarter hour when the task still fits
+export const newTaskTimes = (free: Interval[], length: Duration): Interval | null => {
+    for (const gap of free) {
+        let start = gap.start;
+        const minutes = start.diff(start.startOf('hour')).as('minutes');
+        const quarter = start.startOf('hour').plus({minutes: Math.ceil(minutes / 15) * 15});
+        if (quarter > start && quarter.plus(length) <= gap.end) {
+            start = quarter;
+        }
+        if (start.plus(length) <= gap.end) {
+            return {start, end: start.plus(length)};
+        }
+    }
+    return null;
+};
+
+const addTask = async () => {
+    // Fixed tasks may not overlap, so the new one goes into free time
+    const from = DateTime.now().startOf('hour').plus({hours: 1});
+    const free = await api.getFreeTime(userId(), from, from.plus(NEW_TASK_HORIZON), NEW_TASK_LENGTH);
+    const times = newTaskTimes(free, NEW_TASK_LENGTH);
+    if (times === null) {
+        throw new Error("No free hour in the coming week");
+    }
+    await api.createTask(userId(), ({
+        id: "",
+        name: "New Task",
+        description: null,
+        color: "#4A90E2",
+        leisure: false,
+        dependencies: [],
+        type: 'fixed',
+        start: times.start,
+        end: times.end,
+        nonce: 1,
+    }));
+};
+
 function TaskItem(props: { task: Task }) {
     type EditTarget = "name" | "description" | "start" | "end" | "kickoff" | "deadline" | "timings" | "duration";
 
@@ -106,8 +148,36 @@ function TaskItem(props: { task: Task }) {
     const [unsyncedTask, setUnsyncedTask] = createSignal<EditableTask>(editableTaskFromTask(props.task));
     const [editTarget, setEditTarget] = createSignal<EditTarget | null>(null);
     const editedTask = () => taskFromEditableTask(unsyncedTask());
-    const taskSynced = () => unsyncedTask().nonce <= props.task.nonce;
+    // Number of local edits the server has not confirmed yet. The nonce of
+    // unsyncedTask stays the last one the server confirmed, so it can be sent
+    // as If-Match and incoming updates can be compared against it.
+    const [pendingEdits, setPendingEdits] = createSignal(0);
+    const taskSynced = () => pendingEdits() === 0;
     const [_syncTimeout, setSyncTimeout] = createSignal<number | null>(null);
+    let syncing = false;
+
+    const sync = () => {
+        if (syncing) {
+            // Rescheduled once the request in flight settles
+            return;
+        }
+        syncing = true;
+        const sent = pendingEdits();
+        const task = editedTask();
+        api.updateTask(userId(), task, task.nonce).then(saved => {
+            // Adopt the nonce the server assigned; edits made meanwhile stay pending
+            setUnsyncedTask(t => ({...t, nonce: saved.nonce}));
+            setPendingEdits(n => n - sent);
+        }).catch(err => {
+            // Most likely the task was changed elsewhere: drop the local edits
+            // and fall back to the server copy
+            alert(`Failed to save task: ${err.message}`);
+            setUnsyncedTask(editableTaskFromTask(props.task));
+            setPendingEdits(0);
+        }).finally(() => {
+            syncing = false;
+        });
+    };
 
     createEffect(() => {
         if (!taskSynced()) {
@@ -116,8 +186,7 @@ function TaskItem(props: { task: Task }) {
                     clearTimeout(timeout);
                 }
                 return setTimeout(() => {
-                    const task = editedTask();
-                    api.updateTask(userId(), task).then();
+                    sync();
                     setSyncTimeout(null);
                 }, 1000);
             });
@@ -132,11 +201,15 @@ function TaskItem(props: { task: Task }) {
     });
 
     createEffect(() => {
+        const task = props.task;
+        if (!taskSynced()) {
+            return;
+        }
         setUnsyncedTask(prev => {
-            if (prev.nonce <= props.task.nonce) {
+            if (prev.nonce <= task.nonce) {
                 return {
                     ...prev,
-                    ...props.task,
+                    ...task,
                 };
             } else {
                 return prev;
@@ -154,8 +227,8 @@ function TaskItem(props: { task: Task }) {
         setUnsyncedTask(t => ({
             ...t,
             ...updates,
-            nonce: t.nonce + 1,
         }));
+        setPendingEdits(n => n + 1);
     }
 
     return (
@@ -327,21 +400,9 @@ function TaskList(props: {
         <h2 class="text-xl font-bold mb-4 w-full text-center">Your tasks</h2>
         <div class="flex w-full justify-center mb-4 gap-4">
             <Button label="Add task" onClick={() => {
-                api.createTask(userId(), ({
-                    id: "",
-                    name: "New Task",
-                    description: null,
-                    color: "#4A90E2",
-                    leisure: false,
-                    dependencies: [],
-                    type: 'fixed',
-                    start: DateTime.now().startOf('hour').plus({hours: 1}),
-                    end: DateTime.now().plus({hours: 2}),
-                    nonce: 1,
-                })).then(_task => {
-                    // props.setState("tasks", tasks => [...tasks, task])
-                }).catch(err => {
+                addTask().catch(err => {
                     console.error("Failed to create task:", err);
+                    alert(`Failed to create task: ${err.message}`);
                 });
             }}/>
             <Button label="Schedule!" onClick={() => {
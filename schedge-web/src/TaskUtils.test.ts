@@ -1,6 +1,6 @@
 import { describe, it, expect } from "vitest";
 import { DateTime, Duration } from "luxon";
-import { taskFromEditableTask, editableTaskFromTask, EditableTask } from "./TaskList";
+import { taskFromEditableTask, editableTaskFromTask, newTaskTimes, EditableTask } from "./TaskList";
 import { Task } from "./api";
 
 describe("taskFromEditableTask", () => {
@@ -240,3 +240,32 @@ describe("editableTaskFromTask", () => {
     });
   });
 });
+
+describe("newTaskTimes", () => {
+  const at = (time: string) => DateTime.fromISO(`2023-05-01T${time}`);
+  const hour = Duration.fromObject({ hours: 1 });
+  const times = (free: { start: DateTime; end: DateTime }[]) => {
+    const found = newTaskTimes(free, hour);
+    return found && [found.start.toISO(), found.end.toISO()];
+  };
+
+  it("should skip free intervals that are too short", () => {
+    const free = [
+      { start: at("10:00"), end: at("10:30") },
+      { start: at("12:00"), end: at("14:00") },
+    ];
+    expect(times(free)).toEqual([at("12:00").toISO(), at("13:00").toISO()]);
+  });
+
+  it("should start at the next quarter hour when the task still fits", () => {
+    expect(times([{ start: at("10:05"), end: at("12:00") }]))
+      .toEqual([at("10:15").toISO(), at("11:15").toISO()]);
+    expect(times([{ start: at("10:05"), end: at("11:10") }]))
+      .toEqual([at("10:05").toISO(), at("11:05").toISO()]);
+  });
+
+  it("should return null when there is no free hour", () => {
+    expect(times([])).toBeNull();
+    expect(times([{ start: at("10:00"), end: at("10:59") }])).toBeNull();
+  });
+});
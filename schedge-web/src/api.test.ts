@@ -1,6 +1,6 @@
-import { describe, it, expect } from "vitest";
+import { describe, it, expect, vi, afterEach } from "vitest";
 import { DateTime, Duration } from "luxon";
-import {
+import api, {
   rawToClientTask,
   clientToRawTask,
   rawToClientSlot,
@@ -247,3 +247,71 @@ describe("rawToClientSlot", () => {
     });
   });
 });
+
+describe("api.updateTask", () => {
+  afterEach(() => {
+    vi.unstubAllGlobals();
+  });
+
+  // Mimics the server: the update only applies when If-Match carries the
+  // stored nonce, and every applied update bumps it
+  function stubServer(stored: RawTask) {
+    const ifMatch: (string | null)[] = [];
+    vi.stubGlobal("fetch", async (_url: string, init: RequestInit) => {
+      const expected = new Headers(init.headers).get("If-Match");
+      ifMatch.push(expected);
+      if (expected !== `"${stored.nonce}"`) {
+        return new Response(JSON.stringify({ status: "error", message: "Task was modified concurrently" }), { status: 409 });
+      }
+      stored = { ...JSON.parse(init.body as string), nonce: stored.nonce + 1 };
+      return new Response(JSON.stringify({ status: "ok", result: stored }), { status: 200 });
+    });
+    return ifMatch;
+  }
+
+  it("should accept two edits in a row when the returned nonce is adopted", async () => {
+    const rawTask: RawTask = {
+      id: "1",
+      name: "Fixed Task",
+      description: null,
+      color: "#FF0000",
+      leisure: false,
+      dependencies: [],
+      nonce: 1,
+      type: "fixed",
+      start: "2023-05-01T10:00:00.000Z",
+      end: "2023-05-01T12:00:00.000Z",
+    };
+    const ifMatch = stubServer(rawTask);
+
+    let task = rawToClientTask(rawTask);
+    const first = await api.updateTask(1, { ...task, name: "Renamed" }, task.nonce);
+    expect(first.nonce).toBe(2);
+    task = { ...task, name: "Renamed", nonce: first.nonce };
+
+    const second = await api.updateTask(1, { ...task, description: "Edited twice" }, task.nonce);
+    expect(second.nonce).toBe(3);
+    expect(second.name).toBe("Renamed");
+    expect(second.description).toBe("Edited twice");
+    expect(ifMatch).toEqual(['"1"', '"2"']);
+  });
+
+  it("should reject an edit based on an outdated nonce", async () => {
+    const rawTask: RawTask = {
+      id: "1",
+      name: "Fixed Task",
+      description: null,
+      color: "#FF0000",
+      leisure: false,
+      dependencies: [],
+      nonce: 3,
+      type: "fixed",
+      start: "2023-05-01T10:00:00.000Z",
+      end: "2023-05-01T12:00:00.000Z",
+    };
+    stubServer(rawTask);
+
+    const task = rawToClientTask(rawTask);
+    await expect(api.updateTask(1, { ...task, name: "Renamed" }, 2)).rejects.toThrow("modified concurrently");
+  });
+});
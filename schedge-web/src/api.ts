@@ -76,10 +76,23 @@ export type RawSlot = {
     task: RawTask;
 };
 
+export type RawInterval = {
+    start: string;
+    end: string;
+};
+
+export type RawFreeBusy = {
+    from: string;
+    to: string;
+    busy: RawInterval[];
+    free: RawInterval[];
+};
+
 export type RawState = {
     userId: number;
     tasks: RawTask[];
     slots: RawSlot[];
+    provisional?: boolean;
 }
 
 export type ApiResponse<T> =
@@ -124,6 +137,7 @@ export type ProjectTask = BaseTask & {
 
 export type Task = FixedTask | ContinuousTask | ProjectTask;
 export type Slot = { start: DateTime; end: DateTime; task: Task };
+export type Interval = { start: DateTime; end: DateTime };
 
 export type State = {
     tasks: Task[];
@@ -225,6 +239,13 @@ function rawToClientSlot(raw: RawSlot): Slot {
     };
 }
 
+function rawToClientInterval(raw: RawInterval): Interval {
+    return {
+        start: parseISODate(raw.start),
+        end: parseISODate(raw.end),
+    };
+}
+
 const api = {
     async getTasks(userId: number): Promise<Task[]> {
         const res: Response = await fetch(`${API_BASE}/api/v0/user/${userId}/task`).catch(e => throwErr(new Error(e)));
@@ -255,11 +276,17 @@ const api = {
     async updateTask(
         userId: number,
         task: Task,
+        expectedNonce: number,
     ): Promise<Task> {
         const raw = clientToRawTask(task);
         const res = await fetch(`${API_BASE}/api/v0/user/${userId}/task/${task.id}`, {
             method: 'PUT',
-            headers: {'Content-Type': 'application/json'},
+            headers: {
+                'Content-Type': 'application/json',
+                // Reject the update if the task was changed elsewhere (e.g. in another tab).
+                // The server owns the nonce, so this must be the last one it confirmed.
+                'If-Match': `"${expectedNonce}"`,
+            },
             body: JSON.stringify(raw),
         });
         const body = (await res.json()) as ApiResponse<RawTask>;
@@ -299,6 +326,23 @@ const api = {
         return body.result.map(rawToClientSlot);
     },
 
+    async getFreeTime(
+        userId: number,
+        from: DateTime,
+        to: DateTime,
+        min: Duration,
+    ): Promise<Interval[]> {
+        const query = new URLSearchParams({
+            from: serializeDate(from),
+            to: serializeDate(to),
+            min: String(Math.ceil(min.as('minutes'))),
+        });
+        const res = await fetch(`${API_BASE}/api/v0/user/${userId}/freebusy?${query}`);
+        const body = (await res.json()) as ApiResponse<RawFreeBusy>;
+        if (body.status !== 'ok') throw new Error(body.message);
+        return body.result.free.map(rawToClientInterval);
+    },
+
     rawStateToState(raw: RawState): State {
         return {
             tasks: raw.tasks.map(rawToClientTask),
@@ -330,6 +374,7 @@ export {
     rawToClientTask,
     clientToRawTask,
     rawToClientSlot,
+    rawToClientInterval,
     parseISODate,
     serializeDate,
     parseISODuration,
@@ -1,11 +1,18 @@
+import random
+from datetime import datetime, timedelta, timezone
+
 import pytest
 import requests
 
 BASE_URL = "http://localhost:5000/api/v0"
 
-@pytest.fixture(scope="module")
+def new_user_id():
+    # Fixed tasks may not overlap, so every test starts from a user without tasks
+    return random.randrange(10**6, 10**9)
+
+@pytest.fixture
 def user_id():
-    return 1
+    return new_user_id()
 
 def test_get_user_state(user_id):
     response = requests.get(f"{BASE_URL}/user/{user_id}/state")
@@ -15,6 +22,19 @@ def test_get_user_state(user_id):
     assert "tasks" in data["result"]
     assert "slots" in data["result"]
 
+def test_get_user_state_not_modified(user_id):
+    response = requests.get(f"{BASE_URL}/user/{user_id}/state")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = requests.get(f"{BASE_URL}/user/{user_id}/state", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    create_test_task(user_id)
+    response = requests.get(f"{BASE_URL}/user/{user_id}/state", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
 def create_test_task(user_id):
     task = {
         "id": "",
@@ -88,3 +108,185 @@ def test_compute_slot_request(user_id):
     assert response.status_code == 201
     data = response.json()
     assert data["status"] == "ok"
+
+def test_update_task_stale_nonce(user_id):
+    task_id = create_test_task(user_id)
+    updated_task = {
+        "id": task_id,
+        "type": "fixed",
+        "name": "Updated Task",
+        "description": None,
+        "color": "#00FF00",
+        "leisure": False,
+        "dependencies": [],
+        "nonce": 1,
+        "start": "2023-05-01T10:00:00Z",
+        "end": "2023-05-01T13:00:00Z",
+    }
+    response = requests.put(f"{BASE_URL}/user/{user_id}/task/{task_id}", json=updated_task,
+                            headers={"If-Match": '"1"'})
+    assert response.status_code == 200
+    assert response.json()["result"]["nonce"] == 2
+
+    # A second tab still holding nonce 1 must not overwrite the update
+    response = requests.put(f"{BASE_URL}/user/{user_id}/task/{task_id}", json=updated_task,
+                            headers={"If-Match": '"1"'})
+    assert response.status_code == 409
+
+    response = requests.delete(f"{BASE_URL}/user/{user_id}/task/{task_id}", headers={"If-Match": '"1"'})
+    assert response.status_code == 409
+
+    response = requests.delete(f"{BASE_URL}/user/{user_id}/task/{task_id}", headers={"If-Match": '"2"'})
+    assert response.status_code == 200
+
+def test_update_task_twice(user_id):
+    task_id = create_test_task(user_id)
+    task = requests.get(f"{BASE_URL}/user/{user_id}/task/{task_id}").json()["result"]
+
+    # Like the web client: If-Match carries the last confirmed nonce and the
+    # nonce of the response is adopted before the next edit
+    for name in ("First edit", "Second edit"):
+        task["name"] = name
+        response = requests.put(f"{BASE_URL}/user/{user_id}/task/{task_id}", json=task,
+                                headers={"If-Match": f'"{task["nonce"]}"'})
+        assert response.status_code == 200
+        assert response.json()["result"]["nonce"] == task["nonce"] + 1
+        task = response.json()["result"]
+
+    response = requests.get(f"{BASE_URL}/user/{user_id}/task/{task_id}")
+    assert response.json()["result"]["name"] == "Second edit"
+    assert response.json()["result"]["nonce"] == 3
+
+def test_import_export_ics():
+    user_id = new_user_id()
+    calendar = (
+        "BEGIN:VCALENDAR\r\n"
+        "VERSION:2.0\r\n"
+        "BEGIN:VEVENT\r\n"
+        "UID:import-test@example.com\r\n"
+        "DTSTART:20250501T100000Z\r\n"
+        "DTEND:20250501T110000Z\r\n"
+        "SUMMARY:Imported meeting\r\n"
+        "END:VEVENT\r\n"
+        "END:VCALENDAR\r\n"
+    )
+    response = requests.post(
+        f"{BASE_URL}/user/{user_id}/import.ics",
+        data=calendar.encode(),
+        headers={"Content-Type": "text/calendar"},
+    )
+    assert response.status_code == 201
+    assert response.json()["result"]["imported"] == 1
+
+    tasks = requests.get(f"{BASE_URL}/user/{user_id}/task").json()["result"]
+    assert any(task["name"] == "Imported meeting" for task in tasks)
+
+    response = requests.get(f"{BASE_URL}/user/{user_id}/export.ics")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/calendar")
+    assert response.text.startswith("BEGIN:VCALENDAR")
+    assert response.text.rstrip().endswith("END:VCALENDAR")
+
+def test_dependency_validation():
+    user_id = new_user_id()
+    first = create_test_task(user_id)
+    task = {
+        "id": "",
+        "type": "fixed",
+        "name": "Depends on the first",
+        "description": None,
+        "color": "#00FF00",
+        "leisure": False,
+        "dependencies": [first],
+        "nonce": 1,
+        "start": "2023-05-01T13:00:00Z",
+        "end": "2023-05-01T14:00:00Z",
+    }
+    response = requests.post(f"{BASE_URL}/user/{user_id}/task", json=task)
+    assert response.status_code == 201
+    second = response.json()["result"]["id"]
+
+    response = requests.post(f"{BASE_URL}/user/{user_id}/task", json={**task, "dependencies": ["0" * 24]})
+    assert response.status_code == 400
+    assert response.json()["message"] == f"Unknown dependency: {'0' * 24}"
+
+    # The first task depending on the second would close a cycle
+    response = requests.put(f"{BASE_URL}/user/{user_id}/task/{first}",
+                            json={**task, "id": first, "dependencies": [second],
+                                  "start": "2023-05-01T10:00:00Z", "end": "2023-05-01T12:00:00Z"})
+    assert response.status_code == 400
+    assert response.json()["message"] == f"Dependency cycle: {first} -> {second} -> {first}"
+
+    response = requests.get(f"{BASE_URL}/user/{user_id}/dependencies")
+    order = response.json()["result"]["order"]
+    assert order.index(first) < order.index(second)
+
+    requests.delete(f"{BASE_URL}/user/{user_id}/task/{first}")
+    response = requests.get(f"{BASE_URL}/user/{user_id}/dependencies")
+    assert response.json()["result"]["dangling"] == {second: [first]}
+
+def test_recurring_fixed_tasks_are_busy():
+    user_id = new_user_id()
+    task = {
+        "id": "",
+        "type": "fixed",
+        "name": "Standup",
+        "description": None,
+        "color": "#0000FF",
+        "leisure": False,
+        "dependencies": [],
+        "nonce": 1,
+        "start": "2023-05-01T09:00:00Z",
+        "end": "2023-05-01T10:00:00Z",
+        "recurrence": {"freq": "daily"},
+    }
+    response = requests.post(f"{BASE_URL}/user/{user_id}/task", json=task)
+    assert response.status_code == 201
+    series = response.json()["result"]["id"]
+
+    day = (datetime.now(timezone.utc) + timedelta(days=2)).date()
+    response = requests.get(f"{BASE_URL}/user/{user_id}/freebusy",
+                            params={"from": f"{day}T00:00:00Z", "to": f"{day}T23:59:59Z"})
+    assert response.status_code == 200
+    assert response.json()["result"]["busy"] == [{"start": f"{day}T09:00:00+00:00", "end": f"{day}T10:00:00+00:00"}]
+
+    single = {key: value for key, value in task.items() if key != "recurrence"}
+    response = requests.post(f"{BASE_URL}/user/{user_id}/task",
+                             json={**single, "start": f"{day}T09:30:00Z", "end": f"{day}T10:30:00Z"})
+    assert response.status_code == 409
+    assert response.json()["message"] == f"Overlaps fixed task {series}@{day:%Y%m%d}T090000Z"
+
+    response = requests.post(f"{BASE_URL}/user/{user_id}/task",
+                             json={**single, "start": f"{day}T11:00:00Z", "end": f"{day}T12:00:00Z"})
+    assert response.status_code == 201
+    # A second series at the same time of day runs into the single task
+    response = requests.post(f"{BASE_URL}/user/{user_id}/task",
+                             json={**task, "start": "2023-05-01T11:30:00Z", "end": "2023-05-01T12:30:00Z"})
+    assert response.status_code == 409
+
+def test_reads_see_own_writes():
+    # Run against docker-compose.replica.yml to read from secondaries
+    user_id = new_user_id()
+    task = {
+        "id": "",
+        "type": "continuous",
+        "name": "Reading",
+        "description": None,
+        "color": "#FFD700",
+        "leisure": False,
+        "dependencies": [],
+        "nonce": 1,
+        "duration": "PT1H",
+        "kickoff": "2023-05-01T08:00:00Z",
+        "deadline": "2023-05-01T20:00:00Z",
+    }
+    for _ in range(20):
+        response = requests.post(f"{BASE_URL}/user/{user_id}/task", json=task)
+        assert response.status_code == 201
+        task_id = response.json()["result"]["id"]
+        # Without a secondary in the way, no token is needed
+        headers = {}
+        if "X-Causal-Token" in response.headers:
+            headers["X-Causal-Token"] = response.headers["X-Causal-Token"]
+        response = requests.get(f"{BASE_URL}/user/{user_id}/task", headers=headers)
+        assert task_id in {item["id"] for item in response.json()["result"]}